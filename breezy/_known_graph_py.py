@@ -69,6 +69,7 @@ class KnownGraph(object):
         # Maps {frozenset(revision_id, revision_id): heads}
         self._known_heads = {}
         self.do_cache = do_cache
+        self._partial_merge_sorter = None
         self._initialize_nodes(parent_map)
         self._find_gdfo()
 
@@ -147,6 +148,7 @@ class KnownGraph(object):
         :param parent_keys: The parents of the given node.
         :return: None (should we return if this was a ghost, etc?)
         """
+        self._partial_merge_sorter = None
         nodes = self._nodes
         if key in nodes:
             node = nodes[key]
@@ -352,6 +354,39 @@ class KnownGraph(object):
                                     mainline_revisions=None,
                                     generate_revno=True)]
 
+    def _get_partial_merge_sorter(self, tip_key):
+        sorter = self._partial_merge_sorter
+        if sorter is None or sorter.tip_key != tip_key:
+            from breezy import tsort
+            sorter = tsort.PartialMergeSorter(self, tip_key)
+            self._partial_merge_sorter = sorter
+        return sorter
+
+    def iter_merge_sort(self, tip_key):
+        """Iterate over the merge sorted graph output.
+
+        This yields the same nodes as merge_sort(tip_key), but only sorts as
+        much of the ancestry of tip_key as has been consumed.
+        """
+        for key, merge_depth, revno, end_of_merge in (
+                self._get_partial_merge_sorter(tip_key).iter_merge_sorted()):
+            yield _MergeSortNode(key, merge_depth, revno, end_of_merge)
+
+    def get_dotted_revnos(self, tip_key, keys):
+        """Compute the dotted revnos of some keys.
+
+        The revnos are the same as those merge_sort(tip_key) would give, but
+        only as much of the ancestry of tip_key is sorted as is needed to
+        number keys. The sorted part is kept for later calls with the same
+        tip.
+
+        :param tip_key: The tip to number the ancestry of.
+        :param keys: The keys to number.
+        :return: A dict mapping the keys that are in the ancestry of tip_key
+            to dotted revno tuples.
+        """
+        return self._get_partial_merge_sorter(tip_key).get_dotted_revnos(keys)
+
     def get_parent_keys(self, key):
         """Get the parents for a key
 
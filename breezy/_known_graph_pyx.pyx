@@ -200,6 +200,7 @@ cdef class KnownGraph:
     cdef public object _nodes
     cdef public object _known_heads
     cdef public int do_cache
+    cdef public object _partial_merge_sorter
 
     def __init__(self, parent_map, do_cache=True):
         """Create a new KnownGraph instance.
@@ -211,6 +212,7 @@ cdef class KnownGraph:
         # Maps {sorted(revision_id, revision_id): heads}
         self._known_heads = {}
         self.do_cache = int(do_cache)
+        self._partial_merge_sorter = None
         # TODO: consider disabling gc since we are allocating a lot of nodes
         #       that won't be collectable anyway. real world testing has not
         #       shown a specific impact, yet.
@@ -363,6 +365,7 @@ cdef class KnownGraph:
         cdef _KnownGraphNode node, parent_node, child_node
         cdef long parent_gdfo, next_gdfo
 
+        self._partial_merge_sorter = None
         maybe_node = PyDict_GetItem(self._nodes, key)
         if maybe_node != NULL:
             node = <_KnownGraphNode>maybe_node
@@ -646,6 +649,49 @@ cdef class KnownGraph:
         sorter = _MergeSorter(self, tip_key)
         return sorter.topo_order()
 
+    def _get_partial_merge_sorter(self, tip_key):
+        sorter = self._partial_merge_sorter
+        if sorter is None or sorter.tip_key != tip_key:
+            from breezy import tsort
+            sorter = tsort.PartialMergeSorter(self, tip_key)
+            self._partial_merge_sorter = sorter
+        return sorter
+
+    def iter_merge_sort(self, tip_key):
+        """Iterate over the merge sorted graph output.
+
+        This yields the same nodes as merge_sort(tip_key), but only sorts as
+        much of the ancestry of tip_key as has been consumed.
+        """
+        cdef _MergeSortNode node
+
+        for key, merge_depth, revno, end_of_merge in (
+                self._get_partial_merge_sorter(tip_key).iter_merge_sorted()):
+            node = _MergeSortNode(key)
+            node.merge_depth = merge_depth
+            node.end_of_merge = end_of_merge
+            if len(revno) == 1:
+                node._revno_last = revno[0]
+            else:
+                node._revno_first, node._revno_second, node._revno_last = revno
+            node.completed = 1
+            yield node
+
+    def get_dotted_revnos(self, tip_key, keys):
+        """Compute the dotted revnos of some keys.
+
+        The revnos are the same as those merge_sort(tip_key) would give, but
+        only as much of the ancestry of tip_key is sorted as is needed to
+        number keys. The sorted part is kept for later calls with the same
+        tip.
+
+        :param tip_key: The tip to number the ancestry of.
+        :param keys: The keys to number.
+        :return: A dict mapping the keys that are in the ancestry of tip_key
+            to dotted revno tuples.
+        """
+        return self._get_partial_merge_sorter(tip_key).get_dotted_revnos(keys)
+
     def get_parent_keys(self, key):
         """Get the parents for a key
 
@@ -32,17 +32,12 @@ from .lazy_import import lazy_import
 lazy_import(globals(), """
 
 import patiencediff
-
-from breezy import (
-    tsort,
-    )
 """)
 from . import (
     config,
     errors,
     osutils,
     )
-from .repository import _strip_NULL_ghosts
 from .revision import (
     CURRENT_REVISION,
     Revision,
@@ -163,31 +158,14 @@ def _expand_annotations(annotations, branch, current_rev=None):
         # This can probably become a function on MutableTree, get_revno_map
         # there, or something.
         last_revision = current_rev.revision_id
-        # XXX: Partially Cloned from branch, uses the old_get_graph, eep.
-        # XXX: The main difficulty is that we need to inject a single new node
-        #      (current_rev) into the graph before it gets numbered, etc.
-        #      Once KnownGraph gets an 'add_node()' function, we can use
-        #      VF.get_known_graph_ancestry().
-        graph = repository.get_graph()
-        revision_graph = {
-            key: value for key, value in
-            graph.iter_ancestry(current_rev.parent_ids) if value is not None}
-        revision_graph = _strip_NULL_ghosts(revision_graph)
-        revision_graph[last_revision] = current_rev.parent_ids
-        merge_sorted_revisions = tsort.merge_sort(
-            revision_graph,
-            last_revision,
-            None,
-            generate_revno=True)
-        revision_id_to_revno = {
-            rev_id: revno
-            for seq_num, rev_id, depth, revno, end_of_merge in
-            merge_sorted_revisions}
+        known_graph = repository.get_known_graph_ancestry(
+            current_rev.parent_ids)
+        known_graph.add_node(last_revision, current_rev.parent_ids)
+        revision_id_to_revno = known_graph.get_dotted_revnos(
+            last_revision, revision_ids)
     else:
-        # TODO(jelmer): Only look up the revision ids that we need (i.e. those
-        # in revision_ids). Possibly add a HPSS call that can look those up
-        # in bulk over HPSS.
-        revision_id_to_revno = branch.get_revision_id_to_revno_map()
+        revision_id_to_revno = branch.revision_ids_to_dotted_revnos(
+            revision_ids)
     last_origin = None
     revisions = {}
     if CURRENT_REVISION in revision_ids:
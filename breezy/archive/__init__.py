@@ -29,6 +29,22 @@ from .. import (
     )
 
 
+# Maximum size of the pieces file contents are written in, so that compressors
+# and consumers of the generated chunks never see a whole large file at once.
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _split_chunks(chunks):
+    """Split chunks into pieces of at most _CHUNK_SIZE bytes."""
+    for chunk in chunks:
+        if len(chunk) <= _CHUNK_SIZE:
+            yield chunk
+            continue
+        view = memoryview(chunk)
+        for start in range(0, len(chunk), _CHUNK_SIZE):
+            yield view[start:start + _CHUNK_SIZE].tobytes()
+
+
 class ArchiveFormatInfo(object):
 
     def __init__(self, extensions):
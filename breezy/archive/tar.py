@@ -16,31 +16,23 @@
 
 """Export a tree to a tarball."""
 
-from contextlib import closing
 from io import BytesIO
 import os
 import sys
 import tarfile
+import zlib
 
 from .. import (
     errors,
     osutils,
     )
-from ..export import _export_iter_entries
+from ..export import _export_iter_items
+from . import _split_chunks
 
 
-def prepare_tarball_item(tree, root, final_path, tree_path, entry, force_mtime=None):
-    """Prepare a tarball item for exporting
-
-    :param tree: Tree to export
-    :param final_path: Final path to place item
-    :param tree_path: Path for the entry in the tree
-    :param entry: Entry to export
-    :param force_mtime: Option mtime to force, instead of using tree
-        timestamps.
-
-    Returns a (tarinfo, fileobj) tuple
-    """
+def _prepare_tarinfo(tree, root, final_path, tree_path, entry,
+                     force_mtime=None):
+    """Create the TarInfo for an entry, leaving the size of files unset."""
     file_id = getattr(entry, 'file_id', None)
     filename = osutils.pathjoin(root, final_path)
     item = tarfile.TarInfo(filename)
@@ -54,31 +46,98 @@ def prepare_tarball_item(tree, root, final_path, tree_path, entry, force_mtime=N
             item.mode = 0o755
         else:
             item.mode = 0o644
-        # This brings the whole file into memory, but that's almost needed for
-        # the tarfile contract, which wants the size of the file up front.  We
-        # want to make sure it doesn't change, and we need to read it in one
-        # go for content filtering.
-        content = tree.get_file_text(tree_path)
-        item.size = len(content)
-        fileobj = BytesIO(content)
     elif entry.kind in ("directory", "tree-reference"):
         item.type = tarfile.DIRTYPE
         item.name += '/'
         item.size = 0
         item.mode = 0o755
-        fileobj = None
     elif entry.kind == "symlink":
         item.type = tarfile.SYMTYPE
         item.size = 0
         item.mode = 0o755
         item.linkname = tree.get_symlink_target(tree_path)
-        fileobj = None
     else:
         raise errors.BzrError("don't know how to export {%s} of kind %r"
                               % (file_id, entry.kind))
+    return item
+
+
+def prepare_tarball_item(tree, root, final_path, tree_path, entry, force_mtime=None):
+    """Prepare a tarball item for exporting
+
+    :param tree: Tree to export
+    :param final_path: Final path to place item
+    :param tree_path: Path for the entry in the tree
+    :param entry: Entry to export
+    :param force_mtime: Option mtime to force, instead of using tree
+        timestamps.
+
+    Returns a (tarinfo, fileobj) tuple
+    """
+    item = _prepare_tarinfo(
+        tree, root, final_path, tree_path, entry, force_mtime)
+    if entry.kind == "file":
+        content = tree.get_file_text(tree_path)
+        item.size = len(content)
+        fileobj = BytesIO(content)
+    else:
+        fileobj = None
     return (item, fileobj)
 
 
+def _iter_tar_chunks(tree, root, subdir, force_mtime):
+    """Generate an uncompressed tar stream for tree.
+
+    Members are written directly rather than through tarfile.TarFile.addfile,
+    so that file contents can be passed on as they are retrieved instead of
+    being copied into a buffer first. Only the texts of one batch of files
+    are held in memory at a time.
+    """
+    offset = 0
+    for final_path, tree_path, entry, chunks in _export_iter_items(
+            tree, subdir):
+        item = _prepare_tarinfo(
+            tree, root, final_path, tree_path, entry, force_mtime)
+        if chunks is not None:
+            # The size goes in the header, so the text has to be retrieved
+            # before anything can be written. Trees hand out texts that are
+            # already in memory, so this does not add a copy.
+            chunks = list(chunks)
+            item.size = sum(map(len, chunks))
+        header = item.tobuf(
+            tarfile.DEFAULT_FORMAT, tarfile.ENCODING, "surrogateescape")
+        yield header
+        offset += len(header)
+        if chunks is not None:
+            for chunk in _split_chunks(chunks):
+                yield chunk
+            del chunks
+            remainder = item.size % tarfile.BLOCKSIZE
+            if remainder:
+                yield tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
+            offset += item.size + (-item.size % tarfile.BLOCKSIZE)
+    # End of archive marker, padded up to a full record like TarFile does.
+    trailer = tarfile.BLOCKSIZE * 2
+    trailer += -(offset + trailer) % tarfile.RECORDSIZE
+    yield tarfile.NUL * trailer
+
+
+def _get_compressor(format):
+    if format == 'gz':
+        return zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif format == 'bz2':
+        import bz2
+        return bz2.BZ2Compressor()
+    elif format == 'xz':
+        try:
+            import lzma
+        except ImportError as e:
+            raise errors.DependencyNotPresent('lzma', e)
+        return lzma.LZMACompressor()
+    else:
+        raise errors.BzrError("unknown tar compression %r" % (format, ))
+
+
 def tarball_generator(tree, root, subdir=None, force_mtime=None, format=''):
     """Export tree contents to a tarball.
 
@@ -90,18 +149,21 @@ def tarball_generator(tree, root, subdir=None, force_mtime=None, format=''):
 
     :param force_mtime: Option mtime to force, instead of using tree
         timestamps.
+
+    :param format: Compression to use; one of '', 'gz', 'bz2' or 'xz'.
     """
-    buf = BytesIO()
-    with closing(tarfile.open(None, "w:%s" % format, buf)) as ball, tree.lock_read():
-        for final_path, tree_path, entry in _export_iter_entries(tree, subdir):
-            (item, fileobj) = prepare_tarball_item(
-                tree, root, final_path, tree_path, entry, force_mtime)
-            ball.addfile(item, fileobj)
-            # Yield the data that was written so far, rinse, repeat.
-            yield buf.getvalue()
-            buf.truncate(0)
-            buf.seek(0)
-    yield buf.getvalue()
+    with tree.lock_read():
+        chunks = _iter_tar_chunks(tree, root, subdir, force_mtime)
+        if not format:
+            for chunk in chunks:
+                yield chunk
+            return
+        compressor = _get_compressor(format)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
 
 
 def tgz_generator(tree, dest, root, subdir, force_mtime=None):
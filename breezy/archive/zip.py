@@ -21,15 +21,15 @@ from contextlib import closing
 import os
 import stat
 import sys
-import tempfile
 import time
 import zipfile
 
 from .. import (
     osutils,
     )
-from ..export import _export_iter_entries
+from ..export import _export_iter_items
 from ..trace import mutter
+from . import _split_chunks
 
 
 # Windows expects this bit to be set in the 'external_attr' section,
@@ -42,6 +42,30 @@ _FILE_ATTR = stat.S_IFREG | FILE_PERMISSIONS
 _DIR_ATTR = stat.S_IFDIR | ZIP_DIRECTORY_BIT | DIR_PERMISSIONS
 
 
+class _ChunkCollector(object):
+    """Write-only file object that collects what is written to it.
+
+    As it can not seek, zipfile writes the sizes of members after their
+    contents rather than going back to fill them in, which allows the
+    archive to be produced as a stream.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop_chunks(self):
+        chunks = self._chunks
+        self._chunks = []
+        return chunks
+
+
 def zip_archive_generator(tree, dest, root, subdir=None,
                           force_mtime=None):
     """ Export this tree to a new zip file.
@@ -50,47 +74,55 @@ def zip_archive_generator(tree, dest, root, subdir=None,
     already exists, it will be overwritten".
     """
     compression = zipfile.ZIP_DEFLATED
-    with tempfile.SpooledTemporaryFile() as buf:
-        with closing(zipfile.ZipFile(buf, "w", compression)) as zipf, \
-                tree.lock_read():
-            for dp, tp, ie in _export_iter_entries(tree, subdir):
-                mutter("  export {%s} kind %s to %s", tp, ie.kind, dest)
-
-                # zipfile.ZipFile switches all paths to forward
-                # slashes anyway, so just stick with that.
-                if force_mtime is not None:
-                    mtime = force_mtime
-                else:
-                    mtime = tree.get_file_mtime(tp)
-                date_time = time.localtime(mtime)[:6]
-                filename = osutils.pathjoin(root, dp)
-                if ie.kind == "file":
-                    zinfo = zipfile.ZipInfo(
-                        filename=filename,
-                        date_time=date_time)
-                    zinfo.compress_type = compression
-                    zinfo.external_attr = _FILE_ATTR
-                    content = tree.get_file_text(tp)
-                    zipf.writestr(zinfo, content)
-                elif ie.kind in ("directory", "tree-reference"):
-                    # Directories must contain a trailing slash, to indicate
-                    # to the zip routine that they are really directories and
-                    # not just empty files.
-                    zinfo = zipfile.ZipInfo(
-                        filename=filename + '/',
-                        date_time=date_time)
-                    zinfo.compress_type = compression
-                    zinfo.external_attr = _DIR_ATTR
-                    zipf.writestr(zinfo, '')
-                elif ie.kind == "symlink":
-                    zinfo = zipfile.ZipInfo(
-                        filename=(filename + '.lnk'),
-                        date_time=date_time)
-                    zinfo.compress_type = compression
-                    zinfo.external_attr = _FILE_ATTR
-                    zipf.writestr(zinfo, tree.get_symlink_target(tp))
-        # Urgh, headers are written last since they include e.g. file size.
-        # So we have to buffer it all :(
-        buf.seek(0)
-        for chunk in osutils.file_iterator(buf):
-            yield chunk
+    out = _ChunkCollector()
+    with closing(zipfile.ZipFile(out, "w", compression)) as zipf, \
+            tree.lock_read():
+        for dp, tp, ie, chunks in _export_iter_items(tree, subdir):
+            mutter("  export {%s} kind %s to %s", tp, ie.kind, dest)
+
+            # zipfile.ZipFile switches all paths to forward
+            # slashes anyway, so just stick with that.
+            if force_mtime is not None:
+                mtime = force_mtime
+            else:
+                mtime = tree.get_file_mtime(tp)
+            date_time = time.localtime(mtime)[:6]
+            filename = osutils.pathjoin(root, dp)
+            if ie.kind == "file":
+                zinfo = zipfile.ZipInfo(
+                    filename=filename,
+                    date_time=date_time)
+                zinfo.compress_type = compression
+                zinfo.external_attr = _FILE_ATTR
+                chunks = list(chunks)
+                # Knowing the size up front lets zipfile decide whether the
+                # member needs ZIP64 extensions.
+                zinfo.file_size = sum(map(len, chunks))
+                with zipf.open(zinfo, 'w') as member:
+                    for chunk in _split_chunks(chunks):
+                        member.write(chunk)
+                        for data in out.pop_chunks():
+                            yield data
+                del chunks
+            elif ie.kind in ("directory", "tree-reference"):
+                # Directories must contain a trailing slash, to indicate
+                # to the zip routine that they are really directories and
+                # not just empty files.
+                zinfo = zipfile.ZipInfo(
+                    filename=filename + '/',
+                    date_time=date_time)
+                zinfo.compress_type = compression
+                zinfo.external_attr = _DIR_ATTR
+                zipf.writestr(zinfo, '')
+            elif ie.kind == "symlink":
+                zinfo = zipfile.ZipInfo(
+                    filename=(filename + '.lnk'),
+                    date_time=date_time)
+                zinfo.compress_type = compression
+                zinfo.external_attr = _FILE_ATTR
+                zipf.writestr(zinfo, tree.get_symlink_target(tp))
+            for data in out.pop_chunks():
+                yield data
+    # Closing the archive writes the central directory.
+    for data in out.pop_chunks():
+        yield data
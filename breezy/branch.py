@@ -89,7 +89,7 @@ class Branch(controldir.ControlComponent):
         self._partial_revision_history_cache = []
         self._last_revision_info_cache = None
         self._master_branch_cache = None
-        self._merge_sorted_revisions_cache = None
+        self._known_graph_cache = None
         self._open_hook(possible_transports)
         hooks = Branch.hooks['open']
         for hook in hooks:
@@ -396,12 +396,58 @@ class Branch(controldir.ControlComponent):
             revno = self.revision_id_to_revno(revision_id)
             return (revno,)
         except errors.NoSuchRevision:
-            # We need to load and use the full revno map after all
-            result = self.get_revision_id_to_revno_map().get(revision_id)
+            # Number as much of the ancestry as is needed after all
+            result = self._do_revision_ids_to_dotted_revnos(
+                [revision_id]).get(revision_id)
             if result is None:
                 raise errors.NoSuchRevision(self, revision_id)
         return result
 
+    def revision_ids_to_dotted_revnos(self, revision_ids):
+        """Given several revision ids, return their dotted revnos.
+
+        Unlike get_revision_id_to_revno_map this only merge sorts as much of
+        the ancestry as is needed to number revision_ids.
+
+        :return: A dictionary mapping the revision ids that are in the
+            ancestry of the branch tip to dotted revno tuples.
+        """
+        with self.lock_read():
+            return self._do_revision_ids_to_dotted_revnos(revision_ids)
+
+    def _do_revision_ids_to_dotted_revnos(self, revision_ids):
+        """Worker function for revision_ids_to_dotted_revnos."""
+        if self._revision_id_to_revno_cache is not None:
+            mapping = self._revision_id_to_revno_cache
+            return {revision_id: mapping[revision_id]
+                    for revision_id in revision_ids
+                    if revision_id in mapping}
+        result = {}
+        missing = []
+        for revision_id in revision_ids:
+            revno = self._partial_revision_id_to_revno_cache.get(revision_id)
+            if revno is not None:
+                result[revision_id] = revno
+            else:
+                missing.append(revision_id)
+        last_revision = self.last_revision()
+        if missing and not _mod_revision.is_null(last_revision):
+            result.update(self._get_known_graph().get_dotted_revnos(
+                last_revision, missing))
+        return result
+
+    def _get_known_graph(self):
+        """Return a KnownGraph for the ancestry of the branch tip.
+
+        The graph is cached, which keeps the merge sorting done on it for
+        later calls.
+        """
+        if self._known_graph_cache is None:
+            self._known_graph_cache = (
+                self.repository.get_known_graph_ancestry(
+                    [self.last_revision()]))
+        return self._known_graph_cache
+
     def get_revision_id_to_revno_map(self):
         """Return the revision_id => dotted revno map.
 
@@ -435,9 +481,10 @@ class Branch(controldir.ControlComponent):
 
         :return: A dictionary mapping revision_id => dotted revno.
         """
+        last_revision = self.last_revision()
         revision_id_to_revno = {
-            rev_id: revno for rev_id, depth, revno, end_of_merge
-            in self.iter_merge_sorted_revisions()}
+            node.key: node.revno for node
+            in self._get_known_graph().merge_sort(last_revision)}
         return revision_id_to_revno
 
     def iter_merge_sorted_revisions(self, start_revision_id=None,
@@ -488,15 +535,11 @@ class Branch(controldir.ControlComponent):
         with self.lock_read():
             # Note: depth and revno values are in the context of the branch so
             # we need the full graph to get stable numbers, regardless of the
-            # start_revision_id.
-            if self._merge_sorted_revisions_cache is None:
-                last_revision = self.last_revision()
-                known_graph = self.repository.get_known_graph_ancestry(
-                    [last_revision])
-                self._merge_sorted_revisions_cache = known_graph.merge_sort(
-                    last_revision)
+            # start_revision_id. Only as much of it as is consumed is sorted.
+            merge_sorted_revisions = self._get_known_graph().iter_merge_sort(
+                self.last_revision())
             filtered = self._filter_merge_sorted_revisions(
-                self._merge_sorted_revisions_cache, start_revision_id,
+                merge_sorted_revisions, start_revision_id,
                 stop_revision_id, stop_rule)
             # Make sure we don't return revisions that are not part of the
             # start_revision_id ancestry.
@@ -927,7 +970,7 @@ class Branch(controldir.ControlComponent):
         self._revision_id_to_revno_cache = None
         self._last_revision_info_cache = None
         self._master_branch_cache = None
-        self._merge_sorted_revisions_cache = None
+        self._known_graph_cache = None
         self._partial_revision_history_cache = []
         self._partial_revision_id_to_revno_cache = {}
 
@@ -5176,6 +5176,11 @@ class cmd_pack(Command):
     during or immediately after repacking, you may be left with a state
     where the deletion has been written to disk but the new packs have not
     been. In this case the repository may be unusable.
+
+    The --incremental option only combines packs the way automatic packing
+    does, rather than packing everything. This completes any automatic
+    packing that was deferred because of the repository.autopack_max_bytes
+    option, and is much cheaper than a full pack on large repositories.
     """
 
     _see_also = ['repositories']
@@ -5183,15 +5188,26 @@ class cmd_pack(Command):
     takes_options = [
         Option('clean-obsolete-packs',
                'Delete obsolete packs to save disk space.'),
+        Option('incremental',
+               'Only do the packing automatic packing would do.'),
         ]
 
-    def run(self, branch_or_repo='.', clean_obsolete_packs=False):
+    def run(self, branch_or_repo='.', clean_obsolete_packs=False,
+            incremental=False):
         dir = controldir.ControlDir.open_containing(branch_or_repo)[0]
         try:
             branch = dir.open_branch()
             repository = branch.repository
         except errors.NotBranchError:
             repository = dir.open_repository()
+        if incremental:
+            autopack = getattr(repository, 'autopack', None)
+            if autopack is None:
+                raise errors.CommandError(
+                    gettext('Repository %s does not support incremental '
+                            'packing.') % repository.user_url)
+            autopack()
+            return
         repository.pack(clean_obsolete_packs=clean_obsolete_packs)
 
 
@@ -7129,5 +7145,6 @@ def _register_lazy_builtins():
             ('cmd_sign_my_commits', [], 'breezy.commit_signature_commands'),
             ('cmd_verify_signatures', [], 'breezy.commit_signature_commands'),
             ('cmd_test_script', [], 'breezy.cmd_test_script'),
+            ('cmd_watch_tree', [], 'breezy.bzr.watcher'),
             ]:
         builtin_command_registry.register_lazy(name, aliases, module_name)
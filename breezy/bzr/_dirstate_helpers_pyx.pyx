@@ -1581,7 +1581,7 @@ cdef class ProcessEntryC:
             if self.root_dir_info and self.root_dir_info[2] == 'tree-reference':
                 self.current_dir_info = None
             else:
-                self.dir_iterator = osutils._walkdirs_utf8(self.root_abspath,
+                self.dir_iterator = self.state._walk_disk(self.root_abspath,
                     prefix=self.current_root)
                 self.path_index = 0
                 try:
@@ -0,0 +1,132 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Bloom filters over index keys.
+
+A bloom filter answers "is this key possibly in the set" with no false
+negatives and a small, tunable rate of false positives. They are written
+next to pack indices so that lookups of keys which are not in a pack can be
+answered without reading any pages of its index.
+
+The serialised form is a signature line, a line with the number of hash
+functions, a line with the number of bits and then the bit array itself.
+"""
+
+import hashlib
+
+from .. import errors
+
+
+_SIGNATURE = b"Bazaar Bloom Filter 1\n"
+_OPTION_HASHES = b"hashes="
+_OPTION_BITS = b"bits="
+
+# With 10 bits per key and 7 hash functions about 1% of the lookups for
+# absent keys are false positives.
+BITS_PER_KEY = 10
+NUM_HASHES = 7
+
+
+class BadBloomFilter(errors.BzrError):
+
+    _fmt = "Could not parse bloom filter %(value)s."
+
+    def __init__(self, value):
+        errors.BzrError.__init__(self)
+        self.value = value
+
+
+def _key_offsets(key, num_hashes, num_bits):
+    """Return the bit offsets used for key.
+
+    The offsets are derived from a single digest by double hashing, which is
+    as good as using num_hashes independent hash functions.
+    """
+    digest = hashlib.sha1(b'\0'.join(key)).digest()
+    h1 = int.from_bytes(digest[:8], 'big')
+    h2 = int.from_bytes(digest[8:16], 'big') | 1
+    return [(h1 + i * h2) % num_bits for i in range(num_hashes)]
+
+
+class BloomFilter(object):
+    """A bloom filter for index keys (tuples of bytestrings)."""
+
+    def __init__(self, num_bits, num_hashes=NUM_HASHES, bits=None):
+        """Create a BloomFilter.
+
+        :param num_bits: The size of the filter in bits.
+        :param num_hashes: The number of bits set for each key.
+        :param bits: Optional serialised bit array to start from.
+        """
+        self._num_bits = max(8, num_bits + (-num_bits % 8))
+        self._num_hashes = num_hashes
+        if bits is None:
+            bits = bytearray(self._num_bits // 8)
+        elif len(bits) * 8 != self._num_bits:
+            raise ValueError('bit array has the wrong size')
+        self._bits = bits
+
+    @classmethod
+    def for_key_count(cls, key_count):
+        """Create an empty filter suitably sized for key_count keys."""
+        return cls(max(1, key_count) * BITS_PER_KEY)
+
+    @classmethod
+    def from_bytes(cls, data, name=None):
+        """Parse a serialised filter.
+
+        :param data: The bytes written by to_bytes().
+        :param name: Name to use in errors.
+        :raises BadBloomFilter: If data is not a valid filter.
+        """
+        if not data.startswith(_SIGNATURE):
+            raise BadBloomFilter(name)
+        lines = data[len(_SIGNATURE):].split(b'\n', 2)
+        if (len(lines) != 3 or not lines[0].startswith(_OPTION_HASHES) or
+                not lines[1].startswith(_OPTION_BITS)):
+            raise BadBloomFilter(name)
+        try:
+            num_hashes = int(lines[0][len(_OPTION_HASHES):])
+            num_bits = int(lines[1][len(_OPTION_BITS):])
+            return cls(num_bits, num_hashes, lines[2])
+        except ValueError:
+            raise BadBloomFilter(name)
+
+    def to_bytes(self):
+        """Serialise the filter."""
+        return b''.join([
+            _SIGNATURE,
+            b'%s%d\n' % (_OPTION_HASHES, self._num_hashes),
+            b'%s%d\n' % (_OPTION_BITS, self._num_bits),
+            bytes(self._bits)])
+
+    def add(self, key):
+        """Add key to the filter."""
+        bits = self._bits
+        for offset in _key_offsets(key, self._num_hashes, self._num_bits):
+            bits[offset >> 3] |= 1 << (offset & 7)
+
+    def __contains__(self, key):
+        bits = self._bits
+        try:
+            offsets = _key_offsets(key, self._num_hashes, self._num_bits)
+        except TypeError:
+            # Not a key of bytestrings; let the index itself deal with it.
+            return True
+        for offset in offsets:
+            if not bits[offset >> 3] & (1 << (offset & 7)):
+                return False
+        return True
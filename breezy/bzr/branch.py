@@ -29,6 +29,7 @@ from breezy import (
     shelf,
     )
 from breezy.bzr import (
+    revno_index as _mod_revno_index,
     tag as _mod_tag,
     )
 """)
@@ -50,6 +51,7 @@ from ..branch import (
 from ..decorators import (
     only_raises,
     )
+from ..hooks import install_lazy_named_hook
 from ..lock import _RelockDebugMixin, LogicalLockResult
 from ..trace import (
     mutter,
@@ -97,6 +99,7 @@ class BzrBranch(Branch, _RelockDebugMixin):
         self.conf_store = None
         Branch.__init__(self, possible_transports)
         self._tags_bytes = None
+        self._revno_index = None
 
     def __str__(self):
         return '%s(%s)' % (self.__class__.__name__, self.user_url)
@@ -438,6 +441,96 @@ class BzrBranch(Branch, _RelockDebugMixin):
     def _clear_cached_state(self):
         super(BzrBranch, self)._clear_cached_state()
         self._tags_bytes = None
+        self._revno_index = None
+
+    def _open_revno_index(self):
+        """Return the persistent revno index, or None if it is disabled.
+
+        See breezy.bzr.revno_index and the branch.revno_index option.
+        """
+        if self._revno_index is None:
+            if self.get_config_stack().get('branch.revno_index'):
+                self._revno_index = _mod_revno_index.RevnoIndex(
+                    self._transport, self.controldir._get_file_mode())
+            else:
+                self._revno_index = False
+        return self._revno_index or None
+
+    def _get_revno_index(self):
+        """Return the persistent revno index if it matches the branch tip.
+
+        This never writes to the branch; the index is only written by
+        _update_revno_index.
+
+        :return: A RevnoIndex or None.
+        """
+        index = self._open_revno_index()
+        if index is None or index.get_tip() != self.last_revision_info():
+            return None
+        return index
+
+    def _update_revno_index(self):
+        """Bring the persistent revno index up to date with the branch tip.
+
+        The index is extended if the tip has moved forward along its
+        mainline, and regenerated otherwise. This is called from the
+        post_change_branch_tip hook, so the branch is write locked.
+        """
+        index = self._open_revno_index()
+        if index is None:
+            return
+        last_revision_info = self.last_revision_info()
+        try:
+            if not _mod_revno_index.update_revno_index(
+                    index, self.repository, last_revision_info):
+                index.write(last_revision_info,
+                            self.get_revision_id_to_revno_map())
+        except (errors.TransportNotPossible, errors.PermissionDenied) as e:
+            mutter('unable to update revno index: %s', e)
+
+    def _do_revision_id_to_dotted_revno(self, revision_id):
+        """See Branch._do_revision_id_to_dotted_revno."""
+        index = None
+        if not _mod_revision.is_null(revision_id):
+            index = self._get_revno_index()
+        if index is not None:
+            result = index.get_dotted_revno(revision_id)
+            if result is not None:
+                return result
+            if index.is_complete():
+                raise errors.NoSuchRevision(self, revision_id)
+        return super(BzrBranch, self)._do_revision_id_to_dotted_revno(
+            revision_id)
+
+    def _do_revision_ids_to_dotted_revnos(self, revision_ids):
+        """See Branch._do_revision_ids_to_dotted_revnos."""
+        index = self._get_revno_index()
+        if index is None:
+            return super(BzrBranch, self)._do_revision_ids_to_dotted_revnos(
+                revision_ids)
+        result = {}
+        missing = []
+        for revision_id in revision_ids:
+            revno = index.get_dotted_revno(revision_id)
+            if revno is not None:
+                result[revision_id] = revno
+            elif not index.is_complete():
+                missing.append(revision_id)
+        if missing:
+            mapping = self.get_revision_id_to_revno_map()
+            result.update((revision_id, mapping[revision_id])
+                          for revision_id in missing
+                          if revision_id in mapping)
+        return result
+
+    def _do_dotted_revno_to_revision_id(self, revno):
+        """See Branch._do_dotted_revno_to_revision_id."""
+        index = self._get_revno_index()
+        if index is not None:
+            revision_id = index.get_revision_id(revno)
+            if revision_id is not None:
+                return revision_id
+        return super(BzrBranch, self)._do_dotted_revno_to_revision_id(revno)
 
     def reconcile(self, thorough=True):
         """Make sure the data stored in this branch is consistent."""
@@ -477,6 +570,19 @@ class BzrBranch(Branch, _RelockDebugMixin):
             possible_transports=possible_transports)
 
 
+def _update_revno_index(params):
+    """post_change_branch_tip hook that updates the persistent revno index.
+    """
+    update_revno_index = getattr(params.branch, '_update_revno_index', None)
+    if update_revno_index is not None:
+        update_revno_index()
+
+
+install_lazy_named_hook("breezy.branch", "Branch.hooks",
+                        "post_change_branch_tip", _update_revno_index,
+                        "revno index")
+
+
 class BzrBranch8(BzrBranch):
     """A branch that stores tree-reference locations."""
 
@@ -664,6 +770,12 @@ class BzrBranch8(BzrBranch):
             if history is not None:
                 return history[revno - 1]
 
+            revno_index = self._get_revno_index()
+            if revno_index is not None:
+                revision_id = revno_index.get_revision_id((revno,))
+                if revision_id is not None:
+                    return revision_id
+
             index = last_revno - revno
             if len(self._partial_revision_history_cache) <= index:
                 self._extend_partial_history(stop_index=index)
@@ -677,6 +789,13 @@ class BzrBranch8(BzrBranch):
         if _mod_revision.is_null(revision_id):
             return 0
         with self.lock_read():
+            revno_index = self._get_revno_index()
+            if revno_index is not None:
+                revno = revno_index.get_dotted_revno(revision_id)
+                if revno is not None:
+                    if len(revno) > 1:
+                        raise errors.NoSuchRevision(self, revision_id)
+                    return revno[0]
             try:
                 index = self._partial_revision_history_cache.index(revision_id)
             except ValueError:
@@ -23,13 +23,18 @@ from ..lazy_import import lazy_import
 lazy_import(globals(), """
 import bisect
 import math
+import mmap
+import sys
 import tempfile
 import zlib
+
+from breezy.transport import local
 """)
 
 from .. import (
     chunk_writer,
     debug,
+    errors,
     fifo_cache,
     lru_cache,
     osutils,
@@ -38,6 +43,7 @@ from .. import (
     transport,
     )
 from . import (
+    bloom,
     index,
     )
 from .index import _OPTION_NODE_REFS, _OPTION_KEY_ELEMENTS, _OPTION_LEN
@@ -55,6 +61,9 @@ _PAGE_SIZE = 4096
 # 4K per page: 4MB - 1000 entries
 _NODE_CACHE_SIZE = 1000
 
+# Whether indices on a local transport are read through a memory map.
+_use_mmap = (sys.platform != 'win32')
+
 
 class _BuilderRow(object):
     """The stored state accumulated while writing out a row in the index.
@@ -449,6 +458,16 @@ class BTreeBuilder(index.GraphIndexBuilder):
         """
         return self._write_nodes(self.iter_all_entries())[0]
 
+    def finish_bloom_filter(self):
+        """Build a bloom filter for the keys added to the index.
+
+        :return: The serialised bloom filter (see breezy.bzr.bloom).
+        """
+        bloom_filter = bloom.BloomFilter.for_key_count(self.key_count())
+        for node in self.iter_all_entries():
+            bloom_filter.add(node[1])
+        return bloom_filter.to_bytes()
+
     def iter_all_entries(self):
         """Iterate over all keys within the index
 
@@ -620,6 +639,81 @@ class _LeafNode(dict):
         return keys
 
 
+class _LazyLeafNode(object):
+    """A leaf node that only parses the entries that are looked up.
+
+    The serialised lines of the page are kept and bisected directly: a
+    key joined with NUL bytes sorts the same way as the key tuple, so finding
+    an entry does not require parsing any keys. This avoids building a dict
+    for every page when only a few of its keys are wanted.
+    """
+
+    __slots__ = ('min_key', 'max_key', '_lines', '_key_length',
+                 '_ref_list_length')
+
+    def __init__(self, bytes, key_length, ref_list_length):
+        """Create a leaf node object for the serialised page bytes."""
+        # splitlines mangles the \r delimiters.. don't use it.
+        lines = bytes.split(b'\n')
+        del lines[0]
+        try:
+            del lines[lines.index(b''):]
+        except ValueError:
+            pass
+        self._lines = lines
+        self._key_length = key_length
+        self._ref_list_length = ref_list_length
+        if lines:
+            self.min_key = self._parse_key(lines[0])
+            self.max_key = self._parse_key(lines[-1])
+        else:
+            self.min_key = self.max_key = None
+
+    def _parse_key(self, line):
+        return static_tuple.StaticTuple.from_sequence(
+            line.split(b'\0', self._key_length)[:self._key_length]).intern()
+
+    def _find(self, key):
+        """Return the line for key, or None if it is not in this node."""
+        if len(key) != self._key_length:
+            return None
+        try:
+            prefix = b'\0'.join(key) + b'\0'
+        except TypeError:
+            # Not a key of bytestrings, so it can't be in the index.
+            return None
+        lines = self._lines
+        pos = bisect.bisect_left(lines, prefix)
+        if pos < len(lines) and lines[pos].startswith(prefix):
+            return lines[pos]
+        return None
+
+    def _parse_lines(self, lines):
+        return _btree_serializer._parse_leaf_lines(
+            _LEAF_FLAG + b'\n'.join(lines) + b'\n', self._key_length,
+            self._ref_list_length)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __getitem__(self, key):
+        line = self._find(key)
+        if line is None:
+            raise KeyError(key)
+        return self._parse_lines([line])[0][1]
+
+    def __len__(self):
+        return len(self._lines)
+
+    def all_items(self):
+        """Return a sorted list of (key, (value, refs)) items"""
+        return self._parse_lines(self._lines)
+
+    def all_keys(self):
+        """Return a sorted list of all keys."""
+        return [self._parse_key(line) for line in self._lines]
+
+
 class _InternalNode(object):
     """An internal node for a serialised B+Tree index."""
 
@@ -671,6 +765,10 @@ class BTreeGraphIndex(object):
         self._name = name
         self._size = size
         self._file = None
+        self._mmap = None
+        # Name of an optional bloom filter sidecar for the keys of the index
+        self._bloom_name = None
+        self._bloom_filter = None
         self._recommended_pages = self._compute_recommended_pages()
         self._root_node = None
         self._base_offset = offset
@@ -1464,6 +1562,59 @@ class BTreeGraphIndex(object):
         header_end = (len(signature) + sum(map(len, lines[0:4])) + 4)
         return header_end, bytes[header_end:]
 
+    def get_bloom_filter(self):
+        """Return the bloom filter for the keys in this index.
+
+        :return: A BloomFilter, or None if the index does not have one.
+        """
+        if self._bloom_filter is None:
+            self._bloom_filter = False
+            if self._bloom_name is not None:
+                try:
+                    self._bloom_filter = bloom.BloomFilter.from_bytes(
+                        self._transport.get_bytes(self._bloom_name),
+                        self._bloom_name)
+                except errors.NoSuchFile:
+                    pass
+                except bloom.BadBloomFilter as e:
+                    trace.mutter('ignoring bloom filter: %s', e)
+        if self._bloom_filter is False:
+            return None
+        return self._bloom_filter
+
+    def _get_mapped_file(self):
+        """Return a memoryview of the index file mapped into memory.
+
+        Only indices on a local transport are mapped; for those the pages are
+        served from the OS page cache without going through readv.
+
+        :return: A memoryview, or None if the file can not be mapped.
+        """
+        if self._mmap is None:
+            self._mmap = False
+            if _use_mmap and isinstance(self._transport, local.LocalTransport):
+                try:
+                    with open(self._transport.local_abspath(self._name),
+                              'rb') as f:
+                        try:
+                            # Don't hold on to a file descriptor per index
+                            # where Python allows it.
+                            mapped = mmap.mmap(f.fileno(), 0,
+                                               access=mmap.ACCESS_READ,
+                                               trackfd=False)
+                        except TypeError:
+                            mapped = mmap.mmap(f.fileno(), 0,
+                                               access=mmap.ACCESS_READ)
+                except (OSError, ValueError) as e:
+                    # Missing or empty files can not be mapped, let the
+                    # transport report on those.
+                    trace.mutter('not mapping %s: %s', self._name, e)
+                else:
+                    self._mmap = memoryview(mapped)
+        if self._mmap is False:
+            return None
+        return self._mmap
+
     def _read_nodes(self, nodes):
         """Read some nodes from disk into the LRU cache.
 
@@ -1476,9 +1627,16 @@ class BTreeGraphIndex(object):
         :return: None
         """
         # may be the byte string of the whole file
-        bytes = None
+        all_data = None
+        mapped = None
+        leaf_factory = self._leaf_factory
+        if self._file is None:
+            mapped = self._get_mapped_file()
+            if mapped is not None and leaf_factory is _LeafNode:
+                leaf_factory = _LazyLeafNode
         # list of (offset, length) regions of the file that should, evenually
-        # be read in to data_ranges, either from 'bytes' or from the transport
+        # be read in to data_ranges, either from 'all_data' or from the
+        # transport
         ranges = []
         base_offset = self._base_offset
         for index in nodes:
@@ -1491,10 +1649,13 @@ class BTreeGraphIndex(object):
                 else:
                     # The only case where we don't know the size, is for very
                     # small indexes. So we read the whole thing
-                    bytes = self._transport.get_bytes(self._name)
-                    num_bytes = len(bytes)
+                    if mapped is not None:
+                        all_data = mapped
+                    else:
+                        all_data = self._transport.get_bytes(self._name)
+                    num_bytes = len(all_data)
                     self._size = num_bytes - base_offset
-                    # the whole thing should be parsed out of 'bytes'
+                    # the whole thing should be parsed out of 'all_data'
                     ranges = [(start, min(_PAGE_SIZE, num_bytes - start))
                               for start in range(
                                   base_offset, num_bytes, _PAGE_SIZE)]
@@ -1508,9 +1669,12 @@ class BTreeGraphIndex(object):
             ranges.append((base_offset + offset, size))
         if not ranges:
             return
-        elif bytes is not None:
+        elif mapped is not None:
+            data_ranges = [(start, mapped[start:start + size])
+                           for start, size in ranges]
+        elif all_data is not None:
             # already have the whole file
-            data_ranges = [(start, bytes[start:start + size])
+            data_ranges = [(start, all_data[start:start + size])
                            for start, size in ranges]
         elif self._file is None:
             data_ranges = self._transport.readv(self._name, ranges)
@@ -1523,17 +1687,17 @@ class BTreeGraphIndex(object):
             offset -= base_offset
             if offset == 0:
                 # extract the header
-                offset, data = self._parse_header_from_bytes(data)
+                offset, data = self._parse_header_from_bytes(bytes(data))
                 if len(data) == 0:
                     continue
-            bytes = zlib.decompress(data)
-            if bytes.startswith(_LEAF_FLAG):
-                node = self._leaf_factory(bytes, self._key_length,
-                                          self.node_ref_lists)
-            elif bytes.startswith(_INTERNAL_FLAG):
-                node = _InternalNode(bytes)
+            node_bytes = zlib.decompress(data)
+            if node_bytes.startswith(_LEAF_FLAG):
+                node = leaf_factory(node_bytes, self._key_length,
+                                    self.node_ref_lists)
+            elif node_bytes.startswith(_INTERNAL_FLAG):
+                node = _InternalNode(node_bytes)
             else:
-                raise AssertionError("Unknown node type for %r" % bytes)
+                raise AssertionError("Unknown node type for %r" % node_bytes)
             yield offset // _PAGE_SIZE, node
 
     def _signature(self):
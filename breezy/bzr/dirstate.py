@@ -219,6 +219,7 @@ desired.
 """
 
 import bisect
+from concurrent import futures
 import contextlib
 import errno
 import operator
@@ -301,6 +302,92 @@ class DefaultSHA1Provider(SHA1Provider):
         return statvalue, sha1
 
 
+class _PrefetchingSHA1Provider(SHA1Provider):
+    """A SHA1Provider that hashes files ahead of time on a thread pool.
+
+    iter_changes hashes the files whose stat fingerprint is out of date one
+    at a time, as it compares them. When the contents of a directory are
+    read from disk, the files of it that are likely to be hashed are queued
+    on a thread pool instead, so that hashing (during which hashlib
+    releases the GIL) overlaps with the comparison. Files that were not
+    queued are hashed inline by the wrapped provider.
+    """
+
+    def __init__(self, provider, executor):
+        self._provider = provider
+        self._executor = executor
+        self._pending = {}
+
+    def _take(self, abspath):
+        future = self._pending.pop(abspath, None)
+        if future is None:
+            return None
+        return future.result()
+
+    def sha1(self, abspath):
+        """Return the sha1 of a file given its absolute path."""
+        result = self._take(abspath)
+        if result is None:
+            return self._provider.sha1(abspath)
+        return result[1]
+
+    def stat_and_sha1(self, abspath):
+        """Return the stat and sha1 of a file given its absolute path."""
+        result = self._take(abspath)
+        if result is None:
+            return self._provider.stat_and_sha1(abspath)
+        return result
+
+    def clear(self):
+        """Forget about the files that have been queued but not used."""
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+
+    def prefetch_directory(self, state, dir_info):
+        """Queue the files in a directory whose fingerprint is out of date.
+
+        :param state: The DirState with the entries for the directory.
+        :param dir_info: A directory as yielded by osutils._walkdirs_utf8.
+        """
+        self.clear()
+        dirname = dir_info[0][0]
+        if dirname == b'':
+            # The contents of the root are in the second block.
+            block_index, present = 1, True
+        else:
+            block_index, present = state._find_block_index_from_key(
+                (dirname, b'', b''))
+        if not present:
+            return
+        entries = {}
+        for entry in state._dirblocks[block_index][1]:
+            if entry[1][0][0] == b'f':
+                entries.setdefault(entry[0][1], []).append(entry)
+        for _, basename, kind, lstat, abspath in dir_info[1]:
+            if kind != 'file':
+                continue
+            for entry in entries.get(basename, ()):
+                details = entry[1][0]
+                if (details[4] == pack_stat(lstat) and
+                        details[2] == lstat.st_size):
+                    # The saved sha1 can be used.
+                    continue
+                if not any(parent[0] in (b'f', b'r')
+                           for parent in entry[1][1:]):
+                    # There is nothing to compare the sha1 with.
+                    continue
+                self._pending[abspath] = self._executor.submit(
+                    self._provider.stat_and_sha1, abspath)
+                break
+
+    def iter_prefetching(self, state, dir_iterator):
+        """Prefetch the sha1s for each directory yielded by dir_iterator."""
+        for dir_info in dir_iterator:
+            self.prefetch_directory(state, dir_info)
+            yield dir_info
+
+
 class DirState(object):
     """Record directory and metadata state for fast access.
 
@@ -408,6 +495,7 @@ class DirState(object):
             self._sha1_file = self._sha1_file_and_mutter
         else:
             self._sha1_file = self._sha1_provider.sha1
+        self._sha1_prefetcher = None
         # These two attributes provide a simple cache for lookups into the
         # dirstate in-memory vectors. By probing respectively for the last
         # block, and for the next entry, we save nearly 2 bisections per path
@@ -1936,6 +2024,45 @@ class DirState(object):
         """Return the os.lstat value for this path."""
         return os.lstat(abspath)
 
+    @contextlib.contextmanager
+    def _prefetching_sha1s(self, threads):
+        """Compute sha1s on a pool of threads while the context is active.
+
+        The directories walked with _walk_disk() have the files that
+        need hashing queued on the pool as soon as they are read.
+
+        :param threads: The number of threads to hash files with.
+        """
+        if self._sha1_prefetcher is not None:
+            yield
+            return
+        old_provider = self._sha1_provider
+        old_sha1_file = self._sha1_file
+        with futures.ThreadPoolExecutor(threads) as executor:
+            prefetcher = _PrefetchingSHA1Provider(old_provider, executor)
+            self._sha1_prefetcher = prefetcher
+            self._sha1_provider = prefetcher
+            if old_sha1_file == old_provider.sha1:
+                self._sha1_file = prefetcher.sha1
+            try:
+                yield
+            finally:
+                prefetcher.clear()
+                self._sha1_prefetcher = None
+                self._sha1_provider = old_provider
+                self._sha1_file = old_sha1_file
+
+    def _walk_disk(self, top, prefix=b''):
+        """Walk the directories on disk below top.
+
+        This returns osutils._walkdirs_utf8(top, prefix), queueing the files
+        that need hashing for each directory if sha1s are being prefetched.
+        """
+        dir_iterator = osutils._walkdirs_utf8(top, prefix=prefix)
+        if self._sha1_prefetcher is None:
+            return dir_iterator
+        return self._sha1_prefetcher.iter_prefetching(self, dir_iterator)
+
     def _sha1_file_and_mutter(self, abspath):
         # when -Dhashcache is turned on, this is monkey-patched in to log
         # file reads
@@ -3980,7 +4107,7 @@ class ProcessEntryPython(object):
             if root_dir_info and root_dir_info[2] == 'tree-reference':
                 current_dir_info = None
             else:
-                dir_iterator = osutils._walkdirs_utf8(
+                dir_iterator = self.state._walk_disk(
                     root_abspath, prefix=current_root)
                 try:
                     current_dir_info = next(dir_iterator)
@@ -59,6 +59,10 @@ from .versionedfile import (
 # groupcompress blocks.
 BATCH_SIZE = 2**16
 
+# Number of bytes to try fetch at once per concurrent reader, when the
+# underlying access object can read from several packs concurrently.
+CONCURRENT_BATCH_SIZE = 2**20
+
 # osutils.sha_string(b'')
 _null_sha1 = b'da39a3ee5e6b4b0d3255bfef95601890afd80709'
 
@@ -1646,6 +1650,13 @@ class GroupCompressVersionedFiles(VersionedFilesWithFallbacks):
         #  - we encounter an unadded ref, or
         #  - we run out of keys, or
         #  - the total bytes to retrieve for this batch > BATCH_SIZE
+        batch_size = BATCH_SIZE
+        max_concurrent_reads = getattr(
+            self._access, 'max_concurrent_reads', 1)
+        if max_concurrent_reads > 1:
+            # Make batches big enough to span blocks in several packs, so
+            # that they can be read concurrently.
+            batch_size = CONCURRENT_BATCH_SIZE * max_concurrent_reads
         batcher = _BatchingBlockFetcher(self, locations,
                                         get_compressor_settings=self._get_compressor_settings)
         for source, keys in source_keys:
@@ -1660,7 +1671,7 @@ class GroupCompressVersionedFiles(VersionedFilesWithFallbacks):
                         parents = self._unadded_refs[key]
                         yield ChunkedContentFactory(key, parents, sha1, chunks)
                         continue
-                    if batcher.add_key(key) > BATCH_SIZE:
+                    if batcher.add_key(key) > batch_size:
                         # Ok, this batch is big enough.  Yield some results.
                         for factory in batcher.yield_factories():
                             yield factory
@@ -18,6 +18,13 @@
 
 import time
 
+from ..lazy_import import lazy_import
+lazy_import(globals(), """
+import multiprocessing
+
+from breezy import transport as _mod_transport
+from breezy.transport import local
+""")
 from .. import (
     controldir,
     debug,
@@ -188,6 +195,87 @@ class ResumedGCPack(ResumedPack):
         return set()
 
 
+class _BlockCollector(object):
+    """Access object that keeps groupcompress blocks in memory.
+
+    Blocks are addressed by their position in ``blocks`` rather than by an
+    offset into a pack file.
+    """
+
+    def __init__(self):
+        self.blocks = []
+
+    def add_raw_record(self, key, size, raw_data):
+        self.blocks.append(b''.join(raw_data))
+        return (None, len(self.blocks) - 1, size)
+
+
+def _recompress_texts(job):
+    """Compress file texts into new groupcompress blocks.
+
+    This is run in worker processes by GCCHKPacker, so it only uses its
+    arguments rather than the repository objects of the parent process.
+
+    :param job: A (packs, keys) tuple. packs is a list of (index url, index
+        name, index size, pack url, pack name) tuples describing the text
+        indices and pack files to read from, keys are the text keys to
+        compress.
+    :return: A (blocks, nodes) tuple. blocks is a list of serialised
+        groupcompress blocks and nodes a list of (key, value, refs) text
+        index nodes whose values refer to blocks by their position in that
+        list.
+    """
+    packs, keys = job
+    index_to_pack = {}
+    indices = []
+    for index_url, index_name, index_size, pack_url, pack_name in packs:
+        index = BTreeGraphIndex(_mod_transport.get_transport_from_url(
+            index_url), index_name, index_size)
+        index_to_pack[index] = (
+            _mod_transport.get_transport_from_url(pack_url), pack_name)
+        indices.append(index)
+    source_vf = GroupCompressVersionedFiles(
+        _GCGraphIndex(_mod_index.CombinedGraphIndex(indices),
+                      parents=True, is_locked=lambda: True),
+        access=_DirectPackAccess(index_to_pack), delta=True)
+    builder = BTreeBuilder(reference_lists=1, key_elements=2)
+    collector = _BlockCollector()
+    target_vf = GroupCompressVersionedFiles(
+        _GCGraphIndex(builder, add_callback=builder.add_nodes,
+                      parents=True, is_locked=lambda: True),
+        access=collector, delta=True)
+    stream = source_vf.get_record_stream(keys, 'groupcompress', True)
+    for _ in target_vf._insert_record_stream(
+            stream, random_id=True, reuse_blocks=False):
+        pass
+    nodes = [(key, value, refs)
+             for _, key, value, refs in builder.iter_all_entries()]
+    return collector.blocks, nodes
+
+
+def _partition_text_keys(keys, count):
+    """Split text keys into about count groups of similar size.
+
+    Texts of the same file are always kept together, as groupcompress
+    compresses them against each other, and the groups are returned in
+    the same file order that sort_gc_optimal uses.
+    """
+    per_prefix = {}
+    for key in keys:
+        per_prefix.setdefault(key[:-1], []).append(key)
+    target_size = max(1, len(keys) // count)
+    partitions = []
+    current = []
+    for prefix in sorted(per_prefix):
+        current.extend(per_prefix[prefix])
+        if len(current) >= target_size:
+            partitions.append(current)
+            current = []
+    if current:
+        partitions.append(current)
+    return partitions
+
+
 class GCCHKPacker(Packer):
     """This class understand what it takes to collect a GCCHK repo."""
 
@@ -472,9 +560,72 @@ class GCCHKPacker(Packer):
         #      rev just before the ones you are copying, otherwise the filter
         #      is grabbing too many keys...
         text_keys = source_vf.keys()
+        processes = self._pack_collection.config_stack.get(
+            'repository.pack_processes')
+        if processes > 1 and self._can_copy_texts_in_processes():
+            self._copy_texts_in_processes(target_vf, text_keys, processes, 4)
+            return
         self._copy_stream(source_vf, target_vf, text_keys,
                           'texts', self._get_progress_stream, 4)
 
+    def _can_copy_texts_in_processes(self):
+        """Can the worker processes read the packs being combined?
+
+        Workers open the pack files themselves, which is only done for local
+        packs so that they don't need to reconnect or authenticate.
+        """
+        for pack in self.packs:
+            if not (isinstance(pack.pack_transport, local.LocalTransport) and
+                    isinstance(pack.text_index, BTreeGraphIndex) and
+                    isinstance(pack.text_index._transport,
+                               local.LocalTransport)):
+                return False
+        return True
+
+    def _copy_texts_in_processes(self, target_vf, keys, processes,
+                                 pb_offset):
+        """Recompress texts in worker processes and add them to target_vf.
+
+        The keys are split into groups of whole files, each of which is
+        compressed into groupcompress blocks by a worker. The blocks are then
+        appended to the new pack in the order of the groups and their index
+        entries adjusted to the offsets they ended up at.
+        """
+        trace.mutter('repacking %d texts using %d processes', len(keys),
+                     processes)
+        self.pb.update('repacking texts', pb_offset)
+        packs = [(pack.text_index._transport.base, pack.text_index._name,
+                  pack.text_index._size, pack.pack_transport.base,
+                  pack.file_name()) for pack in self.packs]
+        # Use more groups than processes, so the work is spread more evenly
+        # and progress is reported more often.
+        partitions = _partition_text_keys(keys, processes * 4)
+        done = 0
+        with ui.ui_factory.nested_progress_bar() as child_pb, \
+                multiprocessing.Pool(processes) as pool:
+            child_pb.update('texts', done, len(keys))
+            results = pool.imap(
+                _recompress_texts,
+                [(packs, partition) for partition in partitions])
+            for partition, (blocks, nodes) in zip(partitions, results):
+                self._add_recompressed_texts(target_vf, blocks, nodes)
+                done += len(partition)
+                child_pb.update('texts', done, len(keys))
+
+    def _add_recompressed_texts(self, target_vf, blocks, nodes):
+        """Add the output of _recompress_texts to target_vf."""
+        memos = []
+        for block in blocks:
+            _, start, length = target_vf._access.add_raw_record(
+                None, len(block), [block])
+            memos.append(b'%d %d' % (start, length))
+        records = []
+        for key, value, refs in nodes:
+            block_number, _, reads = value.split(b' ', 2)
+            records.append(
+                (key, b'%s %s' % (memos[int(block_number)], reads), refs))
+        target_vf._index.add_records(records, random_id=True)
+
     def _copy_signature_texts(self):
         source_vf, target_vf = self._build_vfs('signature', False, False)
         signature_keys = source_vf.keys()
@@ -1396,7 +1396,17 @@ class CombinedGraphIndex(object):
                     if not keys:
                         break
                     index_hit = False
-                    for node in index.iter_entries(keys):
+                    search_keys = keys
+                    get_bloom_filter = getattr(index, 'get_bloom_filter', None)
+                    if get_bloom_filter is not None:
+                        bloom_filter = get_bloom_filter()
+                        if bloom_filter is not None:
+                            # Skip the keys the index certainly doesn't have
+                            search_keys = [key for key in keys
+                                           if key in bloom_filter]
+                            if not search_keys:
+                                continue
+                    for node in index.iter_entries(search_keys):
                         keys.remove(node[1])
                         yield node
                         index_hit = True
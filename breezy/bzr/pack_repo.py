@@ -19,7 +19,10 @@ import sys
 
 from ..lazy_import import lazy_import
 lazy_import(globals(), """
+import collections
+from concurrent import futures
 import contextlib
+import threading
 import time
 
 from breezy import (
@@ -68,7 +71,10 @@ from ..trace import (
     note,
     warning,
     )
+from ..transport import ConnectedTransport
 
+# Suffix of the optional bloom filter written next to each pack index.
+_BLOOM_SUFFIX = '.bloom'
 
 class PackCommitBuilder(VersionedFileCommitBuilder):
     """Subclass of VersionedFileCommitBuilder to add texts with pack semantics.
@@ -195,7 +201,7 @@ class Pack(object):
         """The text index is the name + .tix."""
         return self.index_name('text', name)
 
-    def _replace_index_with_readonly(self, index_type):
+    def _replace_index_with_readonly(self, index_type, bloom_name=None):
         unlimited_cache = False
         if index_type == 'chk':
             unlimited_cache = True
@@ -206,6 +212,8 @@ class Pack(object):
                                  unlimited_cache=unlimited_cache)
         if index_type == 'chk':
             index._leaf_factory = btree_index._gcchk_factory
+        if bloom_name is not None:
+            index._bloom_name = bloom_name
         setattr(self, index_type + '_index', index)
 
     def __lt__(self, other):
@@ -538,6 +546,15 @@ class NewPack(Pack):
         write_stream.write(index_bytes)
         write_stream.close(
             want_fdatasync=self._pack_collection.config_stack.get('repository.fdatasync'))
+        bloom_name = None
+        if (not suspend and isinstance(index, btree_index.BTreeBuilder) and
+                self._pack_collection.config_stack.get(
+                    'repository.bloom_filters')):
+            # Clients that don't know about bloom filters simply ignore the
+            # extra file.
+            bloom_name = index_name + _BLOOM_SUFFIX
+            transport.put_bytes(bloom_name, index.finish_bloom_filter(),
+                                mode=self._file_mode)
         self.index_sizes[self.index_offset(index_type)] = len(index_bytes)
         if 'pack' in debug.debug_flags:
             # XXX: size might be interesting?
@@ -548,7 +565,7 @@ class NewPack(Pack):
         # presently unloaded index. We should alter
         # the index layer to make its finish() error if add_node is
         # subsequently used. RBC
-        self._replace_index_with_readonly(index_type)
+        self._replace_index_with_readonly(index_type, bloom_name)
 
 
 class AggregateIndex(object):
@@ -823,6 +840,8 @@ class RepositoryPackCollection(object):
         # resumed packs
         self._resumed_packs = []
         self.config_stack = config.LocationStack(self.transport.base)
+        # whether to consult the bloom filters of pack indices
+        self._use_bloom_filters = False
 
     def __repr__(self):
         return '%s(%r)' % (self.__class__.__name__, self.repo)
@@ -856,7 +875,7 @@ class RepositoryPackCollection(object):
             result.append(self.get_pack_by_name(name))
         return result
 
-    def autopack(self):
+    def autopack(self, max_bytes=None):
         """Pack the pack collection incrementally.
 
         This will not attempt global reorganisation or recompression,
@@ -870,17 +889,23 @@ class RepositoryPackCollection(object):
         in synchronisation with certain steps. Otherwise the names collection
         is not flushed.
 
+        :param max_bytes: The maximum number of bytes of existing packs to
+            combine; the rest of the work is left for a later autopack. None
+            means to use the repository.autopack_max_bytes option, 0 means
+            no limit.
         :return: Something evaluating true if packing took place.
         """
+        if max_bytes is None:
+            max_bytes = self.config_stack.get('repository.autopack_max_bytes')
         while True:
             try:
-                return self._do_autopack()
+                return self._do_autopack(max_bytes)
             except errors.RetryAutopack:
                 # If we get a RetryAutopack exception, we should abort the
                 # current action, and retry.
                 pass
 
-    def _do_autopack(self):
+    def _do_autopack(self, max_bytes=0):
         # XXX: Should not be needed when the management of indices is sane.
         total_revisions = self.revision_index.combined_index.key_count()
         total_packs = len(self._names)
@@ -906,6 +931,13 @@ class RepositoryPackCollection(object):
             existing_packs.append((revision_count, pack))
         pack_operations = self.plan_autopack_combinations(
             existing_packs, pack_distribution)
+        if max_bytes > 0:
+            pack_operations = self._limit_pack_operations(
+                pack_operations, max_bytes)
+            if not pack_operations:
+                mutter('Deferring auto-packing of repository %s, no packs fit'
+                       ' in %d bytes', str(self), max_bytes)
+                return None
         num_new_packs = len(pack_operations)
         num_old_packs = sum([len(po[1]) for po in pack_operations])
         num_revs_affected = sum([po[0] for po in pack_operations])
@@ -919,6 +951,35 @@ class RepositoryPackCollection(object):
         mutter('Auto-packing repository %s completed', str(self))
         return result
 
+    def _limit_pack_operations(self, pack_operations, max_bytes):
+        """Restrict pack operations to combining at most max_bytes of packs.
+
+        The smallest packs are chosen first, as combining those reduces the
+        number of packs the most for the least work.
+
+        :param pack_operations: A list of [revision_count, packs_to_combine].
+        :param max_bytes: The maximum total size of the packs to combine.
+        :return: A list of pack operations, which is empty if fewer than two
+            packs fit in max_bytes.
+        """
+        sized_packs = []
+        for _, packs in pack_operations:
+            for pack in packs:
+                size = pack.pack_transport.stat(pack.file_name()).st_size
+                sized_packs.append((size, pack.name, pack))
+        sized_packs.sort()
+        total_bytes = 0
+        chosen = []
+        for size, _, pack in sized_packs:
+            if total_bytes + size > max_bytes:
+                break
+            total_bytes += size
+            chosen.append(pack)
+        if len(chosen) < 2:
+            return []
+        revision_count = sum(pack.get_revision_count() for pack in chosen)
+        return [[revision_count, chosen]]
+
     def _execute_pack_operations(self, pack_operations, packer_class,
                                  reload_func=None):
         """Execute a series of pack operations.
@@ -1072,6 +1133,10 @@ class RepositoryPackCollection(object):
         if not self.repo.is_locked():
             raise errors.ObjectNotLocked(self.repo)
         if self._names is None:
+            self._set_max_concurrent_reads(
+                self.config_stack.get('repository.max_concurrent_reads'))
+            self._use_bloom_filters = self.config_stack.get(
+                'repository.bloom_filters')
             self._names = {}
             self._packs_at_load = set()
             for index, key, value in self._iter_disk_pack_index():
@@ -1085,6 +1150,23 @@ class RepositoryPackCollection(object):
         self.all_packs()
         return result
 
+    def _set_max_concurrent_reads(self, max_concurrent_reads):
+        """Set how many packs may be read from concurrently."""
+        for aggregate_index in (self.revision_index, self.inventory_index,
+                                self.text_index, self.signature_index,
+                                self.chk_index):
+            if aggregate_index is not None:
+                aggregate_index.data_access.max_concurrent_reads = (
+                    max_concurrent_reads)
+
+    def _close_readers(self):
+        """Release the threads and connections used for concurrent reads."""
+        for aggregate_index in (self.revision_index, self.inventory_index,
+                                self.text_index, self.signature_index,
+                                self.chk_index):
+            if aggregate_index is not None:
+                aggregate_index.data_access.close()
+
     def _parse_index_sizes(self, value):
         """Parse a string of index sizes."""
         return tuple(int(digits) for digits in value.split(b' '))
@@ -1176,8 +1258,11 @@ class RepositoryPackCollection(object):
             index_size = self._names[name][size_offset]
         index = self._index_class(transport, index_name, index_size,
                                   unlimited_cache=is_chk)
-        if is_chk and self._index_class is btree_index.BTreeGraphIndex:
-            index._leaf_factory = btree_index._gcchk_factory
+        if self._index_class is btree_index.BTreeGraphIndex:
+            if is_chk:
+                index._leaf_factory = btree_index._gcchk_factory
+            if self._use_bloom_filters and not resume:
+                index._bloom_name = index_name + _BLOOM_SUFFIX
         return index
 
     def _max_pack_count(self, total_revisions):
@@ -1242,6 +1327,18 @@ class RepositoryPackCollection(object):
                 except (errors.PathError, errors.TransportError) as e:
                     mutter("couldn't rename obsolete index, skipping it:\n%s"
                            % (e,))
+                # Always look for bloom filters, as they may have been written
+                # while the repository.bloom_filters option was set.
+                bloom_name = pack.name + suffix + _BLOOM_SUFFIX
+                try:
+                    self._index_transport.move(
+                        bloom_name, '../obsolete_packs/' + bloom_name)
+                except errors.NoSuchFile:
+                    # Not every pack has bloom filters.
+                    pass
+                except (errors.PathError, errors.TransportError) as e:
+                    mutter("couldn't rename obsolete bloom filter, "
+                           "skipping it:\n%s" % (e,))
 
     def pack_distribution(self, total_revisions):
         """Generate a list of the number of revisions to put in each pack.
@@ -1292,6 +1389,7 @@ class RepositoryPackCollection(object):
 
     def reset(self):
         """Clear all cached data."""
+        self._close_readers()
         # cached revision data
         self.revision_index.clear()
         # cached signature data
@@ -1501,6 +1599,8 @@ class RepositoryPackCollection(object):
             return found
         for filename in obsolete_pack_files:
             name, ext = osutils.splitext(filename)
+            if ext == _BLOOM_SUFFIX:
+                name = osutils.splitext(name)[0]
             if ext == '.pack':
                 found.append(name)
             if name in preserve:
@@ -1811,6 +1911,17 @@ class PackRepository(MetaDirVersionedFileRepository):
             self._pack_collection.pack(
                 hint=hint, clean_obsolete_packs=clean_obsolete_packs)
 
+    def autopack(self):
+        """Combine packs the way automatic packing does.
+
+        Unlike the automatic packing done when committing a write group,
+        this is not limited by the repository.autopack_max_bytes option, so
+        it completes any packing work that was deferred.
+        """
+        with self.lock_write():
+            self._pack_collection.ensure_loaded()
+            self._pack_collection.autopack(max_bytes=0)
+
     def reconcile(self, other=None, thorough=False):
         """Reconcile this repository."""
         from .reconcile import PackReconciler
@@ -1842,6 +1953,7 @@ class PackRepository(MetaDirVersionedFileRepository):
 
         if not self.is_locked():
             self._unstacked_provider.disable_cache()
+            self._pack_collection._close_readers()
             for repo in self._fallback_repositories:
                 repo.unlock()
 
@@ -1941,7 +2053,14 @@ class RetryPackOperations(errors.RetryWithNewPacks):
 
 
 class _DirectPackAccess(object):
-    """Access to data in one or more packs with less translation."""
+    """Access to data in one or more packs with less translation.
+
+    :ivar max_concurrent_reads: The maximum number of packs to read from
+        concurrently when records from several packs are requested at once.
+        See the repository.max_concurrent_reads option.
+    """
+
+    max_concurrent_reads = 1
 
     def __init__(self, index_to_packs, reload_func=None, flush_func=None):
         """Create a _DirectPackAccess object.
@@ -1957,6 +2076,10 @@ class _DirectPackAccess(object):
         self._indices = index_to_packs
         self._reload_func = reload_func
         self._flush_func = flush_func
+        self._reader_lock = threading.Lock()
+        self._reader_transports = {}
+        self._executor = None
+        self._executor_size = None
 
     def add_raw_record(self, key, size, raw_data):
         """Add raw knit bytes to a storage area.
@@ -2032,32 +2155,154 @@ class _DirectPackAccess(object):
         # handle the last entry
         if current_index is not None:
             request_lists.append((current_index, current_list))
+        if (self.max_concurrent_reads > 1 and len(request_lists) > 1 and
+                self._can_read_concurrently(request_lists)):
+            for data in self._iter_records_concurrently(request_lists):
+                yield data
+            return
         for index, offsets in request_lists:
-            try:
-                transport, path = self._indices[index]
-            except KeyError:
-                # A KeyError here indicates that someone has triggered an index
-                # reload, and this index has gone missing, we need to start
-                # over.
-                if self._reload_func is None:
-                    # If we don't have a _reload_func there is nothing that can
-                    # be done
-                    raise
-                raise errors.RetryWithNewPacks(index,
-                                               reload_occurred=True,
-                                               exc_info=sys.exc_info())
-            try:
-                reader = pack.make_readv_reader(transport, path, offsets)
-                for names, read_func in reader.iter_records():
-                    yield read_func(None)
-            except errors.NoSuchFile:
-                # A NoSuchFile error indicates that a pack file has gone
-                # missing on disk, we need to trigger a reload, and start over.
-                if self._reload_func is None:
-                    raise
-                raise errors.RetryWithNewPacks(transport.abspath(path),
-                                               reload_occurred=False,
-                                               exc_info=sys.exc_info())
+            transport, path = self._get_pack_location(index)
+            for data in self._iter_pack_records(transport, path, offsets):
+                yield data
+
+    def _get_pack_location(self, index):
+        """Return the (transport, path) of the pack for index."""
+        try:
+            return self._indices[index]
+        except KeyError:
+            # A KeyError here indicates that someone has triggered an index
+            # reload, and this index has gone missing, we need to start
+            # over.
+            if self._reload_func is None:
+                # If we don't have a _reload_func there is nothing that can
+                # be done
+                raise
+            raise errors.RetryWithNewPacks(index,
+                                           reload_occurred=True,
+                                           exc_info=sys.exc_info())
+
+    def _iter_pack_records(self, transport, path, offsets):
+        """Read the records at offsets from the pack at path."""
+        try:
+            reader = pack.make_readv_reader(transport, path, offsets)
+            for names, read_func in reader.iter_records():
+                yield read_func(None)
+        except errors.NoSuchFile:
+            # A NoSuchFile error indicates that a pack file has gone
+            # missing on disk, we need to trigger a reload, and start over.
+            if self._reload_func is None:
+                raise
+            raise errors.RetryWithNewPacks(transport.abspath(path),
+                                           reload_occurred=False,
+                                           exc_info=sys.exc_info())
+
+    def _can_read_concurrently(self, request_lists):
+        """Check whether the packs for request_lists can be read concurrently.
+
+        Readers open their own connections to connected transports, with the
+        credentials of the existing connection so that the user is never
+        asked for them from a reader thread. Packs on transports that can't
+        do that are read serially.
+        """
+        for index, offsets in request_lists:
+            transport = self._indices.get(index, (None, None))[0]
+            if not isinstance(transport, ConnectedTransport):
+                continue
+            if (getattr(transport, '_create_connection', None) is None or
+                    transport._get_credentials() is None):
+                return False
+        return True
+
+    def _acquire_reader_transport(self, transport):
+        """Get a transport for transport's location for exclusive use.
+
+        Connected transports can not be used from several threads at once,
+        so each concurrent reader uses its own connection. Connections are
+        kept around for later reads; see _release_reader_transport.
+        """
+        if not isinstance(transport, ConnectedTransport):
+            return transport
+        with self._reader_lock:
+            idle = self._reader_transports.get(transport.base)
+            if idle:
+                return idle.pop()
+        reader = transport.__class__(transport.base)
+        connection, credentials = reader._create_connection(
+            transport._get_credentials())
+        reader._set_connection(connection, credentials)
+        return reader
+
+    def _release_reader_transport(self, transport):
+        if not isinstance(transport, ConnectedTransport):
+            return
+        with self._reader_lock:
+            self._reader_transports.setdefault(
+                transport.base, []).append(transport)
+
+    def _read_pack_records(self, index, offsets):
+        transport, path = self._get_pack_location(index)
+        transport = self._acquire_reader_transport(transport)
+        try:
+            return list(self._iter_pack_records(transport, path, offsets))
+        finally:
+            self._release_reader_transport(transport)
+
+    def _iter_records_concurrently(self, request_lists):
+        """Read the records for several packs concurrently.
+
+        At most max_concurrent_reads readv requests are in flight at any
+        time. Records are yielded in the same order as for a serial read.
+        """
+        request_lists = iter(request_lists)
+        pending = collections.deque()
+        pool = self._get_executor()
+        try:
+            for index, offsets in request_lists:
+                pending.append(
+                    pool.submit(self._read_pack_records, index, offsets))
+                if len(pending) >= self.max_concurrent_reads:
+                    break
+            while pending:
+                records = pending.popleft().result()
+                for index, offsets in request_lists:
+                    pending.append(pool.submit(
+                        self._read_pack_records, index, offsets))
+                    break
+                for data in records:
+                    yield data
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _get_executor(self):
+        """Get the thread pool for concurrent reads, creating it if needed."""
+        with self._reader_lock:
+            if (self._executor is None or
+                    self._executor_size != self.max_concurrent_reads):
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._executor = futures.ThreadPoolExecutor(
+                    self.max_concurrent_reads)
+                self._executor_size = self.max_concurrent_reads
+            return self._executor
+
+    def close(self):
+        """Stop the reader threads and disconnect the reader transports.
+
+        The access object can still be used afterwards; threads and
+        connections are set up again as needed.
+        """
+        with self._reader_lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._reader_lock:
+            reader_transports = self._reader_transports
+            self._reader_transports = {}
+        for transports in reader_transports.values():
+            for transport in transports:
+                transport.disconnect()
 
     def set_writer(self, writer, index, transport_packname):
         """Set a writer to use for adding data."""
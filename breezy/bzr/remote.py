@@ -98,6 +98,13 @@ class _RpcHelper(object):
         except errors.ErrorFromSmartServer as err:
             self._translate_error(err, **err_context)
 
+    def _prefetch(self, *calls):
+        """Send read-only calls that are about to be made in one round trip.
+
+        :param calls: (method, args) tuples. See _SmartClient.prefetch.
+        """
+        self._client.prefetch(calls)
+
 
 def response_tuple_to_repo_format(response):
     """Convert a response tuple describing a repository format to a format."""
@@ -829,9 +836,25 @@ class RemoteBzrDir(_mod_bzrdir.BzrDir, _RpcHelper):
             self._next_open_branch_result = None
             return result
         response = self._get_branch_reference()
-        return self._open_branch(name, response[0], response[1],
-                                 possible_transports=possible_transports,
-                                 ignore_fallbacks=ignore_fallbacks)
+        if response[0] == 'branch':
+            self._prefetch_open_branch(ignore_fallbacks)
+        try:
+            return self._open_branch(name, response[0], response[1],
+                                     possible_transports=possible_transports,
+                                     ignore_fallbacks=ignore_fallbacks)
+        finally:
+            self._client.discard_prefetched()
+
+    def _prefetch_open_branch(self, ignore_fallbacks):
+        """Prefetch the responses to the calls made to open a branch.
+
+        Servers that support pipelining support all of these calls.
+        """
+        path = self._path_for_remote_call(self._client)
+        calls = [(b'BzrDir.find_repositoryV3', (path,))]
+        if not ignore_fallbacks:
+            calls.append((b'Branch.get_stacked_on_url', (path,)))
+        self._prefetch(*calls)
 
     def _open_repo_v1(self, path):
         verb = b'BzrDir.find_repository'
@@ -2851,13 +2874,24 @@ class RemoteRepository(_mod_repository.Repository, _RpcHelper,
         parts = search_result.get_network_struct()
         return b'\n'.join(parts)
 
-    def autopack(self):
+    def autopack(self, max_bytes=0):
+        """Combine packs the way automatic packing does.
+
+        :param max_bytes: The maximum number of bytes of existing packs to
+            combine. None means to use the repository.autopack_max_bytes
+            option, 0 means no limit.
+        """
         path = self.controldir._path_for_remote_call(self._client)
         try:
-            response = self._call(b'PackRepository.autopack', path)
+            if max_bytes is None:
+                response = self._call(b'PackRepository.autopack', path)
+            else:
+                response = self._call(
+                    b'PackRepository.autopack_3.2', path, max_bytes)
         except errors.UnknownSmartMethod:
             self._ensure_real()
-            self._real_repository._pack_collection.autopack()
+            self._real_repository._pack_collection.autopack(
+                max_bytes=max_bytes)
             return
         self.refresh_data()
         if response[0] != b'ok':
@@ -2908,7 +2942,7 @@ class RemoteStreamSink(vf_repository.StreamSink):
         sink = self.target_repo._real_repository._get_sink()
         result = sink.insert_stream(stream, src_format, resume_tokens)
         if not result:
-            self.target_repo.autopack()
+            self.target_repo.autopack(max_bytes=None)
         return result
 
     def insert_missing_keys(self, source, missing_keys):
@@ -0,0 +1,334 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Persistent revision id <-> dotted revno index for branches.
+
+The index lives in the branch control directory and records the dotted
+revnos of the ancestry of a particular tip revision. Dotted revnos are
+stable as long as the mainline is only appended to, so when the tip of the
+branch moves forward the index is extended rather than regenerated.
+
+The index consists of two files:
+
+ * ``revno-index`` is a B+Tree index (see ``breezy.bzr.btree_index``) with
+   two element keys. ``(b'revid', revision_id)`` maps to a dotted revno,
+   ``(b'revno', dotted_revno)`` maps back to the revision id and
+   ``(b'meta', b'tip')`` records the tip the index was generated for.
+ * ``revno-index-tail`` is a small, optional text file with the entries
+   added since the B+Tree was written. It is folded into the B+Tree once it
+   grows beyond ``_MAX_TAIL_ENTRIES`` entries.
+
+An index is *complete* when it holds the dotted revno of every revision in
+the ancestry of its tip. Extending an index past a merge of previously
+unseen revisions only records the new mainline revisions, since numbering
+the merged revisions requires a full merge sort; such an index still answers
+lookups for the revisions it knows about but is no longer complete.
+"""
+
+from io import BytesIO
+
+from .. import (
+    errors,
+    revision as _mod_revision,
+    )
+from ..trace import mutter
+from . import (
+    btree_index,
+    index as _mod_index,
+    )
+
+
+REVNO_INDEX_NAME = 'revno-index'
+REVNO_INDEX_TAIL_NAME = 'revno-index-tail'
+
+_TAIL_SIGNATURE = b'Bazaar revno index tail 1\n'
+_META_KEY = (b'meta', b'tip')
+
+# Number of entries the tail may contain before it is folded into the
+# B+Tree.
+_MAX_TAIL_ENTRIES = 1000
+
+
+def revno_to_bytes(revno):
+    """Serialise a dotted revno tuple, e.g. (1, 2, 3) -> b'1.2.3'."""
+    return b'.'.join(b'%d' % r for r in revno)
+
+
+def revno_from_bytes(text):
+    """Parse a serialised dotted revno, e.g. b'1.2.3' -> (1, 2, 3)."""
+    return tuple(int(r) for r in text.split(b'.'))
+
+
+class RevnoIndex(object):
+    """Dotted revno index stored in a branch control directory.
+
+    :ivar tip: (revno, revision_id) of the tip the index is valid for, or
+        None if there is no usable index on disk.
+    :ivar complete: Whether the index contains every revision in the
+        ancestry of tip.
+    """
+
+    def __init__(self, transport, file_mode=None):
+        """Create a RevnoIndex.
+
+        :param transport: Transport for the branch control directory.
+        :param file_mode: Optional file mode for newly written files.
+        """
+        self._transport = transport
+        self._file_mode = file_mode
+        self._loaded = False
+        self._btree = None
+        self._base_tip = None
+        self._tail_revid_to_revno = {}
+        self._tail_revno_to_revid = {}
+        self.tip = None
+        self.complete = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            size = self._transport.stat(REVNO_INDEX_NAME).st_size
+        except errors.NoSuchFile:
+            return
+        except errors.TransportNotPossible:
+            size = None
+        btree = btree_index.BTreeGraphIndex(
+            self._transport, REVNO_INDEX_NAME, size)
+        try:
+            meta = [value for _, _, value in btree.iter_entries([_META_KEY])]
+        except (errors.NoSuchFile, _mod_index.BadIndexFormatSignature,
+                _mod_index.BadIndexOptions, _mod_index.BadIndexData) as e:
+            mutter('ignoring unreadable revno index: %s', e)
+            return
+        if not meta:
+            return
+        revno, revid, complete = meta[0].split(b' ')
+        self._btree = btree
+        self._base_tip = (int(revno), revid)
+        self.tip = self._base_tip
+        self.complete = (complete == b'complete')
+        self._load_tail()
+
+    def _load_tail(self):
+        try:
+            lines = self._transport.get_bytes(
+                REVNO_INDEX_TAIL_NAME).splitlines(True)
+        except errors.NoSuchFile:
+            return
+        if (len(lines) < 3 or lines[0] != _TAIL_SIGNATURE or
+                lines[1].rstrip(b'\n') != self._base_tip[1]):
+            # The tail belongs to an older version of the B+Tree.
+            return
+        revno, revid, complete = lines[2].rstrip(b'\n').split(b' ')
+        for line in lines[3:]:
+            entry_revid, entry_revno = line.rstrip(b'\n').split(b' ')
+            self._tail_revid_to_revno[entry_revid] = entry_revno
+            self._tail_revno_to_revid[entry_revno] = entry_revid
+        self.tip = (int(revno), revid)
+        self.complete = self.complete and (complete == b'complete')
+
+    def get_tip(self):
+        """Return the (revno, revision_id) the index is valid for, or None."""
+        self._load()
+        return self.tip
+
+    def is_complete(self):
+        """Return True if the index covers the whole ancestry of its tip."""
+        self._load()
+        return self.complete
+
+    def _lookup(self, tail, kind, key):
+        self._load()
+        if self._btree is None:
+            return None
+        result = tail.get(key)
+        if result is not None:
+            return result
+        try:
+            for _, _, value in self._btree.iter_entries([(kind, key)]):
+                return value
+        except (errors.NoSuchFile, _mod_index.BadIndexFormatSignature,
+                _mod_index.BadIndexOptions, _mod_index.BadIndexData) as e:
+            # The index was replaced while it was being read; stop using it.
+            mutter('ignoring unreadable revno index: %s', e)
+            self._btree = None
+            self.tip = None
+            self.complete = False
+        return None
+
+    def get_dotted_revno(self, revision_id):
+        """Return the dotted revno of revision_id, or None if unknown."""
+        revno = self._lookup(self._tail_revid_to_revno, b'revid', revision_id)
+        if revno is None:
+            return None
+        return revno_from_bytes(revno)
+
+    def get_revision_id(self, revno):
+        """Return the revision id for the dotted revno tuple, or None."""
+        return self._lookup(
+            self._tail_revno_to_revid, b'revno', revno_to_bytes(revno))
+
+    def _put_bytes(self, name, data):
+        self._transport.put_bytes(name, data, mode=self._file_mode)
+
+    def write(self, tip, revision_id_to_revno, complete=True):
+        """Replace the index contents.
+
+        :param tip: (revno, revision_id) tuple the mapping is valid for.
+        :param revision_id_to_revno: Dictionary mapping revision ids to
+            dotted revno tuples.
+        :param complete: Whether the mapping covers the whole ancestry of tip.
+        """
+        builder = btree_index.BTreeBuilder(reference_lists=0, key_elements=2)
+        builder.add_node(_META_KEY, b'%d %s %s' % (
+            tip[0], tip[1], b'complete' if complete else b'partial'))
+        for revision_id, revno in revision_id_to_revno.items():
+            revno = revno_to_bytes(revno)
+            builder.add_node((b'revid', revision_id), revno)
+            builder.add_node((b'revno', revno), revision_id)
+        self._transport.put_file(
+            REVNO_INDEX_NAME, builder.finish(), mode=self._file_mode)
+        try:
+            self._transport.delete(REVNO_INDEX_TAIL_NAME)
+        except errors.NoSuchFile:
+            pass
+        self._loaded = False
+        self._btree = None
+        self._tail_revid_to_revno = {}
+        self._tail_revno_to_revid = {}
+        self.tip = None
+        self.complete = False
+
+    def extend(self, tip, revision_id_to_revno, complete):
+        """Add entries for revisions introduced since the current tip.
+
+        :param tip: The new (revno, revision_id) tip.
+        :param revision_id_to_revno: Dictionary mapping the newly introduced
+            revision ids to dotted revno tuples.
+        :param complete: Whether the new entries cover all revisions
+            introduced since the current tip.
+        """
+        self._load()
+        if self._btree is None:
+            raise AssertionError('cannot extend a missing revno index')
+        complete = self.complete and complete
+        tail = dict(self._tail_revid_to_revno)
+        for revision_id, revno in revision_id_to_revno.items():
+            tail[revision_id] = revno_to_bytes(revno)
+        if len(tail) > _MAX_TAIL_ENTRIES:
+            mapping = {}
+            for _, key, value in self._btree.iter_all_entries():
+                if key[0] == b'revid':
+                    mapping[key[1]] = value
+            mapping.update(tail)
+            self.write(tip, {revision_id: revno_from_bytes(revno)
+                             for revision_id, revno in mapping.items()},
+                       complete)
+            return
+        out = BytesIO()
+        out.write(_TAIL_SIGNATURE)
+        out.write(self._base_tip[1] + b'\n')
+        out.write(b'%d %s %s\n' % (
+            tip[0], tip[1], b'complete' if complete else b'partial'))
+        for revision_id, revno in sorted(tail.items()):
+            out.write(b'%s %s\n' % (revision_id, revno))
+        self._put_bytes(REVNO_INDEX_TAIL_NAME, out.getvalue())
+        self._tail_revid_to_revno = tail
+        self._tail_revno_to_revid = {
+            revno: revision_id for revision_id, revno in tail.items()}
+        self.tip = tip
+        self.complete = complete
+
+    def clear(self):
+        """Remove the index from disk."""
+        for name in (REVNO_INDEX_TAIL_NAME, REVNO_INDEX_NAME):
+            try:
+                self._transport.delete(name)
+            except errors.NoSuchFile:
+                pass
+        self._loaded = True
+        self._btree = None
+        self.tip = None
+        self.complete = False
+
+
+def update_revno_index(index, repository, new_tip):
+    """Bring a revno index up to date with a new branch tip.
+
+    If the tip recorded in the index is on the left-hand history of new_tip
+    the index is extended with the new mainline revisions (and their merged
+    revisions if those are already known), otherwise it is removed.
+
+    :param index: A RevnoIndex.
+    :param repository: Repository containing the ancestry of new_tip.
+    :param new_tip: (revno, revision_id) tuple for the new branch tip.
+    :return: True if the index is valid for new_tip afterwards.
+    """
+    old_tip = index.get_tip()
+    if old_tip is None:
+        return False
+    if old_tip == new_tip:
+        return True
+    new_revno, new_revid = new_tip
+    old_revno, old_revid = old_tip
+    distance = new_revno - old_revno
+    if distance < 0 or _mod_revision.is_null(new_revid):
+        index.clear()
+        return False
+    graph = repository.get_graph()
+    mainline = []
+    try:
+        for revision_id in graph.iter_lefthand_ancestry(
+                new_revid, (old_revid,)):
+            mainline.append(revision_id)
+            if len(mainline) > distance:
+                break
+    except errors.RevisionNotPresent:
+        index.clear()
+        return False
+    parent_map = graph.get_parent_map(mainline)
+    if (len(mainline) != distance or
+            parent_map.get(mainline[-1], (None,))[:1] != (old_revid,)):
+        index.clear()
+        return False
+    new_entries = {}
+    complete = True
+    for offset, revision_id in enumerate(reversed(mainline)):
+        new_entries[revision_id] = (old_revno + offset + 1,)
+        for parent_id in parent_map.get(revision_id, ())[1:]:
+            if (parent_id not in new_entries and
+                    index.get_dotted_revno(parent_id) is None):
+                complete = False
+    index.extend(new_tip, new_entries, complete)
+    return True
+
+
+def get_rev_id_for_revno(index, revno, known_pair):
+    """Look up a mainline revno relative to a known (revno, revid) pair.
+
+    This mirrors Repository.get_rev_id_for_revno, but only answers if the
+    known pair is on the mainline recorded in the index.
+
+    :return: The revision id, or None if the index can not answer.
+    """
+    known_revno, known_revid = known_pair
+    if revno < 1 or revno > known_revno:
+        return None
+    if index.get_revision_id((known_revno,)) != known_revid:
+        return None
+    return index.get_revision_id((revno,))
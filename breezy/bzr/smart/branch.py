@@ -128,6 +128,8 @@ class SmartServerBranchGetParent(SmartServerBranchRequest):
 
 class SmartServerBranchGetTagsBytes(SmartServerBranchRequest):
 
+    response_cache_files = ('.bzr/branch/tags',)
+
     def do_with_branch(self, branch):
         """Return the _get_tags_bytes for a branch."""
         bytes = branch._get_tags_bytes()
@@ -210,6 +212,8 @@ class SmartServerRequestRevisionHistory(SmartServerBranchRequest):
 
 class SmartServerBranchRequestLastRevisionInfo(SmartServerBranchRequest):
 
+    response_cache_files = ('.bzr/branch/last-revision',)
+
     def do_with_branch(self, branch):
         """Return branch.last_revision_info().
 
@@ -412,6 +416,8 @@ class SmartServerBranchRequestLockWrite(SmartServerBranchRequest):
 
 class SmartServerBranchRequestUnlock(SmartServerBranchRequest):
 
+    invalidates_response_cache = True
+
     def do_with_branch(self, branch, branch_token, repo_token):
         try:
             with branch.repository.lock_write(token=repo_token):
@@ -16,6 +16,7 @@
 
 from ... import lazy_import
 lazy_import.lazy_import(globals(), """
+from breezy import config as _mod_config
 from breezy.bzr.smart import request as _mod_request
 """)
 
@@ -42,23 +43,151 @@ class _SmartClient(object):
                 b'Software version': breezy.__version__.encode('utf-8')}
         else:
             self._headers = dict(headers)
+        # Responses to read-only calls made by prefetch, keyed by
+        # (method, args).
+        self._prefetched_responses = {}
 
     def __repr__(self):
         return '%s(%r)' % (self.__class__.__name__, self._medium)
 
+    def _before_call(self, method):
+        if (not self._medium._body_encoding_negotiated
+                and self._medium._protocol_version == 3):
+            self._negotiate_body_encoding()
+        if self._prefetched_responses:
+            try:
+                request_type = _mod_request.request_handlers.get_info(method)
+            except KeyError:
+                request_type = None
+            if request_type != 'read':
+                # The call may change what the prefetched calls would return.
+                self._prefetched_responses.clear()
+
     def _call_and_read_response(self, method, args, body=None, readv_body=None,
                                 body_stream=None, expect_response_body=True):
+        self._before_call(method)
         request = _SmartClientRequest(self, method, args, body=body,
                                       readv_body=readv_body, body_stream=body_stream,
                                       expect_response_body=expect_response_body)
         return request.call_and_read_response()
 
+    def _negotiate_body_encoding(self):
+        """Agree with the server on how to compress message bodies.
+
+        The encodings offered are those in the smart.compression option that
+        are supported locally. Nothing is sent if that option is empty.
+        """
+        medium = self._medium
+        medium._body_encoding_negotiated = True
+        if medium._is_remote_before((3, 2)):
+            return
+        encodings = []
+        for name in _mod_config.GlobalStack().get('smart.compression'):
+            name = name.encode('ascii', 'replace')
+            if name in protocol.body_encoding_registry:
+                encodings.append(name)
+        if not encodings:
+            return
+        try:
+            response = self.call(b'Medium.negotiate_body_encoding', *encodings)
+        except errors.UnknownSmartMethod:
+            medium._remember_remote_is_before((3, 2))
+            return
+        if response[0] == b'ok' and response[1] in encodings:
+            medium._body_encoding = response[1]
+
     def call(self, method, *args):
         """Call a method on the remote server."""
+        if self._prefetched_responses:
+            result = self._prefetched_responses.pop((method, args), None)
+            if isinstance(result, Exception):
+                raise result
+            elif result is not None:
+                return result
         result, protocol = self.call_expecting_body(method, *args)
         protocol.cancel_read_body()
         return result
 
+    def call_batch(self, calls):
+        """Call several methods, sending them all before reading a response.
+
+        When the medium supports pipelining this takes a single round trip,
+        otherwise the calls are made one after the other. The calls must be
+        read-only, and neither their requests nor their responses may have
+        a body.
+
+        :param calls: A list of (method, args) tuples.
+        :return: A list with, for each call, its response tuple or the
+            ErrorFromSmartServer or UnknownSmartMethod it raised.
+        """
+        medium = self._medium
+        if (len(calls) < 2 or medium._protocol_version != 3 or
+                not medium.supports_pipelining()):
+            return self._call_sequentially(calls)
+        for method, args in calls:
+            self._before_call(method)
+        requests = []
+        results = []
+        try:
+            for method, args in calls:
+                request = _SmartClientRequest(
+                    self, method, args, expect_response_body=False)
+                request._run_call_hooks()
+                encoder, response_handler = request._construct_protocol(3)
+                request._send_no_retry(encoder)
+                encoder._medium_request.pipeline()
+                requests.append(response_handler)
+            for response_handler in requests:
+                try:
+                    results.append(response_handler.read_response_tuple())
+                except (errors.ErrorFromSmartServer,
+                        errors.UnknownSmartMethod) as err:
+                    results.append(err)
+        except errors.ConnectionReset:
+            medium.reset()
+            if 'noretry' in debug.debug_flags:
+                raise
+            trace.warning('ConnectionReset calling %r, retrying'
+                          % (calls[len(results)][0],))
+            trace.log_exception_quietly()
+            results.extend(self._call_sequentially(calls[len(results):]))
+        except BaseException:
+            # The responses to the remaining requests can't be told apart any
+            # more.
+            medium.reset()
+            raise
+        return results
+
+    def _call_sequentially(self, calls):
+        results = []
+        for method, args in calls:
+            try:
+                results.append(self.call(method, *args))
+            except (errors.ErrorFromSmartServer,
+                    errors.UnknownSmartMethod) as err:
+                results.append(err)
+        return results
+
+    def prefetch(self, calls):
+        """Make read-only calls whose responses will be wanted soon.
+
+        If the medium supports pipelining, the calls are made with call_batch
+        and a later call() of one of them returns its response without
+        another round trip. Otherwise nothing is done. Prefetched responses
+        are dropped as soon as a call that isn't read-only is made.
+
+        :param calls: A list of (method, args) tuples.
+        """
+        medium = self._medium
+        if medium._protocol_version != 3 or not medium.supports_pipelining():
+            return
+        for (method, args), result in zip(calls, self.call_batch(calls)):
+            self._prefetched_responses[(method, tuple(args))] = result
+
+    def discard_prefetched(self):
+        """Drop the prefetched responses that haven't been used."""
+        self._prefetched_responses.clear()
+
     def call_expecting_body(self, method, *args):
         """Call a method and return the result and the protocol object.
 
@@ -201,6 +330,11 @@ class _SmartClientRequest(object):
             self._send_no_retry(encoder)
             response_tuple = response_handler.read_response_tuple(
                 expect_body=self.expect_response_body)
+        medium = self.client._medium
+        if not medium._remote_accepts_pipelining:
+            headers = getattr(response_handler, 'headers', None)
+            if headers and headers.get(protocol.PIPELINING_HEADER) == b'yes':
+                medium._remote_accepts_pipelining = True
         return (response_tuple, response_handler)
 
     def _call_determining_protocol_version(self):
@@ -295,6 +429,8 @@ class _SmartClientRequest(object):
     def _send_no_retry(self, encoder):
         """Just encode the request and try to send it."""
         encoder.set_headers(self.client._headers)
+        if self.client._medium._body_encoding is not None:
+            encoder.set_body_encoding(self.client._medium._body_encoding)
         if self.body is not None:
             if self.readv_body is not None:
                 raise AssertionError(
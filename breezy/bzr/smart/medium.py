@@ -24,6 +24,7 @@ over SSH), and pass them to and from the protocol logic.  See the overview in
 breezy/transport/smart/__init__.py.
 """
 
+import collections
 import errno
 import io
 import os
@@ -294,7 +295,10 @@ class SmartServerStreamMedium(SmartMedium):
 
         :returns: a SmartServerRequestProtocol.
         """
-        self._wait_for_bytes_with_timeout(self._client_timeout)
+        if self._push_back_buffer is None:
+            # Bytes of the next request may already have been read along with
+            # the previous one, in which case there is no need to wait.
+            self._wait_for_bytes_with_timeout(self._client_timeout)
         if self.finished:
             # We're stopping, so don't try to do any more work
             return None
@@ -474,14 +478,14 @@ class SmartServerPipeStreamMedium(SmartServerStreamMedium):
 
     def _serve_one_request_unguarded(self, protocol):
         while True:
-            # We need to be careful not to read past the end of the current
-            # request, or else the read from the pipe will block, so we use
-            # protocol.next_read_size().
+            # We need to be careful not to block reading past the end of the
+            # current request, so we use protocol.next_read_size(). See also
+            # _read_bytes.
             bytes_to_read = protocol.next_read_size()
             if bytes_to_read == 0:
                 # Finished serving this request.
                 self._out.flush()
-                return
+                break
             bytes = self.read_bytes(bytes_to_read)
             if bytes == b'':
                 # Connection has been closed.
@@ -489,6 +493,7 @@ class SmartServerPipeStreamMedium(SmartServerStreamMedium):
                 self._out.flush()
                 return
             protocol.accept_bytes(bytes)
+        self._push_back(protocol.unused_data)
 
     def _disconnect_client(self):
         self._in.close()
@@ -515,7 +520,14 @@ class SmartServerPipeStreamMedium(SmartServerStreamMedium):
             return
 
     def _read_bytes(self, desired_count):
-        return self._in.read(desired_count)
+        read1 = getattr(self._in, 'read1', None)
+        if read1 is None:
+            return self._in.read(desired_count)
+        # read1 returns the bytes that are available rather than waiting for
+        # more, so it is safe to read ahead.  This also keeps the bytes of
+        # pipelined requests out of the file's own buffer, where
+        # _wait_for_bytes_with_timeout wouldn't see them.
+        return read1(_MAX_READ_SIZE)
 
     def terminate_due_to_error(self):
         # TODO: This should log to a server log file, but no such thing
@@ -590,6 +602,13 @@ class SmartClientMediumRequest(object):
         self._state = "done"
         self._finished_reading()
 
+    def push_back(self, data):
+        """Return bytes read past the end of the response to this request.
+
+        On mediums that pipeline requests those bytes are the start of the
+        next response. By default they are discarded.
+        """
+
     def _finished_reading(self):
         """Helper for finished_reading.
 
@@ -704,7 +723,7 @@ class _DebugCounter(object):
         """
         medium_repr = repr(medium)
         # Add this medium to the WeakKeyDictionary
-        self.counts[medium] = dict(count=0, vfs_count=0,
+        self.counts[medium] = dict(count=0, vfs_count=0, pipelined_count=0,
                                    medium_repr=medium_repr)
         # Weakref callbacks are fired in reverse order of their association
         # with the referenced object.  So we add a weakref *after* adding to
@@ -724,16 +743,33 @@ class _DebugCounter(object):
         if issubclass(request_method, vfs.VfsRequest):
             value['vfs_count'] += 1
 
+    def increment_pipelined_count(self, medium):
+        """Count a request sent before the previous response was read.
+
+        Each of those saves a round trip to the server.
+        """
+        value = self.counts.get(medium)
+        if value is not None:
+            value['pipelined_count'] += 1
+
     def done(self, ref):
         value = self.counts[ref]
-        count, vfs_count, medium_repr = (
-            value['count'], value['vfs_count'], value['medium_repr'])
+        count, vfs_count, pipelined_count, medium_repr = (
+            value['count'], value['vfs_count'], value['pipelined_count'],
+            value['medium_repr'])
         # In case this callback is invoked for the same ref twice (by the
         # weakref callback and by the atexit function), set the call count back
         # to 0 so this item won't be reported twice.
         value['count'] = 0
         value['vfs_count'] = 0
-        if count != 0:
+        value['pipelined_count'] = 0
+        if count == 0:
+            return
+        if pipelined_count:
+            trace.note(gettext(
+                'HPSS calls: {0} ({1} vfs, {2} round trips saved) {3}').format(
+                count, vfs_count, pipelined_count, medium_repr))
+        else:
             trace.note(gettext('HPSS calls: {0} ({1} vfs) {2}').format(
                        count, vfs_count, medium_repr))
 
@@ -755,6 +791,13 @@ class SmartClientMedium(SmartMedium):
         self._protocol_version_error = None
         self._protocol_version = None
         self._done_hello = False
+        # The encoding agreed with the server for message bodies, see
+        # _SmartClient._negotiate_body_encoding.
+        self._body_encoding = None
+        self._body_encoding_negotiated = False
+        # Whether the server said it reads requests sent before it has
+        # answered the previous ones, see supports_pipelining.
+        self._remote_accepts_pipelining = False
         # Be optimistic: we assume the remote end can accept new remote
         # requests until we get an error saying otherwise.
         # _remote_version_is_before tracks the bzr version the remote side
@@ -857,6 +900,13 @@ class SmartClientMedium(SmartMedium):
         The default implementation does nothing.
         """
 
+    def supports_pipelining(self):
+        """Can several requests be sent before their responses are read?
+
+        The default implementation returns False.
+        """
+        return False
+
     def remote_path_from_transport(self, transport):
         """Convert transport into a path suitable for using in a request.
 
@@ -881,6 +931,9 @@ class SmartClientStreamMedium(SmartClientMedium):
     def __init__(self, base):
         SmartClientMedium.__init__(self, base)
         self._current_request = None
+        # Requests that have been sent and are waiting for their responses
+        # to be read, oldest first. See SmartClientStreamMediumRequest.pipeline.
+        self._pipelined_requests = collections.deque()
 
     def accept_bytes(self, bytes):
         self._accept_bytes(bytes)
@@ -907,6 +960,14 @@ class SmartClientStreamMedium(SmartClientMedium):
         """
         return SmartClientStreamMediumRequest(self)
 
+    def supports_pipelining(self):
+        """See SmartClientMedium.supports_pipelining().
+
+        Responses arrive on the stream in the order the requests were sent,
+        so this is possible once the server has said that it accepts it.
+        """
+        return self._remote_accepts_pipelining
+
     def reset(self):
         """We have been disconnected, reset current state.
 
@@ -914,6 +975,8 @@ class SmartClientStreamMedium(SmartClientMedium):
         """
         self.disconnect()
         self._current_request = None
+        self._pipelined_requests.clear()
+        self._push_back_buffer = None
 
 
 class SmartSimplePipesClientMedium(SmartClientStreamMedium):
@@ -1192,6 +1255,8 @@ class SmartClientStreamMediumRequest(SmartClientMediumRequest):
         if self._medium._current_request is not None:
             raise errors.TooManyConcurrentRequests(self._medium)
         self._medium._current_request = self
+        if self._medium._pipelined_requests and _debug_counter is not None:
+            _debug_counter.increment_pipelined_count(self._medium)
 
     def _accept_bytes(self, bytes):
         """See SmartClientMediumRequest._accept_bytes.
@@ -1201,12 +1266,51 @@ class SmartClientStreamMediumRequest(SmartClientMediumRequest):
         """
         self._medium._accept_bytes(bytes)
 
+    def pipeline(self):
+        """Allow another request to be sent before this response is read.
+
+        The responses to pipelined requests must be read in the order the
+        requests were sent. Only use this for requests whose responses are
+        small: the server won't read further requests while it is blocked
+        writing a response that the client isn't reading yet.
+        """
+        if self._state == "writing":
+            raise errors.WritingNotComplete(self)
+        if self._medium._current_request is not self:
+            raise AssertionError()
+        self._medium._current_request = None
+        self._medium._pipelined_requests.append(self)
+
+    def _check_response_is_next(self):
+        pipelined_requests = self._medium._pipelined_requests
+        if pipelined_requests and pipelined_requests[0] is not self:
+            raise errors.TooManyConcurrentRequests(self._medium)
+
+    def _read_bytes(self, count):
+        """See SmartClientMediumRequest._read_bytes."""
+        self._check_response_is_next()
+        return self._medium.read_bytes(count)
+
+    def _read_line(self):
+        """See SmartClientMediumRequest._read_line."""
+        self._check_response_is_next()
+        return self._medium._get_line()
+
+    def push_back(self, data):
+        """See SmartClientMediumRequest.push_back."""
+        self._medium._push_back(data)
+
     def _finished_reading(self):
         """See SmartClientMediumRequest._finished_reading.
 
-        This clears the _current_request on self._medium to allow a new
-        request to be created.
+        This clears the _current_request on self._medium, or removes this
+        request from its pipelined requests, to allow a new request to be
+        created.
         """
+        pipelined_requests = self._medium._pipelined_requests
+        if pipelined_requests and pipelined_requests[0] is self:
+            pipelined_requests.popleft()
+            return
         if self._medium._current_request is not self:
             raise AssertionError()
         self._medium._current_request = None
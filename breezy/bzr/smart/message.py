@@ -107,6 +107,13 @@ class ConventionalRequestHandler(MessageHandler):
         self._should_finish_body = False
         self._response_sent = False
 
+    def headers_received(self, headers):
+        MessageHandler.headers_received(self, headers)
+        # Responses are sent with the same body encoding as the request.
+        encoding = headers.get(b'Body-Encoding')
+        if encoding is not None:
+            self.responder.set_body_encoding(encoding)
+
     def protocol_error(self, exception):
         if self.responder.response_sent:
             # We can only send one response to a request, no matter how many
@@ -282,6 +289,10 @@ class ConventionalResponseHandler(MessageHandler, ResponseHandler):
         if next_read_size == 0:
             # a complete request has been read.
             self.finished_reading = True
+            unused_data = getattr(self._protocol_decoder, 'unused_data', None)
+            if unused_data:
+                # The start of the response to a pipelined request.
+                self._medium_request.push_back(unused_data)
             self._medium_request.finished_reading()
             return
         data = self._medium_request.read_bytes(next_read_size)
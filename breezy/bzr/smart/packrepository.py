@@ -29,11 +29,27 @@ from .repository import (
 class SmartServerPackRepositoryAutopack(SmartServerRepositoryRequest):
 
     def do_repository_request(self, repository):
+        return self._autopack(repository, None)
+
+    def _autopack(self, repository, max_bytes):
         pack_collection = getattr(repository, '_pack_collection', None)
         if pack_collection is None:
             # This is a not a pack repo, so asking for an autopack is just a
             # no-op.
             return SuccessfulSmartServerResponse((b'ok',))
         with repository.lock_write():
-            repository._pack_collection.autopack()
+            repository._pack_collection.autopack(max_bytes=max_bytes)
         return SuccessfulSmartServerResponse((b'ok',))
+
+
+class SmartServerPackRepositoryAutopack_3_2(SmartServerPackRepositoryAutopack):
+    """Autopack, combining at most max_bytes of existing packs.
+
+    A max_bytes of 0 means no limit, rather than the limit set by the
+    repository.autopack_max_bytes option of the repository.
+
+    New in 3.2.
+    """
+
+    def do_repository_request(self, repository, max_bytes):
+        return self._autopack(repository, max_bytes)
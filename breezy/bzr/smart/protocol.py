@@ -28,12 +28,14 @@ import struct
 import sys
 import _thread
 import time
+import zlib
 
 import breezy
 from ... import (
     debug,
     errors,
     osutils,
+    registry,
     )
 from . import message, request
 from ...trace import log_exception_quietly, mutter
@@ -49,6 +51,80 @@ RESPONSE_VERSION_TWO = b'bzr response 2\n'
 MESSAGE_VERSION_THREE = b'bzr message 3 (bzr 1.6)\n'
 RESPONSE_VERSION_THREE = REQUEST_VERSION_THREE = MESSAGE_VERSION_THREE
 
+# Header of protocol version three messages with the encoding of the body
+# parts of the message.
+BODY_ENCODING_HEADER = b'Body-Encoding'
+
+# Header of protocol version three responses from servers that read requests
+# sent before they have answered the previous ones.
+PIPELINING_HEADER = b'Pipelining'
+
+
+class BodyEncoding(object):
+    """An encoding of the body parts of protocol version three messages.
+
+    The body parts of a message are encoded as a single stream, with each
+    part flushed so that it can be decoded as soon as it is received.
+    """
+
+    def compressor(self):
+        """Return a function that encodes the next part of a body."""
+        raise NotImplementedError(self.compressor)
+
+    def decompressor(self):
+        """Return a function that decodes the next part of a body."""
+        raise NotImplementedError(self.decompressor)
+
+
+class ZlibBodyEncoding(BodyEncoding):
+    """Zlib body encoding."""
+
+    def compressor(self):
+        compressobj = zlib.compressobj()
+
+        def compress(bytes):
+            return (compressobj.compress(bytes)
+                    + compressobj.flush(zlib.Z_SYNC_FLUSH))
+        return compress
+
+    def decompressor(self):
+        return zlib.decompressobj().decompress
+
+
+class ZstdBodyEncoding(BodyEncoding):
+    """Zstandard body encoding, available if zstandard is installed."""
+
+    def compressor(self):
+        compressobj = zstandard.ZstdCompressor().compressobj()
+
+        def compress(bytes):
+            return (compressobj.compress(bytes)
+                    + compressobj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+        return compress
+
+    def decompressor(self):
+        return zstandard.ZstdDecompressor().decompressobj().decompress
+
+
+# Encodings supported for the bodies of protocol version three messages,
+# keyed by the name used for them on the wire.
+body_encoding_registry = registry.Registry()
+body_encoding_registry.register(b'zlib', ZlibBodyEncoding())
+try:
+    import zstandard
+except ImportError:
+    pass
+else:
+    body_encoding_registry.register(b'zstd', ZstdBodyEncoding())
+
+
+def _get_body_encoding(name):
+    try:
+        return body_encoding_registry.get(name)
+    except KeyError:
+        raise errors.SmartProtocolError(
+            'Unknown body encoding %r' % (name,))
+
 
 def _recv_tuple(from_file):
     req_line = from_file.readline()
@@ -907,6 +983,7 @@ class ProtocolThreeDecoder(_StatefulDecoder):
             self._number_needed_bytes = 4
         self.decoding_failed = False
         self.request_handler = self.message_handler = message_handler
+        self._decompress = None
 
     def accept_bytes(self, bytes):
         self._number_needed_bytes = None
@@ -1002,6 +1079,9 @@ class ProtocolThreeDecoder(_StatefulDecoder):
         if not isinstance(decoded, dict):
             raise errors.SmartProtocolError(
                 'Header object %r is not a dict' % (decoded,))
+        encoding = decoded.get(BODY_ENCODING_HEADER)
+        if encoding is not None:
+            self._decompress = _get_body_encoding(encoding).decompressor()
         self.state_accept = self._state_accept_expecting_message_part
         try:
             self.message_handler.headers_received(decoded)
@@ -1034,6 +1114,12 @@ class ProtocolThreeDecoder(_StatefulDecoder):
         # XXX: this should not buffer whole message part, but instead deliver
         # the bytes as they arrive.
         prefixed_bytes = self._extract_length_prefixed_bytes()
+        if self._decompress is not None:
+            try:
+                prefixed_bytes = self._decompress(prefixed_bytes)
+            except Exception as e:
+                raise errors.SmartProtocolError(
+                    'Unable to decode body: %s' % (e,))
         self.state_accept = self._state_accept_expecting_message_part
         try:
             self.message_handler.bytes_part_received(prefixed_bytes)
@@ -1086,6 +1172,15 @@ class _ProtocolThreeEncoder(object):
         self._buf = []
         self._buf_len = 0
         self._real_write_func = write_func
+        self._compress = None
+
+    def set_body_encoding(self, name):
+        """Encode the body parts of the message with a body encoding.
+
+        :param name: Name of an encoding in body_encoding_registry
+        """
+        self._compress = _get_body_encoding(name).compressor()
+        self._headers[BODY_ENCODING_HEADER] = name
 
     def _write_func(self, bytes):
         # TODO: Another possibility would be to turn this into an async model.
@@ -1137,6 +1232,8 @@ class _ProtocolThreeEncoder(object):
         self.flush()
 
     def _write_prefixed_body(self, bytes):
+        if self._compress is not None:
+            bytes = self._compress(bytes)
         self._write_func(b'b')
         self._write_func(struct.pack('!L', len(bytes)))
         self._write_func(bytes)
@@ -1157,7 +1254,8 @@ class ProtocolThreeResponder(_ProtocolThreeEncoder):
         _ProtocolThreeEncoder.__init__(self, write_func)
         self.response_sent = False
         self._headers = {
-            b'Software version': breezy.__version__.encode('utf-8')}
+            b'Software version': breezy.__version__.encode('utf-8'),
+            PIPELINING_HEADER: b'yes'}
         if 'hpss' in debug.debug_flags:
             self._thread_id = _thread.get_ident()
             self._response_start_time = None
@@ -37,6 +37,7 @@ from .. import (
     inventory as _mod_inventory,
     inventory_delta,
     pack,
+    revno_index as _mod_revno_index,
     vf_search,
     )
 from ..bzrdir import BzrDir
@@ -165,6 +166,8 @@ class SmartServerRepositoryGetParentMap(SmartServerRepositoryRequest):
 
     no_extra_results = False
 
+    response_cache_files = ('.bzr/repository/pack-names',)
+
     def do_repository_request(self, repository, *revision_ids):
         """Get parent details for some revisions.
 
@@ -277,6 +280,8 @@ class SmartServerRepositoryGetParentMap(SmartServerRepositoryRequest):
 
 class SmartServerRepositoryGetRevisionGraph(SmartServerRepositoryReadLocked):
 
+    response_cache_files = ('.bzr/repository/pack-names',)
+
     def do_readlocked_repository_request(self, repository, revision_id):
         """Return the result of repository.get_revision_graph(revision_id).
 
@@ -314,12 +319,18 @@ class SmartServerRepositoryGetRevisionGraph(SmartServerRepositoryReadLocked):
 
 class SmartServerRepositoryGetRevIdForRevno(SmartServerRepositoryReadLocked):
 
+    response_cache_files = ('.bzr/repository/pack-names',)
+
     def do_readlocked_repository_request(self, repository, revno,
                                          known_pair):
         """Find the revid for a given revno, given a known revno/revid pair.
 
         New in 1.17.
         """
+        revision_id = self._get_rev_id_from_revno_index(
+            repository, revno, known_pair)
+        if revision_id is not None:
+            return SuccessfulSmartServerResponse((b'ok', revision_id))
         try:
             found_flag, result = repository.get_rev_id_for_revno(
                 revno, known_pair)
@@ -340,6 +351,40 @@ class SmartServerRepositoryGetRevIdForRevno(SmartServerRepositoryReadLocked):
             return SuccessfulSmartServerResponse(
                 (b'history-incomplete', earliest_revno, earliest_revid))
 
+    def _get_rev_id_from_revno_index(self, repository, revno, known_pair):
+        """Try to find the revid using the revno index of a branch.
+
+        Only branches colocated with the repository are considered. Branch
+        references are skipped and stacked-on branches are not opened, as
+        they can be outside of the jail.
+
+        :return: The revision id, or None if no revno index could answer.
+        """
+        controldir = repository.controldir
+        try:
+            names = controldir.branch_names()
+        except (errors.NotBranchError, errors.UnsupportedOperation):
+            return None
+        for name in names:
+            try:
+                if controldir.get_branch_reference(name=name) is not None:
+                    continue
+                branch = controldir.open_branch(
+                    name=name, ignore_fallbacks=True)
+            except errors.NotBranchError:
+                continue
+            open_revno_index = getattr(branch, '_open_revno_index', None)
+            if open_revno_index is None:
+                continue
+            index = open_revno_index()
+            if index is None:
+                continue
+            revision_id = _mod_revno_index.get_rev_id_for_revno(
+                index, revno, known_pair)
+            if revision_id is not None:
+                return revision_id
+        return None
+
 
 class SmartServerRepositoryGetSerializerFormat(SmartServerRepositoryRequest):
 
@@ -518,6 +563,257 @@ class SmartServerRepositoryLockWrite(SmartServerRepositoryRequest):
         return SuccessfulSmartServerResponse((b'ok', token))
 
 
+# The CloneStreamCache used by Repository.get_stream, if any.
+clone_stream_cache = None
+
+
+class CloneStreamCache(object):
+    """Cache of the streams sent to clients that clone a repository.
+
+    When a client asks for the whole ancestry of some revisions, the records
+    sent to it are stored on disk, so that later clones of the same revisions
+    can be answered without searching the repository or recompressing any
+    content. A clone of revisions that descend from a cached clone only
+    searches for the revisions added since, and sends them after the cached
+    records.
+
+    A cached clone is a list of segment files with serialised records. The
+    clones based on an earlier clone share its segments, until there are
+    max_segments of them, after which the clone is written out in full
+    again. The least recently used clones are removed once the segments take
+    up more than the configured amount of disk space.
+
+    Each clone also records the names of the packs in the repository at the
+    time. Data can be added without changing the revisions cloned, e.g.
+    signatures or revisions that were ghosts, so a clone is only sent as is
+    while the packs are the same; otherwise it is used as a base for a
+    stream of what was added since.
+    """
+
+    max_segments = 10
+
+    _read_size = 1024 * 1024
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self._segments_path = os.path.join(path, 'segments')
+        self._clones_path = os.path.join(path, 'clones')
+        os.makedirs(self._segments_path, exist_ok=True)
+        os.makedirs(self._clones_path, exist_ok=True)
+
+    def _clone_key(self, repository_path, format_names, heads):
+        return osutils.sha_string(bencode.bencode(
+            [repository_path, list(format_names), sorted(heads)])).decode(
+                'ascii')
+
+    def _read_clone(self, key):
+        try:
+            with open(os.path.join(self._clones_path, key), 'rb') as f:
+                return bencode.bdecode_as_tuple(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _segments_size(self, segments):
+        return sum(
+            os.path.getsize(os.path.join(
+                self._segments_path, name.decode('ascii')))
+            for name in segments)
+
+    def iter_clones(self):
+        """Iterate over the cached clones, most recently used first.
+
+        :return: Iterator over (key, repository path, format names, heads,
+            segments, pack names) tuples
+        """
+        entries = []
+        for key in os.listdir(self._clones_path):
+            if key.startswith('.tmp'):
+                continue
+            try:
+                mtime = os.stat(os.path.join(self._clones_path, key)).st_mtime
+            except FileNotFoundError:
+                continue
+            entries.append((mtime, key))
+        entries.sort(reverse=True)
+        for mtime, key in entries:
+            clone = self._read_clone(key)
+            if clone is not None:
+                yield (key, ) + clone
+
+    def get_clone(self, repository_path, format_names, heads):
+        """Get the segments of the clone of a set of revisions.
+
+        :param repository_path: Path of the repository
+        :param format_names: Network names of the formats of the repository
+            and of the stream
+        :param heads: Revision ids of the revisions cloned
+        :return: A tuple with the segment names and the pack names recorded
+            for the clone, or None if the clone is not cached
+        """
+        key = self._clone_key(repository_path, format_names, heads)
+        clone = self._read_clone(key)
+        if clone is None:
+            return None
+        try:
+            os.utime(os.path.join(self._clones_path, key))
+        except OSError:
+            pass
+        return clone[3:]
+
+    def find_base(self, repository_path, format_names, heads, graph,
+                  pack_names):
+        """Find the cached clone to base a clone of a set of revisions on.
+
+        This is the largest cached clone of ancestors of the revisions that
+        can still be extended. Clones made before some of their packs were
+        removed, e.g. by packing the repository, are not used, as the data
+        added since can't be determined.
+
+        :param pack_names: The names of the packs in the repository
+        :return: A tuple with the heads, segments and pack names of the
+            clone, or None
+        """
+        heads = set(heads)
+        best = None
+        best_size = 0
+        for (key, clone_path, clone_format_names, clone_heads,
+             segments, clone_pack_names) in self.iter_clones():
+            if (clone_path != repository_path
+                    or clone_format_names != tuple(format_names)
+                    or len(segments) >= self.max_segments
+                    or not set(clone_pack_names).issubset(pack_names)):
+                continue
+            try:
+                size = self._segments_size(segments)
+            except FileNotFoundError:
+                continue
+            if size <= best_size:
+                continue
+            if graph.heads(heads.union(clone_heads)) != heads:
+                continue
+            best = (clone_heads, segments, clone_pack_names)
+            best_size = size
+        return best
+
+    def open_segments(self, segments):
+        """Open the segment files of a clone.
+
+        :return: A list of files, or None if a segment is missing
+        """
+        files = []
+        try:
+            for name in segments:
+                files.append(open(os.path.join(
+                    self._segments_path, name.decode('ascii')), 'rb'))
+        except FileNotFoundError:
+            for f in files:
+                f.close()
+            return None
+        return files
+
+    def iter_segments(self, files):
+        """Iterate over the contents of the segment files of a clone."""
+        for f in files:
+            with f:
+                while True:
+                    data = f.read(self._read_size)
+                    if not data:
+                        break
+                    yield data
+
+    def start_segment(self):
+        """Start writing a new segment.
+
+        :return: A tuple with the file to write the segment to and its path
+        """
+        fd, path = tempfile.mkstemp(dir=self._segments_path, prefix='.tmp')
+        return os.fdopen(fd, 'wb'), path
+
+    def add_clone(self, repository_path, format_names, heads, base_segments,
+                  segment_path, pack_names):
+        """Record the clone of a set of revisions.
+
+        :param base_segments: The segments of the clone the new one is based
+            on
+        :param segment_path: Path of the segment with the remaining records,
+            as returned by start_segment
+        :param pack_names: The names of the packs in the repository the
+            records were read from
+        """
+        segments = list(base_segments)
+        if os.path.getsize(segment_path):
+            name = os.path.basename(segment_path)[len('.tmp'):]
+            os.replace(segment_path, os.path.join(self._segments_path, name))
+            segments.append(name.encode('ascii'))
+        else:
+            os.unlink(segment_path)
+        fd, tmp_path = tempfile.mkstemp(dir=self._clones_path, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(bencode.bencode(
+                [repository_path, list(format_names), sorted(heads),
+                 segments, list(pack_names)]))
+        os.replace(tmp_path, os.path.join(
+            self._clones_path,
+            self._clone_key(repository_path, format_names, heads)))
+        self.prune()
+
+    def prune(self):
+        """Remove the least recently used clones and unused segments."""
+        keep = set()
+        size = 0
+        for i, (key, repository_path, format_names, heads,
+                segments, pack_names) in enumerate(self.iter_clones()):
+            new = [name for name in segments if name not in keep]
+            try:
+                new_size = self._segments_size(new)
+            except FileNotFoundError:
+                new_size = None
+            if new_size is None or (i > 0 and size + new_size > self.max_size):
+                os.unlink(os.path.join(self._clones_path, key))
+                continue
+            keep.update(new)
+            size += new_size
+        for name in os.listdir(self._segments_path):
+            if not name.startswith('.tmp') and name.encode('ascii') not in keep:
+                os.unlink(os.path.join(self._segments_path, name))
+
+
+def _repository_pack_names(repository):
+    """Return the sorted names of the packs of a repository.
+
+    :return: A list of pack names, or None if the repository does not store
+        its data in packs
+    """
+    pack_collection = getattr(repository, '_pack_collection', None)
+    if pack_collection is None:
+        return None
+    pack_collection.ensure_loaded()
+    return sorted(name.encode('ascii') for name in pack_collection.names())
+
+
+def _clone_heads(search_bytes):
+    """Find the revisions whose whole ancestry a search is for.
+
+    :return: A frozenset of revision ids, or None if the search is not for
+        the whole ancestry of some revisions
+    """
+    lines = search_bytes.split(b'\n')
+    if lines[0] == b'ancestry-of':
+        heads = set(lines[1:])
+    elif lines[0] == b'search' and len(lines) == 4:
+        if set(lines[2].split(b' ')).difference(
+                [b'', _mod_revision.NULL_REVISION]):
+            return None
+        heads = set(lines[1].split(b' '))
+    else:
+        return None
+    heads.difference_update([b'', _mod_revision.NULL_REVISION])
+    if not heads:
+        return None
+    return frozenset(heads)
+
+
 class SmartServerRepositoryGetStream(SmartServerRepositoryRequest):
 
     def do_repository_request(self, repository, to_network_name):
@@ -535,6 +831,8 @@ class SmartServerRepositoryGetStream(SmartServerRepositoryRequest):
             repository.
         """
         self._to_format = network_format_registry.get(to_network_name)
+        self._repository_path = self._backing_transport.relpath(
+            repository.controldir.root_transport.base).encode('utf-8')
         if self._should_fake_unknown():
             return FailedSmartServerResponse(
                 (b'UnknownMethod', b'Repository.get_stream'))
@@ -573,6 +871,13 @@ class SmartServerRepositoryGetStream(SmartServerRepositoryRequest):
 
     def do_body(self, body_bytes):
         repository = self._repository
+        cache = clone_stream_cache
+        if cache is not None:
+            heads = _clone_heads(body_bytes)
+            if heads is not None:
+                response = self._get_clone_stream(cache, heads)
+                if response is not None:
+                    return response
         repository.lock_read()
         try:
             search_result, error = self.recreate_search(repository, body_bytes,
@@ -604,6 +909,126 @@ class SmartServerRepositoryGetStream(SmartServerRepositoryRequest):
         else:
             repository.unlock()
 
+    def _get_clone_stream(self, cache, heads):
+        """Get a response for a clone of some revisions using the cache.
+
+        :param cache: A CloneStreamCache
+        :param heads: The revisions whose ancestry to send
+        :return: A SmartServerResponse, or None if the stream can not be
+            cached
+        """
+        repository = self._repository
+        format_names = (repository._format.network_name(),
+                        self._to_format.network_name())
+        segment_files = stream = None
+        repository.lock_read()
+        try:
+            pack_names = _repository_pack_names(repository)
+            graph = repository.get_graph()
+            if (pack_names is None or
+                    len(graph.get_parent_map(heads)) != len(heads)):
+                repository.unlock()
+                return None
+            clone = cache.get_clone(
+                self._repository_path, format_names, heads)
+            if clone is not None and list(clone[1]) == pack_names:
+                segments = clone[0]
+                segment_files = cache.open_segments(segments)
+            if segment_files is None:
+                base = cache.find_base(
+                    self._repository_path, format_names, heads, graph,
+                    pack_names)
+                if base is None:
+                    segments = []
+                    search = vf_search.PendingAncestryResult(heads, repository)
+                else:
+                    base_heads, segments, base_pack_names = base
+                    keys = set()
+                    for head in heads:
+                        keys.update(graph.find_unique_ancestors(
+                            head, base_heads))
+                    keys.update(self._find_added_ancestors(
+                        repository, graph, heads, keys,
+                        set(pack_names).difference(base_pack_names)))
+                    search = vf_search.SearchResult(
+                        heads, set(base_heads), len(keys), keys)
+                segment_files = cache.open_segments(segments)
+                if segment_files is None:
+                    repository.unlock()
+                    return None
+                source = repository._get_source(self._to_format)
+                stream = source.get_stream(search)
+        except Exception:
+            try:
+                repository.unlock()
+            finally:
+                raise
+        return SuccessfulSmartServerResponse(
+            (b'ok',), body_stream=self.clone_body_stream(
+                cache, heads, format_names, segments, segment_files, stream,
+                pack_names))
+
+    def _find_added_ancestors(self, repository, graph, heads, keys,
+                              new_pack_names):
+        """Find the ancestors of heads with data in packs added since a clone.
+
+        These are revisions that were ghosts, or that were signed, when the
+        clone was made. Their records are sent again.
+
+        :param keys: Revisions that are already being sent
+        :param new_pack_names: Names of the packs added since the clone
+        :return: A set of revision ids
+        """
+        pack_collection = repository._pack_collection
+        candidates = set()
+        for name in new_pack_names:
+            pack = pack_collection.get_pack_by_name(name.decode('ascii'))
+            for index in (pack.revision_index, pack.signature_index):
+                candidates.update(
+                    node[1][0] for node in index.iter_all_entries())
+        candidates.difference_update(keys)
+        return set(
+            revid for revid in candidates
+            if any(graph.is_ancestor(revid, head) for head in heads))
+
+    def clone_body_stream(self, cache, heads, format_names, segments,
+                          segment_files, stream, pack_names):
+        """Send the cached records of a clone, followed by stream.
+
+        If stream is not None, its records are added to the cache as a new
+        segment once they have all been sent.
+        """
+        repository = self._repository
+        pack_writer = pack.ContainerSerialiser()
+        try:
+            yield pack_writer.begin()
+            yield pack_writer.bytes_record(format_names[0], b'')
+            for bytes in cache.iter_segments(segment_files):
+                yield bytes
+            if stream is not None:
+                f, segment_path = cache.start_segment()
+                try:
+                    with f:
+                        for bytes in _stream_to_records(stream, pack_writer):
+                            f.write(bytes)
+                            yield bytes
+                except BaseException:
+                    os.unlink(segment_path)
+                    raise
+                try:
+                    cache.add_clone(self._repository_path, format_names,
+                                    heads, segments, segment_path,
+                                    pack_names)
+                except OSError as e:
+                    trace.mutter('unable to cache clone stream: %s', e)
+            yield pack_writer.end()
+        except errors.RevisionNotPresent as e:
+            yield FailedSmartServerResponse((b'NoSuchRevision', e.revision_id))
+        finally:
+            for f in segment_files:
+                f.close()
+            repository.unlock()
+
 
 class SmartServerRepositoryGetStream_1_19(SmartServerRepositoryGetStream):
     """The same as Repository.get_stream, but will return stream CHK formats to
@@ -624,6 +1049,13 @@ def _stream_to_byte_stream(stream, src_format):
     pack_writer = pack.ContainerSerialiser()
     yield pack_writer.begin()
     yield pack_writer.bytes_record(src_format.network_name(), b'')
+    for bytes in _stream_to_records(stream, pack_writer):
+        yield bytes
+    yield pack_writer.end()
+
+
+def _stream_to_records(stream, pack_writer):
+    """Serialise the records of a record stream as container records."""
     for substream_type, substream in stream:
         for record in substream:
             if record.storage_kind in ('chunked', 'fulltext'):
@@ -637,7 +1069,6 @@ def _stream_to_byte_stream(stream, src_format):
                 # representation of the first record, which means that
                 # later records have no wire representation: we skip them.
                 yield pack_writer.bytes_record(serialised, [(substream_type.encode('ascii'),)])
-    yield pack_writer.end()
 
 
 class _ByteStreamDecoder(object):
@@ -773,6 +1204,8 @@ def _byte_stream_to_stream(byte_stream, record_counter=None):
 
 class SmartServerRepositoryUnlock(SmartServerRepositoryRequest):
 
+    invalidates_response_cache = True
+
     def do_repository_request(self, repository, token):
         try:
             repository.lock_write(token=token)
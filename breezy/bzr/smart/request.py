@@ -38,6 +38,7 @@ from ... import (
     branch as _mod_branch,
     debug,
     errors,
+    lru_cache,
     osutils,
     registry,
     revision,
@@ -46,8 +47,10 @@ from ... import (
     )
 from ...lazy_import import lazy_import
 lazy_import(globals(), """
+from breezy.bencode import bencode
 from breezy.bzr import bzrdir
 from breezy.bzr.bundle import serializer
+from breezy.bzr.smart import protocol
 
 import tempfile
 """)
@@ -56,6 +59,9 @@ import tempfile
 jail_info = threading.local()
 jail_info.transports = None
 
+# The ResponseCache used by request handlers, if any.
+response_cache = None
+
 
 class DisabledMethod(errors.InternalBzrError):
 
@@ -100,6 +106,16 @@ class SmartServerRequest(object):
     # XXX: rename this class to BaseSmartServerRequestHandler ?  A request
     # *handler* is a different concept to the request.
 
+    # Paths, relative to the control directory the request is for, of the
+    # files the response is computed from.  Responses to requests that set
+    # this are kept in the response_cache for as long as the contents of
+    # these files are unchanged.
+    response_cache_files = None
+
+    # Whether the response cache entries for the control directory should be
+    # dropped once the request succeeds.
+    invalidates_response_cache = False
+
     def __init__(self, backing_transport, root_client_path='/', jail_root=None):
         """Constructor.
 
@@ -173,6 +189,30 @@ class SmartServerRequest(object):
         self._body_chunks = None
         return self.do_body(body_bytes)
 
+    def get_response_generation(self, path):
+        """Get the state that responses for the given path are computed from.
+
+        :param path: The path of the control directory as received from the
+            client.
+        :return: A tuple with the base of the control directory and the
+            contents of its response_cache_files, or None if the response can
+            not be cached.
+        """
+        try:
+            transport = self.transport_from_client_path(path)
+        except (errors.PathError, UnicodeDecodeError):
+            return None
+        if transport.get_segment_parameters():
+            # The files to check are not at the usual place for colocated
+            # branches.
+            return None
+        try:
+            contents = tuple(transport.get_bytes(relpath)
+                             for relpath in self.response_cache_files)
+        except errors.PathError:
+            return None
+        return (transport.base, contents)
+
     def setup_jail(self):
         jail_info.transports = [self._jail_root]
 
@@ -268,6 +308,51 @@ class SuccessfulSmartServerResponse(SmartServerResponse):
         return True
 
 
+def _response_size(response):
+    # Response arguments are usually byte strings, but may be ints too.
+    try:
+        args_size = len(bencode(response.args))
+    except TypeError:
+        args_size = len(repr(response.args))
+    return args_size + len(response.body or b'')
+
+
+class ResponseCache(object):
+    """A cache of the responses to read-only requests.
+
+    Responses are cached by verb, arguments, body and the contents of the
+    files the request names in response_cache_files, so that a cached
+    response is never used once the branch or repository it was computed
+    from has changed.
+    """
+
+    def __init__(self, max_size):
+        """Create a new ResponseCache.
+
+        :param max_size: Maximum size in bytes of the cached responses.
+        """
+        self._lock = threading.Lock()
+        self._cache = lru_cache.LRUSizeCache(
+            max_size=max_size, compute_size=_response_size)
+
+    def get(self, key):
+        """Return the cached response for key, or None."""
+        with self._lock:
+            return self._cache.get(key)
+
+    def add(self, key, response):
+        """Cache a response."""
+        with self._lock:
+            self._cache[key] = response
+
+    def invalidate(self, base):
+        """Drop the cached responses for the control directory at base."""
+        with self._lock:
+            for key in list(self._cache.keys()):
+                if key[0] == base:
+                    del self._cache[key]
+
+
 class SmartServerRequestHandler(object):
     """Protocol logic for smart server.
 
@@ -302,6 +387,8 @@ class SmartServerRequestHandler(object):
         self.response = None
         self.finished_reading = False
         self._command = None
+        self._cache_key = None
+        self._cache_body = None
         if 'hpss' in debug.debug_flags:
             self._request_start_time = osutils.perf_counter()
             self._thread_id = get_ident()
@@ -329,6 +416,8 @@ class SmartServerRequestHandler(object):
         if self._command is None:
             # no active command object, so ignore the event.
             return
+        if self._cache_body is not None:
+            self._cache_body.append(bytes)
         self._run_handler_code(self._command.do_chunk, (bytes,), {})
         if 'hpss' in debug.debug_flags:
             self._trace('accept body',
@@ -336,7 +425,7 @@ class SmartServerRequestHandler(object):
 
     def end_of_body(self):
         """No more body data will be received."""
-        self._run_handler_code(self._command.do_end, (), {})
+        self._end()
         # cannot read after this.
         self.finished_reading = True
         if 'hpss' in debug.debug_flags:
@@ -397,13 +486,86 @@ class SmartServerRequestHandler(object):
             self._trace(action, '%s %s' % (cmd, repr(args)[1:-1]))
         self._command = command(
             self._backing_transport, self._root_client_path, self._jail_root)
+        if (response_cache is not None and args
+                and self._command.response_cache_files is not None):
+            self._start_caching(response_cache, cmd, args)
+            if self._use_cached_response(None):
+                return
         self._run_handler_code(self._command.execute, args, {})
+        if self.response is not None:
+            self._cache_response(None)
+            if (response_cache is not None and args
+                    and self.response.is_successful()
+                    and self._command.invalidates_response_cache):
+                response_cache.invalidate(
+                    self._command.transport_from_client_path(args[0]).base)
+
+    def _start_caching(self, cache, cmd, args):
+        generation = self._command.get_response_generation(args[0])
+        if generation is None:
+            return
+        base, contents = generation
+        self._response_cache = cache
+        self._cache_path = args[0]
+        self._cache_key = (base, cmd, args[1:], contents)
+        self._cache_body = []
+
+    def _use_cached_response(self, body):
+        """Respond with the cached response to the request, if any.
+
+        :param body: The body of the request, or None if the request has not
+            been given a body.
+        :return: True if a cached response was used.
+        """
+        if self._cache_key is None:
+            return False
+        response = self._response_cache.get(self._cache_key + (body,))
+        if response is None:
+            return False
+        if 'hpss' in debug.debug_flags:
+            self._trace('hpss cached', self._cache_key[1].decode('ascii'))
+        self.response = response
+        self.finished_reading = True
+        return True
+
+    def _cache_response(self, body):
+        """Add the response to the request to the response cache.
+
+        The response is only cached if the files it was computed from did not
+        change while the request was being processed.
+        """
+        if self._cache_key is None:
+            return
+        response = self.response
+        if not response.is_successful() or response.body_stream is not None:
+            return
+        try:
+            base, cmd, args, contents = self._cache_key
+            generation = self._command.get_response_generation(
+                self._cache_path)
+            if generation != (base, contents):
+                return
+            self._response_cache.add(self._cache_key + (body,), response)
+        except Exception:
+            # Failing to cache a response must not fail the request.
+            trace.log_exception_quietly()
+
+    def _end(self):
+        if self._cache_key is None or self.response is not None:
+            self._run_handler_code(self._command.do_end, (), {})
+            return
+        body = b''.join(self._cache_body)
+        if self._use_cached_response(body):
+            return
+        self._run_handler_code(self._command.do_end, (), {})
+        if self.response is not None:
+            self._cache_response(body)
 
     def end_received(self):
         if self._command is None:
             # no active command object, so ignore the event.
             return
-        self._run_handler_code(self._command.do_end, (), {})
+        self._end()
         if 'hpss' in debug.debug_flags:
             self._trace('end', '', include_time=True)
 
@@ -491,6 +653,23 @@ class HelloRequest(SmartServerRequest):
         return SuccessfulSmartServerResponse((b'ok', b'2'))
 
 
+class NegotiateBodyEncodingRequest(SmartServerRequest):
+    """Pick an encoding for the bodies of later messages on a connection.
+
+    The arguments are the names of the encodings the client supports, in
+    order of preference. The response is ('ok', name) with the first of
+    those the server supports, or ('ok', '') if it supports none of them.
+
+    New in 3.2.
+    """
+
+    def do(self, *encodings):
+        for name in encodings:
+            if name in protocol.body_encoding_registry:
+                return SuccessfulSmartServerResponse((b'ok', name))
+        return SuccessfulSmartServerResponse((b'ok', b''))
+
+
 class GetBundleRequest(SmartServerRequest):
     """Get a bundle of from the null revision to the specified revision."""
 
@@ -674,6 +853,9 @@ request_handlers.register_lazy(
     b'has', 'breezy.bzr.smart.vfs', 'HasRequest', info='read')
 request_handlers.register_lazy(
     b'hello', 'breezy.bzr.smart.request', 'HelloRequest', info='read')
+request_handlers.register_lazy(
+    b'Medium.negotiate_body_encoding', 'breezy.bzr.smart.request',
+    'NegotiateBodyEncodingRequest', info='read')
 request_handlers.register_lazy(
     b'iter_files_recursive', 'breezy.bzr.smart.vfs', 'IterFilesRecursiveRequest',
     info='read')
@@ -703,6 +885,9 @@ request_handlers.register_lazy(
 request_handlers.register_lazy(
     b'PackRepository.autopack', 'breezy.bzr.smart.packrepository',
     'SmartServerPackRepositoryAutopack', info='idem')
+request_handlers.register_lazy(
+    b'PackRepository.autopack_3.2', 'breezy.bzr.smart.packrepository',
+    'SmartServerPackRepositoryAutopack_3_2', info='idem')
 request_handlers.register_lazy(
     b'Repository.break_lock', 'breezy.bzr.smart.repository',
     'SmartServerRepositoryBreakLock', info='idem')
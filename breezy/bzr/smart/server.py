@@ -16,8 +16,11 @@
 
 """Server for smart-server protocol."""
 
+import collections
 import errno
 import os.path
+import queue
+import selectors
 import socket
 import sys
 import time
@@ -34,6 +37,8 @@ from ...lazy_import import lazy_import
 lazy_import(globals(), """
 from breezy.bzr.smart import (
     medium,
+    repository,
+    request,
     signals,
     )
 from breezy.transport import (
@@ -41,7 +46,9 @@ from breezy.transport import (
     pathfilter,
     )
 from breezy import (
+    bedding,
     config,
+    osutils,
     urlutils,
     )
 """)
@@ -86,11 +93,12 @@ class SmartTCPServer(object):
         # we disconnect.
         self._gracefully_stopping = False
 
-    def start_server(self, host, port):
+    def start_server(self, host, port, backlog=1):
         """Create the server listening socket.
 
         :param host: Name of the interface to listen on.
         :param port: TCP port to listen on, or 0 to allocate a transient port.
+        :param backlog: Maximum number of connections waiting to be accepted.
         """
         # let connections timeout so that we get a chance to terminate
         # Keep a reference to the exceptions we want to catch because the socket
@@ -115,7 +123,7 @@ class SmartTCPServer(object):
             raise errors.CannotBindAddress(host, port, message)
         self._sockname = self._server_socket.getsockname()
         self.port = self._sockname[1]
-        self._server_socket.listen(1)
+        self._server_socket.listen(backlog)
         self._server_socket.settimeout(self._ACCEPT_TIMEOUT)
         # Once we start accept()ing connections, we set started.
         self._started = threading.Event()
@@ -202,27 +210,7 @@ class SmartTCPServer(object):
         self._started.set()
         try:
             try:
-                while not self._should_terminate:
-                    try:
-                        conn, client_addr = self._server_socket.accept()
-                    except self._socket_timeout:
-                        # just check if we're asked to stop
-                        pass
-                    except self._socket_error as e:
-                        # if the socket is closed by stop_background_thread
-                        # we might get a EBADF here, or if we get a signal we
-                        # can get EINTR, any other socket errors should get
-                        # logged.
-                        if e.args[0] not in (errno.EBADF, errno.EINTR):
-                            trace.warning(gettext("listening socket error: %s")
-                                          % (e,))
-                    else:
-                        if self._should_terminate:
-                            conn.close()
-                            break
-                        self.serve_conn(conn, thread_name_suffix)
-                    # Cleanout any threads that have finished processing.
-                    self._poll_active_connections()
+                self._serve_connections(thread_name_suffix)
             except KeyboardInterrupt:
                 # dont log when CTRL-C'd.
                 raise
@@ -243,6 +231,41 @@ class SmartTCPServer(object):
             self._wait_for_clients_to_disconnect()
         self._fully_stopped.set()
 
+    def _serve_connections(self, thread_name_suffix):
+        """Accept and serve connections until asked to stop."""
+        while not self._should_terminate:
+            conn = self._accept()
+            if conn is not None:
+                if self._should_terminate:
+                    conn.close()
+                    break
+                self.serve_conn(conn, thread_name_suffix)
+            # Cleanout any threads that have finished processing.
+            self._poll_active_connections()
+
+    def _accept(self):
+        """Accept a connection.
+
+        :return: The socket for the new connection, or None if no connection
+            was accepted
+        """
+        try:
+            conn, client_addr = self._server_socket.accept()
+        except self._socket_timeout:
+            # just check if we're asked to stop
+            pass
+        except self._socket_error as e:
+            # if the socket is closed by stop_background_thread
+            # we might get a EBADF here, or if we get a signal we
+            # can get EINTR, any other socket errors should get
+            # logged.
+            if e.args[0] not in (errno.EBADF, errno.EINTR):
+                trace.warning(gettext("listening socket error: %s")
+                              % (e,))
+        else:
+            return conn
+        return None
+
     def get_url(self):
         """Return the url of the server"""
         return "bzr://%s:%s/" % (self._sockname[0], self._sockname[1])
@@ -319,6 +342,207 @@ class SmartTCPServer(object):
         self._server_thread.join()
 
 
+class _SelectorConnection(object):
+    """State of a connection served by a SmartSelectorTCPServer.
+
+    :ivar handler: The SmartServerSocketStreamMedium for the connection
+    :ivar busy: Whether a worker is serving a request on the connection
+    :ivar last_activity: Time the last request finished
+    """
+
+    def __init__(self, handler, now):
+        self.handler = handler
+        self.busy = False
+        self.last_activity = now
+
+
+class SmartSelectorTCPServer(SmartTCPServer):
+    """A SmartTCPServer that serves requests from a fixed pool of threads.
+
+    Idle connections are watched with a selector, rather than each having a
+    thread blocked reading from it. Once a request arrives on a connection,
+    it is served by one of the worker threads, which decodes the request,
+    runs it and sends the response as SmartServerSocketStreamMedium
+    normally does.
+    """
+
+    def __init__(self, backing_transport, root_client_path='/',
+                 client_timeout=None, max_concurrent_requests=4):
+        """Construct a new server.
+
+        :param max_concurrent_requests: Number of worker threads, and thus
+            the number of requests that can be served at the same time.
+        """
+        SmartTCPServer.__init__(
+            self, backing_transport, root_client_path=root_client_path,
+            client_timeout=client_timeout)
+        self._max_concurrent_requests = max_concurrent_requests
+        self._lock = threading.Condition()
+        self._finished_requests = collections.deque()
+        self._pending_requests = queue.Queue()
+        self._selector = None
+
+    def _serve_connections(self, thread_name_suffix):
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._selector.register(self._server_socket, selectors.EVENT_READ)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        workers = []
+        for i in range(self._max_concurrent_requests):
+            worker = threading.Thread(
+                None, self._serve_requests,
+                name='smart-server-worker%s-%d' % (thread_name_suffix, i))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        try:
+            while not self._should_terminate:
+                try:
+                    events = self._selector.select(self._ACCEPT_TIMEOUT)
+                except (OSError, ValueError):
+                    # The listening socket was closed by
+                    # stop_background_thread.
+                    if self._should_terminate:
+                        break
+                    raise
+                for key, mask in events:
+                    if key.fileobj is self._server_socket:
+                        conn = self._accept()
+                        if conn is not None:
+                            if self._should_terminate:
+                                conn.close()
+                                break
+                            self.serve_conn(conn, thread_name_suffix)
+                    elif key.fileobj is self._wakeup_recv:
+                        self._drain_wakeup()
+                    else:
+                        self._dispatch(key.data)
+                self._watch_finished_requests()
+                self._disconnect_idle_clients()
+        finally:
+            for worker in workers:
+                self._pending_requests.put(None)
+            self._close_idle_connections()
+            self._selector.close()
+            self._wakeup_recv.close()
+            self._wakeup_send.close()
+
+    def serve_conn(self, conn, thread_name_suffix):
+        conn.setblocking(True)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        handler = self._make_handler(conn)
+        connection = _SelectorConnection(handler, self._timer())
+        with self._lock:
+            self._active_connections.append((handler, connection))
+        self._selector.register(conn, selectors.EVENT_READ, connection)
+        return connection
+
+    def _dispatch(self, connection):
+        """Hand a connection with a request waiting to a worker."""
+        self._selector.unregister(connection.handler.socket)
+        connection.busy = True
+        self._pending_requests.put(connection)
+
+    def _serve_requests(self):
+        """Serve requests handed over by _dispatch until told to stop."""
+        while True:
+            connection = self._pending_requests.get()
+            if connection is None:
+                return
+            self._serve_request(connection)
+
+    def _serve_request(self, connection):
+        handler = connection.handler
+        # A client that stalls part way through a request must not keep a
+        # worker, and with enough such clients the whole server, blocked.
+        handler.socket.settimeout(self._client_timeout)
+        try:
+            protocol = handler._build_protocol()
+            if protocol is not None:
+                handler._serve_one_request_unguarded(protocol)
+        except errors.ConnectionTimeout as e:
+            trace.note('%s' % (e,))
+            handler.finished = True
+        except self._socket_timeout:
+            trace.note('disconnecting client after %.1f seconds'
+                       % (self._client_timeout,))
+            handler.terminate_due_to_error()
+        except Exception:
+            trace.log_exception_quietly()
+            handler.terminate_due_to_error()
+        if handler.finished or self._should_terminate:
+            self._remove_connection(handler)
+            return
+        with self._lock:
+            connection.last_activity = self._timer()
+            self._finished_requests.append(connection)
+        try:
+            self._wakeup_send.send(b'\0')
+        except OSError:
+            # The server is stopping.
+            pass
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_recv.recv(1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _watch_finished_requests(self):
+        """Wait for the next request on connections that are idle again."""
+        while True:
+            with self._lock:
+                if not self._finished_requests:
+                    return
+                connection = self._finished_requests.popleft()
+            handler = connection.handler
+            if handler.finished:
+                self._remove_connection(handler)
+            elif handler._push_back_buffer is not None:
+                # The next request was already read along with the last.
+                self._pending_requests.put(connection)
+            else:
+                connection.busy = False
+                self._selector.register(
+                    handler.socket, selectors.EVENT_READ, connection)
+
+    def _disconnect_idle_clients(self):
+        """Disconnect clients that have not sent a request in a while."""
+        if self._client_timeout is None:
+            return
+        cutoff = self._timer() - self._client_timeout
+        for handler, connection in list(self._active_connections):
+            if not connection.busy and connection.last_activity < cutoff:
+                trace.note('disconnecting client after %.1f seconds'
+                           % (self._client_timeout,))
+                self._selector.unregister(handler.socket)
+                self._remove_connection(handler)
+
+    def _close_idle_connections(self):
+        for handler, connection in list(self._active_connections):
+            if not connection.busy:
+                self._remove_connection(handler)
+
+    def _remove_connection(self, handler):
+        handler._disconnect_client()
+        with self._lock:
+            self._active_connections = [
+                (h, c) for (h, c) in self._active_connections
+                if h is not handler]
+            self._lock.notify_all()
+
+    def _poll_active_connections(self, timeout=0.0):
+        """Wait for requests that are being served to finish.
+
+        :param timeout: Maximum number of seconds to wait.
+        """
+        with self._lock:
+            if self._active_connections and timeout:
+                self._lock.wait(timeout)
+
+
 class SmartServerHooks(Hooks):
     """Hooks for the smart server."""
 
@@ -417,6 +641,7 @@ class BzrServerFactory(object):
     def _make_backing_transport(self, transport):
         """Chroot transport, and decorate with userdir expander."""
         self.base_path = self.get_base_path(transport)
+        self.served_url = transport.base
         chroot_server = chroot.ChrootServer(transport)
         chroot_server.start_server()
         self.cleanups.append(chroot_server.stop_server)
@@ -448,9 +673,16 @@ class BzrServerFactory(object):
                 host = medium.BZR_DEFAULT_INTERFACE
             if port is None:
                 port = medium.BZR_DEFAULT_PORT
-            smart_server = SmartTCPServer(self.transport,
-                                          client_timeout=timeout)
-            smart_server.start_server(host, port)
+            c = config.GlobalStack()
+            max_concurrent_requests = c.get('serve.max_concurrent_requests')
+            if max_concurrent_requests:
+                smart_server = SmartSelectorTCPServer(
+                    self.transport, client_timeout=timeout,
+                    max_concurrent_requests=max_concurrent_requests)
+            else:
+                smart_server = SmartTCPServer(self.transport,
+                                              client_timeout=timeout)
+            smart_server.start_server(host, port, c.get('serve.backlog'))
             trace.note(gettext('listening on port: %s'),
                        str(smart_server.port))
         self.smart_server = smart_server
@@ -475,6 +707,29 @@ class BzrServerFactory(object):
         def restore_signals():
             signals.restore_sighup_handler(orig)
         self.cleanups.append(restore_signals)
+        cache_size = config.GlobalStack().get('serve.response_cache_size')
+        if cache_size:
+            old_response_cache = request.response_cache
+
+            def restore_response_cache():
+                request.response_cache = old_response_cache
+            self.cleanups.append(restore_response_cache)
+            request.response_cache = request.ResponseCache(cache_size)
+        clone_cache_size = config.GlobalStack().get('serve.clone_cache_size')
+        if clone_cache_size:
+            old_clone_stream_cache = repository.clone_stream_cache
+
+            def restore_clone_stream_cache():
+                repository.clone_stream_cache = old_clone_stream_cache
+            self.cleanups.append(restore_clone_stream_cache)
+            # Keep the clones of each served directory apart, as the paths
+            # of the repositories are relative to it.
+            cache_path = osutils.pathjoin(
+                bedding.cache_dir(), 'smart-clones',
+                osutils.sha_string(self.served_url.encode('utf-8')).decode(
+                    'ascii'))
+            repository.clone_stream_cache = repository.CloneStreamCache(
+                cache_path, clone_cache_size)
 
     def set_up(self, transport, host, port, inet, timeout):
         self._make_backing_transport(transport)
@@ -58,6 +58,7 @@ def load_tests(loader, basic_tests, pattern):
         'test__chk_map',
         'test__dirstate_helpers',
         'test__groupcompress',
+        'test_bloom',
         'test_btree_index',
         'test_bundle',
         'test_bzrdir',
@@ -75,6 +76,7 @@ def load_tests(loader, basic_tests, pattern):
         'test_read_bundle',
         'test_remote',
         'test_repository',
+        'test_revno_index',
         'test_smart',
         'test_smart_request',
         'test_smart_signals',
@@ -86,6 +88,7 @@ def load_tests(loader, basic_tests, pattern):
         'test_versionedfile',
         'test_vf_search',
         'test_vfs_ratchet',
+        'test_watcher',
         'test_workingtree',
         'test_workingtree_4',
         'test_weave',
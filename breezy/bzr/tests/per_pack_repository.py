@@ -234,6 +234,35 @@ class TestPackRepository(TestCaseWithTransport):
         pack_names = [node[1][0] for node in index.iter_all_entries()]
         self.assertTrue(large_pack_name in pack_names)
 
+    def test_commit_autopack_limited_by_max_bytes(self):
+        format = self.get_format()
+        tree = self.make_branch_and_tree('.', format=format)
+        trans = tree.branch.repository.controldir.get_repository_transport(
+            None)
+        config_stack = tree.branch.repository._pack_collection.config_stack
+        config_stack.set('repository.autopack_max_bytes', '1')
+        for x in range(10):
+            tree.commit('commit %s' % x)
+        # no packs fit in the limit, so autopacking was deferred.
+        index = self.index_class(trans, 'pack-names', None)
+        self.assertEqual(10, len(list(index.iter_all_entries())))
+        pack_sizes = [trans.stat('packs/%s.pack' % node[1][0].decode('ascii')
+                                 ).st_size
+                      for node in index.iter_all_entries()]
+        config_stack.set('repository.autopack_max_bytes',
+                         str(3 * max(pack_sizes)))
+        tree.commit('commit triggering limited pack')
+        index = self.index_class(trans, 'pack-names', None)
+        pack_count = len(list(index.iter_all_entries()))
+        self.assertTrue(1 < pack_count < 10, pack_count)
+        # the rest of the work is done by an explicit autopack; 11 revisions
+        # are distributed over at most 2 packs.
+        tree.branch.repository.autopack()
+        index = self.index_class(trans, 'pack-names', None)
+        self.assertTrue(len(list(index.iter_all_entries())) <= 2)
+        tree = tree.controldir.open_workingtree()
+        tree.branch.repository.check([tree.branch.last_revision()])
+
     def test_commit_write_group_returns_new_pack_names(self):
         # This test doesn't need real disk.
         self.vfs_transport_factory = memory.MemoryServer
@@ -335,6 +364,58 @@ class TestPackRepository(TestCaseWithTransport):
         self.assertEqual(1, len(list(index.iter_all_entries())))
         self.assertEqual(2, len(tree.branch.repository.all_revision_ids()))
 
+    def test_bloom_filters(self):
+        format = self.get_format()
+        tree = self.make_branch_and_tree('.', format=format)
+        if self.index_class is not BTreeGraphIndex:
+            raise TestNotApplicable('bloom filters need B+Tree indices')
+        tree.branch.repository._pack_collection.config_stack.set(
+            'repository.bloom_filters', True)
+        tree = tree.controldir.open_workingtree()
+        index_trans = tree.controldir.get_repository_transport(
+            None).clone('indices')
+        revid1 = tree.commit('start')
+        revid2 = tree.commit('more work')
+        indices = index_trans.list_dir('.')
+        blooms = [name for name in indices if name.endswith('.bloom')]
+        self.assertEqual(sorted(name + '.bloom' for name in indices
+                                if not name.endswith('.bloom')),
+                         sorted(blooms))
+        tree.branch.repository.pack()
+        # the filters of the obsolete packs are removed along with their
+        # indices.
+        indices = index_trans.list_dir('.')
+        self.assertEqual(len(indices), 2 * len(
+            [name for name in indices if name.endswith('.bloom')]))
+        repo = repository.Repository.open('.')
+        with repo.lock_read():
+            self.assertEqual(
+                {revid2: (revid1,)},
+                repo.get_parent_map([revid2, b'missing']))
+            revision_index = repo._pack_collection.revision_index
+            bloom_filter = (
+                revision_index.combined_index._indices[0].get_bloom_filter())
+            self.assertTrue((revid1,) in bloom_filter)
+
+    def test_bloom_filters_removed_when_disabled(self):
+        format = self.get_format()
+        tree = self.make_branch_and_tree('.', format=format)
+        if self.index_class is not BTreeGraphIndex:
+            raise TestNotApplicable('bloom filters need B+Tree indices')
+        config_stack = tree.branch.repository._pack_collection.config_stack
+        config_stack.set('repository.bloom_filters', True)
+        tree = tree.controldir.open_workingtree()
+        tree.commit('start')
+        tree.commit('more work')
+        config_stack.set('repository.bloom_filters', False)
+        tree = tree.controldir.open_workingtree()
+        tree.branch.repository.pack()
+        index_trans = tree.controldir.get_repository_transport(
+            None).clone('indices')
+        self.assertEqual(
+            [], [name for name in index_trans.list_dir('.')
+                 if name.endswith('.bloom')])
+
     def test_pack_preserves_all_inventories(self):
         # This is related to bug:
         #   https://bugs.launchpad.net/bzr/+bug/412198
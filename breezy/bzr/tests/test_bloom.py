@@ -0,0 +1,76 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for breezy.bzr.bloom."""
+
+from .. import bloom
+from ... import tests
+
+
+class TestBloomFilter(tests.TestCase):
+
+    def make_keys(self, prefix, count):
+        return [(b'%s-%d' % (prefix, i), b'rev-%d' % i) for i in range(count)]
+
+    def test_empty(self):
+        bloom_filter = bloom.BloomFilter.for_key_count(0)
+        self.assertFalse((b'key',) in bloom_filter)
+
+    def test_malformed_key(self):
+        # The filter can't rule out keys it can't hash.
+        bloom_filter = bloom.BloomFilter.for_key_count(0)
+        self.assertTrue(((b'key',),) in bloom_filter)
+
+    def test_no_false_negatives(self):
+        keys = self.make_keys(b'present', 1000)
+        bloom_filter = bloom.BloomFilter.for_key_count(len(keys))
+        for key in keys:
+            bloom_filter.add(key)
+        for key in keys:
+            self.assertTrue(key in bloom_filter)
+
+    def test_few_false_positives(self):
+        keys = self.make_keys(b'present', 1000)
+        bloom_filter = bloom.BloomFilter.for_key_count(len(keys))
+        for key in keys:
+            bloom_filter.add(key)
+        false_positives = [key for key in self.make_keys(b'absent', 1000)
+                           if key in bloom_filter]
+        # About 1% are expected, leave plenty of slack.
+        self.assertTrue(len(false_positives) < 50, len(false_positives))
+
+    def test_roundtrip(self):
+        keys = self.make_keys(b'present', 100)
+        bloom_filter = bloom.BloomFilter.for_key_count(len(keys))
+        for key in keys:
+            bloom_filter.add(key)
+        data = bloom_filter.to_bytes()
+        self.assertStartsWith(data, b'Bazaar Bloom Filter 1\nhashes=7\n'
+                                    b'bits=1000\n')
+        parsed = bloom.BloomFilter.from_bytes(data)
+        self.assertEqual(data, parsed.to_bytes())
+        for key in keys:
+            self.assertTrue(key in parsed)
+
+    def test_bad_data(self):
+        self.assertRaises(bloom.BadBloomFilter,
+                          bloom.BloomFilter.from_bytes, b'junk', 'name')
+        self.assertRaises(bloom.BadBloomFilter,
+                          bloom.BloomFilter.from_bytes,
+                          b'Bazaar Bloom Filter 1\nhashes=7\nbits=64\nshort')
+        self.assertRaises(bloom.BadBloomFilter,
+                          bloom.BloomFilter.from_bytes,
+                          b'Bazaar Bloom Filter 1\nhashes=7\n')
@@ -645,6 +645,95 @@ class TestBTreeIndex(BTreeTestCase):
         return btree_index.BTreeGraphIndex(transport, 'index', size=size,
                                            offset=offset)
 
+    def make_index_with_bloom_filter(self, name, nodes, bloom_data=None):
+        builder = btree_index.BTreeBuilder(key_elements=1, reference_lists=0)
+        for node in nodes:
+            builder.add_node(*node)
+        trans = transport.get_transport_from_url('trace+' + self.get_url())
+        size = trans.put_file(name, builder.finish())
+        if bloom_data is None:
+            bloom_data = builder.finish_bloom_filter()
+        trans.put_bytes(name + '.bloom', bloom_data)
+        del trans._activity[:]
+        index = btree_index.BTreeGraphIndex(trans, name, size)
+        index._bloom_name = name + '.bloom'
+        return trans, index
+
+    def test_bloom_filter(self):
+        nodes = self.make_nodes(500, 1, 0)
+        trans, index = self.make_index_with_bloom_filter('index', nodes)
+        bloom_filter = index.get_bloom_filter()
+        for key, value, refs in nodes:
+            self.assertTrue(key in bloom_filter)
+        self.assertEqual([('get', 'index.bloom')], trans._activity)
+        # The filter is only read once.
+        self.assertIs(bloom_filter, index.get_bloom_filter())
+
+    def test_bloom_filter_not_configured(self):
+        nodes = self.make_nodes(10, 1, 0)
+        trans, index = self.make_index_with_bloom_filter('index', nodes)
+        index._bloom_name = None
+        self.assertIs(None, index.get_bloom_filter())
+        self.assertEqual([], trans._activity)
+
+    def test_bloom_filter_missing_or_corrupt(self):
+        nodes = self.make_nodes(10, 1, 0)
+        trans, index = self.make_index_with_bloom_filter(
+            'index', nodes, b'junk')
+        self.assertIs(None, index.get_bloom_filter())
+        trans.delete('index.bloom')
+        index = btree_index.BTreeGraphIndex(trans, 'index', None)
+        index._bloom_name = 'index.bloom'
+        self.assertIs(None, index.get_bloom_filter())
+
+    def test_combined_index_skips_indices_by_bloom_filter(self):
+        nodes = [((b'key-%d' % i,), b'value') for i in range(10)]
+        trans1, index1 = self.make_index_with_bloom_filter(
+            'index1', nodes[:5])
+        trans2, index2 = self.make_index_with_bloom_filter(
+            'index2', nodes[5:])
+        combined = _mod_index.CombinedGraphIndex([index1, index2])
+        self.assertEqual([(index2, (b'key-7',), b'value')],
+                         list(combined.iter_entries([(b'key-7',)])))
+        # Only the filter of the first index was read, not the index itself.
+        self.assertEqual([('get', 'index1.bloom')], trans1._activity)
+        self.assertEqual([], list(combined.iter_entries([(b'missing',)])))
+        self.assertEqual([('get', 'index1.bloom')], trans1._activity)
+
+    def test_local_index_is_mapped(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        nodes = self.make_nodes(160, 2, 2)
+        index = self.make_index_with_offset(ref_lists=2, key_elements=2,
+                                            nodes=nodes, offset=10)
+        self.assertEqual(
+            [(index, nodes[30][0], nodes[30][1], nodes[30][2])],
+            list(index.iter_entries([nodes[30][0]])))
+        self.assertIsInstance(index._mmap, memoryview)
+        self.assertEqual([btree_index._LazyLeafNode],
+                         list(set(type(node) for node in
+                                  index._leaf_node_cache.as_dict().values())))
+        self.assertEqual(sorted(nodes),
+                         sorted(entry[1:] for entry in
+                                index.iter_all_entries()))
+
+    def test_local_index_without_mmap(self):
+        self.overrideAttr(btree_index, '_use_mmap', False)
+        nodes = self.make_nodes(160, 2, 2)
+        index = self.make_index_with_offset(ref_lists=2, key_elements=2,
+                                            nodes=nodes)
+        self.assertEqual(1, len(list(index.iter_entries([nodes[30][0]]))))
+        self.assertFalse(index._mmap)
+        self.assertEqual([btree_index._LeafNode],
+                         list(set(type(node) for node in
+                                  index._leaf_node_cache.as_dict().values())))
+
+    def test_missing_local_index_is_not_mapped(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        index = btree_index.BTreeGraphIndex(self.get_transport(''), 'index',
+                                            None)
+        self.assertRaises(errors.NoSuchFile, index.key_count)
+        self.assertFalse(index._mmap)
+
     def test_clear_cache(self):
         nodes = self.make_nodes(160, 2, 2)
         index = self.make_index(ref_lists=2, key_elements=2, nodes=nodes)
@@ -1293,6 +1382,44 @@ class TestBTreeNodes(BTreeTestCase):
             (b'11', b'44'): (b'value:4', ((), ((b'11', b'ref00'),)))
             }, dict(node.all_items()))
 
+    def test_LazyLeafNode_2_2(self):
+        node_bytes = (b"type=leaf\n"
+                      b"00\x0000\x00\t00\x00ref00\x00value:0\n"
+                      b"00\x0011\x0000\x00ref00\t00\x00ref00\r01\x00ref01\x00value:1\n"
+                      b"11\x0033\x0011\x00ref22\t11\x00ref22\r11\x00ref22\x00value:3\n"
+                      b"11\x0044\x00\t11\x00ref00\x00value:4\n"
+                      b""
+                      )
+        node = btree_index._LazyLeafNode(node_bytes, 2, 2)
+        self.assertEqual(
+            btree_index._LeafNode(node_bytes, 2, 2).all_items(),
+            node.all_items())
+        self.assertEqual(4, len(node))
+        self.assertEqual((b'00', b'00'), node.min_key)
+        self.assertEqual((b'11', b'44'), node.max_key)
+        self.assertEqual([(b'00', b'00'), (b'00', b'11'), (b'11', b'33'),
+                          (b'11', b'44')], node.all_keys())
+        self.assertTrue((b'11', b'33') in node)
+        self.assertEqual((b'value:3', (((b'11', b'ref22'),),
+                                       ((b'11', b'ref22'), (b'11', b'ref22')))),
+                         node[(b'11', b'33')])
+        # Neither a prefix of a key, nor a key that sorts between two others
+        # is found.
+        self.assertFalse((b'1', b'33') in node)
+        self.assertFalse((b'11', b'3') in node)
+        self.assertFalse((b'00', b'22') in node)
+        self.assertRaises(KeyError, node.__getitem__, (b'22', b'00'))
+        # Keys of the wrong shape are not found either.
+        self.assertFalse((b'11',) in node)
+        self.assertFalse(((b'11', b'33'),) in node)
+
+    def test_LazyLeafNode_empty(self):
+        node = btree_index._LazyLeafNode(b"type=leaf\n", 1, 0)
+        self.assertEqual(0, len(node))
+        self.assertIs(None, node.min_key)
+        self.assertEqual([], node.all_items())
+        self.assertFalse((b'key',) in node)
+
     def assertFlattened(self, expected, key, value, refs):
         flat_key, flat_line = self.parse_btree._flatten_node(
             (None, key, value, refs), bool(refs))
@@ -16,8 +16,10 @@
 
 """Tests of the dirstate functionality being built for WorkingTreeFormat4."""
 
+from concurrent import futures
 import os
 import tempfile
+import threading
 
 from ... import (
     controldir,
@@ -2466,6 +2468,73 @@ class TestSHA1Provider(tests.TestCaseInTempDir):
         self.assertEqual(expected_sha, sha1)
 
 
+class TestPrefetchingSHA1s(tests.TestCaseWithTransport):
+
+    def make_stale_tree(self):
+        tree = self.make_branch_and_tree('.')
+        self.build_tree_contents([
+            ('a', b'a content\n'), ('b', b'b content\n'), ('dir/',),
+            ('dir/c', b'c content\n')])
+        tree.add(['a', 'b', 'dir', 'dir/c'])
+        tree.commit('one')
+        self.build_tree_contents([('unknown', b'new\n')])
+        tree.add(['unknown'])
+        # Change the content of a and make the fingerprints of the other
+        # files out of date.
+        self.build_tree_contents([('b', b'b changed\n')])
+        for path in ['a', 'dir/c', 'unknown']:
+            os.utime(path, (1000000000, 1000000000))
+        return tree
+
+    def test_prefetch_directory(self):
+        tree = self.make_stale_tree()
+        self.addCleanup(tree.lock_read().unlock)
+        state = tree.current_dirstate()
+        state._read_dirblocks_if_needed()
+        dir_info = next(osutils._walkdirs_utf8(tree.basedir))
+        prefetcher = dirstate._PrefetchingSHA1Provider(
+            dirstate.DefaultSHA1Provider(), futures.ThreadPoolExecutor(2))
+        self.addCleanup(prefetcher._executor.shutdown)
+        prefetcher.prefetch_directory(state, dir_info)
+        # The newly added file has nothing to be compared with.
+        self.assertEqual([tree.abspath('a'), tree.abspath('b')],
+                         sorted(prefetcher._pending))
+        self.assertEqual(osutils.sha_string(b'b changed\n'),
+                         prefetcher.sha1(tree.abspath('b')))
+        self.assertEqual([tree.abspath('a')], list(prefetcher._pending))
+        prefetcher.clear()
+        self.assertEqual({}, prefetcher._pending)
+        # Files that were not prefetched are hashed inline.
+        self.assertEqual(osutils.sha_string(b'a content\n'),
+                         prefetcher.stat_and_sha1(tree.abspath('a'))[1])
+
+    def test_iter_changes_with_threads(self):
+        tree = self.make_stale_tree()
+        tree.get_config_stack().set('dirstate.sha1_threads', 2)
+        self.addCleanup(tree.lock_read().unlock)
+        basis = tree.basis_tree()
+        self.addCleanup(basis.lock_read().unlock)
+        state = tree.current_dirstate()
+        provider = state._sha1_provider
+        calls = []
+        orig_stat_and_sha1 = provider.stat_and_sha1
+
+        def stat_and_sha1(abspath):
+            in_main_thread = (
+                threading.current_thread() is threading.main_thread())
+            calls.append((osutils.basename(abspath), in_main_thread))
+            return orig_stat_and_sha1(abspath)
+        self.overrideAttr(provider, 'stat_and_sha1', stat_and_sha1)
+        self.assertEqual(
+            ['b', 'unknown'],
+            sorted(change.path[1] for change in tree.iter_changes(basis)))
+        self.assertIs(None, state._sha1_prefetcher)
+        self.assertIs(provider, state._sha1_provider)
+        # All files were hashed on the thread pool.
+        self.assertEqual([('a', False), ('b', False), ('c', False)],
+                         sorted(calls))
+
+
 class _Repo(object):
     """A minimal api to get InventoryRevisionTree to work."""
 
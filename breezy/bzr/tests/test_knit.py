@@ -523,6 +523,147 @@ class TestPackKnitAccess(TestCaseWithMemoryTransport, KnitRecordAccessTestsMixin
         self.assertEqual([b'1234567890', b'alpha'],
                          list(access.get_raw_records(memos[0:1] + memos[2:3])))
 
+    def test_read_from_several_packs_concurrently(self):
+        access, writer = self._get_access()
+        memos = []
+        memos.extend(access.add_raw_records([(b'key', 10)], [b'1234567890']))
+        writer.end()
+        access, writer = self._get_access('pack2', 'FOOBAR')
+        memos.extend(access.add_raw_records([(b'key', 5)], [b'12345']))
+        writer.end()
+        access, writer = self._get_access('pack3', 'BAZ')
+        memos.extend(access.add_raw_records([(b'key', 5)], [b'alpha']))
+        writer.end()
+        transport = self.get_transport()
+        access = pack_repo._DirectPackAccess({"FOO": (transport, 'packfile'),
+                                              "FOOBAR": (transport, 'pack2'),
+                                              "BAZ": (transport, 'pack3')})
+        access.max_concurrent_reads = 2
+        self.addCleanup(access.close)
+        self.assertEqual([b'1234567890', b'12345', b'alpha'],
+                         list(access.get_raw_records(memos)))
+        self.assertEqual([b'alpha', b'1234567890', b'12345'],
+                         list(access.get_raw_records(
+                             memos[2:3] + memos[0:2])))
+
+    def test_concurrent_reads_reuse_executor(self):
+        memos = self.make_pack_file()
+        access, writer = self._get_access('pack2', 'bar')
+        memos.extend(access.add_raw_records([(b'key', 5)], [b'alpha']))
+        writer.end()
+        transport = self.get_transport()
+        access = pack_repo._DirectPackAccess(
+            {'foo': (transport, 'packname'),
+             'bar': (transport, 'pack2')})
+        access.max_concurrent_reads = 2
+        self.addCleanup(access.close)
+        list(access.get_raw_records(memos))
+        executor = access._executor
+        self.assertIsNot(None, executor)
+        list(access.get_raw_records(memos))
+        self.assertIs(executor, access._executor)
+        access.close()
+        self.assertIs(None, access._executor)
+
+    def test_reader_transport_reuses_credentials(self):
+        created = []
+
+        class ReaderTransport(transport.ConnectedTransport):
+
+            def _create_connection(self, credentials=None):
+                created.append(credentials)
+                return object(), credentials
+
+            def disconnect(self):
+                pass
+
+        t = ReaderTransport('stub://user@host/')
+        t._set_connection(object(), ('user', 'secret'))
+        access = pack_repo._DirectPackAccess({'foo': (t, 'packname')})
+        self.assertTrue(access._can_read_concurrently([('foo', [])]))
+        reader = access._acquire_reader_transport(t)
+        self.assertIsNot(t, reader)
+        self.assertIsNot(t._get_connection(), reader._get_connection())
+        self.assertEqual(('user', 'secret'), reader._get_credentials())
+        self.assertEqual([('user', 'secret')], created)
+
+    def test_serial_reads_without_credentials(self):
+        # Readers for transports that can't open a connection with known
+        # credentials might prompt the user from a reader thread.
+        t = transport.ConnectedTransport('stub://host/')
+        access = pack_repo._DirectPackAccess({'foo': (t, 'packname')})
+        self.assertFalse(access._can_read_concurrently([('foo', [])]))
+        access = pack_repo._DirectPackAccess(
+            {'foo': (self.get_transport(), 'packname')})
+        self.assertTrue(access._can_read_concurrently([('foo', [])]))
+
+    def test_close_disconnects_reader_transports(self):
+        disconnected = []
+
+        class StubTransport(object):
+
+            def disconnect(self):
+                disconnected.append(self)
+
+        access = pack_repo._DirectPackAccess({})
+        reader = StubTransport()
+        access._reader_transports['sftp://host/'] = [reader]
+        access.close()
+        self.assertEqual([reader], disconnected)
+        self.assertEqual({}, access._reader_transports)
+
+    def test_concurrent_missing_file_raises_retry(self):
+        memos = self.make_pack_file()
+        access, writer = self._get_access('pack2', 'bar')
+        memos.extend(access.add_raw_records([(b'key', 5)], [b'alpha']))
+        writer.end()
+        transport = self.get_transport()
+        reload_called, reload_func = self.make_reload_func()
+        access = pack_repo._DirectPackAccess(
+            {'foo': (transport, 'packname'),
+             'bar': (transport, 'different-packname')},
+            reload_func=reload_func)
+        access.max_concurrent_reads = 2
+        self.addCleanup(access.close)
+        e = self.assertListRaises(errors.RetryWithNewPacks,
+                                  access.get_raw_records, memos)
+        self.assertFalse(e.reload_occurred)
+        self.assertIs(e.exc_info[0], errors.NoSuchFile)
+
+    def test_pack_collection_max_concurrent_reads(self):
+        builder = self.make_branch_builder('.')
+        builder.start_series()
+        builder.build_snapshot(None, [
+            ('add', ('', b'root-id', 'directory', None)),
+            ('add', ('file', b'file-id', 'file', b'content\nrev 1\n')),
+            ], revision_id=b'rev-1')
+        builder.build_snapshot([b'rev-1'], [
+            ('modify', ('file', b'content\nrev 2\n')),
+            ], revision_id=b'rev-2')
+        builder.finish_series()
+        repo = builder.get_branch().repository
+        keys = [(b'file-id', b'rev-1'), (b'file-id', b'rev-2')]
+        with repo.lock_read():
+            expected = {
+                record.key: record.get_bytes_as('fulltext')
+                for record in repo.texts.get_record_stream(
+                    keys, 'unordered', True)}
+        repo._pack_collection.config_stack.set(
+            'repository.max_concurrent_reads', '3')
+        repo = repo.controldir.open_repository()
+        with repo.lock_read():
+            self.assertEqual(
+                3, repo._pack_collection.text_index.data_access
+                .max_concurrent_reads)
+            self.assertEqual(expected, {
+                record.key: record.get_bytes_as('fulltext')
+                for record in repo.texts.get_record_stream(
+                    keys, 'unordered', True)})
+            self.assertIsNot(
+                None, repo._pack_collection.text_index.data_access._executor)
+        self.assertIs(
+            None, repo._pack_collection.text_index.data_access._executor)
+
     def test_set_writer(self):
         """The writer should be settable post construction."""
         access = pack_repo._DirectPackAccess({})
@@ -3671,8 +3671,8 @@ class _StubPackCollection(object):
     def __init__(self, calls):
         self.calls = calls
 
-    def autopack(self):
-        self.calls.append(('pack collection autopack',))
+    def autopack(self, max_bytes=None):
+        self.calls.append(('pack collection autopack', max_bytes))
 
 
 class TestRemotePackRepositoryAutoPack(TestRemoteRepository):
@@ -3685,10 +3685,19 @@ class TestRemotePackRepositoryAutoPack(TestRemoteRepository):
         transport_path = 'quack'
         repo, client = self.setup_fake_client_and_repository(transport_path)
         client.add_expected_call(
-            b'PackRepository.autopack', (b'quack/',), b'success', (b'ok',))
+            b'PackRepository.autopack_3.2', (b'quack/', 0), b'success',
+            (b'ok',))
         repo.autopack()
         self.assertFinished(client)
 
+    def test_ok_configured_limit(self):
+        transport_path = 'quack'
+        repo, client = self.setup_fake_client_and_repository(transport_path)
+        client.add_expected_call(
+            b'PackRepository.autopack', (b'quack/',), b'success', (b'ok',))
+        repo.autopack(max_bytes=None)
+        self.assertFinished(client)
+
     def test_ok_with_real_repo(self):
         """When the server returns 'ok' and there is a _real_repository, then
         the _real_repository's reload_pack_name's method will be called.
@@ -3696,22 +3705,23 @@ class TestRemotePackRepositoryAutoPack(TestRemoteRepository):
         transport_path = 'quack'
         repo, client = self.setup_fake_client_and_repository(transport_path)
         client.add_expected_call(
-            b'PackRepository.autopack', (b'quack/',),
+            b'PackRepository.autopack_3.2', (b'quack/', 0),
             b'success', (b'ok',))
         repo._real_repository = _StubRealPackRepository(client._calls)
         repo.autopack()
         self.assertEqual(
-            [('call', b'PackRepository.autopack', (b'quack/',)),
+            [('call', b'PackRepository.autopack_3.2', (b'quack/', 0)),
              ('pack collection reload_pack_names',)],
             client._calls)
 
     def test_backwards_compatibility(self):
-        """If the server does not recognise the PackRepository.autopack verb,
-        fallback to the real_repository's implementation.
+        """If the server does not recognise the PackRepository.autopack_3.2
+        verb, fallback to the real_repository's implementation, still without
+        a limit.
         """
         transport_path = 'quack'
         repo, client = self.setup_fake_client_and_repository(transport_path)
-        client.add_unknown_method_response(b'PackRepository.autopack')
+        client.add_unknown_method_response(b'PackRepository.autopack_3.2')
 
         def stub_ensure_real():
             client._calls.append(('_ensure_real',))
@@ -3719,9 +3729,9 @@ class TestRemotePackRepositoryAutoPack(TestRemoteRepository):
         repo._ensure_real = stub_ensure_real
         repo.autopack()
         self.assertEqual(
-            [('call', b'PackRepository.autopack', (b'quack/',)),
+            [('call', b'PackRepository.autopack_3.2', (b'quack/', 0)),
              ('_ensure_real',),
-             ('pack collection autopack',)],
+             ('pack collection autopack', 0)],
             client._calls)
 
     def test_oom_error_reporting(self):
@@ -3729,7 +3739,7 @@ class TestRemotePackRepositoryAutoPack(TestRemoteRepository):
         transport_path = 'quack'
         repo, client = self.setup_fake_client_and_repository(transport_path)
         client.add_expected_call(
-            b'PackRepository.autopack', (b'quack/',),
+            b'PackRepository.autopack_3.2', (b'quack/', 0),
             b'error', (b'MemoryError',))
         err = self.assertRaises(errors.BzrError, repo.autopack)
         self.assertContainsRe(str(err), "^remote server out of mem")
@@ -4222,6 +4232,28 @@ class TestRemoteBranchEffort(tests.TestCaseWithTransport):
         remote_branch.copy_content_into(local)
         self.assertFalse(b'Branch.revision_history' in self.hpss_calls)
 
+    def test_open_branch_prefetches(self):
+        self.make_branch('remote')
+        remote_bzrdir = bzrdir.BzrDir.open(
+            self.smart_server.get_url() + 'remote')
+        self.assertTrue(remote_bzrdir._client._medium.supports_pipelining())
+        self.hpss_calls = []
+        remote_bzrdir.open_branch()
+        # The calls after open_branchV3 are pipelined, and their responses
+        # all used.
+        self.assertEqual(
+            [b'BzrDir.open_branchV3', b'BzrDir.find_repositoryV3',
+             b'Branch.get_stacked_on_url'], self.hpss_calls)
+        self.assertEqual({}, remote_bzrdir._client._prefetched_responses)
+
+    def test_open_missing_branch_doesnt_prefetch(self):
+        self.make_controldir('remote')
+        remote_bzrdir = bzrdir.BzrDir.open(
+            self.smart_server.get_url() + 'remote')
+        self.hpss_calls = []
+        self.assertRaises(errors.NotBranchError, remote_bzrdir.open_branch)
+        self.assertEqual([b'BzrDir.open_branchV3'], self.hpss_calls)
+
     def test_fetch_everything_needs_just_one_call(self):
         local = self.make_branch('local')
         builder = self.make_branch_builder('remote')
@@ -1650,6 +1650,42 @@ class TestGCCHKPacker(TestCaseWithTransport):
         self.assertContainsRe(str(e),
                               r"We are missing inventories for revisions: .*'A'")
 
+    def test_partition_text_keys(self):
+        keys = [(b'f-%d' % (i % 3,), b'rev-%d' % i) for i in range(9)]
+        partitions = groupcompress_repo._partition_text_keys(keys, 2)
+        # Texts of a file are never split between partitions.
+        self.assertEqual(
+            [{b'f-0', b'f-1'}, {b'f-2'}],
+            [set(key[0] for key in partition) for partition in partitions])
+        self.assertEqual(sorted(keys),
+                         sorted(key for p in partitions for key in p))
+
+    def test_pack_in_processes(self):
+        b_source = self.make_abc_branch()
+        repo = b_source.repository
+        repo._pack_collection.config_stack.set('repository.pack_processes', 2)
+        repo = b_source.controldir.open_repository()
+        with repo.lock_read():
+            expected = dict(
+                (record.key, record.get_bytes_as('fulltext'))
+                for record in repo.texts.get_record_stream(
+                    repo.texts.keys(), 'unordered', True))
+        calls = []
+        orig_copy = groupcompress_repo.GCCHKPacker._copy_texts_in_processes
+        self.overrideAttr(
+            groupcompress_repo.GCCHKPacker, '_copy_texts_in_processes',
+            lambda *args: calls.append(args) or orig_copy(*args))
+        repo.pack()
+        self.assertEqual(1, len(calls))
+        repo = b_source.controldir.open_repository()
+        with repo.lock_read():
+            self.assertEqual(1, len(repo._pack_collection.names()))
+            self.assertEqual(expected, dict(
+                (record.key, record.get_bytes_as('fulltext'))
+                for record in repo.texts.get_record_stream(
+                    repo.texts.keys(), 'unordered', True)))
+        repo.check([b'C']).report_results(verbose=False)
+
 
 class TestCrossFormatPacks(TestCaseWithTransport):
 
@@ -0,0 +1,241 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for breezy.bzr.revno_index."""
+
+from ... import (
+    branch as _mod_branch,
+    errors,
+    )
+from .. import (
+    branch as bzr_branch,
+    revno_index,
+    )
+from ..smart import (
+    repository as smart_repo,
+    request as smart_req,
+    )
+from ...tests import (
+    TestCaseWithMemoryTransport,
+    TestCaseWithTransport,
+    )
+
+
+class TestRevnoIndex(TestCaseWithMemoryTransport):
+
+    def make_index(self):
+        return revno_index.RevnoIndex(self.get_transport())
+
+    def test_missing(self):
+        index = self.make_index()
+        self.assertIs(None, index.get_tip())
+        self.assertFalse(index.is_complete())
+        self.assertIs(None, index.get_dotted_revno(b'rev-1'))
+        self.assertIs(None, index.get_revision_id((1,)))
+
+    def test_write_and_read(self):
+        self.make_index().write(
+            (2, b'rev-2'),
+            {b'rev-1': (1,), b'rev-1.1.1': (1, 1, 1), b'rev-2': (2,)})
+        index = self.make_index()
+        self.assertEqual((2, b'rev-2'), index.get_tip())
+        self.assertTrue(index.is_complete())
+        self.assertEqual((1, 1, 1), index.get_dotted_revno(b'rev-1.1.1'))
+        self.assertEqual(b'rev-2', index.get_revision_id((2,)))
+        self.assertEqual(b'rev-1.1.1', index.get_revision_id((1, 1, 1)))
+        self.assertIs(None, index.get_dotted_revno(b'rev-3'))
+
+    def test_extend(self):
+        self.make_index().write((1, b'rev-1'), {b'rev-1': (1,)})
+        index = self.make_index()
+        index.extend((2, b'rev-2'), {b'rev-2': (2,)}, True)
+        self.assertEqual((2, b'rev-2'), index.get_tip())
+        index = self.make_index()
+        self.assertEqual((2, b'rev-2'), index.get_tip())
+        self.assertTrue(index.is_complete())
+        self.assertEqual((2,), index.get_dotted_revno(b'rev-2'))
+        self.assertEqual(b'rev-1', index.get_revision_id((1,)))
+        self.assertTrue(
+            self.get_transport().has(revno_index.REVNO_INDEX_TAIL_NAME))
+
+    def test_extend_partial(self):
+        self.make_index().write((1, b'rev-1'), {b'rev-1': (1,)})
+        index = self.make_index()
+        index.extend((2, b'rev-2'), {b'rev-2': (2,)}, False)
+        index = self.make_index()
+        self.assertEqual((2, b'rev-2'), index.get_tip())
+        self.assertFalse(index.is_complete())
+
+    def test_extend_folds_tail(self):
+        self.overrideAttr(revno_index, '_MAX_TAIL_ENTRIES', 2)
+        self.make_index().write((1, b'rev-1'), {b'rev-1': (1,)})
+        index = self.make_index()
+        index.extend((2, b'rev-2'), {b'rev-2': (2,)}, True)
+        index.extend((4, b'rev-4'), {b'rev-3': (3,), b'rev-4': (4,)}, True)
+        self.assertFalse(
+            self.get_transport().has(revno_index.REVNO_INDEX_TAIL_NAME))
+        index = self.make_index()
+        self.assertEqual((4, b'rev-4'), index.get_tip())
+        self.assertEqual([b'rev-1', b'rev-2', b'rev-3', b'rev-4'],
+                         [index.get_revision_id((i,)) for i in range(1, 5)])
+
+    def test_stale_tail_ignored(self):
+        self.make_index().write((1, b'rev-1'), {b'rev-1': (1,)})
+        self.make_index().extend((2, b'rev-2'), {b'rev-2': (2,)}, True)
+        # Rewriting the B+Tree without removing the tail, as an interrupted
+        # write would.
+        tail = self.get_transport().get_bytes(
+            revno_index.REVNO_INDEX_TAIL_NAME)
+        self.make_index().write((1, b'other-1'), {b'other-1': (1,)})
+        self.get_transport().put_bytes(
+            revno_index.REVNO_INDEX_TAIL_NAME, tail)
+        index = self.make_index()
+        self.assertEqual((1, b'other-1'), index.get_tip())
+        self.assertIs(None, index.get_dotted_revno(b'rev-2'))
+
+    def test_clear(self):
+        self.make_index().write((1, b'rev-1'), {b'rev-1': (1,)})
+        self.make_index().clear()
+        self.assertIs(None, self.make_index().get_tip())
+
+
+class TestBranchRevnoIndex(TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestBranchRevnoIndex, self).setUp()
+        _mod_branch.Branch.hooks.install_named_hook(
+            'post_change_branch_tip', bzr_branch._update_revno_index,
+            'revno index')
+
+    def make_merged_branch(self):
+        builder = self.make_branch_builder('branch')
+        builder.start_series()
+        builder.build_snapshot(None, [
+            ('add', ('', b'TREE_ROOT', 'directory', None))],
+            revision_id=b'1')
+        builder.build_snapshot([b'1'], [], revision_id=b'1.1.1')
+        builder.build_snapshot([b'1'], [], revision_id=b'2')
+        builder.build_snapshot([b'2', b'1.1.1'], [], revision_id=b'3')
+        builder.finish_series()
+        branch = builder.get_branch()
+        branch.get_config_stack().set('branch.revno_index', True)
+        return _mod_branch.Branch.open('branch')
+
+    def get_index(self, branch):
+        return revno_index.RevnoIndex(branch._transport)
+
+    def build_index(self, branch):
+        with branch.lock_write():
+            branch._update_revno_index()
+
+    def test_disabled(self):
+        branch = self.make_branch('branch')
+        self.assertIs(None, branch._open_revno_index())
+        self.assertIs(None, branch._get_revno_index())
+
+    def test_lookups_read_only(self):
+        branch = self.make_merged_branch()
+        with branch.lock_read():
+            self.assertEqual(
+                (1, 1, 1), branch.revision_id_to_dotted_revno(b'1.1.1'))
+            self.assertEqual(b'2', branch.get_rev_id(2))
+            self.assertEqual(2, branch.revision_id_to_revno(b'2'))
+        self.assertFalse(
+            branch._transport.has(revno_index.REVNO_INDEX_NAME))
+
+    def test_built_on_tip_change(self):
+        branch = self.make_merged_branch()
+        branch.set_last_revision_info(3, b'3')
+        index = self.get_index(branch)
+        self.assertEqual((3, b'3'), index.get_tip())
+        self.assertTrue(index.is_complete())
+        self.assertEqual((3,), index.get_dotted_revno(b'3'))
+        # A fresh branch object answers from the index.
+        branch = _mod_branch.Branch.open('branch')
+        with branch.lock_read():
+            self.assertEqual(
+                b'1.1.1', branch.dotted_revno_to_revision_id((1, 1, 1)))
+            self.assertEqual(b'2', branch.get_rev_id(2))
+            self.assertEqual(2, branch.revision_id_to_revno(b'2'))
+            self.assertRaises(errors.NoSuchRevision,
+                              branch.revision_id_to_revno, b'1.1.1')
+            self.assertRaises(errors.NoSuchRevision,
+                              branch.revision_id_to_dotted_revno, b'unknown')
+            self.assertIs(None, branch._revision_id_to_revno_cache)
+
+    def test_stale_index_ignored(self):
+        branch = self.make_merged_branch()
+        self.build_index(branch)
+        # Move the tip without running the hooks, as an older client would.
+        with branch.lock_write():
+            branch._write_last_revision_info(2, b'2')
+        branch = _mod_branch.Branch.open('branch')
+        with branch.lock_read():
+            self.assertIs(None, branch._get_revno_index())
+            self.assertRaises(errors.NoSuchRevision,
+                              branch.revision_id_to_dotted_revno, b'3')
+            self.assertEqual(b'1', branch.get_rev_id(1))
+        self.assertEqual((3, b'3'), self.get_index(branch).get_tip())
+
+    def test_extended_on_tip_change(self):
+        branch = self.make_merged_branch()
+        self.build_index(branch)
+        branch = _mod_branch.Branch.open('branch')
+        tree = branch.create_checkout('tree', lightweight=True)
+        tree.commit('four', rev_id=b'4')
+        index = self.get_index(branch)
+        self.assertEqual((4, b'4'), index.get_tip())
+        self.assertTrue(index.is_complete())
+        self.assertEqual(b'4', index.get_revision_id((4,)))
+
+    def test_merge_makes_partial(self):
+        branch = self.make_merged_branch()
+        self.build_index(branch)
+        builder = self.make_branch_builder('other')
+        builder.build_snapshot(None, [
+            ('add', ('', b'TREE_ROOT', 'directory', None))],
+            revision_id=b'other-1')
+        branch.repository.fetch(builder.get_branch().repository)
+        tree = branch.create_checkout('tree', lightweight=True)
+        tree.set_parent_ids([b'3', b'other-1'])
+        tree.commit('merge', rev_id=b'4')
+        index = self.get_index(branch)
+        self.assertEqual((4, b'4'), index.get_tip())
+        self.assertFalse(index.is_complete())
+        branch = _mod_branch.Branch.open('branch')
+        with branch.lock_read():
+            self.assertEqual(
+                (0, 1, 1), branch.revision_id_to_dotted_revno(b'other-1'))
+
+    def test_regenerated_on_uncommit(self):
+        branch = self.make_merged_branch()
+        self.build_index(branch)
+        branch = _mod_branch.Branch.open('branch')
+        branch.set_last_revision_info(2, b'2')
+        index = self.get_index(branch)
+        self.assertEqual((2, b'2'), index.get_tip())
+        self.assertTrue(index.is_complete())
+        self.assertIs(None, index.get_dotted_revno(b'3'))
+        self.assertEqual(b'1', branch.get_rev_id(1))
+
+    def test_smart_get_rev_id_for_revno(self):
+        branch = self.make_merged_branch()
+        self.build_index(branch)
+        request = smart_repo.SmartServerRepositoryGetRevIdForRevno(
+            self.get_transport())
+        self.assertEqual(
+            smart_req.SmartServerResponse((b'ok', b'2')),
+            request.execute(b'branch', 2, (3, b'3')))
@@ -25,6 +25,7 @@ Tests for low-level protocol encoding are found in test_smart_transport.
 """
 
 import bz2
+import os
 from io import BytesIO
 import tarfile
 import zlib
@@ -906,6 +907,26 @@ class TestSmartServerBranchRequestLastRevisionInfo(
             smart_req.SmartServerResponse((b'ok', b'2', rev_id_utf8)),
             request.execute(b''))
 
+    def test_cached(self):
+        self.overrideAttr(
+            smart_req, 'response_cache', smart_req.ResponseCache(1024))
+
+        def last_revision_info():
+            handler = smart_req.SmartServerRequestHandler(
+                self.get_transport(), smart_req.request_handlers, '/')
+            handler.args_received((b'Branch.last_revision_info', b''))
+            return handler.response
+        tree = self.make_branch_and_memory_tree('.')
+        tree.lock_write()
+        tree.add('')
+        tree.commit('1st commit', rev_id=b'rev1')
+        response = last_revision_info()
+        self.assertEqual((b'ok', b'1', b'rev1'), response.args)
+        self.assertIs(response, last_revision_info())
+        tree.commit('2nd commit', rev_id=b'rev2')
+        tree.unlock()
+        self.assertEqual((b'ok', b'2', b'rev2'), last_revision_info().args)
+
 
 class TestSmartServerBranchRequestRevisionIdToRevno(
         tests.TestCaseWithMemoryTransport):
@@ -1833,6 +1854,32 @@ class TestSmartServerRepositoryGetRevIdForRevno(
             smart_req.SmartServerResponse((b'history-incomplete', 2, r2)),
             request.execute(b'stacked', 1, (3, r3)))
 
+    def test_history_incomplete_cached(self):
+        self.overrideAttr(
+            smart_req, 'response_cache', smart_req.ResponseCache(1024))
+        parent = self.make_branch_and_memory_tree('parent', format='2a')
+        parent.lock_write()
+        parent.add([''])
+        parent.commit(message='first commit')
+        r2 = parent.commit(message='second commit')
+        parent.unlock()
+        local = self.make_branch_and_memory_tree('local', format='2a')
+        local.branch.pull(parent.branch)
+        local.set_parent_ids([r2])
+        r3 = local.commit(message='local commit')
+        local.branch.create_clone_on_transport(
+            self.get_transport('stacked'), stacked_on=self.get_url('parent'))
+
+        def get_rev_id_for_revno():
+            handler = smart_req.SmartServerRequestHandler(
+                self.get_transport(), smart_req.request_handlers, '/')
+            handler.args_received(
+                (b'Repository.get_rev_id_for_revno', b'stacked', 1, (3, r3)))
+            return handler.response
+        response = get_rev_id_for_revno()
+        self.assertEqual((b'history-incomplete', 2, r2), response.args)
+        self.assertIs(response, get_rev_id_for_revno())
+
 
 class TestSmartServerRepositoryIterRevisions(
         tests.TestCaseWithMemoryTransport):
@@ -1932,6 +1979,165 @@ class TestSmartServerRepositoryGetStream(GetStreamTestBase):
         self.assertStartsWith(stream_bytes, b'Bazaar pack format 1')
 
 
+class TestSmartServerRepositoryGetStreamCloneCache(
+        tests.TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestSmartServerRepositoryGetStreamCloneCache, self).setUp()
+        self.cache = smart_repo.CloneStreamCache('cache', 10 * 1024 * 1024)
+        self.overrideAttr(smart_repo, 'clone_stream_cache', self.cache)
+        self.tree = self.make_branch_and_tree('repo')
+        self.tree.lock_write()
+        self.addCleanup(self.tree.unlock)
+
+    def get_stream_bytes(self, search_bytes):
+        backing = self.get_transport()
+        request = smart_repo.SmartServerRepositoryGetStream_1_19(backing)
+        request.execute(
+            b'repo', self.tree.branch.repository._format.network_name())
+        response = request.do_body(search_bytes)
+        self.assertEqual((b'ok',), response.args)
+        return b''.join(response.body_stream)
+
+    def assertStreamInserts(self, stream_bytes, revision_ids):
+        repo = self.make_repository('target')
+        src_format, stream = smart_repo._byte_stream_to_stream(
+            [stream_bytes])
+        with repo.lock_write():
+            repo._get_sink().insert_stream(stream, src_format, [])
+        self.assertEqual(
+            set(revision_ids), set(repo.all_revision_ids()))
+
+    def get_clones(self):
+        return [clone[1:] for clone in self.cache.iter_clones()]
+
+    def test_cached(self):
+        r1 = self.tree.commit('1st commit')
+        stream_bytes = self.get_stream_bytes(b'ancestry-of\n' + r1)
+        [(path, format_names, heads, segments,
+          pack_names)] = self.get_clones()
+        self.assertEqual(b'repo', path)
+        self.assertEqual((r1,), heads)
+        self.assertEqual(1, len(segments))
+        self.assertEqual(
+            stream_bytes, self.get_stream_bytes(b'ancestry-of\n' + r1))
+        self.assertEqual(
+            stream_bytes,
+            self.get_stream_bytes(b'search\n' + r1 + b'\nnull:\n1'))
+        self.assertStreamInserts(stream_bytes, [r1])
+
+    def test_extends_cached_clone(self):
+        r1 = self.tree.commit('1st commit')
+        self.get_stream_bytes(b'ancestry-of\n' + r1)
+        r2 = self.tree.commit('2nd commit')
+        stream_bytes = self.get_stream_bytes(b'ancestry-of\n' + r2)
+        clones = dict(
+            (heads, segments)
+            for (path, format_names, heads, segments,
+                 pack_names) in self.get_clones())
+        self.assertEqual(2, len(clones[(r2,)]))
+        self.assertEqual(clones[(r1,)], clones[(r2,)][:1])
+        self.assertStreamInserts(stream_bytes, [r1, r2])
+
+    def test_signature_added(self):
+        r1 = self.tree.commit('1st commit')
+        self.get_stream_bytes(b'ancestry-of\n' + r1)
+        repo = self.tree.branch.repository
+        repo.start_write_group()
+        repo.add_signature_text(r1, b'signature')
+        repo.commit_write_group()
+        stream_bytes = self.get_stream_bytes(b'ancestry-of\n' + r1)
+        self.assertStreamInserts(stream_bytes, [r1])
+        target = self.make_repository('target2')
+        src_format, stream = smart_repo._byte_stream_to_stream(
+            [stream_bytes])
+        with target.lock_write():
+            target._get_sink().insert_stream(stream, src_format, [])
+            self.assertEqual(
+                b'signature', target.get_signature_text(r1))
+        # The clone is up to date again.
+        [(path, format_names, heads, segments,
+          pack_names)] = self.get_clones()
+        self.assertEqual(2, len(segments))
+        self.assertEqual(
+            stream_bytes, self.get_stream_bytes(b'ancestry-of\n' + r1))
+
+    def test_ghost_filled(self):
+        self.tree.add_parent_tree_id(b'ghost', allow_leftmost_as_ghost=True)
+        r1 = self.tree.commit('1st commit')
+        self.get_stream_bytes(b'ancestry-of\n' + r1)
+        other = self.make_branch_and_tree('other')
+        other.commit('ghost', rev_id=b'ghost')
+        self.tree.branch.repository.fetch(
+            other.branch.repository, revision_id=b'ghost')
+        stream_bytes = self.get_stream_bytes(b'ancestry-of\n' + r1)
+        self.assertStreamInserts(stream_bytes, [r1, b'ghost'])
+
+    def test_repacked(self):
+        r1 = self.tree.commit('1st commit')
+        self.get_stream_bytes(b'ancestry-of\n' + r1)
+        r2 = self.tree.commit('2nd commit')
+        self.tree.branch.repository.pack()
+        stream_bytes = self.get_stream_bytes(b'ancestry-of\n' + r2)
+        self.assertStreamInserts(stream_bytes, [r1, r2])
+        clones = dict(
+            (heads, segments)
+            for (path, format_names, heads, segments,
+                 pack_names) in self.get_clones())
+        self.assertEqual(1, len(clones[(r2,)]))
+
+    def test_max_segments(self):
+        self.cache.max_segments = 1
+        r1 = self.tree.commit('1st commit')
+        self.get_stream_bytes(b'ancestry-of\n' + r1)
+        r2 = self.tree.commit('2nd commit')
+        self.get_stream_bytes(b'ancestry-of\n' + r2)
+        self.assertEqual(
+            [1, 1], [len(clone[3]) for clone in self.get_clones()])
+
+    def test_not_cached(self):
+        r1 = self.tree.commit('1st commit')
+        r2 = self.tree.commit('2nd commit')
+        stream_bytes = self.get_stream_bytes(
+            b'search\n' + r2 + b'\n' + r1 + b'\n1')
+        self.assertEqual([], self.get_clones())
+        self.assertStartsWith(stream_bytes, b'Bazaar pack format 1')
+
+    def test_prune(self):
+        r1 = self.tree.commit('1st commit')
+        self.get_stream_bytes(b'ancestry-of\n' + r1)
+        self.cache.max_segments = 1
+        r2 = self.tree.commit('2nd commit')
+        self.get_stream_bytes(b'ancestry-of\n' + r2)
+        self.cache.max_size = 1
+        self.cache.prune()
+        [(path, format_names, heads, segments,
+          pack_names)] = self.get_clones()
+        self.assertEqual((r2,), heads)
+        self.assertEqual(
+            [name.decode('ascii') for name in segments],
+            os.listdir('cache/segments'))
+
+
+class TestCloneHeads(tests.TestCase):
+
+    def test_ancestry_of(self):
+        self.assertEqual(
+            frozenset([b'a', b'b']),
+            smart_repo._clone_heads(b'ancestry-of\na\nb'))
+
+    def test_search(self):
+        self.assertEqual(
+            frozenset([b'a', b'b']),
+            smart_repo._clone_heads(b'search\na b\nnull:\n2'))
+        self.assertIs(
+            None, smart_repo._clone_heads(b'search\na b\nc\n2'))
+
+    def test_other(self):
+        self.assertIs(None, smart_repo._clone_heads(b'everything'))
+        self.assertIs(None, smart_repo._clone_heads(b'ancestry-of\nnull:'))
+
+
 class TestSmartServerRequestHasRevision(tests.TestCaseWithMemoryTransport):
 
     def test_missing_revision(self):
@@ -2500,6 +2706,20 @@ class TestSmartServerPackRepositoryAutopack(tests.TestCaseWithTransport):
         repo._pack_collection.reload_pack_names()
         self.assertEqual(9, len(repo._pack_collection.names()))
 
+    def test_autopack_unlimited(self):
+        repo = self.make_repo_needing_autopacking()
+        repo._pack_collection.config_stack.set(
+            'repository.autopack_max_bytes', '1')
+        repo.lock_write()
+        self.addCleanup(repo.unlock)
+        backing = self.get_transport()
+        request = smart_packrepo.SmartServerPackRepositoryAutopack_3_2(
+            backing)
+        response = request.execute(b'', 0)
+        self.assertEqual(smart_req.SmartServerResponse((b'ok',)), response)
+        repo._pack_collection.reload_pack_names()
+        self.assertEqual(1, len(repo._pack_collection.names()))
+
     def test_autopack_on_nonpack_format(self):
         """A request to autopack a non-pack repo is a no-op."""
         repo = self.make_repository('.', format='knit')
@@ -2599,6 +2819,9 @@ class TestHandlers(tests.TestCase):
                                 smart_dir.SmartServerRequestOpenBranchV3)
         self.assertHandlerEqual(b'PackRepository.autopack',
                                 smart_packrepo.SmartServerPackRepositoryAutopack)
+        self.assertHandlerEqual(
+            b'PackRepository.autopack_3.2',
+            smart_packrepo.SmartServerPackRepositoryAutopack_3_2)
         self.assertHandlerEqual(b'Repository.add_signature_text',
                                 smart_repo.SmartServerRepositoryAddSignatureText)
         self.assertHandlerEqual(b'Repository.all_revision_ids',
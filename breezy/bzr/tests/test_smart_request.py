@@ -90,6 +90,45 @@ class CheckJailRequest(request.SmartServerRequest):
         self.jail_transports_log.append(request.jail_info.transports)
 
 
+class GenerationRequest(request.SmartServerRequest):
+    """A request whose response is cached until 'dir/generation' changes."""
+
+    response_cache_files = ('generation',)
+
+    def do(self, path, *args):
+        self.transport = self.transport_from_client_path(path)
+        return request.SuccessfulSmartServerResponse(
+            (self.transport.get_bytes('generation'),) + args)
+
+
+class GenerationBodyRequest(GenerationRequest):
+    """A cached request that takes a body."""
+
+    def do(self, path):
+        self.transport = self.transport_from_client_path(path)
+
+    def do_body(self, body_bytes):
+        return request.SuccessfulSmartServerResponse(
+            (self.transport.get_bytes('generation'), body_bytes))
+
+
+class ChangingGenerationRequest(GenerationRequest):
+    """A cached request that changes the generation while it is processed."""
+
+    def do(self, path):
+        response = GenerationRequest.do(self, path)
+        self.transport.put_bytes('generation', b'changed')
+        return response
+
+
+class InvalidatingRequest(request.SmartServerRequest):
+
+    invalidates_response_cache = True
+
+    def do(self, path):
+        return request.SuccessfulSmartServerResponse((b'ok',))
+
+
 class TestErrors(TestCase):
 
     def test_disabled_method(self):
@@ -284,3 +323,80 @@ class TestJailHook(TestCaseWithMemoryTransport):
         thread.start()
         thread.join()
         self.assertEqual(['ok'], thread_result)
+
+
+class TestResponseCache(TestCaseWithMemoryTransport):
+
+    commands = {
+        b'generation': GenerationRequest,
+        b'generation_body': GenerationBodyRequest,
+        b'changing_generation': ChangingGenerationRequest,
+        b'invalidate': InvalidatingRequest,
+        }
+
+    def setUp(self):
+        super(TestResponseCache, self).setUp()
+        self.cache = request.ResponseCache(1024)
+        self.overrideAttr(request, 'response_cache', self.cache)
+        self.backing = self.get_transport()
+        self.backing.mkdir('dir')
+        self.backing.put_bytes('dir/generation', b'1')
+
+    def call(self, *args, **kwargs):
+        handler = request.SmartServerRequestHandler(
+            self.backing, self.commands, '/')
+        handler.args_received(args)
+        body = kwargs.get('body')
+        if body is not None and not handler.finished_reading:
+            handler.accept_body(body)
+        handler.end_received()
+        return handler.response
+
+    def test_cached(self):
+        response = self.call(b'generation', b'dir', b'arg')
+        self.assertEqual((b'1', b'arg'), response.args)
+        # Change the response without changing the generation.
+        self.backing.put_bytes('dir/generation', b'1')
+        self.assertIs(response, self.call(b'generation', b'dir', b'arg'))
+        self.assertIsNot(response, self.call(b'generation', b'dir', b'other'))
+
+    def test_generation_changed(self):
+        self.call(b'generation', b'dir')
+        self.backing.put_bytes('dir/generation', b'2')
+        self.assertEqual((b'2',), self.call(b'generation', b'dir').args)
+
+    def test_no_generation(self):
+        self.backing.mkdir('other')
+        response = self.call(b'generation', b'other')
+        self.assertEqual(
+            (b'NoSuchFile', b'generation'), response.args)
+        self.backing.put_bytes('other/generation', b'1')
+        self.assertEqual((b'1',), self.call(b'generation', b'other').args)
+
+    def test_generation_changed_during_request(self):
+        self.assertEqual(
+            (b'1',), self.call(b'changing_generation', b'dir').args)
+        self.backing.put_bytes('dir/generation', b'1')
+        self.assertEqual(
+            (b'1',), self.call(b'changing_generation', b'dir').args)
+        self.assertEqual(
+            b'changed', self.backing.get_bytes('dir/generation'))
+
+    def test_body(self):
+        response = self.call(b'generation_body', b'dir', body=b'body')
+        self.assertEqual((b'1', b'body'), response.args)
+        self.assertIs(
+            response, self.call(b'generation_body', b'dir', body=b'body'))
+        self.assertEqual(
+            (b'1', b'other'),
+            self.call(b'generation_body', b'dir', body=b'other').args)
+
+    def test_invalidate(self):
+        response = self.call(b'generation', b'dir')
+        self.call(b'invalidate', b'dir')
+        self.assertIsNot(response, self.call(b'generation', b'dir'))
+
+    def test_disabled(self):
+        self.overrideAttr(request, 'response_cache', None)
+        response = self.call(b'generation', b'dir')
+        self.assertIsNot(response, self.call(b'generation', b'dir'))
@@ -31,6 +31,7 @@ from testtools.matchers import DocTestMatches
 
 import breezy
 from ... import (
+    config,
     controldir,
     debug,
     errors,
@@ -709,6 +710,48 @@ class TestSmartClientStreamMediumRequest(tests.TestCase):
         request.finished_reading()
         self.assertEqual(None, client_medium._current_request)
 
+    def test_pipeline(self):
+        # a pipelined request lets another request be sent, and the responses
+        # are read in the order the requests were sent.
+        input = BytesIO(b'12')
+        output = BytesIO()
+        client_medium = medium.SmartSimplePipesClientMedium(
+            input, output, 'base')
+        request1 = medium.SmartClientStreamMediumRequest(client_medium)
+        request1.finished_writing()
+        request1.pipeline()
+        self.assertIs(None, client_medium._current_request)
+        request2 = medium.SmartClientStreamMediumRequest(client_medium)
+        request2.finished_writing()
+        self.assertRaises(errors.TooManyConcurrentRequests,
+                          request2.read_bytes, 1)
+        self.assertEqual(b'1', request1.read_bytes(1))
+        request1.finished_reading()
+        self.assertEqual(b'2', request2.read_bytes(1))
+        request2.finished_reading()
+        self.assertIs(None, client_medium._current_request)
+        self.assertEqual(0, len(client_medium._pipelined_requests))
+
+    def test_pipeline_before_finished_write_errors(self):
+        client_medium = medium.SmartSimplePipesClientMedium(
+            None, None, 'base')
+        request = medium.SmartClientStreamMediumRequest(client_medium)
+        self.assertRaises(errors.WritingNotComplete, request.pipeline)
+
+    def test_push_back(self):
+        # bytes pushed back by a request are read by the next one.
+        input = BytesIO(b'3')
+        client_medium = medium.SmartSimplePipesClientMedium(
+            input, BytesIO(), 'base')
+        request = medium.SmartClientStreamMediumRequest(client_medium)
+        request.finished_writing()
+        request.push_back(b'12')
+        request.finished_reading()
+        request = medium.SmartClientStreamMediumRequest(client_medium)
+        request.finished_writing()
+        self.assertEqual(b'12', request.read_bytes(3))
+        self.assertEqual(b'3', request.read_bytes(3))
+
     def test_finished_read_before_finished_write_errors(self):
         # calling finished_reading before calling finished_writing triggers a
         # WritingNotComplete error.
@@ -1490,6 +1533,109 @@ class TestSmartTCPServer(tests.TestCase):
         server_thread.join()
 
 
+class TestSmartSelectorTCPServer(tests.TestCase):
+
+    def make_server(self, max_concurrent_requests=1, client_timeout=4.0):
+        t = _mod_transport.get_transport_from_url('memory:///')
+        server = _mod_server.SmartSelectorTCPServer(
+            t, client_timeout=client_timeout,
+            max_concurrent_requests=max_concurrent_requests)
+        server._ACCEPT_TIMEOUT = 0.1
+        server.start_server('127.0.0.1', 0, backlog=5)
+        server_thread = threading.Thread(target=server.serve,
+                                         args=(self.id(),))
+        server_thread.start()
+        self.addCleanup(self.shutdown_server, server, server_thread)
+        server._started.wait()
+        return server
+
+    def shutdown_server(self, server, server_thread):
+        server._stop_gracefully()
+        server_thread.join()
+
+    def connect_to_server(self, server):
+        client_sock = socket.socket()
+        client_sock.connect(server._server_socket.getsockname())
+        self.addCleanup(client_sock.close)
+        return client_sock
+
+    def say_hello(self, client_sock):
+        client_sock.send(b'hello\n')
+        self.assertEqual(b'ok\x012\n', client_sock.recv(5))
+
+    def test_idle_connections_do_not_use_workers(self):
+        server = self.make_server(max_concurrent_requests=1)
+        socks = [self.connect_to_server(server) for i in range(3)]
+        for sock in socks + socks:
+            self.say_hello(sock)
+        self.assertEqual(3, len(server._active_connections))
+
+    def test_pipelined_requests(self):
+        server = self.make_server()
+        sock = self.connect_to_server(server)
+        # A protocol version 3 hello request.
+        request = (b'bzr message 3 (bzr 1.6)\n'  # protocol version
+                   b'\x00\x00\x00\x02de'  # no headers
+                   b's\x00\x00\x00\x09l5:helloe'  # args
+                   b'e')  # end
+        sock.send(request + request)
+        data = b''
+        while data.count(b'l2:ok1:2e') < 2:
+            data += sock.recv(4096)
+        self.assertEqual(2, data.count(b'bzr message 3 (bzr 1.6)\n'))
+
+    def test_client_disconnects(self):
+        server = self.make_server()
+        sock = self.connect_to_server(server)
+        self.say_hello(sock)
+        sock.close()
+        with server._lock:
+            while server._active_connections:
+                server._lock.wait(1.0)
+
+    def test_idle_timeout(self):
+        server = self.make_server(client_timeout=0.2)
+        sock = self.connect_to_server(server)
+        self.say_hello(sock)
+        sock.settimeout(5.0)
+        self.assertEqual(b'', sock.recv(5))
+        self.assertContainsRe(
+            self.get_log(), 'disconnecting client after 0.2 seconds')
+
+    def test_stalled_request_timeout(self):
+        server = self.make_server(max_concurrent_requests=1,
+                                  client_timeout=0.2)
+        stalled_sock = self.connect_to_server(server)
+        # Only part of a protocol version 3 request.
+        stalled_sock.send(b'bzr message 3 (bzr 1.6)\n\x00\x00')
+        stalled_sock.settimeout(5.0)
+        self.assertEqual(b'', stalled_sock.recv(5))
+        self.assertContainsRe(
+            self.get_log(), 'disconnecting client after 0.2 seconds')
+        # The worker serves other clients again.
+        sock = self.connect_to_server(server)
+        sock.settimeout(5.0)
+        self.say_hello(sock)
+
+    def test_stop_gracefully_closes_idle_connections(self):
+        server = self.make_server()
+        sock = self.connect_to_server(server)
+        self.say_hello(sock)
+        server._stop_gracefully()
+        sock.settimeout(5.0)
+        self.assertEqual(b'', sock.recv(5))
+        server._fully_stopped.wait()
+        self.assertEqual([], server._active_connections)
+
+    def test_remote_transport(self):
+        server = self.make_server(max_concurrent_requests=2)
+        server.backing_transport.put_bytes('foo', b'contents\n' * 1000)
+        t = remote.RemoteTCPTransport(server.get_url())
+        self.addCleanup(t.disconnect)
+        self.assertEqual(b'contents\n' * 1000, t.get_bytes('foo'))
+        self.assertTrue(t.has('foo'))
+
+
 class SmartTCPTests(tests.TestCase):
     """Tests for connection/end to end behaviour using the TCP server.
 
@@ -1759,6 +1905,13 @@ class SmartServerCommandTests(tests.TestCaseWithTransport):
         self.assertEqual((b'ok', b'2'), response.args)
         self.assertEqual(None, response.body)
 
+    def test_negotiate_body_encoding(self):
+        cmd = _mod_request.NegotiateBodyEncodingRequest(None, '/')
+        response = cmd.execute(b'bogus', b'zlib')
+        self.assertEqual((b'ok', b'zlib'), response.args)
+        response = cmd.execute(b'bogus')
+        self.assertEqual((b'ok', b''), response.args)
+
     def test_get_bundle(self):
         from breezy.bzr.bundle import serializer
         wt = self.make_branch_and_tree('.')
@@ -3352,6 +3505,25 @@ class TestClientEncodingProtocolThree(TestSmartProtocol):
         self.assertEqual([False, True, True], flush_called)
 
 
+    def test_call_with_body_stream_body_encoding(self):
+        requester, output = self.make_client_encoder_and_output()
+        requester.set_headers({})
+        requester.set_body_encoding(b'zlib')
+        stream = [b'chunk 1' * 10, b'chunk two' * 10]
+        requester.call_with_body_stream((b'one arg',), stream)
+        decoder = protocol.ProtocolThreeDecoder(
+            LoggingMessageHandler(), expect_version_marker=True)
+        decoder.accept_bytes(output.getvalue())
+        self.assertEqual(
+            [('headers', {b'Body-Encoding': b'zlib'}),
+             ('structure', (b'one arg',)),
+             ('bytes', b'chunk 1' * 10),
+             ('bytes', b'chunk two' * 10),
+             ('end',)],
+            decoder.message_handler.event_log)
+        self.assertNotIn(b'chunk two', output.getvalue())
+
+
 class StubMediumRequest(object):
     """A stub medium request that tracks the number of times accept_bytes is
     called.
@@ -3419,6 +3591,36 @@ class TestResponseEncodingProtocolThree(tests.TestCase):
         self.assertEqual(expected_response, out_stream.getvalue())
 
 
+    def test_send_response_body_encoding(self):
+        encoder, out_stream = self.make_response_encoder()
+        encoder._headers = {}
+        request_handler = message.ConventionalRequestHandler(None, encoder)
+        request_handler.headers_received({b'Body-Encoding': b'zlib'})
+        response = _mod_request.SuccessfulSmartServerResponse(
+            (b'args',), body_stream=iter([b'aaa' * 10, b'bbb' * 10]))
+        encoder.send_response(response)
+        self.assertNotIn(b'bbbbbb', out_stream.getvalue())
+        response_handler = message.ConventionalResponseHandler()
+        decoder = protocol.ProtocolThreeDecoder(
+            response_handler, expect_version_marker=True)
+        response_handler.setProtoAndMediumRequest(decoder, StubRequest())
+        decoder.accept_bytes(out_stream.getvalue())
+        self.assertEqual((b'args',), response_handler.read_response_tuple(
+            expect_body=True))
+        self.assertEqual(
+            [b'aaa' * 10, b'bbb' * 10],
+            list(response_handler.read_streamed_body()))
+
+    def test_unknown_body_encoding(self):
+        response_handler = LoggingMessageHandler()
+        decoder = protocol.ProtocolThreeDecoder(response_handler)
+        decoder.accept_bytes(b"\0\0\0\x19d13:Body-Encoding5:boguse")
+        self.assertTrue(decoder.decoding_failed)
+        [(event, error)] = response_handler.event_log
+        self.assertEqual('protocol_error', event)
+        self.assertIsInstance(error, errors.SmartProtocolError)
+
+
 class TestResponseEncoderBufferingProtocolThree(tests.TestCase):
     """Tests for buffering of responses.
 
@@ -3780,6 +3982,149 @@ class Test_SmartClient(tests.TestCase):
         # encoder.
 
 
+class Test_SmartClientBodyEncoding(tests.TestCaseWithTransport):
+
+    def setUp(self):
+        super(Test_SmartClientBodyEncoding, self).setUp()
+        self.transport_server = test_server.SmartTCPServer_for_testing
+        self.build_tree_contents([('a', b'contents\n' * 100)])
+
+    def get_bytes(self, compression):
+        config.GlobalStack().set('smart.compression', compression)
+        t = self.get_transport()
+        self.addCleanup(t.disconnect)
+        # The first request finds out the protocol version, and the encoding
+        # is negotiated before the next one.
+        self.assertEqual(b'contents\n' * 100, t.get_bytes('a'))
+        self.assertEqual(b'contents\n' * 100, t.get_bytes('a'))
+        return t
+
+    def test_negotiated(self):
+        t = self.get_bytes(['bogus', 'zlib'])
+        self.assertEqual(b'zlib', t.get_smart_medium()._body_encoding)
+        t.put_bytes('b', b'more contents\n' * 100)
+        self.assertEqual(b'more contents\n' * 100, t.get_bytes('b'))
+
+    def test_not_negotiated(self):
+        t = self.get_bytes([])
+        self.assertIs(None, t.get_smart_medium()._body_encoding)
+        self.assertTrue(t.get_smart_medium()._body_encoding_negotiated)
+
+    def test_unsupported_by_server(self):
+        self.overrideAttr(
+            _mod_request.NegotiateBodyEncodingRequest, 'do',
+            lambda self, *encodings: _mod_request.SuccessfulSmartServerResponse(
+                (b'ok', b'')))
+        t = self.get_bytes(['zlib'])
+        self.assertIs(None, t.get_smart_medium()._body_encoding)
+
+
+class Test_SmartClientPipelining(SmartTCPTests):
+
+    def setUp(self):
+        super(Test_SmartClientPipelining, self).setUp()
+        self.start_server()
+        self.backing_transport.put_bytes('a', b'contents')
+        self.client = client._SmartClient(self.transport.get_smart_medium())
+        self.addCleanup(self.stop_server_and_connections, self.server)
+
+    def stop_server_and_connections(self, server):
+        # Stopping the server doesn't wait for its connection threads, so
+        # wait for them to notice the client disconnecting.
+        self.stop_server()
+        server._poll_active_connections(server._client_timeout)
+
+    def remote_path(self, relpath):
+        return self.transport._remote_path(relpath)
+
+    def test_supports_pipelining(self):
+        client_medium = self.transport.get_smart_medium()
+        self.assertFalse(client_medium.supports_pipelining())
+        # The server says it accepts pipelined requests in its responses.
+        self.transport.has('a')
+        self.assertTrue(client_medium.supports_pipelining())
+
+    def test_call_batch(self):
+        self.transport.has('a')
+        hpss_calls = []
+        client._SmartClient.hooks.install_named_hook(
+            'call', hpss_calls.append, None)
+        results = self.client.call_batch([
+            (b'has', (self.remote_path('a'),)),
+            (b'has', (self.remote_path('b'),)),
+            (b'get', (self.remote_path('b'),)),
+            (b'Not.a.verb', ()),
+            (b'has', (self.remote_path('a'),)),
+            ])
+        self.assertEqual((b'yes',), results[0])
+        self.assertEqual((b'no',), results[1])
+        self.assertIsInstance(results[2], errors.ErrorFromSmartServer)
+        self.assertEqual(b'NoSuchFile', results[2].error_tuple[0])
+        self.assertIsInstance(results[3], errors.UnknownSmartMethod)
+        self.assertEqual((b'yes',), results[4])
+        self.assertLength(5, hpss_calls)
+        # The medium can be used as usual afterwards.
+        self.assertEqual(b'contents', self.transport.get_bytes('a'))
+
+    def test_call_batch_counts_round_trips_saved(self):
+        self.overrideAttr(medium, '_debug_counter', None)
+        debug.debug_flags.add('hpss')
+        client_medium = medium.SmartTCPClientMedium(
+            self.server._sockname[0], self.server._sockname[1], '/')
+        self.addCleanup(client_medium.disconnect)
+        smart_client = client._SmartClient(client_medium)
+        smart_client.call(b'hello')
+        smart_client.call_batch([(b'hello', ())] * 3)
+        self.assertEqual(
+            2, medium._debug_counter.counts[client_medium]['pipelined_count'])
+        medium._debug_counter.done(client_medium)
+        self.assertContainsRe(
+            self.get_log(), 'HPSS calls: 4 \\(0 vfs, 2 round trips saved\\)')
+
+    def test_call_batch_without_pipelining(self):
+        # Until the server is known to accept pipelined requests, the calls
+        # are made one after the other.
+        results = self.client.call_batch([
+            (b'has', (self.remote_path('a'),)),
+            (b'has', (self.remote_path('b'),)),
+            ])
+        self.assertEqual([(b'yes',), (b'no',)], results)
+
+    def test_prefetch(self):
+        self.transport.has('a')
+        self.client.prefetch([
+            (b'has', (self.remote_path('a'),)),
+            (b'get', (self.remote_path('b'),)),
+            ])
+        hpss_calls = []
+        client._SmartClient.hooks.install_named_hook(
+            'call', hpss_calls.append, None)
+        self.backing_transport.delete('a')
+        self.assertEqual(
+            (b'yes',), self.client.call(b'has', self.remote_path('a')))
+        self.assertRaises(errors.ErrorFromSmartServer,
+                          self.client.call, b'get', self.remote_path('b'))
+        self.assertEqual([], hpss_calls)
+        # Prefetched responses are only used once.
+        self.assertEqual(
+            (b'no',), self.client.call(b'has', self.remote_path('a')))
+        self.assertLength(1, hpss_calls)
+
+    def test_prefetch_dropped_by_mutating_call(self):
+        self.transport.has('a')
+        self.client.prefetch([(b'has', (self.remote_path('b'),)),
+                              (b'has', (self.remote_path('a'),))])
+        self.client.call(b'mkdir', self.remote_path('d'), b'')
+        self.assertEqual({}, self.client._prefetched_responses)
+
+    def test_discard_prefetched(self):
+        self.transport.has('a')
+        self.client.prefetch([(b'has', (self.remote_path('b'),)),
+                              (b'has', (self.remote_path('a'),))])
+        self.client.discard_prefetched()
+        self.assertEqual({}, self.client._prefetched_responses)
+
+
 class Test_SmartClientRequest(tests.TestCase):
 
     def make_client_with_failing_medium(self, fail_at_write=True, response=b''):
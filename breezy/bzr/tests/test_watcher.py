@@ -0,0 +1,249 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for breezy.bzr.watcher."""
+
+import os
+import threading
+import time
+
+from .. import (
+    dirstate,
+    watcher,
+    )
+from ... import transport as _mod_transport
+from ...tests import (
+    TestCaseWithMemoryTransport,
+    TestCaseWithTransport,
+    )
+
+
+def _future_cutoff_time(state):
+    state._cutoff_time = int(time.time()) + 60
+    return state._cutoff_time
+
+
+class TestJournal(TestCaseWithMemoryTransport):
+
+    def test_record_and_parse(self):
+        t = self.get_transport()
+        journal = watcher.Journal(t)
+        journal.start()
+        journal.record_paths(['b', 'a/ሴ'])
+        journal.record_cookies(['watcher-cookie-1'])
+        token, host, pid, entries = watcher._parse_journal(
+            t.get_bytes(watcher.JOURNAL_NAME))
+        self.assertEqual(journal.token, token)
+        self.assertEqual(os.getpid(), pid)
+        self.assertEqual(
+            [(b'd', 'a/ሴ'), (b'd', 'b'), (b'c', 'watcher-cookie-1')],
+            [entry[1:] for entry in entries])
+        self.assertEqual(len(t.get_bytes(watcher.JOURNAL_NAME)),
+                         entries[-1][0])
+
+    def test_partial_line_ignored(self):
+        t = self.get_transport()
+        journal = watcher.Journal(t)
+        journal.start()
+        journal.record_paths(['a'])
+        t.append_bytes(watcher.JOURNAL_NAME, b'd parti')
+        entries = watcher._parse_journal(
+            t.get_bytes(watcher.JOURNAL_NAME))[3]
+        self.assertEqual([(b'd', 'a')], [entry[1:] for entry in entries])
+
+    def test_not_a_journal(self):
+        self.assertIs(None, watcher._parse_journal(b'garbage\n'))
+
+    def test_restart_when_full(self):
+        self.overrideAttr(watcher, '_MAX_JOURNAL_ENTRIES', 2)
+        t = self.get_transport()
+        journal = watcher.Journal(t)
+        journal.start()
+        token = journal.token
+        journal.record_paths(['a', 'b'])
+        journal.record_paths(['c'])
+        self.assertNotEqual(token, journal.token)
+        self.assertEqual([], watcher._parse_journal(
+            t.get_bytes(watcher.JOURNAL_NAME))[3])
+
+    def test_stop(self):
+        t = self.get_transport()
+        journal = watcher.Journal(t)
+        journal.start()
+        journal.stop()
+        self.assertFalse(t.has(watcher.JOURNAL_NAME))
+
+
+class TestSync(TestCaseWithTransport):
+
+    def test_no_watcher(self):
+        self.assertIs(None, watcher.sync(self.get_transport()))
+
+    def test_unresponsive_watcher(self):
+        t = self.get_transport()
+        watcher.Journal(t).start()
+        self.assertIs(None, watcher.sync(t, timeout=0.05))
+        self.assertEqual([watcher.JOURNAL_NAME], t.list_dir('.'))
+
+    def test_watcher_on_other_host(self):
+        t = self.get_transport()
+        t.put_bytes(watcher.JOURNAL_NAME,
+                    watcher._JOURNAL_SIGNATURE + b'token otherhost 1\n')
+        start = time.time()
+        self.assertIs(None, watcher.sync(t, timeout=10))
+        self.assertLess(time.time() - start, 5)
+
+    def test_read_only(self):
+        t = self.get_transport()
+        watcher.Journal(t).start()
+        readonly = _mod_transport.get_transport_from_url(
+            'readonly+' + t.base)
+        self.assertIs(None, watcher.sync(readonly, timeout=10))
+        self.assertEqual([watcher.JOURNAL_NAME], t.list_dir('.'))
+
+    def test_sync(self):
+        t = self.get_transport()
+        journal = watcher.Journal(t)
+        journal.start()
+        journal.record_paths(['a'])
+        stop = []
+
+        def respond():
+            # Play the watcher, recording the cookie once it appears.
+            while not stop:
+                names = [name for name in t.list_dir('.')
+                         if name.startswith(watcher.COOKIE_PREFIX)]
+                if names:
+                    journal.record_paths(['b'])
+                    journal.record_cookies(names)
+                    return
+                time.sleep(0.01)
+        thread = threading.Thread(target=respond)
+        thread.start()
+        try:
+            token, offset, paths = watcher.sync(t, timeout=10)
+        finally:
+            stop.append(True)
+            thread.join()
+        self.assertEqual(journal.token, token)
+        self.assertEqual(['a', 'b'], [path for end, path in paths])
+        self.assertEqual(len(t.get_bytes(watcher.JOURNAL_NAME)), offset)
+        # The cookie is removed again.
+        self.assertEqual([watcher.JOURNAL_NAME], t.list_dir('.'))
+
+
+class TestWriteState(TestCaseWithTransport):
+
+    def test_read_only(self):
+        t = self.get_transport()
+        readonly = _mod_transport.get_transport_from_url(
+            'readonly+' + t.base)
+        watcher._write_state(readonly, b'token', 0, b'rev-1', {'a'})
+        self.assertFalse(t.has(watcher.STATE_NAME))
+
+
+class TestIterChanges(TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestIterChanges, self).setUp()
+        # Allow the fingerprints of the files just written to be cached, as
+        # files with unknown fingerprints are always compared.
+        self.overrideAttr(dirstate.DirState, '_sha_cutoff_time',
+                          _future_cutoff_time)
+        self.tree = self.make_branch_and_tree('tree')
+        self.build_tree(['tree/a', 'tree/b', 'tree/dir/', 'tree/dir/c'])
+        self.tree.add(['a', 'b', 'dir', 'dir/c'])
+        self.tree.commit('one')
+        self.journal = watcher.Journal(self.tree._transport)
+        self.journal.start()
+        self.overrideAttr(watcher, 'sync', self.fake_sync)
+        self.syncs = 0
+
+    def fake_sync(self, transport):
+        # The journal is complete, as it is only written by the test.
+        self.syncs += 1
+        token, _, _, entries = watcher._parse_journal(
+            transport.get_bytes(watcher.JOURNAL_NAME))
+        offset = len(transport.get_bytes(watcher.JOURNAL_NAME))
+        return token, offset, [(end, value) for end, kind, value in entries
+                               if kind == b'd']
+
+    def get_changes(self, use_watcher=True):
+        with self.tree.lock_read():
+            if use_watcher:
+                changes = self.tree.iter_changes(
+                    self.tree.basis_tree(), want_unversioned=True)
+            else:
+                changes = self.tree.iter_changes(
+                    self.tree.basis_tree(), want_unversioned=True,
+                    specific_files=[''])
+            return sorted(((change.path, change.kind, change.versioned)
+                           for change in changes), key=repr)
+
+    def assertChanges(self, expected):
+        self.assertEqual(expected, self.get_changes())
+
+    def test_restricted_to_recorded_paths(self):
+        self.assertChanges([])
+        self.build_tree_contents([('tree/a', b'new content\n')])
+        # Changes the watcher didn't see are not noticed.
+        self.assertChanges([])
+        self.journal.record_paths(['a'])
+        expected = [(('a', 'a'), ('file', 'file'), (True, True))]
+        self.assertChanges(expected)
+        self.assertEqual(expected, self.get_changes(use_watcher=False))
+        # Paths that were changed before are still examined.
+        self.assertChanges(expected)
+        self.assertEqual(4, self.syncs)
+
+    def test_unknowns(self):
+        self.assertChanges([])
+        self.build_tree(['tree/unknown', 'tree/newdir/', 'tree/newdir/x'])
+        self.journal.record_paths(['unknown', 'newdir/x', 'gone'])
+        expected = [
+            ((None, 'newdir'), (None, 'directory'), (False, False)),
+            ((None, 'unknown'), (None, 'file'), (False, False))]
+        self.assertChanges(expected)
+        self.assertEqual(expected, self.get_changes(use_watcher=False))
+
+    def test_dirstate_changes(self):
+        self.assertChanges([])
+        # Unversioning a file changes nothing on disk.
+        self.tree.remove(['b'], keep_files=True)
+        expected = [
+            (('b', None), ('file', None), (True, False)),
+            ((None, 'b'), (None, 'file'), (False, False))]
+        self.assertChanges(expected)
+        self.assertEqual(expected, self.get_changes(use_watcher=False))
+
+    def test_removed_directory(self):
+        self.assertChanges([])
+        self.build_tree_contents([('tree/dir/c', b'changed\n')])
+        os.rename('tree/dir', 'tree/moved')
+        self.journal.record_paths(['dir', 'moved'])
+        self.assertChanges(self.get_changes(use_watcher=False))
+
+    def test_whole_tree_compared_for_new_journal(self):
+        self.assertChanges([])
+        self.build_tree_contents([('tree/a', b'new content\n')])
+        self.journal.start()
+        self.assertChanges([(('a', 'a'), ('file', 'file'), (True, True))])
+
+    def test_whole_tree_compared_for_new_basis(self):
+        self.assertChanges([])
+        self.build_tree_contents([('tree/b', b'new content\n')])
+        self.tree.commit('two', specific_files=['a'])
+        self.assertChanges([(('b', 'b'), ('file', 'file'), (True, True))])
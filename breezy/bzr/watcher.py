@@ -0,0 +1,419 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Restrict working tree comparisons to the paths a watcher saw change.
+
+``brz watch-tree`` runs a watcher that uses inotify to record the paths that
+change in a working tree in a journal in the tree's control directory.
+When comparing a dirstate working tree to its basis, only the paths in the
+journal need to be examined on disk, together with the paths that were
+found to be changed the previous time and the entries that differ in the
+dirstate itself.
+
+Both sides use two files in the control directory:
+
+ * ``watcher-journal`` is written by the watcher. It starts with a header
+   with a random token, followed by a line per recorded change: ``d PATH``
+   for a path that changed and ``c NAME`` for a cookie file (see below).
+   Whenever the watcher may have missed changes, it starts a new journal
+   with a new token.
+ * ``watcher-state`` records the journal token and offset up to which the
+   journal was taken into account, the revision compared against and the
+   paths that were changed at that point.
+
+To make sure the watcher has seen all changes made before a comparison
+starts, the comparison creates a cookie file in the control directory and
+waits for the watcher to record it; inotify reports events in order, so all
+earlier changes are in the journal before the cookie. If the journal and
+state don't match up, or the watcher doesn't respond in time, the whole
+tree is compared as usual.
+"""
+
+import os
+import socket
+import stat
+import time
+
+from .. import (
+    errors,
+    osutils,
+    trace,
+    )
+from ..commands import Command
+from ..i18n import gettext
+from .inventorytree import InventoryTreeChange
+
+
+JOURNAL_NAME = 'watcher-journal'
+STATE_NAME = 'watcher-state'
+COOKIE_PREFIX = 'watcher-cookie-'
+
+_JOURNAL_SIGNATURE = b'Breezy tree watcher journal 1\n'
+_STATE_SIGNATURE = b'Breezy tree watcher state 1\n'
+
+# Number of changes after which the watcher starts a new journal.
+_MAX_JOURNAL_ENTRIES = 100000
+
+# Number of seconds to wait for the watcher to record a cookie.
+_SYNC_TIMEOUT = 0.5
+
+# Errors raised when writing to a control directory that is read only.
+_READ_ONLY_ERRORS = (
+    errors.PermissionDenied, errors.ReadOnlyError,
+    errors.TransportNotPossible)
+
+
+class Journal(object):
+    """The journal of changed paths, as written by the watcher."""
+
+    def __init__(self, transport):
+        """Create a Journal.
+
+        :param transport: Transport for the working tree control directory.
+        """
+        self._transport = transport
+        self._entries = 0
+        self.token = None
+
+    def start(self):
+        """Start a new journal, with a new token."""
+        self.token = osutils.rand_chars(20).encode('ascii')
+        self._entries = 0
+        self._transport.put_bytes(JOURNAL_NAME, b'%s%s %s %d\n' % (
+            _JOURNAL_SIGNATURE, self.token,
+            socket.gethostname().encode('utf-8'), os.getpid()))
+
+    def _append(self, lines):
+        if self._entries + len(lines) > _MAX_JOURNAL_ENTRIES:
+            # Comparisons with the new journal start with a complete scan.
+            self.start()
+        else:
+            self._entries += len(lines)
+            self._transport.append_bytes(JOURNAL_NAME, b''.join(lines))
+
+    def record_paths(self, relpaths):
+        """Record that relpaths have changed."""
+        self._append([b'd %s\n' % path.encode('utf-8')
+                      for path in sorted(relpaths)])
+
+    def record_cookies(self, names):
+        """Record that the cookie files called names have been seen."""
+        self._append([b'c %s\n' % name.encode('utf-8')
+                      for name in sorted(names)])
+
+    def stop(self):
+        """Remove the journal, as the watcher is going away."""
+        try:
+            self._transport.delete(JOURNAL_NAME)
+        except errors.NoSuchFile:
+            pass
+
+
+def _parse_journal(data):
+    """Parse the contents of a journal.
+
+    :return: (token, host, pid, entries) with entries a list of
+        (end offset, kind, value) tuples, or None if data is not a journal.
+    """
+    if not data.startswith(_JOURNAL_SIGNATURE):
+        return None
+    offset = data.find(b'\n', len(_JOURNAL_SIGNATURE)) + 1
+    if not offset:
+        return None
+    header = data[len(_JOURNAL_SIGNATURE):offset - 1]
+    try:
+        token, host, pid = header.split(b' ')
+        pid = int(pid)
+    except ValueError:
+        return None
+    entries = []
+    while True:
+        end = data.find(b'\n', offset) + 1
+        if not end:
+            # Ignore a line the watcher is still writing.
+            break
+        entries.append((end, data[offset:offset + 1],
+                        data[offset + 2:end - 1].decode('utf-8')))
+        offset = end
+    return token, host.decode('utf-8'), pid, entries
+
+
+def _watcher_is_gone(host, pid):
+    """Check whether the process that wrote a journal has gone away.
+
+    A watcher on another host does not see the changes made on this one, so
+    it counts as gone.
+    """
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+def sync(transport, timeout=None):
+    """Wait for the watcher to record the changes made until now.
+
+    :param transport: Transport for the working tree control directory.
+    :param timeout: Number of seconds to wait for the watcher.
+    :return: (token, offset, paths) with offset the offset in the journal up
+        to which changes were recorded and paths a list of (offset, relpath)
+        tuples for the changes, or None if there is no watcher that is up to
+        date.
+    """
+    if timeout is None:
+        timeout = _SYNC_TIMEOUT
+    try:
+        journal = _parse_journal(transport.get_bytes(JOURNAL_NAME))
+    except errors.NoSuchFile:
+        return None
+    if journal is None or _watcher_is_gone(journal[1], journal[2]):
+        return None
+    cookie = COOKIE_PREFIX + osutils.rand_chars(16)
+    try:
+        transport.put_bytes_non_atomic(cookie, b'')
+    except _READ_ONLY_ERRORS as e:
+        trace.mutter('not using tree watcher: %s', e)
+        return None
+    try:
+        deadline = time.time() + timeout
+        while True:
+            if journal is not None:
+                token, _, _, entries = journal
+                paths = []
+                for end, kind, value in entries:
+                    if kind == b'd':
+                        paths.append((end, value))
+                    elif kind == b'c' and value == cookie:
+                        return token, end, paths
+            if time.time() > deadline:
+                trace.mutter('tree watcher did not respond in time')
+                return None
+            time.sleep(0.01)
+            try:
+                journal = _parse_journal(transport.get_bytes(JOURNAL_NAME))
+            except errors.NoSuchFile:
+                return None
+    finally:
+        try:
+            transport.delete(cookie)
+        except errors.NoSuchFile:
+            pass
+
+
+def _read_state(transport):
+    """Read the watcher state.
+
+    :return: (token, offset, source revision id, set of changed paths) or
+        None if there is no usable state.
+    """
+    try:
+        lines = transport.get_bytes(STATE_NAME).split(b'\n')
+    except errors.NoSuchFile:
+        return None
+    if len(lines) < 5 or lines[0] + b'\n' != _STATE_SIGNATURE:
+        return None
+    try:
+        offset = int(lines[2])
+    except ValueError:
+        return None
+    return (lines[1], offset, lines[3],
+            set(path.decode('utf-8') for path in lines[4:-1]))
+
+
+def _write_state(transport, token, offset, source_revision_id, paths):
+    try:
+        transport.put_bytes(STATE_NAME, b''.join(
+            [_STATE_SIGNATURE, b'%s\n%d\n%s\n' % (token, offset,
+                                                 source_revision_id)] +
+            [path.encode('utf-8') + b'\n' for path in sorted(paths)]))
+    except _READ_ONLY_ERRORS as e:
+        trace.mutter('not saving tree watcher state: %s', e)
+
+
+def _iter_dirstate_changes(state, source_index):
+    """Iterate the paths of entries that differ in the dirstate itself.
+
+    These are the changes recorded by brz, e.g. added, removed or renamed
+    files, and files whose last known fingerprint differs from the source.
+    """
+    for dirname, entries in state._dirblocks:
+        for entry in entries:
+            target = entry[1][0]
+            source = entry[1][source_index]
+            if (target[0] != source[0] or target[1] != source[1] or
+                    target[3] != source[3]):
+                yield osutils.pathjoin(entry[0][0], entry[0][1]).decode(
+                    'utf-8')
+
+
+def _unversioned_change(tree, path):
+    """Return the change for an unversioned path, or None if it is missing.
+
+    This matches what InterDirStateTree.iter_changes reports for it.
+    """
+    try:
+        st = os.lstat(tree.abspath(path))
+    except FileNotFoundError:
+        return None
+    kind = osutils.file_kind_from_stat_mode(st.st_mode)
+    if kind == 'directory' and tree._directory_is_tree_reference(path):
+        kind = 'tree-reference'
+    executable = bool(stat.S_ISREG(st.st_mode) and
+                      stat.S_IEXEC & st.st_mode)
+    return InventoryTreeChange(
+        None, (None, path), True, (False, False), (None, None),
+        (None, osutils.basename(path)), (None, kind), (None, executable))
+
+
+def _split_candidates(state, paths):
+    """Split candidate paths into versioned and unversioned paths.
+
+    Unversioned paths are replaced by their outermost unversioned parent,
+    as comparisons don't descend into unversioned directories. Paths that
+    were versioned in a parent tree but not in the working tree are both.
+
+    :return: (versioned paths, unversioned paths)
+    """
+    versioned = set()
+    unversioned = set()
+    for path in paths:
+        entries = state._entries_for_path(path.encode('utf-8'))
+        if entries:
+            versioned.add(path)
+            if not any(entry[1][0][0] in (b'f', b'd', b'l', b't')
+                       for entry in entries):
+                unversioned.add(path)
+            continue
+        while True:
+            parent = osutils.dirname(path)
+            parent_entries = state._entries_for_path(parent.encode('utf-8'))
+            if parent_entries:
+                break
+            path = parent
+        if any(entry[1][0][0] == b'd' for entry in parent_entries):
+            unversioned.add(path)
+        else:
+            # The parent is not a directory in the tree, e.g. a nested tree;
+            # let the comparison deal with it.
+            versioned.add(parent)
+    return osutils.minimum_path_selection(versioned), unversioned
+
+
+def iter_changes(tree, state, source_index, iter_changes):
+    """Compare a working tree to a parent, using the watcher if possible.
+
+    :param tree: The DirStateWorkingTree.
+    :param state: The DirState of tree.
+    :param source_index: The index of the parent tree in the dirstate.
+    :param iter_changes: Callable that compares the paths in the set of utf-8
+        paths passed to it (and everything below them) and returns an
+        iterator over the changes.
+    """
+    transport = tree._transport
+    synced = sync(transport)
+    if synced is None:
+        for change in iter_changes({b''}):
+            yield change
+        return
+    token, offset, dirty = synced
+    source_revision_id = state.get_parent_ids()[source_index - 1]
+    saved = _read_state(transport)
+    if (saved is None or saved[0] != token or saved[1] > offset or
+            saved[2] != source_revision_id):
+        trace.mutter('comparing whole tree to start watching changes')
+        versioned, unversioned = {''}, set()
+    else:
+        candidates = set(saved[3])
+        candidates.update(path for end, path in dirty if end > saved[1])
+        candidates.update(_iter_dirstate_changes(state, source_index))
+        versioned, unversioned = _split_candidates(state, candidates)
+        trace.mutter('comparing %d paths seen changing by watcher',
+                     len(versioned) + len(unversioned))
+    changed = set()
+    reported_unversioned = set()
+    if versioned:
+        for change in iter_changes(
+                set(path.encode('utf-8') for path in versioned)):
+            changed.update(path for path in change.path if path is not None)
+            if not change.versioned[1]:
+                reported_unversioned.add(change.path[1])
+            yield change
+    for path in sorted(unversioned):
+        if path in reported_unversioned:
+            # Already reported while comparing a versioned path.
+            continue
+        change = _unversioned_change(tree, path)
+        if change is not None:
+            changed.add(path)
+            yield change
+    _write_state(transport, token, offset, source_revision_id, changed)
+
+
+class cmd_watch_tree(Command):
+    __doc__ = """Watch a working tree for changes to speed up status.
+
+    This keeps running until interrupted, recording the paths that change in
+    the working tree. Commands such as status only examine those paths
+    rather than the whole tree while it runs.
+
+    This uses inotify and is only available on Linux with the pyinotify
+    library installed.
+    """
+
+    takes_args = ['location?']
+
+    def run(self, location='.'):
+        from ..workingtree import WorkingTree
+        from ..dirty_tracker import DirtyTracker
+        tree = WorkingTree.open_containing(location)[0]
+        transport = getattr(tree, '_transport', None)
+        if transport is None or not hasattr(tree, 'current_dirstate'):
+            raise errors.CommandError(gettext(
+                'Only dirstate working trees can be watched.'))
+        control_abspath = transport.local_abspath('.')
+        tracker = DirtyTracker(tree)
+        tracker.add_watch(control_abspath)
+        journal = Journal(transport)
+        journal.start()
+        self.outf.write(gettext('Watching %s\n') % tree.basedir)
+        try:
+            while True:
+                tracker.wait()
+                paths = tracker.pop_paths()
+                if paths is None:
+                    trace.mutter('tree watcher missed changes')
+                    journal.start()
+                    continue
+                relpaths = set()
+                cookies = set()
+                for path in paths:
+                    if osutils.dirname(path) == control_abspath:
+                        name = osutils.basename(path)
+                        if name.startswith(COOKIE_PREFIX):
+                            cookies.add(name)
+                    else:
+                        relpaths.add(tree.relpath(path))
+                if relpaths:
+                    journal.record_paths(relpaths)
+                if cookies:
+                    journal.record_cookies(cookies)
+        finally:
+            journal.stop()
@@ -47,6 +47,7 @@ from breezy.bzr import (
     dirstate,
     generate_ids,
     transform as bzr_transform,
+    watcher,
     )
 """)
 
@@ -288,6 +289,14 @@ class DirStateWorkingTree(InventoryWorkingTree):
         conf = self.get_config_stack()
         return conf.get('bzr.workingtree.worth_saving_limit')
 
+    def _sha1_threads(self):
+        """How many threads to hash files with when comparing the tree.
+
+        :return: an integer. 1 means that files are hashed inline.
+        """
+        conf = self.get_config_stack()
+        return conf.get('dirstate.sha1_threads')
+
     def filter_unversioned_files(self, paths):
         """Filter out paths that are versioned.
 
@@ -2272,7 +2281,8 @@ class InterDirStateTree(InterInventoryTree):
             source_index = 1 + parent_ids.index(self.source._revision_id)
             indices = (source_index, target_index)
 
-        if specific_files is None:
+        whole_tree = specific_files is None
+        if whole_tree:
             specific_files = {''}
 
         # -- get the state object and prepare it.
@@ -2311,11 +2321,24 @@ class InterDirStateTree(InterInventoryTree):
             # would be good here.
             search_specific_files_utf8.add(path.encode('utf8'))
 
-        iter_changes = self.target._iter_changes(
-            include_unchanged, self.target._supports_executable(),
-            search_specific_files_utf8, state, source_index, target_index,
-            want_unversioned, self.target)
-        return iter_changes.iter_changes()
+        def iter_changes(search_specific_files):
+            return self.target._iter_changes(
+                include_unchanged, self.target._supports_executable(),
+                search_specific_files, state, source_index, target_index,
+                want_unversioned, self.target).iter_changes()
+        if (whole_tree and want_unversioned and not include_unchanged and
+                source_index is not None):
+            # Comparisons like those done by status can be restricted to the
+            # paths a watcher saw change.
+            changes = watcher.iter_changes(
+                self.target, state, source_index, iter_changes)
+        else:
+            changes = iter_changes(search_specific_files_utf8)
+        sha1_threads = self.target._sha1_threads()
+        if sha1_threads > 1:
+            changes = _iter_changes_with_sha1_threads(
+                state, changes, sha1_threads)
+        return changes
 
     @staticmethod
     def is_compatible(source, target):
@@ -2335,6 +2358,13 @@ class InterDirStateTree(InterInventoryTree):
         return True
 
 
+def _iter_changes_with_sha1_threads(state, changes, threads):
+    """Iterate over changes while state hashes files on a thread pool."""
+    with state._prefetching_sha1s(threads):
+        for change in changes:
+            yield change
+
+
 InterTree.register_optimiser(InterDirStateTree)
 
 
@@ -2432,6 +2432,15 @@ option_registry.register(
            help="""\
 Whether revisions associated with tags should be fetched.
 """))
+option_registry.register(
+    Option('branch.revno_index', default=False, from_unicode=bool_from_store,
+           help="""\
+Whether to keep a persistent index of dotted revision numbers.
+
+The index is stored in the branch control directory and is written
+whenever the branch tip changes, so that looking up revision numbers in
+branches with long histories does not require walking the ancestry.
+"""))
 option_registry.register_lazy(
     'transform.orphan_policy', 'breezy.transform', 'opt_transform_orphan')
 option_registry.register(
@@ -2504,6 +2513,18 @@ If true (default), working tree metadata changes are flushed through the
 OS buffers to physical disk.  This is somewhat slower, but means data
 should not be lost if the machine crashes.  See also repository.fdatasync.
 '''))
+option_registry.register(
+    Option('dirstate.sha1_threads', default=1,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+Number of threads used to hash files when comparing a working tree.
+
+Files whose recorded stat fingerprint is out of date, e.g. after a tool
+touched all of them, have to be hashed to find out whether they changed.
+When greater than one, the files of each directory that need hashing are
+hashed in parallel by that many threads while ``brz status`` and similar
+commands compare the tree.
+'''))
 option_registry.register(
     ListOption('debug_flags', default=[],
                help='Debug flags to activate.'))
@@ -2599,6 +2620,51 @@ The default value for ``push --strict``.
 If present, defines the ``--strict`` option default value for checking
 uncommitted changes before sending a merge directive.
 '''))
+option_registry.register(
+    Option('repository.max_concurrent_reads', default=1,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+Maximum number of pack files to read from concurrently.
+
+When records are needed from several pack files, up to this many reads
+are issued at the same time. This mostly helps when accessing repositories
+with many packs over high latency transports such as sftp or http. Each
+concurrent reader opens its own connection to the server.
+'''))
+option_registry.register(
+    Option('repository.autopack_max_bytes', default=u'0',
+           from_unicode=int_SI_from_store, invalid='warning',
+           help='''\
+Maximum size of the packs combined by automatic packing in one go.
+
+Automatic packing runs when a write group is committed and can take a long
+time on big repositories. When set, at most this many bytes of existing
+packs (e.g. 100MB) are repacked per commit, starting with the smallest
+packs, and the remaining work is left for later commits or for
+``brz pack --incremental``. Zero means no limit.
+'''))
+option_registry.register(
+    Option('repository.pack_processes', default=1,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+Number of processes used to recompress file texts when packing.
+
+When greater than one, the file texts of 2a repositories on the local
+disk are split into groups of whole files which are recompressed in
+parallel by that many worker processes during ``brz pack`` and automatic
+packing.
+'''))
+option_registry.register(
+    Option('repository.bloom_filters', default=False,
+           from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Write and use bloom filters for pack indices.
+
+When enabled, a bloom filter of the keys in each new pack index is written
+next to the index, and lookups skip the indices whose filter shows they
+can not contain the key. This saves many index reads in repositories with
+lots of packs. Older clients ignore the filters.
+'''))
 option_registry.register(
     Option('repository.fdatasync', default=True,
            from_unicode=bool_from_store,
@@ -2637,6 +2703,51 @@ option_registry.register(
            default=300.0, from_unicode=float_from_store,
            help="If we wait for a new request from a client for more than"
                 " X seconds, consider the client idle, and hangup."))
+option_registry.register(
+    Option('serve.backlog',
+           default=128, from_unicode=int_from_store,
+           help="Maximum number of connections waiting to be accepted by"
+                " the smart server."))
+option_registry.register(
+    Option('serve.clone_cache_size',
+           default=u'0', from_unicode=int_SI_from_store,
+           help="""\
+Disk space used to cache the streams sent to clients that clone a repository.
+
+When set, ``brz serve`` keeps the data sent for the clone of a branch on disk
+in the cache directory, so that later clones of the same or newer revisions
+can send it again without searching the repository. 0 disables the cache.
+"""))
+option_registry.register(
+    Option('serve.max_concurrent_requests',
+           default=0, from_unicode=int_from_store,
+           help="""\
+Number of requests the smart server serves at the same time.
+
+If set, idle connections are watched with a single thread and requests
+are served by this many worker threads. If 0, every connection is served
+by its own thread.
+"""))
+option_registry.register(
+    Option('serve.response_cache_size',
+           default=u'10MB', from_unicode=int_SI_from_store,
+           help="""\
+Size of the cache of responses to read-only smart server requests.
+
+Responses to requests such as Branch.last_revision_info and
+Repository.get_parent_map are cached until the branch or repository
+changes. Set to 0 to disable the cache.
+"""))
+option_registry.register(
+    ListOption('smart.compression',
+               default=[],
+               help="""\
+Compression to use for the data sent to and from smart servers.
+
+A list of the methods to offer the server, in order of preference. zlib is
+always available, zstd if the zstandard module is installed. Compressing
+the data takes an extra round trip to the server when connecting.
+"""))
 option_registry.register(
     Option('ssh',
            default=None, override_from_env=['BRZ_SSH'],
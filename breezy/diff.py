@@ -699,6 +699,10 @@ class DiffText(DiffPath):
     # or removed in a diff.
     EPOCH_DATE = '1970-01-01 00:00:00 +0000'
 
+    # Number of bytes at the start of files that are checked for NUL bytes,
+    # as by textfile.check_text_lines.
+    _binary_check_size = 1024
+
     def __init__(self, old_tree, new_tree, to_file, path_encoding='utf-8',
                  old_label='', new_label='', text_differ=internal_diff,
                  context_lines=DEFAULT_CONTEXT_AMOUNT):
@@ -746,16 +750,39 @@ class DiffText(DiffPath):
             to a different file from from_path.  If None,
             the file is not present in the to tree.
         """
-        def _get_text(tree, path):
+        def _get_file(tree, path):
             if path is None:
-                return []
+                return None
             try:
-                return tree.get_file_lines(path)
+                return tree.get_file(path)
             except errors.NoSuchFile:
+                return None
+
+        def _read_lines(f, start):
+            if f is None:
                 return []
+            return osutils.split_lines(start + f.read())
         try:
-            from_text = _get_text(self.old_tree, from_path)
-            to_text = _get_text(self.new_tree, to_path)
+            with contextlib.ExitStack() as stack:
+                from_file = _get_file(self.old_tree, from_path)
+                to_file = _get_file(self.new_tree, to_path)
+                starts = []
+                for f in (from_file, to_file):
+                    if f is None:
+                        starts.append(b'')
+                    else:
+                        stack.enter_context(f)
+                        starts.append(f.read(self._binary_check_size))
+                # internal_diff recognizes binary files from their first
+                # bytes, so large binary files never have to be read in
+                # full. Other differs decide for themselves what to do
+                # with binary files.
+                if self.text_differ is internal_diff:
+                    for start in starts:
+                        if b'\x00' in start:
+                            raise errors.BinaryFile()
+                from_text = _read_lines(from_file, starts[0])
+                to_text = _read_lines(to_file, starts[1])
             self.text_differ(from_label, from_text, to_label, to_text,
                              self.to_file, path_encoding=self.path_encoding,
                              context_lines=self.context_lines)
@@ -43,8 +43,8 @@ except ImportError as e:
 
 
 MASK = (
-    IN_CLOSE_WRITE | IN_DELETE | IN_Q_OVERFLOW | IN_MOVED_TO | IN_MOVED_FROM |
-    IN_ATTRIB)
+    IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_Q_OVERFLOW | IN_MOVED_TO |
+    IN_MOVED_FROM | IN_ATTRIB)
 
 
 class _Process(ProcessEvent):
@@ -52,8 +52,13 @@ class _Process(ProcessEvent):
     def my_init(self):
         self.paths = set()
         self.created = set()
+        self.overflowed = False
 
     def process_default(self, event):
+        if event.mask & IN_Q_OVERFLOW:
+            # The kernel dropped events, so we don't know what changed.
+            self.overflowed = True
+            return
         path = os.path.join(event.path, event.name)
         if event.mask & IN_CREATE:
             self.created.add(path)
@@ -92,6 +97,37 @@ class DirtyTracker(object):
         self._process_pending()
         self._process.paths.clear()
         self._process.created.clear()
+        self._process.overflowed = False
+
+    def add_watch(self, path, mask=IN_CREATE):
+        """Also track changes in the directory at path, not recursively."""
+        self._wm.add_watch(path, mask)
+
+    def wait(self, timeout=None):
+        """Wait until there are changes.
+
+        :param timeout: Maximum time to wait in milliseconds, or None to wait
+            indefinitely.
+        """
+        if self._notifier.check_events(timeout=timeout):
+            self._notifier.read_events()
+        self._notifier.process_events()
+
+    def pop_paths(self):
+        """Return the paths that have changed and mark them clean.
+
+        :return: A set of paths, or None if changes were lost because the
+            kernel event queue overflowed.
+        """
+        self._process_pending()
+        if self._process.overflowed:
+            paths = None
+        else:
+            paths = set(self._process.paths)
+        self._process.paths.clear()
+        self._process.created.clear()
+        self._process.overflowed = False
+        return paths
 
     def is_dirty(self):
         """Check whether there are any changes."""
@@ -165,6 +165,70 @@ def _export_iter_entries(tree, subdir, skip_special=True):
         yield final_path, path, entry
 
 
+# Number of files whose texts are requested from the tree in one go when
+# exporting to an archive. Larger batches let the repository return more texts
+# in storage order, at the cost of keeping more texts in memory.
+_FILE_BATCH_SIZE = 1000
+
+# Total size of the file texts requested in one go, for trees that know the
+# size of their texts up front.
+_FILE_BATCH_BYTES = 32 * 1024 * 1024
+
+
+def _export_iter_items(tree, subdir, skip_special=True):
+    """Iter the entries for tree along with the texts of its files.
+
+    File texts are retrieved in batches using tree.iter_files_bytes, which
+    allows repositories to return them in the order they are stored in rather
+    than decompressing the same storage block once for every file in it. The
+    texts of a batch are buffered so that entries are still yielded in the
+    same order as _export_iter_entries, which keeps archives reproducible
+    however the repository happens to be packed.
+
+    :param tree: A tree object.
+    :param subdir: None or the path of an entry to start exporting from.
+    :param skip_special: Whether to skip .bzr files.
+    :return: iterator over tuples with final path, tree path, inventory entry
+        and, for files, a list of bytestrings with the file contents (None
+        for other kinds).
+    """
+    pending = []
+    pending_files = []
+    pending_bytes = 0
+
+    def fetch_pending():
+        texts = {}
+        for tree_path, chunks in tree.iter_files_bytes(pending_files):
+            texts[tree_path] = list(chunks)
+        for final_path, tree_path, entry in pending:
+            if entry.kind == 'file':
+                yield final_path, tree_path, entry, texts.pop(tree_path)
+            else:
+                yield final_path, tree_path, entry, None
+        del pending[:]
+        del pending_files[:]
+
+    for final_path, tree_path, entry in _export_iter_entries(
+            tree, subdir, skip_special):
+        if entry.kind != 'file':
+            if pending:
+                pending.append((final_path, tree_path, entry))
+            else:
+                yield final_path, tree_path, entry, None
+            continue
+        pending.append((final_path, tree_path, entry))
+        pending_files.append((tree_path, tree_path))
+        pending_bytes += entry.text_size or 0
+        if (len(pending_files) >= _FILE_BATCH_SIZE or
+                pending_bytes >= _FILE_BATCH_BYTES):
+            for item in fetch_pending():
+                yield item
+            pending_bytes = 0
+    if pending:
+        for item in fetch_pending():
+            yield item
+
+
 def dir_exporter_generator(tree, dest, root, subdir=None,
                            force_mtime=None, fileobj=None):
     """Return a generator that exports this tree to a new directory.
@@ -439,6 +439,8 @@ from ..config import (
     option_registry,
     Option,
     bool_from_store,
+    int_from_store,
+    int_SI_from_store,
     )
 
 option_registry.register(
@@ -450,6 +452,53 @@ Allow fetching of Git packs over HTTP.
 This enables support for fetching Git packs over HTTP in Loggerhead.
 '''))
 
+option_registry.register(
+    Option('git.import_read_ahead',
+           default=16, from_unicode=int_from_store, invalid='warning',
+           help='''\
+Number of commits to read ahead when importing from Git.
+
+When importing Git commits into a Bazaar repository, the Git objects for
+this many commits are read and decompressed in a background thread while
+earlier commits are being imported. Set to 0 to read objects as they are
+needed.
+'''))
+
+option_registry.register(
+    Option('git.tree_cache_size',
+           default=50 * 1024 * 1024, from_unicode=int_SI_from_store,
+           invalid='warning',
+           help='''\
+Maximum memory used for caching revision trees when exporting to Git.
+
+Trees are cached while the Bazaar repository is locked. Suffixes K, M and G
+are accepted.
+'''))
+
+option_registry.register(
+    Option('git.object_cache_size',
+           default=20 * 1024 * 1024, from_unicode=int_SI_from_store,
+           invalid='warning',
+           help='''\
+Maximum memory used for caching Git blobs and trees generated from Bazaar.
+
+The cache is shared by all Git exports in a process. Suffixes K, M and G
+are accepted.
+'''))
+
+option_registry.register(
+    Option('git.serve_cache_size',
+           default=1024 * 1024 * 1024, from_unicode=int_SI_from_store,
+           invalid='warning',
+           help='''\
+Maximum disk space used for caching packs served to Git clients.
+
+When serving a Bazaar repository to Git clients, the packs generated for
+clones are kept on disk, so that further clones of the same revisions can
+be served without converting them again. Set to 0 to disable the cache.
+Suffixes K, M and G are accepted.
+'''))
+
 
 def test_suite():
     from . import tests
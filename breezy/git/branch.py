@@ -258,16 +258,13 @@ class InterTagsFromGitToNonGit(InterTags):
             return updates, conflicts
 
     def _merge_to(self, to_tags, source_tag_refs, overwrite=False,
-                  selector=None):
-        unpeeled_map = defaultdict(set)
+                  selector=None, update_unpeel_map=True):
         conflicts = []
         updates = {}
         result = dict(to_tags.get_tag_dict())
         for ref_name, tag_name, peeled, unpeeled in source_tag_refs:
             if selector and not selector(tag_name):
                 continue
-            if unpeeled is not None:
-                unpeeled_map[peeled].add(unpeeled)
             try:
                 bzr_revid = self.source.branch.lookup_foreign_revision_id(peeled)
             except NotCommitError:
@@ -280,11 +277,30 @@ class InterTagsFromGitToNonGit(InterTags):
             else:
                 conflicts.append((tag_name, bzr_revid, result[tag_name]))
         to_tags._set_tag_dict(result)
+        if update_unpeel_map:
+            self.update_unpeel_map(
+                to_tags.branch.repository, source_tag_refs, selector=selector)
+        return updates, set(conflicts)
+
+    @staticmethod
+    def update_unpeel_map(repository, source_tag_refs, selector=None):
+        """Record the unpeeled object ids of tags in a repository.
+
+        :param repository: Repository to store the unpeel map in
+        :param source_tag_refs: Iterable over
+            (ref_name, tag_name, peeled_sha1, unpeeled_sha1)
+        :param selector: Optional callable to select the tags to record
+        """
+        unpeeled_map = defaultdict(set)
+        for ref_name, tag_name, peeled, unpeeled in source_tag_refs:
+            if selector and not selector(tag_name):
+                continue
+            if unpeeled is not None:
+                unpeeled_map[peeled].add(unpeeled)
         if len(unpeeled_map) > 0:
-            map_file = UnpeelMap.from_repository(to_tags.branch.repository)
+            map_file = UnpeelMap.from_repository(repository)
             map_file.update(unpeeled_map)
-            map_file.save_in_repository(to_tags.branch.repository)
-        return updates, set(conflicts)
+            map_file.save_in_repository(repository)
 
 
 InterTags.register_optimiser(InterTagsFromGitToRemoteGit)
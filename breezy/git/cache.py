@@ -20,7 +20,10 @@ from dulwich.objects import (
     sha_to_hex,
     hex_to_sha,
     )
+import bisect
 import os
+import stat
+import struct
 import threading
 
 from dulwich.objects import (
@@ -35,6 +38,7 @@ from .. import (
     trace,
     )
 from ..bzr import (
+    bloom as _mod_bloom,
     btree_index as _mod_btree_index,
     index as _mod_index,
     versionedfile,
@@ -65,6 +69,32 @@ def get_remote_cache_transport(repository):
     return get_transport_from_path(path)
 
 
+def get_cache_transport(repository):
+    """Retrieve the transport to store git caches for a repository in.
+
+    This is the ``git`` directory in the repository if it is local, or
+    the users global cache directory otherwise.
+    """
+    from ..transport.local import LocalTransport
+    repo_transport = getattr(repository, "_transport", None)
+    if (repo_transport is not None
+            and isinstance(repo_transport, LocalTransport)):
+        # Even if we don't write to this repo, we should be able
+        # to update its cache.
+        try:
+            repo_transport = remove_readonly_transport_decorator(
+                repo_transport)
+        except bzr_errors.ReadOnlyError:
+            pass
+        else:
+            try:
+                repo_transport.mkdir('git')
+            except bzr_errors.FileExists:
+                pass
+            return repo_transport.clone('git')
+    return get_remote_cache_transport(repository)
+
+
 def check_pysqlite_version(sqlite3):
     """Check that sqlite library is compatible.
 
@@ -215,28 +245,7 @@ class BzrGitCacheFormat(object):
         :param repository: Repository to open the cache for
         :return: A `BzrGitCache`
         """
-        from ..transport.local import LocalTransport
-        repo_transport = getattr(repository, "_transport", None)
-        if (repo_transport is not None
-                and isinstance(repo_transport, LocalTransport)):
-            # Even if we don't write to this repo, we should be able
-            # to update its cache.
-            try:
-                repo_transport = remove_readonly_transport_decorator(
-                    repo_transport)
-            except bzr_errors.ReadOnlyError:
-                transport = None
-            else:
-                try:
-                    repo_transport.mkdir('git')
-                except bzr_errors.FileExists:
-                    pass
-                transport = repo_transport.clone('git')
-        else:
-            transport = None
-        if transport is None:
-            transport = get_remote_cache_transport(repository)
-        return cls.from_transport(transport)
+        return cls.from_transport(get_cache_transport(repository))
 
 
 class CacheUpdater(object):
@@ -383,17 +392,10 @@ class SqliteCacheUpdater(CacheUpdater):
     def finish(self):
         if self._commit is None:
             raise AssertionError("No commit object added")
-        self.db.executemany(
-            "replace into trees (sha1, fileid, revid) values (?, ?, ?)",
-            self._trees)
-        self.db.executemany(
-            "replace into blobs (sha1, fileid, revid) values (?, ?, ?)",
-            self._blobs)
-        self.db.execute(
-            "replace into commits (sha1, revid, tree_sha, testament3_sha1) "
-            "values (?, ?, ?, ?)",
-            (self._commit.id, self.revid, self._commit.tree,
-                self._testament3_sha1))
+        self.cache.idmap._add_rows(
+            self._trees, self._blobs,
+            [(self._commit.id, self.revid, self._commit.tree,
+              self._testament3_sha1)])
         return self._commit
 
 
@@ -419,11 +421,22 @@ class SqliteGitShaMap(GitShaMap):
 
     def __init__(self, path=None):
         self.path = path
+        # Rows added in the current write group, inserted in bulk when the
+        # write group is committed or when they are looked up.
+        self._pending = None
         if path is None:
             self.db = sqlite3.connect(":memory:")
         else:
             if path not in mapdbs():
-                mapdbs()[path] = sqlite3.connect(path)
+                db = sqlite3.connect(path)
+                # Write ahead logging lets readers carry on while a fetch
+                # writes, and needs fewer fsyncs per transaction.
+                try:
+                    db.execute("pragma journal_mode=wal")
+                    db.execute("pragma synchronous=normal")
+                except sqlite3.OperationalError:
+                    pass  # Read-only database.
+                mapdbs()[path] = db
             self.db = mapdbs()[path]
         self.db.text_factory = str
         self.db.executescript("""
@@ -432,14 +445,12 @@ class SqliteGitShaMap(GitShaMap):
             revid text not null,
             tree_sha text not null check(length(tree_sha) == 40)
         );
-        create index if not exists commit_sha1 on commits(sha1);
         create unique index if not exists commit_revid on commits(revid);
         create table if not exists blobs(
             sha1 text not null check(length(sha1) == 40),
             fileid text not null,
             revid text not null
         );
-        create index if not exists blobs_sha1 on blobs(sha1);
         create unique index if not exists blobs_fileid_revid on blobs(
             fileid, revid);
         create table if not exists trees(
@@ -456,11 +467,51 @@ class SqliteGitShaMap(GitShaMap):
                 "ALTER TABLE commits ADD testament3_sha1 TEXT;")
         except sqlite3.OperationalError:
             pass  # Column already exists.
+        # Covering indices, so that lookup_git_sha doesn't have to read the
+        # commits and blobs tables themselves. They replace the plain indices
+        # on sha1 used by older versions. Tree shas are unique, so there is
+        # at most one row to read for those.
+        try:
+            self.db.executescript("""
+            create index if not exists commits_sha1_covering on commits(
+                sha1, revid, tree_sha, testament3_sha1);
+            create index if not exists blobs_sha1_covering on blobs(
+                sha1, fileid, revid);
+            drop index if exists commit_sha1;
+            drop index if exists blobs_sha1;
+            """)
+        except sqlite3.OperationalError:
+            pass  # Read-only database; keep using the old indices.
 
     def __repr__(self):
         return "%s(%r)" % (self.__class__.__name__, self.path)
 
+    def _add_rows(self, trees, blobs, commits):
+        if self._pending is not None:
+            self._pending[0].extend(trees)
+            self._pending[1].extend(blobs)
+            self._pending[2].extend(commits)
+        else:
+            self._insert_rows(trees, blobs, commits)
+
+    def _insert_rows(self, trees, blobs, commits):
+        self.db.executemany(
+            "replace into trees (sha1, fileid, revid) values (?, ?, ?)",
+            trees)
+        self.db.executemany(
+            "replace into blobs (sha1, fileid, revid) values (?, ?, ?)",
+            blobs)
+        self.db.executemany(
+            "replace into commits (sha1, revid, tree_sha, testament3_sha1) "
+            "values (?, ?, ?, ?)", commits)
+
+    def _flush_pending(self):
+        if self._pending is not None and any(self._pending):
+            self._insert_rows(*self._pending)
+            self._pending = ([], [], [])
+
     def lookup_commit(self, revid):
+        self._flush_pending()
         cursor = self.db.execute("select sha1 from commits where revid = ?",
                                  (revid,))
         row = cursor.fetchone()
@@ -468,10 +519,20 @@ class SqliteGitShaMap(GitShaMap):
             return row[0]
         raise KeyError
 
+    def start_write_group(self):
+        self._pending = ([], [], [])
+
     def commit_write_group(self):
+        self._flush_pending()
+        self._pending = None
         self.db.commit()
 
+    def abort_write_group(self):
+        self._pending = None
+        self.db.rollback()
+
     def lookup_blob_id(self, fileid, revision):
+        self._flush_pending()
         row = self.db.execute(
             "select sha1 from blobs where fileid = ? and revid = ?",
             (fileid, revision)).fetchone()
@@ -480,6 +541,7 @@ class SqliteGitShaMap(GitShaMap):
         raise KeyError(fileid)
 
     def lookup_tree_id(self, fileid, revision):
+        self._flush_pending()
         row = self.db.execute(
             "select sha1 from trees where fileid = ? and revid = ?",
             (fileid, revision)).fetchone()
@@ -496,6 +558,7 @@ class SqliteGitShaMap(GitShaMap):
             tree: fileid, revid
             blob: fileid, revid
         """
+        self._flush_pending()
         found = False
         cursor = self.db.execute(
             "select revid, tree_sha, testament3_sha1 from commits where "
@@ -522,10 +585,12 @@ class SqliteGitShaMap(GitShaMap):
 
     def revids(self):
         """List the revision ids known."""
+        self._flush_pending()
         return (row for (row,) in self.db.execute("select revid from commits"))
 
     def sha1s(self):
         """List the SHA1s."""
+        self._flush_pending()
         for table in ("blobs", "commits", "trees"):
             for (sha,) in self.db.execute("select sha1 from %s" % table):
                 yield sha.encode('ascii')
@@ -968,6 +1033,251 @@ class IndexGitShaMap(GitShaMap):
             yield key[1]
 
 
+CHANGED_PATH_INDEX_DIR = 'bzr-changed-paths'
+
+_CHANGED_PATHS_SIGNATURE = b'Breezy git changed path index 1\n'
+
+# Commits that change more paths than this get a filter that matches every
+# path, as git does for its changed path filters.
+_MAX_CHANGED_PATHS = 512
+
+# Number of layers the index may consist of before they are combined.
+_MAX_CHANGED_PATH_LAYERS = 8
+
+_FULL_FILTER = b'\xff'
+
+
+def changed_paths(store, commit):
+    """Determine the paths a commit changes relative to its parents.
+
+    A path is considered changed if its mode or contents differ between the
+    commit and any of its parents, or if it is only present on one side.
+    Directories containing changed paths are changed as well.
+
+    :param store: Object store to retrieve trees from.
+    :param commit: Commit object.
+    :return: Set of changed paths, or None if the commit changes more than
+        _MAX_CHANGED_PATHS paths.
+    """
+    paths = set()
+    for parent_id in commit.parents:
+        if not _add_tree_changes(
+                store, store[parent_id].tree, commit.tree, b'', paths):
+            return None
+    return paths
+
+
+def _tree_entries(store, tree_id):
+    if tree_id is None:
+        return {}
+    return {entry.path: (entry.mode, entry.sha)
+            for entry in store[tree_id].iteritems()}
+
+
+def _add_tree_changes(store, old_tree_id, new_tree_id, prefix, paths):
+    if old_tree_id == new_tree_id:
+        return True
+    old_entries = _tree_entries(store, old_tree_id)
+    new_entries = _tree_entries(store, new_tree_id)
+    for name in set(old_entries) | set(new_entries):
+        old_entry = old_entries.get(name)
+        new_entry = new_entries.get(name)
+        if old_entry == new_entry:
+            continue
+        path = prefix + name
+        paths.add(path)
+        if len(paths) > _MAX_CHANGED_PATHS:
+            return False
+        if old_entry is not None and stat.S_ISDIR(old_entry[0]):
+            old_subtree_id = old_entry[1]
+        else:
+            old_subtree_id = None
+        if new_entry is not None and stat.S_ISDIR(new_entry[0]):
+            new_subtree_id = new_entry[1]
+        else:
+            new_subtree_id = None
+        if old_subtree_id is not None or new_subtree_id is not None:
+            if not _add_tree_changes(store, old_subtree_id, new_subtree_id,
+                                     path + b'/', paths):
+                return False
+    return True
+
+
+def _serialize_changed_paths(paths):
+    if paths is None:
+        return _FULL_FILTER
+    if not paths:
+        return b''
+    bloom = _mod_bloom.BloomFilter.for_key_count(len(paths))
+    for path in paths:
+        bloom.add((path,))
+    return bytes(bloom._bits)
+
+
+class ChangedPathIndex(object):
+    """Index of the paths changed by git commits.
+
+    For every indexed commit a bloom filter of the paths it changes relative
+    to its parents is kept, similar to the changed path filters in git's
+    commit-graph. Walks over the history of a single file can skip commits
+    whose filter does not contain the file without looking at their trees.
+
+    The index consists of immutable layers, each a file with the sorted
+    binary shas of the commits it covers, the end offset of the filter of
+    each commit and then the filters themselves. Entries for newly seen
+    commits are written as a new layer; once there are more than
+    _MAX_CHANGED_PATH_LAYERS layers they are combined into one.
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+        self._layers = None
+        self._pending = {}
+
+    @classmethod
+    def from_repository(cls, repository):
+        """Open the changed path index for a local git repository."""
+        transport = repository._git._commontransport
+        try:
+            transport = remove_readonly_transport_decorator(transport)
+        except bzr_errors.ReadOnlyError:
+            transport = get_remote_cache_transport(repository)
+        return cls(transport.clone(CHANGED_PATH_INDEX_DIR))
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self._transport.base)
+
+    def _load(self):
+        if self._layers is not None:
+            return
+        self._layers = {}
+        try:
+            names = self._transport.list_dir('.')
+        except bzr_errors.NoSuchFile:
+            return
+        for name in names:
+            if not name.endswith('.cpi'):
+                continue
+            try:
+                data = self._transport.get_bytes(name)
+            except bzr_errors.NoSuchFile:
+                # Combined into a new layer by another process.
+                continue
+            layer = self._parse_layer(data)
+            if layer is None:
+                trace.mutter('ignoring unreadable changed path index %s',
+                             name)
+                continue
+            self._layers[name] = layer
+
+    def _parse_layer(self, data):
+        if not data.startswith(_CHANGED_PATHS_SIGNATURE):
+            return None
+        offset = len(_CHANGED_PATHS_SIGNATURE)
+        try:
+            (count,) = struct.unpack_from('>L', data, offset)
+        except struct.error:
+            return None
+        offset += 4
+        shas = [data[i:i + 20] for i in range(offset, offset + 20 * count, 20)]
+        offset += 20 * count
+        try:
+            ends = struct.unpack_from('>%dL' % count, data, offset)
+        except struct.error:
+            return None
+        offset += 4 * count
+        if len(data) != offset + (ends[-1] if ends else 0):
+            return None
+        return (shas, ends, offset, data)
+
+    def _get_filter(self, sha):
+        try:
+            return self._pending[sha]
+        except KeyError:
+            pass
+        self._load()
+        for shas, ends, base, data in self._layers.values():
+            i = bisect.bisect_left(shas, sha)
+            if i < len(shas) and shas[i] == sha:
+                start = base + (ends[i - 1] if i else 0)
+                return data[start:base + ends[i]]
+        return None
+
+    def may_have_changed(self, commit_id, path):
+        """Check whether a commit may have changed a path.
+
+        :param commit_id: Hex sha of the commit.
+        :param path: Path to check, as bytes.
+        :return: False if the commit definitely did not change path, True if
+            it might have and None if the commit is not indexed.
+        """
+        bits = self._get_filter(hex_to_sha(commit_id))
+        if bits is None:
+            return None
+        if not bits:
+            return False
+        bloom = _mod_bloom.BloomFilter(len(bits) * 8, bits=bits)
+        return (path,) in bloom
+
+    def add(self, commit_id, paths):
+        """Record the paths changed by a commit.
+
+        The entry is kept in memory until flush() is called.
+
+        :param commit_id: Hex sha of the commit.
+        :param paths: Set of changed paths, as returned by changed_paths().
+        """
+        self._pending[hex_to_sha(commit_id)] = _serialize_changed_paths(paths)
+
+    def _write_layer(self, entries):
+        ends = []
+        end = 0
+        filters = []
+        for sha in sorted(entries):
+            filters.append(entries[sha])
+            end += len(entries[sha])
+            ends.append(end)
+        chunks = [_CHANGED_PATHS_SIGNATURE, struct.pack('>L', len(entries))]
+        chunks.extend(sorted(entries))
+        chunks.append(struct.pack('>%dL' % len(ends), *ends))
+        chunks.extend(filters)
+        data = b''.join(chunks)
+        name = osutils.sha_string(data).decode('ascii') + '.cpi'
+        self._transport.put_bytes(name, data)
+        return name, self._parse_layer(data)
+
+    def flush(self):
+        """Write the pending entries to disk as a new layer."""
+        if not self._pending:
+            return
+        self._load()
+        entries = self._pending
+        self._pending = {}
+        try:
+            self._transport.ensure_base()
+            if len(self._layers) >= _MAX_CHANGED_PATH_LAYERS:
+                old_names = list(self._layers)
+                for shas, ends, base, data in self._layers.values():
+                    for i, sha in enumerate(shas):
+                        if sha not in entries:
+                            start = base + (ends[i - 1] if i else 0)
+                            entries[sha] = data[start:base + ends[i]]
+            else:
+                old_names = []
+            name, layer = self._write_layer(entries)
+            for old_name in old_names:
+                del self._layers[old_name]
+                if old_name != name:
+                    try:
+                        self._transport.delete(old_name)
+                    except bzr_errors.NoSuchFile:
+                        pass
+            self._layers[name] = layer
+        except (bzr_errors.TransportNotPossible, bzr_errors.PermissionDenied,
+                bzr_errors.ReadOnlyError) as e:
+            trace.mutter('unable to write changed path index: %s', e)
+
+
 formats = registry.Registry()
 formats.register(TdbGitCacheFormat().get_format_string(),
                  TdbGitCacheFormat())
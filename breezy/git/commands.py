@@ -33,9 +33,40 @@ from ..option import (
     )
 
 
+def _left_hand_distances(object_store, heads):
+    """Find the length of the left hand ancestry of a set of commits.
+
+    Commits shared between the heads are only looked at once.
+
+    :param object_store: Object store to read commits from
+    :param heads: Iterable over commit shas
+    :return: Dictionary mapping the shas of the heads (and their left hand
+        ancestors) to their distance to the start of history. Heads whose
+        left hand ancestry is incomplete are not included.
+    """
+    distances = {}
+    for head in heads:
+        todo = []
+        sha = head
+        try:
+            while sha is not None and sha not in distances:
+                todo.append(sha)
+                parents = object_store[sha].parents
+                sha = parents[0] if parents else None
+        except KeyError:
+            continue
+        distance = 0 if sha is None else distances[sha]
+        for sha in reversed(todo):
+            distance += 1
+            distances[sha] = distance
+    return distances
+
+
 class cmd_git_import(Command):
     """Import all branches from a git repository.
 
+    The revisions for all branches are fetched at once, after which the
+    branches are created concurrently.
     """
 
     takes_args = ["src_location", "dest_location?"]
@@ -51,6 +82,9 @@ class cmd_git_import(Command):
                        value_switches=True,
                        title="Branch format",
                        ),
+        Option('jobs', type=int,
+               help='Number of branches to create concurrently '
+                    '(defaults to the number of CPUs).'),
         ]
 
     def _get_colocated_branch(self, target_controldir, name):
@@ -74,10 +108,38 @@ class cmd_git_import(Command):
         except NotBranchError:
             return head_controldir.create_branch()
 
-    def run(self, src_location, dest_location=None, colocated=False, dest_format=None):
+    def _update_branch(self, get_head_branch, revid, revno, source_branch,
+                       source_tag_refs, parent_url):
+        from ..tag import InterTags
+        from .branch import InterTagsFromGitToNonGit
+        head_branch = get_head_branch()
+        with head_branch.lock_write():
+            if head_branch.last_revision() != revid:
+                if revno is None:
+                    head_branch.generate_revision_history(revid)
+                else:
+                    head_branch.set_last_revision_info(revno, revid)
+            if source_tag_refs:
+                inter = InterTags.get(source_branch.tags, head_branch.tags)
+                if isinstance(inter, InterTagsFromGitToNonGit):
+                    # The unpeel map has already been updated for all
+                    # branches.
+                    inter._merge_to(head_branch.tags, source_tag_refs,
+                                    update_unpeel_map=False)
+                else:
+                    inter.merge()
+            if not head_branch.get_parent():
+                head_branch.set_parent(parent_url)
+
+    def run(self, src_location, dest_location=None, colocated=False,
+            dest_format=None, jobs=None):
+        from concurrent import futures
+        import contextlib
+        import functools
         import os
         from .. import (
             controldir,
+            osutils,
             trace,
             ui,
             urlutils,
@@ -98,6 +160,7 @@ class cmd_git_import(Command):
             )
         from ..transport import get_transport
         from .branch import (
+            InterTagsFromGitToNonGit,
             LocalGitBranch,
             )
         from .refs import (
@@ -134,34 +197,61 @@ class cmd_git_import(Command):
         interrepo = InterRepository.get(source_repo, target_repo)
         mapping = source_repo.get_mapping()
         result = interrepo.fetch()
-        with ui.ui_factory.nested_progress_bar() as pb:
-            for i, (name, sha) in enumerate(result.refs.items()):
-                try:
-                    branch_name = ref_to_branch_name(name)
-                except ValueError:
-                    # Not a branch, ignore
-                    continue
-                pb.update(gettext("creating branches"), i, len(result.refs))
+        heads = []
+        for name, sha in result.refs.items():
+            try:
+                branch_name = ref_to_branch_name(name)
+            except ValueError:
+                # Not a branch, ignore
+                continue
+            heads.append((name, branch_name, sha))
+        if jobs is None:
+            jobs = osutils.local_concurrency()
+        # The revision numbers of all heads are determined in one pass over
+        # the history, rather than walking the shared history once for every
+        # branch. The tags are the same for every branch; the unpeel map is
+        # shared by all of them, so it is written once up front rather than
+        # by each of the concurrent tag merges.
+        source_branch = LocalGitBranch(
+            source_repo.controldir, source_repo, b"HEAD")
+        with contextlib.ExitStack() as es:
+            es.enter_context(source_branch.lock_read())
+            revnos = _left_hand_distances(
+                source_repo._git.object_store, [sha for _, _, sha in heads])
+            source_tag_refs = source_branch.get_tag_refs()
+            if heads and not isinstance(target_repo, GitRepository):
+                with target_repo.lock_write():
+                    InterTagsFromGitToNonGit.update_unpeel_map(
+                        target_repo, source_tag_refs)
+            pb = es.enter_context(ui.ui_factory.nested_progress_bar())
+            executor = es.enter_context(
+                futures.ThreadPoolExecutor(max(1, jobs)))
+            pending = []
+            for name, branch_name, sha in heads:
+                parent_url = urlutils.join_segment_parameters(
+                    source_branch.base,
+                    {"branch": urlutils.escape(branch_name)})
                 if (getattr(target_controldir._format, "colocated_branches",
                             False) and colocated):
                     if name == "HEAD":
                         branch_name = None
+                    # Branches in the same control directory are not created
+                    # concurrently, as they share its state.
                     head_branch = self._get_colocated_branch(
                         target_controldir, branch_name)
+                    get_head_branch = (lambda head_branch=head_branch:
+                                       head_branch)
                 else:
-                    head_branch = self._get_nested_branch(
-                        dest_transport, dest_format, branch_name)
-                revid = mapping.revision_id_foreign_to_bzr(sha)
-                source_branch = LocalGitBranch(
-                    source_repo.controldir, source_repo, sha)
-                if head_branch.last_revision() != revid:
-                    head_branch.generate_revision_history(revid)
-                source_branch.tags.merge_to(head_branch.tags)
-                if not head_branch.get_parent():
-                    url = urlutils.join_segment_parameters(
-                        source_branch.base,
-                        {"branch": urlutils.escape(branch_name)})
-                    head_branch.set_parent(url)
+                    get_head_branch = functools.partial(
+                        self._get_nested_branch, dest_transport, dest_format,
+                        branch_name)
+                pending.append(executor.submit(
+                    self._update_branch, get_head_branch,
+                    mapping.revision_id_foreign_to_bzr(sha), revnos.get(sha),
+                    source_branch, source_tag_refs, parent_url))
+            for i, future in enumerate(futures.as_completed(pending)):
+                pb.update(gettext("creating branches"), i, len(pending))
+                future.result()
         trace.note(gettext(
             "Use 'bzr checkout' to create a working tree in "
             "the newly created branches."))
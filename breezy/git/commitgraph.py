@@ -0,0 +1,409 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Support for git's commit-graph files.
+
+A commit-graph file (``objects/info/commit-graph``, or a chain of files in
+``objects/info/commit-graphs``) lists commits together with their parents
+and generation numbers. The generation number of a commit is one more than
+the largest generation number of its parents, so a commit can only be an
+ancestor of commits with a higher generation number. Graph searches use
+this to stop walking history early.
+
+See Documentation/technical/commit-graph-format.txt in git for the format.
+"""
+
+import struct
+
+from dulwich.objects import (
+    hex_to_sha,
+    sha_to_hex,
+    )
+
+from .. import (
+    errors,
+    osutils,
+    revision as _mod_revision,
+    trace,
+    )
+
+
+COMMIT_GRAPH_NAME = 'info/commit-graph'
+COMMIT_GRAPH_CHAIN_NAME = 'info/commit-graphs/commit-graph-chain'
+
+_SIGNATURE = b'CGPH'
+_VERSION = 1
+_HASH_VERSION_SHA1 = 1
+
+_CHUNK_OID_FANOUT = b'OIDF'
+_CHUNK_OID_LOOKUP = b'OIDL'
+_CHUNK_COMMIT_DATA = b'CDAT'
+_CHUNK_EXTRA_EDGES = b'EDGE'
+_CHUNK_BASE_GRAPHS = b'BASE'
+
+_PARENT_NONE = 0x70000000
+_PARENT_EXTRA_EDGES = 0x80000000
+_GENERATION_MAX = 0x3FFFFFFF
+_COMMIT_DATA_SIZE = 36
+
+
+class BadCommitGraph(errors.BzrError):
+
+    _fmt = "Could not parse commit-graph %(name)s: %(reason)s"
+
+    def __init__(self, name, reason):
+        errors.BzrError.__init__(self)
+        self.name = name
+        self.reason = reason
+
+
+class _CommitGraphLayer(object):
+    """A single commit-graph file."""
+
+    def __init__(self, data, name, offset):
+        """Parse a commit-graph file.
+
+        :param data: Contents of the file.
+        :param name: Name of the file, for use in errors.
+        :param offset: Number of commits in the base layers.
+        """
+        self.name = name
+        self.offset = offset
+        if len(data) < 28 or data[:4] != _SIGNATURE:
+            raise BadCommitGraph(name, 'bad signature')
+        version, hash_version, num_chunks, num_bases = struct.unpack_from(
+            '>BBBB', data, 4)
+        if version != _VERSION or hash_version != _HASH_VERSION_SHA1:
+            raise BadCommitGraph(
+                name, 'unsupported version %d/%d' % (version, hash_version))
+        chunks = {}
+        table = []
+        for i in range(num_chunks + 1):
+            try:
+                chunk_id, chunk_offset = struct.unpack_from(
+                    '>4sQ', data, 8 + 12 * i)
+            except struct.error:
+                raise BadCommitGraph(name, 'truncated chunk table')
+            table.append((chunk_id, chunk_offset))
+        for (chunk_id, start), (_, end) in zip(table, table[1:]):
+            if start > end or end > len(data) - 20:
+                raise BadCommitGraph(name, 'bad chunk offset')
+            chunks[chunk_id] = (start, end)
+        for required in (_CHUNK_OID_FANOUT, _CHUNK_OID_LOOKUP,
+                         _CHUNK_COMMIT_DATA):
+            if required not in chunks:
+                raise BadCommitGraph(name, 'missing %s chunk' %
+                                     required.decode('ascii'))
+        fanout_start = chunks[_CHUNK_OID_FANOUT][0]
+        self._fanout = struct.unpack_from('>256L', data, fanout_start)
+        self.count = self._fanout[255]
+        self._oids = chunks[_CHUNK_OID_LOOKUP][0]
+        self._commit_data = chunks[_CHUNK_COMMIT_DATA][0]
+        if (chunks[_CHUNK_OID_LOOKUP][1] - self._oids != 20 * self.count or
+                chunks[_CHUNK_COMMIT_DATA][1] - self._commit_data !=
+                _COMMIT_DATA_SIZE * self.count):
+            raise BadCommitGraph(name, 'inconsistent commit count')
+        self._extra_edges = chunks.get(_CHUNK_EXTRA_EDGES, (None,))[0]
+        base_range = chunks.get(_CHUNK_BASE_GRAPHS)
+        if base_range is None:
+            self.base_ids = []
+        else:
+            self.base_ids = [
+                sha_to_hex(data[i:i + 20])
+                for i in range(base_range[0], base_range[1], 20)]
+        if len(self.base_ids) != num_bases:
+            raise BadCommitGraph(name, 'inconsistent base graph count')
+        self._data = data
+
+    def find(self, sha):
+        """Find the position of a binary sha in this layer, or None."""
+        first = sha[0]
+        lo = self._fanout[first - 1] if first else 0
+        hi = self._fanout[first]
+        data = self._data
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._oids + 20 * mid
+            mid_sha = data[start:start + 20]
+            if mid_sha < sha:
+                lo = mid + 1
+            elif mid_sha > sha:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def get_sha(self, position):
+        start = self._oids + 20 * position
+        return self._data[start:start + 20]
+
+    def get_commit_data(self, position):
+        """Return the generation and global parent positions of a commit."""
+        start = self._commit_data + _COMMIT_DATA_SIZE * position
+        parent1, parent2, generation = struct.unpack_from(
+            '>LLL', self._data, start + 20)
+        generation >>= 2
+        parents = []
+        if parent1 != _PARENT_NONE:
+            parents.append(parent1)
+        if parent2 & _PARENT_EXTRA_EDGES:
+            if self._extra_edges is None:
+                raise BadCommitGraph(self.name, 'missing EDGE chunk')
+            edge = self._extra_edges + 4 * (parent2 & ~_PARENT_EXTRA_EDGES)
+            while True:
+                (parent,) = struct.unpack_from('>L', self._data, edge)
+                parents.append(parent & ~_PARENT_EXTRA_EDGES)
+                if parent & _PARENT_EXTRA_EDGES:
+                    break
+                edge += 4
+        elif parent2 != _PARENT_NONE:
+            parents.append(parent2)
+        return generation, parents
+
+
+class CommitGraph(object):
+    """Commit-graph, consisting of one or more layers."""
+
+    def __init__(self, layers):
+        self._layers = layers
+
+    @classmethod
+    def from_transport(cls, transport):
+        """Read the commit-graph of an object store.
+
+        :param transport: Transport for the objects directory.
+        :return: A CommitGraph, or None if there is no usable commit-graph.
+        """
+        try:
+            try:
+                data = transport.get_bytes(COMMIT_GRAPH_NAME)
+            except errors.NoSuchFile:
+                pass
+            else:
+                return cls([_CommitGraphLayer(data, COMMIT_GRAPH_NAME, 0)])
+            try:
+                chain = transport.get_bytes(COMMIT_GRAPH_CHAIN_NAME)
+            except errors.NoSuchFile:
+                return None
+            graph_ids = chain.split()
+            layers = []
+            offset = 0
+            for graph_id in graph_ids:
+                name = 'info/commit-graphs/graph-%s.graph' % (
+                    graph_id.decode('ascii'))
+                layer = _CommitGraphLayer(
+                    transport.get_bytes(name), name, offset)
+                if layer.base_ids != graph_ids[:len(layers)]:
+                    raise BadCommitGraph(name, 'base graphs do not match')
+                layers.append(layer)
+                offset += layer.count
+            return cls(layers)
+        except (BadCommitGraph, errors.NoSuchFile) as e:
+            trace.mutter('ignoring commit-graph: %s', e)
+            return None
+
+    def __len__(self):
+        return sum(layer.count for layer in self._layers)
+
+    def _find(self, sha):
+        for layer in self._layers:
+            position = layer.find(sha)
+            if position is not None:
+                return layer, position
+        return None, None
+
+    def _get_sha(self, global_position):
+        for layer in self._layers:
+            if global_position < layer.offset + layer.count:
+                return layer.get_sha(global_position - layer.offset)
+        raise BadCommitGraph(self._layers[-1].name, 'bad parent position')
+
+    def get_generation(self, commit_id):
+        """Return the generation number of a commit, or None if unknown.
+
+        :param commit_id: Hex sha of a commit.
+        """
+        layer, position = self._find(hex_to_sha(commit_id))
+        if layer is None:
+            return None
+        generation = layer.get_commit_data(position)[0]
+        if generation == 0:
+            # Written by a version of git without generation numbers.
+            return None
+        return generation
+
+    def get_parents(self, commit_id):
+        """Return the parents of a commit, or None if it is not present.
+
+        :param commit_id: Hex sha of a commit.
+        """
+        layer, position = self._find(hex_to_sha(commit_id))
+        if layer is None:
+            return None
+        return [sha_to_hex(self._get_sha(parent))
+                for parent in layer.get_commit_data(position)[1]]
+
+
+def write_commit_graph(f, object_store, heads):
+    """Write a commit-graph covering the ancestry of some commits.
+
+    :param f: File-like object to write to.
+    :param object_store: Object store to read the commits from.
+    :param heads: Hex shas of the commits to include along with their
+        ancestry.
+    :return: Number of commits written.
+    :raise KeyError: If a commit in the ancestry is missing, e.g. in a
+        shallow repository.
+    """
+    commits = {}
+    generations = {}
+    pending = list(heads)
+    while pending:
+        commit_id = pending.pop()
+        if commit_id in generations:
+            continue
+        commit = commits.get(commit_id)
+        if commit is None:
+            commit = commits[commit_id] = object_store[commit_id]
+        missing = [parent for parent in commit.parents
+                   if parent not in generations]
+        if missing:
+            pending.append(commit_id)
+            pending.extend(missing)
+        else:
+            generations[commit_id] = min(_GENERATION_MAX, 1 + max(
+                [generations[parent] for parent in commit.parents] or [0]))
+    shas = sorted(hex_to_sha(commit_id) for commit_id in commits)
+    positions = {sha_to_hex(sha): i for i, sha in enumerate(shas)}
+    fanout = [0] * 256
+    for sha in shas:
+        fanout[sha[0]] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+    commit_data = []
+    extra_edges = []
+    for sha in shas:
+        commit_id = sha_to_hex(sha)
+        commit = commits[commit_id]
+        parents = [positions[parent] for parent in commit.parents]
+        parent1 = parents[0] if parents else _PARENT_NONE
+        if len(parents) > 2:
+            parent2 = _PARENT_EXTRA_EDGES | len(extra_edges)
+            extra_edges.extend(parents[1:-1])
+            extra_edges.append(_PARENT_EXTRA_EDGES | parents[-1])
+        elif len(parents) == 2:
+            parent2 = parents[1]
+        else:
+            parent2 = _PARENT_NONE
+        commit_time = max(0, min(commit.commit_time, (1 << 34) - 1))
+        commit_data.append(hex_to_sha(commit.tree))
+        commit_data.append(struct.pack(
+            '>LLLL', parent1, parent2,
+            (generations[commit_id] << 2) | (commit_time >> 32),
+            commit_time & 0xFFFFFFFF))
+    chunks = [
+        (_CHUNK_OID_FANOUT, struct.pack('>256L', *fanout)),
+        (_CHUNK_OID_LOOKUP, b''.join(shas)),
+        (_CHUNK_COMMIT_DATA, b''.join(commit_data)),
+        ]
+    if extra_edges:
+        chunks.append((_CHUNK_EXTRA_EDGES, struct.pack(
+            '>%dL' % len(extra_edges), *extra_edges)))
+    out = [_SIGNATURE, struct.pack(
+        '>BBBB', _VERSION, _HASH_VERSION_SHA1, len(chunks), 0)]
+    offset = 8 + 12 * (len(chunks) + 1)
+    for chunk_id, chunk in chunks:
+        out.append(struct.pack('>4sQ', chunk_id, offset))
+        offset += len(chunk)
+    out.append(struct.pack('>4sQ', b'\0\0\0\0', offset))
+    out.extend(chunk for _, chunk in chunks)
+    data = b''.join(out)
+    f.write(data)
+    f.write(osutils.sha(data).digest())
+    return len(shas)
+
+
+class CommitGraphParentsProvider(object):
+    """Parents provider for git repositories that has generation numbers.
+
+    Parents are looked up by the repository; generation numbers come from
+    the commit-graph, and are computed for commits that were added after it
+    was written.
+    """
+
+    def __init__(self, repository, commit_graph):
+        self._repository = repository
+        self._commit_graph = commit_graph
+        self._generations = {}
+        self.get_parent_map = repository.get_parent_map
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self._repository)
+
+    def _get_generation(self, commit_id):
+        generation = self._generations.get(commit_id)
+        if generation is not None:
+            return generation
+        store = self._repository._git.object_store
+        pending = [commit_id]
+        while pending:
+            current = pending[-1]
+            if current in self._generations:
+                pending.pop()
+                continue
+            generation = self._commit_graph.get_generation(current)
+            if generation is None:
+                try:
+                    parents = store[current].parents
+                except KeyError:
+                    # Ghosts and commits beyond a shallow boundary have
+                    # no known generation, nor do their descendants.
+                    return None
+                missing = [parent for parent in parents
+                           if parent not in self._generations]
+                if missing:
+                    pending.extend(missing)
+                    continue
+                generation = 1 + max(
+                    [self._generations[parent] for parent in parents] or [0])
+            self._generations[current] = generation
+            pending.pop()
+        return self._generations[commit_id]
+
+    def get_generation_map(self, keys):
+        """Get the generation numbers of revisions.
+
+        A revision can only be an ancestor of revisions with a higher
+        generation number.
+
+        :param keys: Revision ids.
+        :return: Dictionary mapping revision ids to generation numbers.
+            Revisions for which no generation number is known are omitted.
+        """
+        ret = {}
+        for revision_id in keys:
+            if revision_id == _mod_revision.NULL_REVISION:
+                ret[revision_id] = 0
+                continue
+            try:
+                commit_id, mapping = self._repository.lookup_bzr_revision_id(
+                    revision_id)
+            except errors.NoSuchRevision:
+                continue
+            generation = self._get_generation(commit_id)
+            if generation is not None:
+                ret[revision_id] = generation
+        return ret
@@ -28,7 +28,9 @@ from dulwich.object_store import (
     tree_lookup_path,
     )
 import posixpath
+import queue
 import stat
+import threading
 
 from .. import (
     debug,
@@ -450,19 +452,139 @@ def import_git_commit(repo, mapping, head, lookup_object,
             parent_trees, mapping, unusual_modes, verifiers)
 
 
+def _read_import_objects(lookup_object, commit_id, objects):
+    """Read the git objects needed to import a commit.
+
+    This reads the same objects import_git_commit looks up: the commit, its
+    left hand parent and the trees and blobs that differ between them.
+    Objects that are not available are skipped.
+
+    :param lookup_object: Function to look up a git object by sha.
+    :param commit_id: Sha of the commit to import.
+    :param objects: Dictionary to add the objects to, by sha.
+    """
+    def lookup(sha):
+        if sha not in objects:
+            objects[sha] = lookup_object(sha)
+        return objects[sha]
+
+    def read_tree(base_tree_id, tree_id):
+        if base_tree_id == tree_id:
+            return
+        try:
+            tree = lookup(tree_id) if tree_id is not None else None
+            base_tree = (
+                lookup(base_tree_id) if base_tree_id is not None else None)
+        except KeyError:
+            return
+        entries = {} if tree is None else {
+            name: (mode, sha) for name, mode, sha in tree.iteritems()}
+        base_entries = {} if base_tree is None else {
+            name: (mode, sha) for name, mode, sha in base_tree.iteritems()}
+        for name in set(entries) | set(base_entries):
+            mode, sha = entries.get(name, (None, None))
+            base_mode, base_sha = base_entries.get(name, (None, None))
+            if (mode, sha) == (base_mode, base_sha):
+                continue
+            if base_mode is not None and stat.S_ISDIR(base_mode):
+                base_subtree_id = base_sha
+            else:
+                base_subtree_id = None
+            if mode is not None and stat.S_ISDIR(mode):
+                read_tree(base_subtree_id, sha)
+            else:
+                read_tree(base_subtree_id, None)
+                if (mode is not None and sha != base_sha and
+                        not S_ISGITLINK(mode)):
+                    try:
+                        lookup(sha)
+                    except KeyError:
+                        pass
+
+    try:
+        commit = lookup(commit_id)
+        if commit.parents:
+            base_tree_id = lookup(commit.parents[0]).tree
+        else:
+            base_tree_id = None
+    except KeyError:
+        return
+    read_tree(base_tree_id, commit.tree)
+
+
+def _iter_read_ahead(lookup_object, commit_ids, read_ahead):
+    """Read the objects for importing commits in a background thread.
+
+    The objects for up to read_ahead commits are read before they are
+    needed. Most of that time is spent reading and decompressing, during
+    which the thread releases the GIL, so this overlaps with building
+    inventories and inserting texts in the thread consuming the results.
+
+    :param lookup_object: Thread safe function to look up git objects.
+    :param commit_ids: Shas of the commits that will be imported, in order.
+    :param read_ahead: Number of commits to read ahead.
+    :return: Iterator over a dictionary of objects for each commit, in the
+        order of commit_ids.
+    """
+    results = queue.Queue(read_ahead)
+    stop = threading.Event()
+
+    def produce():
+        for commit_id in commit_ids:
+            objects = {}
+            try:
+                _read_import_objects(lookup_object, commit_id, objects)
+            except Exception as e:
+                # The importer will look up the objects itself and report
+                # any problems.
+                trace.mutter('reading ahead %s failed: %s', commit_id, e)
+            while not stop.is_set():
+                try:
+                    results.put(objects, timeout=0.1)
+                except queue.Full:
+                    continue
+                break
+            else:
+                return
+
+    thread = threading.Thread(target=produce, name='git-import-read-ahead')
+    thread.daemon = True
+    thread.start()
+    try:
+        for commit_id in commit_ids:
+            yield results.get()
+    finally:
+        stop.set()
+        thread.join()
+
+
 def import_git_objects(repo, mapping, object_iter,
                        target_git_object_retriever, heads, pb=None,
-                       limit=None):
+                       limit=None, read_ahead=0):
     """Import a set of git objects into a bzr repository.
 
     :param repo: Target Bazaar repository
     :param mapping: Mapping to use
     :param object_iter: Iterator over Git objects.
+    :param read_ahead: Number of commits for which to read the git objects
+        in a background thread before they are imported. Zero reads objects
+        as they are needed.
     :return: Tuple with pack hints and last imported revision id
     """
+    object_lock = threading.Lock()
+    read_ahead_objects = {}
+
+    def lookup_source_object(sha):
+        with object_lock:
+            return object_iter[sha]
+
     def lookup_object(sha):
         try:
-            return object_iter[sha]
+            return read_ahead_objects[sha]
+        except KeyError:
+            pass
+        try:
+            return lookup_source_object(sha)
         except KeyError:
             return target_git_object_retriever[sha]
     graph = []
@@ -506,32 +628,44 @@ def import_git_objects(repo, mapping, object_iter,
     if limit is not None:
         revision_ids = revision_ids[:limit]
     last_imported = None
-    for offset in range(0, len(revision_ids), batch_size):
-        target_git_object_retriever.start_write_group()
-        try:
-            repo.start_write_group()
+    if read_ahead > 0:
+        read_ahead_iter = _iter_read_ahead(
+            lookup_source_object, revision_ids, read_ahead)
+    else:
+        read_ahead_iter = None
+    try:
+        for offset in range(0, len(revision_ids), batch_size):
+            target_git_object_retriever.start_write_group()
             try:
-                for i, head in enumerate(
-                        revision_ids[offset:offset + batch_size]):
-                    if pb is not None:
-                        pb.update("fetching revisions", offset + i,
-                                  len(revision_ids))
-                    import_git_commit(repo, mapping, head, lookup_object,
-                                      target_git_object_retriever, trees_cache,
-                                      strict=True)
-                    last_imported = head
+                repo.start_write_group()
+                try:
+                    for i, head in enumerate(
+                            revision_ids[offset:offset + batch_size]):
+                        if pb is not None:
+                            pb.update("fetching revisions", offset + i,
+                                      len(revision_ids))
+                        if read_ahead_iter is not None:
+                            read_ahead_objects.clear()
+                            read_ahead_objects.update(next(read_ahead_iter))
+                        import_git_commit(repo, mapping, head, lookup_object,
+                                          target_git_object_retriever,
+                                          trees_cache, strict=True)
+                        last_imported = head
+                except BaseException:
+                    repo.abort_write_group()
+                    raise
+                else:
+                    hint = repo.commit_write_group()
+                    if hint is not None:
+                        pack_hints.extend(hint)
             except BaseException:
-                repo.abort_write_group()
+                target_git_object_retriever.abort_write_group()
                 raise
             else:
-                hint = repo.commit_write_group()
-                if hint is not None:
-                    pack_hints.extend(hint)
-        except BaseException:
-            target_git_object_retriever.abort_write_group()
-            raise
-        else:
-            target_git_object_retriever.commit_write_group()
+                target_git_object_retriever.commit_write_group()
+    finally:
+        if read_ahead_iter is not None:
+            read_ahead_iter.close()
     return pack_hints, last_imported
 
 
@@ -30,6 +30,10 @@ from ..revision import (
     NULL_REVISION,
     )
 
+from .cache import (
+    ChangedPathIndex,
+    changed_paths,
+    )
 from .mapping import (
     encode_git_path,
     )
@@ -40,8 +44,45 @@ class GitFileLastChangeScanner(object):
     def __init__(self, repository):
         self.repository = repository
         self.store = self.repository._git.object_store
+        self._changed_path_index = None
+
+    def _get_changed_path_index(self):
+        if self._changed_path_index is None:
+            self._changed_path_index = ChangedPathIndex.from_repository(
+                self.repository)
+        return self._changed_path_index
+
+    def _may_have_changed(self, commit, path):
+        """Check whether commit may have changed path relative to its parents.
+
+        Commits that are not in the changed path index yet are added to it.
+        """
+        if not commit.parents:
+            return True
+        index = self._get_changed_path_index()
+        ret = index.may_have_changed(commit.id, path)
+        if ret is None:
+            try:
+                paths = changed_paths(self.store, commit)
+            except KeyError:
+                # Missing parents, e.g. in a shallow clone.
+                return True
+            index.add(commit.id, paths)
+            ret = (paths is None or path in paths)
+        return ret
+
+    def flush(self):
+        """Write out changed path index entries added by recent lookups."""
+        if self._changed_path_index is not None:
+            self._changed_path_index.flush()
 
     def find_last_change_revision(self, path, commit_id):
+        ret = self._find_last_change_revision(path, commit_id)
+        if not self.repository.is_locked():
+            self.flush()
+        return ret
+
+    def _find_last_change_revision(self, path, commit_id):
         if not isinstance(path, bytes):
             raise TypeError(path)
         commit = self.store[commit_id]
@@ -53,6 +94,10 @@ class GitFileLastChangeScanner(object):
             raise AssertionError("sha %r for %r in %r" %
                                  (target_sha, path, commit_id))
         while True:
+            if not self._may_have_changed(commit, path):
+                # The path is the same in all parents.
+                commit = self.store[commit.parents[0]]
+                continue
             parent_commits = []
             for parent_commit in [self.store[c] for c in commit.parents]:
                 try:
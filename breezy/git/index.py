@@ -0,0 +1,579 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Support for git index files, including their extensions.
+
+Dulwich reads the entries of an index file, but ignores its extensions.
+GitIndex also supports:
+
+ * split indexes (the ``link`` extension), where most entries live in a
+   shared index file (``sharedindex.<sha>``) and the index itself only
+   records the changes to it;
+ * the fsmonitor token (``FSMN``), recorded by git when ``core.fsmonitor``
+   is set, together with the entries that may have changed since;
+ * the cache tree (``TREE``), resolve undo (``REUC``) and untracked cache
+   (``UNTR``) extensions, which are written back for as long as they are
+   still valid.
+
+Indexes are always written out in full rather than split; git splits them
+again the next time it writes the index if core.splitIndex is set.
+
+The time the index was written is remembered, so that racily clean entries
+- of files that changed in the same second as their stat information was
+recorded - are not trusted.
+
+See Documentation/technical/index-format.txt in git for the format.
+"""
+
+import os
+import struct
+import subprocess
+import time
+
+from dulwich.file import GitFile
+from dulwich.index import (
+    Index,
+    IndexEntry,
+    cleanup_mode,
+    )
+from dulwich.objects import (
+    hex_to_sha,
+    sha_to_hex,
+    )
+
+from .. import (
+    errors,
+    osutils,
+    trace,
+    )
+
+
+SHARED_INDEX_PREFIX = 'sharedindex.'
+
+_SIGNATURE = b'DIRC'
+_DEFAULT_VERSION = 2
+_ENTRY_HEADER = struct.Struct('>LLLLLLLLLL20sH')
+_NAME_MASK = 0x0fff
+_EXTENDED_FLAG = 0x4000
+_NULL_CHECKSUM = b'\0' * 20
+
+_EXT_SPLIT_INDEX = b'link'
+_EXT_CACHE_TREE = b'TREE'
+_EXT_RESOLVE_UNDO = b'REUC'
+_EXT_UNTRACKED_CACHE = b'UNTR'
+_EXT_FSMONITOR = b'FSMN'
+
+_FSMONITOR_VERSION = 2
+_FSMONITOR_HOOK_VERSION = b'2'
+
+
+class BadIndex(errors.BzrError):
+
+    _fmt = "Could not parse index %(path)s: %(reason)s"
+
+    def __init__(self, path, reason):
+        errors.BzrError.__init__(self)
+        self.path = path
+        self.reason = reason
+
+
+class UnsupportedIndexExtension(errors.BzrError):
+
+    _fmt = "Index %(path)s uses the unsupported extension %(extension)r."
+
+    def __init__(self, path, extension):
+        errors.BzrError.__init__(self)
+        self.path = path
+        self.extension = extension
+
+
+def read_ewah(data, offset=0):
+    """Read an EWAH compressed bitmap.
+
+    :param data: Bytes to read from
+    :param offset: Offset of the bitmap in data
+    :return: Tuple with a list of the set bits and the offset of the end
+        of the bitmap
+    """
+    bit_size, word_count = struct.unpack_from('>LL', data, offset)
+    offset += 8
+    words = struct.unpack_from('>%dQ' % word_count, data, offset)
+    # The words are followed by the position of the last marker word.
+    offset += 8 * word_count + 4
+    bits = []
+    pos = 0
+    i = 0
+    while i < word_count:
+        marker = words[i]
+        running_length = (marker >> 1) & 0xffffffff
+        literal_count = marker >> 33
+        if marker & 1:
+            bits.extend(range(pos, pos + 64 * running_length))
+        pos += 64 * running_length
+        for word in words[i + 1:i + 1 + literal_count]:
+            while word:
+                lowest = word & -word
+                bits.append(pos + lowest.bit_length() - 1)
+                word ^= lowest
+            pos += 64
+        i += 1 + literal_count
+    return [bit for bit in bits if bit < bit_size], offset
+
+
+def write_ewah(bits, bit_size):
+    """Serialize a bitmap with EWAH compression.
+
+    :param bits: Iterable over the set bits
+    :param bit_size: Number of bits in the bitmap
+    :return: The serialized bitmap
+    """
+    literals = [0] * ((bit_size + 63) // 64)
+    for bit in bits:
+        literals[bit // 64] |= 1 << (bit % 64)
+    words = []
+    marker = 0
+    i = 0
+    while i < len(literals) or not words:
+        run_start = i
+        while (i < len(literals) and not literals[i] and
+               i - run_start < 0xffffffff):
+            i += 1
+        literal_start = i
+        while (i < len(literals) and literals[i] and
+               i - literal_start < 0x7fffffff):
+            i += 1
+        marker = len(words)
+        words.append(((i - literal_start) << 33) | ((literal_start - run_start) << 1))
+        words.extend(literals[literal_start:i])
+    return (struct.pack('>LL', bit_size, len(words)) +
+            struct.pack('>%dQ' % len(words), *words) +
+            struct.pack('>L', marker))
+
+
+def _decode_varint(data, offset):
+    c = data[offset]
+    offset += 1
+    value = c & 0x7f
+    while c & 0x80:
+        c = data[offset]
+        offset += 1
+        value = ((value + 1) << 7) | (c & 0x7f)
+    return value, offset
+
+
+def _encode_varint(value):
+    ret = [value & 0x7f]
+    value >>= 7
+    while value:
+        value -= 1
+        ret.append(0x80 | (value & 0x7f))
+        value >>= 7
+    return bytes(reversed(ret))
+
+
+def _seconds(t):
+    if isinstance(t, tuple):
+        return t[0]
+    return int(t)
+
+
+def _split_time(t):
+    if isinstance(t, tuple):
+        return t
+    if isinstance(t, int):
+        return (t, 0)
+    secs, fraction = divmod(t, 1.0)
+    return (int(secs), int(fraction * 1000000000))
+
+
+def _parse_index(path, data):
+    """Parse the contents of an index file.
+
+    :return: Tuple with the index version, a list of (name, entry,
+        extended_flags) tuples and a list of (signature, data) tuples for
+        the extensions
+    """
+    if len(data) < 32 or data[:4] != _SIGNATURE:
+        raise BadIndex(path, 'invalid header')
+    checksum = data[-20:]
+    # Since git 2.40 index.skipHash leaves out the checksum.
+    if (checksum != _NULL_CHECKSUM and
+            osutils.sha_string(data[:-20]) != sha_to_hex(checksum)):
+        raise BadIndex(path, 'checksum mismatch')
+    version, count = struct.unpack_from('>LL', data, 4)
+    if version not in (2, 3, 4):
+        raise BadIndex(path, 'unsupported version %d' % version)
+    offset = 12
+    entries = []
+    previous = b''
+    for i in range(count):
+        start = offset
+        (ctime, ctime_ns, mtime, mtime_ns, dev, ino, mode, uid, gid, size,
+         sha, flags) = _ENTRY_HEADER.unpack_from(data, offset)
+        offset += _ENTRY_HEADER.size
+        extended_flags = 0
+        if flags & _EXTENDED_FLAG:
+            if version < 3:
+                raise BadIndex(path, 'extended flags in version 2 index')
+            (extended_flags, ) = struct.unpack_from('>H', data, offset)
+            offset += 2
+        if version >= 4:
+            # The name is stored as the number of bytes to remove from the
+            # end of the previous name, and the bytes to add after that.
+            strip, offset = _decode_varint(data, offset)
+            end = data.index(b'\0', offset)
+            name = previous[:len(previous) - strip] + data[offset:end]
+            offset = end + 1
+        else:
+            if flags & _NAME_MASK == _NAME_MASK:
+                end = data.index(b'\0', offset + _NAME_MASK)
+            else:
+                end = offset + (flags & _NAME_MASK)
+            name = data[offset:end]
+            # Entries are padded with 1-8 NUL bytes to a multiple of 8.
+            offset = start + ((end - start + 8) & ~7)
+        previous = name
+        entries.append((name, IndexEntry(
+            (ctime, ctime_ns), (mtime, mtime_ns), dev, ino, mode, uid, gid,
+            size, sha_to_hex(sha), flags & ~(_NAME_MASK | _EXTENDED_FLAG)),
+            extended_flags))
+    extensions = []
+    end = len(data) - 20
+    while offset < end:
+        signature, size = struct.unpack_from('>4sL', data, offset)
+        offset += 8
+        extensions.append((signature, data[offset:offset + size]))
+        offset += size
+    if offset != end:
+        raise BadIndex(path, 'truncated extension')
+    return version, entries, extensions
+
+
+def _apply_split_index(path, entries, data):
+    """Combine the entries of a split index with those of its shared index.
+
+    :param path: Path of the split index
+    :param entries: Entries in the split index
+    :param data: Contents of the link extension
+    :return: The combined entries
+    """
+    shared_path = os.path.join(
+        os.path.dirname(path), SHARED_INDEX_PREFIX + sha_to_hex(
+            data[:20]).decode('ascii'))
+    try:
+        with open(shared_path, 'rb') as f:
+            shared_data = f.read()
+    except FileNotFoundError:
+        raise BadIndex(path, 'missing shared index %s' % shared_path)
+    shared_entries = _parse_index(shared_path, shared_data)[1]
+    if len(data) > 20:
+        deleted, offset = read_ewah(data, 20)
+        replaced = read_ewah(data, offset)[0]
+    else:
+        deleted = replaced = []
+    # Entries replacing those in the shared index come first, in order,
+    # followed by new entries. Replacements without a name keep the name of
+    # the entry they replace.
+    if len(replaced) > len(entries):
+        raise BadIndex(path, 'missing replacement entries')
+    for pos, (name, entry, extended_flags) in zip(replaced, entries):
+        if not name:
+            name = shared_entries[pos][0]
+        shared_entries[pos] = (name, entry, extended_flags)
+    deleted = set(deleted)
+    return ([e for pos, e in enumerate(shared_entries) if pos not in deleted] +
+            entries[len(replaced):])
+
+
+def query_fsmonitor_hook(hook, token, cwd):
+    """Ask an fsmonitor hook (version 2) which files have changed.
+
+    :param hook: Path to the hook, relative to cwd
+    :param token: Token returned by the previous query
+    :param cwd: Directory to run the hook in; the root of the working tree
+    :return: Tuple with the new token and a set with the paths that have
+        changed since token (without trailing slashes), or None if anything
+        could have changed. None is returned if the hook fails.
+    """
+    try:
+        proc = subprocess.Popen(
+            [hook, _FSMONITOR_HOOK_VERSION, token], cwd=cwd,
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+    except OSError as e:
+        trace.mutter('unable to run fsmonitor hook %s: %s', hook, e)
+        return None
+    output = proc.communicate()[0]
+    if proc.returncode != 0:
+        trace.mutter('fsmonitor hook %s failed with exit code %d',
+                     hook, proc.returncode)
+        return None
+    fields = output.split(b'\0')
+    new_token = fields[0]
+    if not new_token:
+        return None
+    changed = set(path.rstrip(b'/') for path in fields[1:] if path)
+    if b'' in changed:
+        # The hook reported '/': everything may have changed.
+        return new_token, None
+    return new_token, changed
+
+
+class FSMonitorQuery(object):
+    """The result of querying an fsmonitor hook.
+
+    :ivar token: The token returned by the hook
+    :ivar dirty: Paths that may have changed and have not been checked yet
+    """
+
+    def __init__(self, token, changed, dirty):
+        self.token = token
+        self._changed = changed
+        self.dirty = set(dirty)
+
+    def may_have_changed(self, path):
+        """Check whether the file at path may have changed.
+
+        This is the case if the hook reported it or one of its parent
+        directories, or if it had not been checked since the previous
+        query.
+        """
+        if self._changed is None or path in self.dirty:
+            return True
+        while True:
+            if path in self._changed:
+                return True
+            i = path.rfind(b'/')
+            if i == -1:
+                return False
+            path = path[:i]
+
+
+class GitIndex(Index):
+    """A git index file.
+
+    :ivar fsmonitor_token: Token returned by the last fsmonitor query, or
+        None
+    :ivar fsmonitor_dirty: Set of the paths that may have changed since the
+        fsmonitor token was obtained
+    """
+
+    def __init__(self, filename):
+        self._stat = None
+        self._extended_flags = {}
+        self._extensions = {}
+        self.fsmonitor_token = None
+        self.fsmonitor_dirty = set()
+        super(GitIndex, self).__init__(filename)
+
+    def clear(self):
+        super(GitIndex, self).clear()
+        self._extended_flags = {}
+        # Paths that were set since the index was read.
+        self._updated = set()
+        self._paths_changed = True
+        self._contents_changed = True
+
+    def __setitem__(self, name, x):
+        old = self._byname.get(name)
+        super(GitIndex, self).__setitem__(name, x)
+        if old is None:
+            self._paths_changed = True
+            self._contents_changed = True
+            self._extended_flags.pop(name, None)
+        elif (old.mode, old.sha) != (x[4], x[8]):
+            self._contents_changed = True
+            self._extended_flags.pop(name, None)
+        self._updated.add(name)
+
+    def __delitem__(self, name):
+        super(GitIndex, self).__delitem__(name)
+        self._paths_changed = True
+        self._contents_changed = True
+        self._extended_flags.pop(name, None)
+        self._updated.discard(name)
+        self.fsmonitor_dirty.discard(name)
+
+    def read(self):
+        """Read the contents of the index from disk."""
+        try:
+            f = GitFile(self._filename, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+        version, entries, extensions = _parse_index(self._filename, data)
+        fsmonitor = None
+        for signature, ext_data in extensions:
+            if signature == _EXT_SPLIT_INDEX:
+                entries = _apply_split_index(
+                    self._filename, entries, ext_data)
+            elif signature in (_EXT_CACHE_TREE, _EXT_RESOLVE_UNDO,
+                               _EXT_UNTRACKED_CACHE):
+                self._extensions[signature] = ext_data
+            elif signature == _EXT_FSMONITOR:
+                fsmonitor = ext_data
+            elif not signature[:1].isupper():
+                # Extensions that can not be ignored.
+                raise UnsupportedIndexExtension(self._filename, signature)
+        for name, entry, extended_flags in entries:
+            self._byname[name] = entry
+            if extended_flags:
+                self._extended_flags[name] = extended_flags
+        if fsmonitor is not None:
+            self._read_fsmonitor(fsmonitor)
+        self._version = version
+        self._stat = st
+        self._updated = set()
+        self._paths_changed = False
+        self._contents_changed = False
+
+    def _read_fsmonitor(self, data):
+        (version, ) = struct.unpack_from('>L', data)
+        if version != _FSMONITOR_VERSION:
+            # Version 1 tokens are timestamps, which need a different
+            # version of the hook.
+            return
+        end = data.index(b'\0', 4)
+        self.fsmonitor_token = data[4:end]
+        # The bitmap size is followed by the bitmap of entries that may
+        # have changed since the token was obtained.
+        dirty = read_ewah(data, end + 5)[0]
+        names = sorted(self._byname)
+        self.fsmonitor_dirty = set(
+            names[pos] for pos in dirty if pos < len(names))
+
+    def is_current(self):
+        """Check whether the index file is unchanged since it was read."""
+        try:
+            st = os.stat(self._filename)
+        except FileNotFoundError:
+            return self._stat is None
+        if self._stat is None:
+            return False
+        return ((st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino) ==
+                (self._stat.st_mtime_ns, self._stat.st_ctime_ns,
+                 self._stat.st_size, self._stat.st_ino))
+
+    def is_modified(self):
+        """Check whether any entries were set or removed since reading."""
+        return bool(self._updated) or self._paths_changed
+
+    def is_racy(self, entry):
+        """Check whether the stat information of an entry can be trusted.
+
+        A file changed within the same second as its entry was written to
+        the index could still have the same size and timestamps as
+        recorded in the entry.
+        """
+        return (self._stat is None or
+                _seconds(entry.mtime) >= int(self._stat.st_mtime))
+
+    def is_up_to_date(self, entry, stat_value):
+        """Check whether an entry describes a file, based on its stat data.
+
+        :param entry: Index entry
+        :param stat_value: Result of lstat for the file
+        :return: True if the entry is known to be up to date
+        """
+        return (entry.mode == cleanup_mode(stat_value.st_mode) and
+                entry.size & 0xffffffff == stat_value.st_size & 0xffffffff and
+                _seconds(entry.mtime) == int(stat_value.st_mtime) and
+                _seconds(entry.ctime) == int(stat_value.st_ctime) and
+                entry.ino & 0xffffffff == stat_value.st_ino & 0xffffffff and
+                not self.is_racy(entry))
+
+    def write(self):
+        """Write the index to disk."""
+        f = GitFile(self._filename, 'wb')
+        try:
+            f.write(self.serialize())
+        except BaseException:
+            f.abort()
+            raise
+        f.close()
+
+    def serialize(self):
+        """Serialize the index.
+
+        Split indexes are written as a full index.
+
+        :return: The contents of the index file
+        """
+        now = int(time.time())
+        names = sorted(self._byname)
+        version = self._version or _DEFAULT_VERSION
+        if version < 3 and self._extended_flags:
+            version = 3
+        chunks = [struct.pack('>4sLL', _SIGNATURE, version, len(names))]
+        previous = b''
+        for name in names:
+            entry = self._byname[name]
+            mtime = entry.mtime
+            # Smudge entries that would not be recognized as racily clean
+            # anymore once the index has been rewritten, so that their
+            # contents get compared. Git clears the size instead, but that
+            # is used as the text size of files by GitWorkingTree.
+            if (_seconds(mtime) >= now or
+                    (name not in self._updated and self.is_racy(entry))):
+                mtime = (0, 0)
+            extended_flags = self._extended_flags.get(name, 0)
+            flags = ((entry.flags & ~(_NAME_MASK | _EXTENDED_FLAG)) |
+                     min(len(name), _NAME_MASK))
+            if extended_flags:
+                flags |= _EXTENDED_FLAG
+            header = _ENTRY_HEADER.pack(
+                *(_split_time(entry.ctime) + _split_time(mtime) + (
+                    entry.dev & 0xffffffff, entry.ino & 0xffffffff,
+                    entry.mode, entry.uid & 0xffffffff,
+                    entry.gid & 0xffffffff, entry.size & 0xffffffff,
+                    hex_to_sha(entry.sha), flags)))
+            chunks.append(header)
+            length = len(header)
+            if extended_flags:
+                chunks.append(struct.pack('>H', extended_flags))
+                length += 2
+            if version >= 4:
+                common = len(os.path.commonprefix([previous, name]))
+                chunks.append(_encode_varint(len(previous) - common))
+                chunks.append(name[common:] + b'\0')
+            else:
+                length += len(name)
+                chunks.append(name + b'\0' * (((length + 8) & ~7) - length))
+            previous = name
+        extensions = []
+        if not self._contents_changed:
+            extensions.extend(
+                (signature, self._extensions[signature])
+                for signature in (_EXT_CACHE_TREE, _EXT_RESOLVE_UNDO)
+                if signature in self._extensions)
+        if (not self._paths_changed and
+                _EXT_UNTRACKED_CACHE in self._extensions):
+            extensions.append(
+                (_EXT_UNTRACKED_CACHE,
+                 self._extensions[_EXT_UNTRACKED_CACHE]))
+        if self.fsmonitor_token is not None:
+            bitmap = write_ewah(
+                [pos for pos, name in enumerate(names)
+                 if name in self.fsmonitor_dirty], len(names))
+            extensions.append((_EXT_FSMONITOR, b''.join([
+                struct.pack('>L', _FSMONITOR_VERSION), self.fsmonitor_token,
+                b'\0', struct.pack('>L', len(bitmap)), bitmap])))
+        for signature, data in extensions:
+            chunks.append(struct.pack('>4sL', signature, len(data)))
+            chunks.append(data)
+        data = b''.join(chunks)
+        return data + hex_to_sha(osutils.sha_string(data))
@@ -299,19 +299,36 @@ class InterToLocalGitRepository(InterToGitRepository):
             with ui.ui_factory.nested_progress_bar() as pb:
                 object_generator = MissingObjectsIterator(
                     self.source_store, self.source, pb)
-                for (old_revid, git_sha) in object_generator.import_revisions(
-                        todo, lossy=lossy):
-                    if lossy:
-                        new_revid = self.mapping.revision_id_foreign_to_bzr(
-                            git_sha)
-                    else:
-                        new_revid = old_revid
-                        try:
-                            self.mapping.revision_id_bzr_to_foreign(old_revid)
-                        except InvalidRevisionId:
-                            pass
-                    revidmap[old_revid] = (git_sha, new_revid)
-                self.target_store.add_objects(object_generator)
+
+                def iter_objects():
+                    # Objects are written to the pack as they are generated,
+                    # rather than all kept in memory first.
+                    for i, old_revid in enumerate(todo):
+                        pb.update("pushing revisions", i, len(todo))
+                        git_sha = None
+                        for obj, path in (
+                                object_generator.iter_revision_objects(
+                                    old_revid, lossy)):
+                            if obj.type_name == b"commit":
+                                git_sha = obj.id
+                            yield obj, path
+                        if git_sha is None:
+                            raise AssertionError(
+                                "no commit object generated for revision %s"
+                                % old_revid)
+                        if lossy:
+                            new_revid = (
+                                self.mapping.revision_id_foreign_to_bzr(
+                                    git_sha))
+                        else:
+                            new_revid = old_revid
+                            try:
+                                self.mapping.revision_id_bzr_to_foreign(
+                                    old_revid)
+                            except InvalidRevisionId:
+                                pass
+                        revidmap[old_revid] = (git_sha, new_revid)
+                self.target_store.add_pack_objects(iter_objects())
                 return revidmap
 
     def fetch(self, revision_id=None, pb=None, find_ghosts=False,
@@ -504,6 +521,9 @@ class InterGitNonGitRepository(InterFromGitRepository):
                 'Fetching from Git to Bazaar repository. '
                 'For better performance, fetch into a Git repository.')
 
+    def _get_import_read_ahead(self):
+        return config.GlobalStack().get('git.import_read_ahead')
+
     def fetch_objects(self, determine_wants, mapping, limit=None, lossy=False):
         """Fetch objects from a remote server.
 
@@ -587,7 +607,8 @@ class InterRemoteGitNonGitRepository(InterGitNonGitRepository):
                              len(wants_recorder.wants))
                 (pack_hint, last_rev) = import_git_objects(
                     self.target, mapping, objects_iter, store,
-                    wants_recorder.wants, pb, limit)
+                    wants_recorder.wants, pb, limit,
+                    read_ahead=self._get_import_read_ahead())
                 return (pack_hint, last_rev, wants_recorder.remote_refs)
 
     @staticmethod
@@ -619,7 +640,8 @@ class InterLocalGitNonGitRepository(InterGitNonGitRepository):
             try:
                 (pack_hint, last_rev) = import_git_objects(
                     self.target, mapping, self.source._git.object_store,
-                    target_git_object_retriever, wants, pb, limit)
+                    target_git_object_retriever, wants, pb, limit,
+                    read_ahead=self._get_import_read_ahead())
                 return (pack_hint, last_rev, remote_refs)
             finally:
                 target_git_object_retriever.unlock()
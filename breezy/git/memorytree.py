@@ -178,7 +178,7 @@ class GitMemoryTree(MutableGitIndexTree, _mod_tree.Tree):
             (mem_stat.st_mode, 0, 0, 0, 0, 0, mem_stat.st_size, 0, 0, 0))
         return stat_val
 
-    def _live_entry(self, path):
+    def _live_entry(self, path, index_entry=None):
         path = urlutils.quote_from_bytes(path)
         stat_val = self._lstat(path)
         if stat.S_ISDIR(stat_val.st_mode):
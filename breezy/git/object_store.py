@@ -34,6 +34,8 @@ from dulwich.pack import (
     )
 
 from .. import (
+    config,
+    debug,
     errors,
     lru_cache,
     trace,
@@ -66,6 +68,8 @@ from .unpeel_map import (
 
 import posixpath
 import stat
+import sys
+import threading
 
 
 BANNED_FILENAMES = ['.git']
@@ -82,27 +86,146 @@ def get_object_store(repo, mapping=None):
 
 
 MAX_TREE_CACHE_SIZE = 50 * 1024 * 1024
+MAX_OBJECT_CACHE_SIZE = 20 * 1024 * 1024
 
+# Memory used by an inventory entry and its slot in the inventory, not
+# counting the strings it refers to.
+_INVENTORY_ENTRY_OVERHEAD = 200
+# Memory used by a git object besides its raw contents.
+_GIT_OBJECT_OVERHEAD = 150
 
-class LRUTreeCache(object):
 
-    def __init__(self, repository):
-        def approx_tree_size(tree):
-            # Very rough estimate, 250 per inventory entry
-            try:
-                inv = tree.root_inventory
-            except AttributeError:
-                inv = tree.inventory
-            return len(inv) * 250
-        self.repository = repository
+def _inventory_entry_size(ie):
+    size = _INVENTORY_ENTRY_OVERHEAD + sys.getsizeof(ie.name)
+    for value in (ie.file_id, ie.revision,
+                  getattr(ie, 'text_sha1', None),
+                  getattr(ie, 'symlink_target', None)):
+        if value is not None:
+            size += sys.getsizeof(value)
+    return size
+
+
+def _revision_tree_size(tree):
+    """Estimate the memory used by a revision tree, in bytes."""
+    try:
+        inv = tree.root_inventory
+    except AttributeError:
+        inv = tree.inventory
+    entries = getattr(inv, '_byid', None)
+    if entries is None:
+        # CHK inventories load their entries lazily; extrapolate from the
+        # entries that have been loaded so far.
+        entries = getattr(inv, '_fileid_to_entry_cache', None)
+        if not entries:
+            entries = {inv.root_id: inv.root}
+        size = sum(_inventory_entry_size(ie) for ie in entries.values())
+        return size * len(inv) // len(entries)
+    return sum(_inventory_entry_size(ie) for ie in entries.values())
+
+
+def _git_object_size(obj):
+    """Return the memory used by a git object, in bytes."""
+    return _GIT_OBJECT_OVERHEAD + obj.raw_length()
+
+
+class SharedCache(object):
+    """A size bounded LRU cache that can be shared between threads.
+
+    Hits and misses are counted, and reported when 'cache' is in
+    debug.debug_flags.
+    """
+
+    def __init__(self, name, max_size, compute_size):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._compute_size = compute_size
+        # Values are stored with their size as computed when they were added,
+        # as the size of lazily loaded values can change later on.
         self._cache = lru_cache.LRUSizeCache(
-            max_size=MAX_TREE_CACHE_SIZE, after_cleanup_size=None,
-            compute_size=approx_tree_size)
+            max_size=max_size, after_cleanup_size=None,
+            compute_size=lambda item: item[1])
+
+    def get(self, key):
+        """Return the value for key, or None if it is not cached."""
+        with self._lock:
+            item = self._cache.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return item[0]
 
-    def revision_tree(self, revid):
+    def add(self, key, value):
+        size = self._compute_size(value)
+        with self._lock:
+            self._cache[key] = (value, size)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def report(self):
+        """Report cache statistics if -Dcache is active."""
+        if 'cache' not in debug.debug_flags:
+            return
+        with self._lock:
+            trace.mutter(
+                '%s: %d hits, %d misses, %d entries using %d of %d bytes',
+                self.name, self.hits, self.misses, len(self._cache),
+                self._cache._value_size, self._cache._max_size)
+
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def _get_shared_cache(name, option_name, compute_size):
+    with _shared_caches_lock:
         try:
-            tree = self._cache[revid]
+            return _shared_caches[name]
         except KeyError:
+            max_size = config.GlobalStack().get(option_name)
+            cache = SharedCache(name, max_size, compute_size)
+            _shared_caches[name] = cache
+            return cache
+
+
+def get_object_cache():
+    """Return the process wide cache of generated git blobs and trees.
+
+    Objects are cached by their hex sha, so the cache is shared between
+    repositories.
+    """
+    return _get_shared_cache(
+        'git object cache', 'git.object_cache_size', _git_object_size)
+
+
+def clear_shared_caches():
+    """Discard the process wide caches, e.g. after changing their limits."""
+    with _shared_caches_lock:
+        _shared_caches.clear()
+
+
+class LRUTreeCache(object):
+    """Cache of revision trees of a repository.
+
+    Trees read through the repository they came from, so they are only
+    cached while it is locked; see clear().
+    """
+
+    def __init__(self, repository, max_size=MAX_TREE_CACHE_SIZE):
+        self.repository = repository
+        self._cache = SharedCache(
+            'git tree cache', max_size, _revision_tree_size)
+
+    def _get(self, revid):
+        return self._cache.get(revid)
+
+    def revision_tree(self, revid):
+        tree = self._get(revid)
+        if tree is None:
             tree = self.repository.revision_tree(revid)
             self.add(tree)
         return tree
@@ -111,9 +234,8 @@ class LRUTreeCache(object):
         trees = {}
         todo = []
         for revid in revids:
-            try:
-                tree = self._cache[revid]
-            except KeyError:
+            tree = self._get(revid)
+            if tree is None:
                 todo.append(revid)
             else:
                 if tree.get_revision_id() != revid:
@@ -130,7 +252,13 @@ class LRUTreeCache(object):
         return list(self.iter_revision_trees(revids))
 
     def add(self, tree):
-        self._cache[tree.get_revision_id()] = tree
+        self._cache.add(tree.get_revision_id(), tree)
+
+    def clear(self):
+        self._cache.clear()
+
+    def report(self):
+        self._cache.report()
 
 
 def _find_missing_bzr_revids(graph, want, have, shallow=None):
@@ -421,7 +549,10 @@ class BazaarObjectStore(BaseObjectStore):
         self.start_write_group = self._cache.idmap.start_write_group
         self.abort_write_group = self._cache.idmap.abort_write_group
         self.commit_write_group = self._cache.idmap.commit_write_group
-        self.tree_cache = LRUTreeCache(self.repository)
+        self.tree_cache = LRUTreeCache(
+            self.repository,
+            config.GlobalStack().get('git.tree_cache_size'))
+        self.object_cache = get_object_cache()
         self.unpeel_map = UnpeelMap.from_repository(self.repository)
 
     def _missing_revisions(self, revisions):
@@ -578,6 +709,7 @@ class BazaarObjectStore(BaseObjectStore):
                 if tree.kind(path) == 'symlink':
                     blob = symlink_to_blob(tree.get_symlink_target(path))
             _check_expected_sha(expected_sha, blob)
+            self.object_cache.add(blob.id, blob)
             yield blob
 
     def _reconstruct_tree(self, fileid, revid, bzr_tree, unusual_modes,
@@ -691,7 +823,11 @@ class BazaarObjectStore(BaseObjectStore):
     def unlock(self):
         self._locked = None
         self._map_updated = False
+        self.tree_cache.report()
+        self.object_cache.report()
         self.repository.unlock()
+        if not self.repository.is_locked():
+            self.tree_cache.clear()
 
     def lookup_git_shas(self, shas):
         ret = {}
@@ -716,6 +852,10 @@ class BazaarObjectStore(BaseObjectStore):
 
     def __getitem__(self, sha):
         for (kind, type_data) in self.lookup_git_sha(sha):
+            if kind in ("blob", "tree"):
+                obj = self.object_cache.get(sha)
+                if obj is not None:
+                    return obj
             # convert object to git object
             if kind == "commit":
                 (revid, tree_sha, verifiers) = type_data
@@ -751,10 +891,13 @@ class BazaarObjectStore(BaseObjectStore):
                     raise KeyError(sha)
                 unusual_modes = extract_unusual_modes(rev)
                 try:
-                    return self._reconstruct_tree(
+                    obj = self._reconstruct_tree(
                         fileid, revid, tree, unusual_modes, expected_sha=sha)
                 except errors.NoSuchRevision:
                     raise KeyError(sha)
+                if obj is not None:
+                    self.object_cache.add(obj.id, obj)
+                return obj
             else:
                 raise AssertionError("Unknown object type '%s'" % kind)
         else:
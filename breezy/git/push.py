@@ -75,11 +75,8 @@ class MissingObjectsIterator(object):
         :param revid: Revision id of the revision
         :param roundtrip: Whether to roundtrip bzr metadata
         """
-        tree = self._object_store.tree_cache.revision_tree(revid)
-        rev = self.source.get_revision(revid)
         commit = None
-        for path, obj in self._object_store._revision_to_objects(
-                rev, tree, lossy):
+        for obj, path in self.iter_revision_objects(revid, lossy):
             if obj.type_name == b"commit":
                 commit = obj
             self._pending.append((obj, path))
@@ -88,6 +85,19 @@ class MissingObjectsIterator(object):
                                  revid)
         return commit.id
 
+    def iter_revision_objects(self, revid, lossy):
+        """Iterate over the git objects for a revision, without keeping them.
+
+        :param revid: Revision id of the revision
+        :param lossy: Whether to not roundtrip bzr metadata
+        :return: Iterator over (object, path) tuples
+        """
+        tree = self._object_store.tree_cache.revision_tree(revid)
+        rev = self.source.get_revision(revid)
+        for path, obj in self._object_store._revision_to_objects(
+                rev, tree, lossy):
+            yield obj, path
+
     def __len__(self):
         return len(self._pending)
 
@@ -17,6 +17,8 @@
 
 """An adapter between a Git Repository and a Bazaar Branch"""
 
+from io import BytesIO
+
 from .. import (
     check,
     errors,
@@ -33,6 +35,12 @@ from ..foreign import (
     ForeignRepository,
     )
 
+from .commitgraph import (
+    COMMIT_GRAPH_NAME,
+    CommitGraph,
+    CommitGraphParentsProvider,
+    write_commit_graph,
+    )
 from .filegraph import (
     GitFileLastChangeScanner,
     GitFileParentProvider,
@@ -232,6 +240,13 @@ class LocalGitRepository(GitRepository):
         self._git = gitdir._git
         self._file_change_scanner = GitFileLastChangeScanner(self)
         self._transaction = None
+        self._commit_graph = None
+
+    @only_raises(errors.LockNotHeld, errors.LockBroken)
+    def unlock(self):
+        super(LocalGitRepository, self).unlock()
+        if not self.is_locked():
+            self._file_change_scanner.flush()
 
     def get_commit_builder(self, branch, parents, config, timestamp=None,
                            timezone=None, committer=None, revprops=None,
@@ -262,6 +277,48 @@ class LocalGitRepository(GitRepository):
         return _mod_graph.Graph(GitFileParentProvider(
             self._file_change_scanner))
 
+    def _get_commit_graph(self):
+        if self._commit_graph is None:
+            transport = getattr(self._git.object_store, 'transport', None)
+            if transport is None:
+                self._commit_graph = False
+            else:
+                self._commit_graph = (
+                    CommitGraph.from_transport(transport) or False)
+        return self._commit_graph or None
+
+    def _make_parents_provider(self):
+        commit_graph = self._get_commit_graph()
+        if commit_graph is None:
+            return self
+        return CommitGraphParentsProvider(self, commit_graph)
+
+    def _write_commit_graph(self):
+        """Write a commit-graph for the commits referenced by refs."""
+        if self._git.get_shallow():
+            # The ancestry of the shallow commits is not available.
+            return
+        store = self._git.object_store
+        heads = set()
+        for sha in self._git.refs.as_dict().values():
+            try:
+                obj = store.peel_sha(sha)
+            except KeyError:
+                continue
+            if isinstance(obj, Commit):
+                heads.add(obj.id)
+        if not heads:
+            return
+        f = BytesIO()
+        write_commit_graph(f, store, heads)
+        f.seek(0)
+        try:
+            store.transport.mkdir('info')
+        except errors.FileExists:
+            pass
+        store.transport.put_file(COMMIT_GRAPH_NAME, f)
+        self._commit_graph = None
+
     def iter_files_bytes(self, desired_files):
         """Iterate through file versions.
 
@@ -419,6 +476,8 @@ class LocalGitRepository(GitRepository):
 
     def pack(self, hint=None, clean_obsolete_packs=False):
         self._git.object_store.pack_loose_objects()
+        if getattr(self._git.object_store, 'transport', None) is not None:
+            self._write_commit_graph()
 
     def lookup_foreign_revision_id(self, foreign_revid, mapping=None):
         """Lookup a revision id.
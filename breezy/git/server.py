@@ -18,10 +18,16 @@
 
 from dulwich.server import TCPGitServer
 
+import os
 import sys
+import tempfile
+import threading
+import time
 
 from .. import (
+    config,
     errors,
+    osutils,
     trace,
     )
 
@@ -29,6 +35,9 @@ from ..controldir import (
     ControlDir,
     )
 
+from .cache import (
+    get_cache_transport,
+    )
 from .mapping import (
     default_mapping,
     decode_git_path,
@@ -41,15 +50,277 @@ from .refs import (
     get_refs_container,
     )
 
-from dulwich.protocol import Protocol
+from dulwich.object_store import DiskObjectStore
+from dulwich.pack import (
+    Pack,
+    SHA1Writer,
+    write_pack_header,
+    write_pack_objects,
+    )
+from dulwich.protocol import (
+    CAPABILITY_NO_DONE,
+    SIDE_BAND_CHANNEL_DATA,
+    TCP_GIT_PORT,
+    Protocol,
+    ProtocolFile,
+    )
 from dulwich.server import (
+    DEFAULT_HANDLERS,
     Backend,
     BackendRepo,
     ReceivePackHandler,
     UploadPackHandler,
+    _ProtocolGraphWalker,
     )
 
 
+SERVE_CACHE_DIR = 'serve-cache'
+
+# Number of recent clones to consider as base for a new clone pack.
+_MAX_BASE_CANDIDATES = 10
+
+# Number of seconds for which packs that are not used by any clone are kept,
+# as another process may be about to record a clone that uses them.
+_PRUNE_GRACE_PERIOD = 3600
+
+_serve_cache_locks = {}
+_serve_cache_locks_lock = threading.Lock()
+
+
+class ClonePack(object):
+    """A pack to send for a clone, made up of one or more cached packs.
+
+    The objects in the cached packs are sent as a single pack, without
+    decompressing them.
+    """
+
+    _chunk_size = 64 * 1024
+
+    def __init__(self, packs):
+        self.packs = packs
+
+    def __len__(self):
+        return sum(len(pack) for pack in self.packs)
+
+    def __iter__(self):
+        for pack in self.packs:
+            for obj in pack.iterobjects():
+                yield obj, None
+
+    def write_pack(self, f):
+        """Write the combined pack to a file."""
+        f = SHA1Writer(f)
+        write_pack_header(f, len(self))
+        for pack in self.packs:
+            with open(pack._data_path, 'rb') as pf:
+                # Skip the 12 byte header and 20 byte trailer of each pack.
+                remaining = os.fstat(pf.fileno()).st_size - 32
+                pf.seek(12)
+                while remaining > 0:
+                    chunk = pf.read(min(remaining, self._chunk_size))
+                    if not chunk:
+                        raise errors.BzrError(
+                            'pack %s is truncated' % pack._data_path)
+                    f.write(chunk)
+                    remaining -= len(chunk)
+        f.write_sha()
+
+
+class CachedPackTupleIterable(object):
+    """Objects to send to a client, read from a cache where possible.
+
+    :param contents: The objects to send, as returned by
+        BazaarObjectStore.generate_pack_contents
+    :param cache: A GitServeCache
+    """
+
+    def __init__(self, contents, cache):
+        self.contents = contents
+        self.cache = cache
+
+    def __len__(self):
+        return len(self.contents)
+
+    def __iter__(self):
+        for sha, path in self.contents.objects.items():
+            try:
+                obj = self.cache.store[sha]
+            except KeyError:
+                obj = self.contents.store[sha]
+            yield obj, path
+
+
+class GitServeCache(object):
+    """Cache of the packs sent to Git clients for a Bazaar repository.
+
+    Generated objects are stored in ordinary Git packs, and are looked up
+    by their SHA1. A clone of a set of ref tips is recorded as the list of
+    packs that contain all objects for it; clones of later revisions only
+    add a pack with the objects that were added since a previous clone.
+
+    The least recently used clones are removed once the packs take up more
+    than the configured amount of disk space.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        objects_path = os.path.join(path, 'objects')
+        if not os.path.isdir(objects_path):
+            os.makedirs(path, exist_ok=True)
+            try:
+                DiskObjectStore.init(objects_path)
+            except FileExistsError:
+                pass
+        self.store = DiskObjectStore(objects_path)
+        self._clones_path = os.path.join(path, 'clones')
+        os.makedirs(self._clones_path, exist_ok=True)
+
+    @classmethod
+    def from_repository(cls, repository):
+        """Open the serve cache for a repository.
+
+        :return: A GitServeCache, or None if caching is disabled or not
+            possible
+        """
+        max_size = config.GlobalStack().get('git.serve_cache_size')
+        if not max_size:
+            return None
+        try:
+            transport = get_cache_transport(repository)
+            return cls(transport.local_abspath(SERVE_CACHE_DIR), max_size)
+        except (errors.NotLocalUrl, OSError) as e:
+            trace.mutter('not caching git packs for %r: %s', repository, e)
+            return None
+
+    def lock(self):
+        """Return a lock that serializes generation of packs in a process."""
+        with _serve_cache_locks_lock:
+            return _serve_cache_locks.setdefault(self.path, threading.Lock())
+
+    def _clone_key(self, wants):
+        return osutils.sha_string(b' '.join(sorted(set(wants)))).decode(
+            'ascii')
+
+    def _open_packs(self, names):
+        packs = []
+        for name in names:
+            basename = os.path.join(self.store.pack_dir, name.decode('ascii'))
+            if not os.path.exists(basename + '.pack'):
+                return None
+            packs.append(Pack(basename))
+        return packs
+
+    def _read_clone(self, key):
+        try:
+            with open(os.path.join(self._clones_path, key), 'rb') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None
+        return lines[0].split(), lines[1].split()
+
+    def iter_clones(self):
+        """Iterate over the recorded clones, most recently used first.
+
+        :return: Iterator over (key, wants, pack names) tuples
+        """
+        entries = []
+        for key in os.listdir(self._clones_path):
+            try:
+                mtime = os.stat(os.path.join(self._clones_path, key)).st_mtime
+            except FileNotFoundError:
+                continue
+            entries.append((mtime, key))
+        entries.sort(reverse=True)
+        for mtime, key in entries:
+            clone = self._read_clone(key)
+            if clone is not None:
+                yield (key, ) + clone
+
+    def get_clone_pack(self, wants):
+        """Find the pack for a clone of a set of commits.
+
+        :param wants: SHA1s of the commits to clone
+        :return: A ClonePack, or None if the clone was not cached
+        """
+        key = self._clone_key(wants)
+        clone = self._read_clone(key)
+        if clone is None:
+            return None
+        packs = self._open_packs(clone[1])
+        if packs is None:
+            return None
+        try:
+            os.utime(os.path.join(self._clones_path, key))
+        except OSError:
+            pass
+        return ClonePack(packs)
+
+    def add_clone_pack(self, wants, base_names, objects):
+        """Record the pack for a clone.
+
+        :param wants: SHA1s of the commits cloned
+        :param base_names: Names of the cached packs with the objects for an
+            earlier clone
+        :param objects: The objects that are not in those packs, as
+            (object, path) tuples
+        :return: A ClonePack, or None if the clone was pruned by another
+            process before it could be opened
+        """
+        f, commit, abort = self.store.add_pack()
+        try:
+            write_pack_objects(f, objects)
+        except BaseException:
+            abort()
+            raise
+        pack = commit()
+        names = list(base_names) + [
+            os.path.basename(pack._basename).encode('ascii')]
+        fd, tmp_path = tempfile.mkstemp(dir=self._clones_path, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b' '.join(sorted(set(wants))) + b'\n')
+            f.write(b' '.join(names) + b'\n')
+        os.replace(tmp_path, os.path.join(
+            self._clones_path, self._clone_key(wants)))
+        self.prune()
+        return self.get_clone_pack(wants)
+
+    def prune(self):
+        """Remove the least recently used clones and unused packs."""
+        keep = set()
+        size = 0
+        for i, (key, wants, names) in enumerate(self.iter_clones()):
+            new = [name for name in names if name not in keep]
+            try:
+                new_size = sum(
+                    os.path.getsize(os.path.join(
+                        self.store.pack_dir, name.decode('ascii') + '.pack'))
+                    for name in new)
+            except FileNotFoundError:
+                new_size = None
+            if new_size is None or (i > 0 and size + new_size > self.max_size):
+                try:
+                    os.unlink(os.path.join(self._clones_path, key))
+                except FileNotFoundError:
+                    pass
+                continue
+            keep.update(new)
+            size += new_size
+        cutoff = time.time() - _PRUNE_GRACE_PERIOD
+        for filename in os.listdir(self.store.pack_dir):
+            name, ext = os.path.splitext(filename)
+            if (not name.startswith('pack-') or ext not in ('.pack', '.idx') or
+                    name.encode('ascii') in keep):
+                continue
+            path = os.path.join(self.store.pack_dir, filename)
+            try:
+                if os.stat(path).st_mtime > cutoff:
+                    continue
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
 class BzrBackend(Backend):
     """A git serve backend that can use a Bazaar repository."""
 
@@ -93,9 +364,16 @@ class BzrBackendRepo(BackendRepo):
                 return
             shallows = getattr(graph_walker, 'shallow', frozenset())
             if isinstance(self.object_store, BazaarObjectStore):
-                return self.object_store.generate_pack_contents(
+                cache = GitServeCache.from_repository(self.repo)
+                if cache is not None and not have and not shallows:
+                    return self._fetch_clone(
+                        cache, wants, progress, get_tagged)
+                contents = self.object_store.generate_pack_contents(
                     have, wants, shallow=shallows,
                     progress=progress, get_tagged=get_tagged, lossy=True)
+                if cache is not None:
+                    return CachedPackTupleIterable(contents, cache)
+                return contents
             else:
                 if shallows:
                     return self.object_store.generate_pack_contents(
@@ -105,8 +383,134 @@ class BzrBackendRepo(BackendRepo):
                         have, wants, progress=progress)
 
 
+    def _lookup_revids(self, shas):
+        """Look up the revision ids for commit SHA1s.
+
+        :return: Set of revision ids, or None if some were not found
+        """
+        ret = set()
+        for sha, entries in self.object_store.lookup_git_shas(shas).items():
+            revids = [type_data[0] for (kind, type_data) in entries
+                      if kind == "commit"]
+            if not revids:
+                return None
+            ret.update(revids)
+        if len(ret) < len(set(shas)):
+            return None
+        return ret
+
+    def _find_base_clone(self, cache, wants):
+        """Find a cached clone of ancestors of wants.
+
+        :return: Tuple with the SHA1s cloned and the names of the packs with
+            their objects
+        """
+        revids = self._lookup_revids(wants)
+        if revids is None:
+            return [], []
+        graph = self.repo.get_graph()
+        for i, (key, base_wants, names) in enumerate(cache.iter_clones()):
+            if i >= _MAX_BASE_CANDIDATES:
+                break
+            base_revids = self._lookup_revids(base_wants)
+            if base_revids is None:
+                continue
+            if graph.heads(base_revids | revids).issubset(revids):
+                return base_wants, names
+        return [], []
+
+    def _fetch_clone(self, cache, wants, progress, get_tagged):
+        """Return the pack for a clone, generating and caching it if needed.
+        """
+        with cache.lock():
+            pack = cache.get_clone_pack(wants)
+            if pack is not None:
+                trace.mutter('serving cached pack for clone of %d refs',
+                             len(wants))
+                return pack
+            base_wants, base_names = self._find_base_clone(cache, wants)
+            base_packs = cache._open_packs(base_names)
+            if base_packs is None:
+                # A pack of the base clone has been pruned since; send a
+                # full clone instead.
+                base_wants = base_names = []
+                base_packs = []
+            contents = self.object_store.generate_pack_contents(
+                list(base_wants), wants, progress=progress,
+                get_tagged=get_tagged, lossy=True)
+            # Objects that reappear in newer revisions are already in the
+            # base packs.
+            for sha in list(contents.objects):
+                if any(sha in pack for pack in base_packs):
+                    del contents.objects[sha]
+            pack = cache.add_clone_pack(
+                wants, base_names, CachedPackTupleIterable(contents, cache))
+            if pack is not None:
+                return pack
+        trace.mutter('clone pack was pruned by another process; '
+                     'generating it again')
+        return self.object_store.generate_pack_contents(
+            [], wants, progress=progress, get_tagged=get_tagged, lossy=True)
+
+
+class BzrUploadPackHandler(UploadPackHandler):
+    """Upload pack handler that sends cached packs without unpacking them.
+    """
+
+    def handle(self):
+        # This is UploadPackHandler.handle, except for writing the pack.
+        def write(x):
+            return self.proto.write_sideband(SIDE_BAND_CHANNEL_DATA, x)
+
+        graph_walker = _ProtocolGraphWalker(
+            self, self.repo.object_store, self.repo.get_peeled,
+            self.repo.refs.get_symrefs)
+        wants = []
+
+        def wants_wrapper(refs):
+            wants.extend(graph_walker.determine_wants(refs))
+            return wants
+
+        objects_iter = self.repo.fetch_objects(
+            wants_wrapper, graph_walker, self.progress,
+            get_tagged=self.get_tagged)
+
+        self._processing_have_lines = True
+        if len(wants) == 0:
+            return
+        self._processing_have_lines = False
+
+        if not graph_walker.handle_done(
+                not self.has_capability(CAPABILITY_NO_DONE),
+                self._done_received):
+            return
+
+        self.progress(
+            ("counting objects: %d, done.\n" % len(objects_iter)).encode(
+                'ascii'))
+        f = ProtocolFile(None, write)
+        write_pack = getattr(objects_iter, 'write_pack', None)
+        if write_pack is not None:
+            write_pack(f)
+        else:
+            write_pack_objects(f, objects_iter)
+        self.proto.write_pkt_line(None)
+
+
+BZR_HANDLERS = dict(DEFAULT_HANDLERS)
+BZR_HANDLERS[b'git-upload-pack'] = BzrUploadPackHandler
+
+
 class BzrTCPGitServer(TCPGitServer):
 
+    def __init__(self, backend, listen_addr, port=TCP_GIT_PORT,
+                 handlers=None):
+        all_handlers = dict(BZR_HANDLERS)
+        if handlers is not None:
+            all_handlers.update(handlers)
+        TCPGitServer.__init__(
+            self, backend, listen_addr, port, handlers=all_handlers)
+
     def handle_error(self, request, client_address):
         trace.log_exception_quietly()
         trace.warning('Exception happened during processing of request '
@@ -126,7 +530,7 @@ def serve_git(transport, host=None, port=None, inet=False, timeout=None):
 
 
 def git_http_hook(branch, method, path):
-    from dulwich.web import HTTPGitApplication, HTTPGitRequest, DEFAULT_HANDLERS
+    from dulwich.web import HTTPGitApplication, HTTPGitRequest
     handler = None
     for (smethod, spath) in HTTPGitApplication.services:
         if smethod != method:
@@ -141,7 +545,7 @@ def git_http_hook(branch, method, path):
 
     def git_call(environ, start_response):
         req = HTTPGitRequest(environ, start_response, dumb=False,
-                             handlers=DEFAULT_HANDLERS)
+                             handlers=BZR_HANDLERS)
         return handler(req, backend, mat)
     return git_call
 
@@ -181,4 +585,4 @@ def serve_git_upload_pack(transport, host=None, port=None, inet=False):
         raise errors.CommandError(
             "git-receive-pack only works in inetd mode")
     backend = BzrBackend(transport)
-    sys.exit(serve_command(UploadPackHandler, backend=backend))
+    sys.exit(serve_command(BzrUploadPackHandler, backend=backend))
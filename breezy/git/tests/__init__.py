@@ -213,9 +213,12 @@ def load_tests(loader, basic_tests, pattern):
         'test_builder',
         'test_branch',
         'test_cache',
+        'test_commitgraph',
         'test_dir',
         'test_fetch',
+        'test_filegraph',
         'test_git_remote_helper',
+        'test_index',
         'test_mapping',
         'test_memorytree',
         'test_object_store',
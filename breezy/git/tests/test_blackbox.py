@@ -23,6 +23,9 @@ from dulwich.repo import (
 
 import os
 
+from ... import urlutils
+from ...branch import Branch
+from ...repository import Repository
 from ...controldir import (
     ControlDir,
     )
@@ -33,6 +36,8 @@ from ...workingtree import WorkingTree
 from .. import (
     tests,
     )
+from ..mapping import default_mapping
+from ..unpeel_map import UnpeelMap
 from ...tests.script import TestCaseWithTransportAndScript
 from ...tests.features import PluginLoadedFeature
 
@@ -389,6 +394,61 @@ class TestGitBlackBox(ExternalBase):
         self.assertEqual(["atag"],
                          list(b.open_branch("abranch").tags.get_tag_dict().keys()))
 
+    def test_git_import_annotated_tags(self):
+        from dulwich.objects import Commit, Tag
+        r = GitRepo.init("a", mkdir=True)
+        self.build_tree(["a/file"])
+        r.stage("file")
+        cid = r.do_commit(ref=b"refs/heads/abranch",
+                          committer=b"Joe <joe@example.com>", message=b"Dummy")
+        r.do_commit(ref=b"refs/heads/bbranch",
+                    committer=b"Joe <joe@example.com>", message=b"Dummy")
+        tag = Tag()
+        tag.name = b"atag"
+        tag.tagger = b"Joe <joe@example.com>"
+        tag.message = b"A tag"
+        tag.tag_time = 0
+        tag.tag_timezone = 0
+        tag.object = (Commit, cid)
+        r.object_store.add_object(tag)
+        r[b"refs/tags/atag"] = tag.id
+        self.run_bzr(["git-import", "--jobs=2", "a", "b"])
+        revid = default_mapping.revision_id_foreign_to_bzr(cid)
+        for name in ["abranch", "bbranch"]:
+            branch = Branch.open(os.path.join("b", name))
+            self.assertEqual({"atag": revid}, branch.tags.get_tag_dict())
+        unpeel_map = UnpeelMap.from_repository(Repository.open("b"))
+        self.assertIsNot(None, unpeel_map.peel_tag(tag.id))
+
+    def test_git_import_revnos(self):
+        r = GitRepo.init("a", mkdir=True)
+        self.build_tree(["a/file"])
+        r.stage("file")
+        base = r.do_commit(ref=b"refs/heads/abranch",
+                           committer=b"Joe <joe@example.com>",
+                           message=b"Dummy")
+        r.do_commit(ref=b"refs/heads/abranch",
+                    committer=b"Joe <joe@example.com>", message=b"Dummy")
+        r[b"refs/heads/bbranch"] = base
+        r.do_commit(ref=b"refs/heads/bbranch",
+                    committer=b"Joe <joe@example.com>", message=b"Dummy")
+        r.do_commit(ref=b"refs/heads/bbranch",
+                    committer=b"Joe <joe@example.com>", message=b"Dummy")
+        r[b"refs/tags/atag"] = base
+        self.run_bzr(["git-import", "--jobs=2", "a", "b"])
+        for name, revno in [("abranch", 2), ("bbranch", 3)]:
+            branch = Branch.open(os.path.join("b", name))
+            sha = r.refs[b"refs/heads/" + name.encode("ascii")]
+            self.assertEqual(
+                (revno, default_mapping.revision_id_foreign_to_bzr(sha)),
+                branch.last_revision_info())
+            self.assertEqual(["atag"], list(branch.tags.get_tag_dict()))
+            self.assertEqual(
+                urlutils.join_segment_parameters(
+                    urlutils.local_path_to_url("a") + "/",
+                    {"branch": name}),
+                branch.get_parent())
+
     def test_git_import_colo(self):
         r = GitRepo.init("a", mkdir=True)
         self.build_tree(["a/file"])
@@ -21,6 +21,9 @@ from dulwich.objects import (
     Commit,
     Tree,
     )
+from dulwich.object_store import (
+    MemoryObjectStore,
+    )
 
 import os
 import stat
@@ -32,13 +35,18 @@ from ...revision import (
 from ...tests import (
     TestCase,
     TestCaseInTempDir,
+    TestCaseWithMemoryTransport,
     UnavailableFeature,
     )
 from ...transport import (
     get_transport,
     )
 
+from .. import (
+    cache,
+    )
 from ..cache import (
+    ChangedPathIndex,
     DictBzrGitCache,
     IndexBzrGitCache,
     IndexGitCacheFormat,
@@ -152,6 +160,75 @@ class SqliteGitShaMapTests(TestCaseInTempDir, TestGitShaMap):
         self.cache = SqliteBzrGitCache(os.path.join(self.test_dir, 'foo.db'))
         self.map = self.cache.idmap
 
+    def add_commit(self, revid):
+        updater = self.cache.get_updater(Revision(revid))
+        c = self._get_test_commit()
+        c.message = revid
+        updater.add_object(c, {"testament3-sha1": b"testament"}, None)
+        b = Blob.from_string(revid)
+        updater.add_object(b, (b"fileid", revid), None)
+        updater.finish()
+        return c, b
+
+    def test_write_group_inserts_in_bulk(self):
+        self.map.start_write_group()
+        self.add_commit(b"rev1")
+        self.add_commit(b"rev2")
+        self.assertEqual(2, len(self.map._pending[2]))
+        self.assertEqual(
+            [], self.map.db.execute("select sha1 from commits").fetchall())
+        self.map.commit_write_group()
+        self.assertEqual(set([b"rev1", b"rev2"]), set(self.map.revids()))
+
+    def test_lookup_in_write_group(self):
+        self.map.start_write_group()
+        c, b = self.add_commit(b"rev1")
+        self.assertEqual(c.id, self.map.lookup_commit(b"rev1"))
+        self.assertEqual(b.id, self.map.lookup_blob_id(b"fileid", b"rev1"))
+        self.assertEqual([("blob", (b"fileid", b"rev1"))],
+                         list(self.map.lookup_git_sha(b.id)))
+        self.map.commit_write_group()
+
+    def test_abort_write_group(self):
+        self.map.start_write_group()
+        c, b = self.add_commit(b"rev1")
+        self.map.lookup_commit(b"rev1")
+        self.map.abort_write_group()
+        self.assertRaises(KeyError, self.map.lookup_commit, b"rev1")
+        self.assertEqual([], list(self.map.revids()))
+
+    def test_wal(self):
+        self.assertEqual(
+            "wal", self.map.db.execute("pragma journal_mode").fetchone()[0])
+
+    def test_upgrade_indices(self):
+        import sqlite3
+        db = sqlite3.connect('old.db')
+        db.executescript("""
+        create table commits(sha1 text, revid text, tree_sha text);
+        create index commit_sha1 on commits(sha1);
+        create table blobs(sha1 text, fileid text, revid text);
+        create index blobs_sha1 on blobs(sha1);
+        """)
+        db.close()
+        idmap = SqliteBzrGitCache(os.path.join(self.test_dir, 'old.db')).idmap
+        self.assertEqual(
+            set(['blobs_fileid_revid', 'blobs_sha1_covering', 'commit_revid',
+                 'commits_sha1_covering', 'trees_fileid_revid',
+                 'trees_sha1']),
+            set(name for (name,) in idmap.db.execute(
+                "select name from sqlite_master where type = 'index' "
+                "and name not like 'sqlite_%'")))
+
+    def test_covering_indices(self):
+        for table, columns in [
+                ("commits", "revid, tree_sha, testament3_sha1"),
+                ("blobs", "fileid, revid")]:
+            plan = self.map.db.execute(
+                "explain query plan select %s from %s where sha1 = ?" % (
+                    columns, table), (b"a" * 40,)).fetchall()
+            self.assertContainsRe(plan[0][-1], "COVERING INDEX")
+
 
 class TdbGitShaMapTests(TestCaseInTempDir, TestGitShaMap):
 
@@ -172,3 +249,103 @@ class IndexGitShaMapTests(TestCaseInTempDir, TestGitShaMap):
         IndexGitCacheFormat().initialize(transport)
         self.cache = IndexBzrGitCache(transport)
         self.map = self.cache.idmap
+
+
+class TestChangedPaths(TestCase):
+
+    def setUp(self):
+        super(TestChangedPaths, self).setUp()
+        self.store = MemoryObjectStore()
+
+    def make_tree(self, entries):
+        tree = Tree()
+        for name, value in entries.items():
+            if isinstance(value, dict):
+                tree.add(name, stat.S_IFDIR, self.make_tree(value))
+            else:
+                blob = Blob.from_string(value)
+                self.store.add_object(blob)
+                tree.add(name, stat.S_IFREG | 0o644, blob.id)
+        self.store.add_object(tree)
+        return tree.id
+
+    def make_commit(self, entries, parents):
+        commit = Commit()
+        commit.committer = commit.author = b"Joe <joe@example.com>"
+        commit.commit_time = commit.author_time = 0
+        commit.commit_timezone = commit.author_timezone = 0
+        commit.message = b"message"
+        commit.tree = self.make_tree(entries)
+        commit.parents = [parent.id for parent in parents]
+        self.store.add_object(commit)
+        return commit
+
+    def test_changed_paths(self):
+        base = self.make_commit(
+            {b'a': b'a', b'dir': {b'b': b'b', b'c': b'c'}, b'd': b'd'}, [])
+        commit = self.make_commit(
+            {b'a': b'a', b'dir': {b'b': b'b', b'c': b'new'},
+             b'e': {b'f': b'f'}}, [base])
+        self.assertEqual({b'dir', b'dir/c', b'd', b'e', b'e/f'},
+                         cache.changed_paths(self.store, commit))
+
+    def test_merge(self):
+        base = self.make_commit({b'a': b'a', b'b': b'b'}, [])
+        other = self.make_commit({b'a': b'a', b'b': b'other'}, [base])
+        merge = self.make_commit({b'a': b'new', b'b': b'other'},
+                                 [base, other])
+        self.assertEqual({b'a', b'b'}, cache.changed_paths(self.store, merge))
+
+    def test_too_many(self):
+        self.overrideAttr(cache, '_MAX_CHANGED_PATHS', 2)
+        base = self.make_commit({b'a': b'a'}, [])
+        commit = self.make_commit(
+            {b'a': b'a', b'b': b'b', b'c': b'c', b'd': b'd'}, [base])
+        self.assertIs(None, cache.changed_paths(self.store, commit))
+
+
+class TestChangedPathIndex(TestCaseWithMemoryTransport):
+
+    def make_index(self):
+        return ChangedPathIndex(self.get_transport().clone('index'))
+
+    def test_unknown(self):
+        self.assertIs(None, self.make_index().may_have_changed(
+            b'a' * 40, b'foo'))
+
+    def test_add_and_flush(self):
+        index = self.make_index()
+        index.add(b'a' * 40, {b'dir', b'dir/foo'})
+        index.add(b'b' * 40, set())
+        index.add(b'c' * 40, None)
+        self.assertTrue(index.may_have_changed(b'a' * 40, b'dir/foo'))
+        index.flush()
+        index = self.make_index()
+        self.assertTrue(index.may_have_changed(b'a' * 40, b'dir/foo'))
+        self.assertTrue(index.may_have_changed(b'a' * 40, b'dir'))
+        self.assertFalse(index.may_have_changed(b'a' * 40, b'bar'))
+        self.assertFalse(index.may_have_changed(b'b' * 40, b'dir/foo'))
+        self.assertTrue(index.may_have_changed(b'c' * 40, b'bar'))
+        self.assertIs(None, index.may_have_changed(b'd' * 40, b'bar'))
+
+    def test_layers_combined(self):
+        self.overrideAttr(cache, '_MAX_CHANGED_PATH_LAYERS', 2)
+        index = self.make_index()
+        for c in (b'a', b'b', b'c'):
+            index.add(c * 40, {c})
+            index.flush()
+        self.assertEqual(1, len(self.get_transport('index').list_dir('.')))
+        index = self.make_index()
+        for c in (b'a', b'b', b'c'):
+            self.assertTrue(index.may_have_changed(c * 40, c))
+            self.assertFalse(index.may_have_changed(c * 40, b'x'))
+
+    def test_corrupt_layer_ignored(self):
+        index = self.make_index()
+        index.add(b'a' * 40, {b'foo'})
+        index.flush()
+        t = self.get_transport('index')
+        for name in t.list_dir('.'):
+            t.put_bytes(name, t.get_bytes(name)[:-1])
+        self.assertIs(None, self.make_index().may_have_changed(
+            b'a' * 40, b'foo'))
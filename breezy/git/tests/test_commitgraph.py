@@ -0,0 +1,143 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for commit-graph support."""
+
+from io import BytesIO
+
+from dulwich.objects import (
+    Commit,
+    Tree,
+    )
+from dulwich.object_store import (
+    MemoryObjectStore,
+    )
+from dulwich.repo import Repo as GitRepo
+
+from ...repository import Repository
+from ...tests import (
+    TestCase,
+    TestCaseWithMemoryTransport,
+    TestCaseWithTransport,
+    )
+
+from .. import commitgraph
+from ..mapping import default_mapping
+
+
+def make_commit(store, parents, commit_time=0):
+    tree = Tree()
+    store.add_object(tree)
+    commit = Commit()
+    commit.committer = commit.author = b"Joe <joe@example.com>"
+    commit.commit_time = commit.author_time = commit_time
+    commit.commit_timezone = commit.author_timezone = 0
+    commit.message = b"message %d" % len(list(store))
+    commit.tree = tree.id
+    commit.parents = parents
+    store.add_object(commit)
+    return commit.id
+
+
+class TestCommitGraph(TestCaseWithMemoryTransport):
+
+    def setUp(self):
+        super(TestCommitGraph, self).setUp()
+        self.store = MemoryObjectStore()
+        self.transport = self.get_transport()
+
+    def write(self, heads):
+        f = BytesIO()
+        count = commitgraph.write_commit_graph(f, self.store, heads)
+        self.transport.mkdir('info')
+        self.transport.put_bytes(commitgraph.COMMIT_GRAPH_NAME, f.getvalue())
+        return count
+
+    def test_missing(self):
+        self.assertIs(
+            None, commitgraph.CommitGraph.from_transport(self.transport))
+
+    def test_write_and_read(self):
+        root = make_commit(self.store, [])
+        a = make_commit(self.store, [root])
+        b = make_commit(self.store, [root])
+        c = make_commit(self.store, [a])
+        merge = make_commit(self.store, [c, b])
+        octopus = make_commit(self.store, [merge, a, b], 1234567890)
+        unrelated = make_commit(self.store, [])
+        self.assertEqual(6, self.write([octopus]))
+        graph = commitgraph.CommitGraph.from_transport(self.transport)
+        self.assertEqual(6, len(graph))
+        self.assertEqual(
+            [1, 2, 2, 3, 4, 5],
+            [graph.get_generation(c)
+             for c in (root, a, b, c, merge, octopus)])
+        self.assertEqual([], graph.get_parents(root))
+        self.assertEqual([c, b], graph.get_parents(merge))
+        self.assertEqual([merge, a, b], graph.get_parents(octopus))
+        self.assertIs(None, graph.get_generation(unrelated))
+        self.assertIs(None, graph.get_parents(unrelated))
+
+    def test_corrupt(self):
+        self.write([make_commit(self.store, [])])
+        self.transport.put_bytes(commitgraph.COMMIT_GRAPH_NAME, b'CGPH\1\1')
+        self.assertIs(
+            None, commitgraph.CommitGraph.from_transport(self.transport))
+
+
+class TestCommitGraphParentsProvider(TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestCommitGraphParentsProvider, self).setUp()
+        self.git_repo = GitRepo.init('.')
+
+    def commit(self, merge_heads=None):
+        return self.git_repo.do_commit(
+            b'message', committer=b'Joe <joe@example.com>',
+            merge_heads=merge_heads)
+
+    def revid(self, commit_id):
+        return default_mapping.revision_id_foreign_to_bzr(commit_id)
+
+    def test_no_commit_graph(self):
+        self.commit()
+        repo = Repository.open('.')
+        self.assertIs(repo, repo._make_parents_provider())
+
+    def test_pack_writes_commit_graph(self):
+        c1 = self.commit()
+        c2 = self.commit()
+        repo = Repository.open('.')
+        repo.pack()
+        self.assertTrue(self.get_transport('.git/objects').has(
+            commitgraph.COMMIT_GRAPH_NAME))
+        c3 = self.commit()
+        repo = Repository.open('.')
+        provider = repo._make_parents_provider()
+        self.assertIsInstance(
+            provider, commitgraph.CommitGraphParentsProvider)
+        # Generation numbers are computed for commits that are newer than
+        # the commit-graph.
+        self.assertEqual(
+            {self.revid(c1): 1, self.revid(c2): 2, self.revid(c3): 3,
+             b'null:': 0},
+            provider.get_generation_map(
+                [self.revid(c) for c in (c1, c2, c3)] +
+                [b'null:', b'unknown-revid']))
+        graph = repo.get_graph()
+        self.assertEqual({self.revid(c3)},
+                         graph.heads([self.revid(c1), self.revid(c3)]))
+        self.assertTrue(graph.is_ancestor(self.revid(c2), self.revid(c3)))
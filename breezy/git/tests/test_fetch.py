@@ -31,6 +31,7 @@ import stat
 import time
 
 from ... import (
+    config,
     osutils,
     )
 from ...bzr import (
@@ -54,6 +55,8 @@ from ...tests import (
     )
 
 from ..fetch import (
+    _iter_read_ahead,
+    _read_import_objects,
     import_git_blob,
     import_git_tree,
     import_git_submodule,
@@ -504,3 +507,82 @@ class ImportObjects(TestCaseWithTransport):
                                       self._mapping.generate_file_id("foo")))
         ie = ret[1][3]
         self.assertEqual(ie.kind, "tree-reference")
+
+
+class ReadAheadTests(TestCaseWithTransport):
+
+    def make_git_history(self):
+        repo = GitRepo.init('git', mkdir=True)
+        self.build_tree_contents([
+            ('git/a', b'a\n'), ('git/dir/',), ('git/dir/b', b'b\n'),
+            ('git/dir/sub/',), ('git/dir/sub/c', b'c\n')])
+        repo.stage(['a', 'dir/b', 'dir/sub/c'])
+        c1 = repo.do_commit(b'one', committer=b'Somebody <s@example.com>')
+        self.build_tree_contents([('git/dir/sub/c', b'changed\n')])
+        os.unlink('git/a')
+        repo.stage(['a', 'dir/sub/c'])
+        c2 = repo.do_commit(b'two', committer=b'Somebody <s@example.com>')
+        return repo, c1, c2
+
+    def test_read_import_objects(self):
+        repo, c1, c2 = self.make_git_history()
+        store = repo.object_store
+        objects = {}
+        _read_import_objects(store.__getitem__, c2, objects)
+        commit = store[c2]
+        base_tree = store[store[c1].tree]
+        tree = store[commit.tree]
+        dir_id = tree[b'dir'][1]
+        sub_id = store[dir_id][b'sub'][1]
+        base_dir_id = base_tree[b'dir'][1]
+        base_sub_id = store[base_dir_id][b'sub'][1]
+        # The unchanged dir/b and the removed a are not read.
+        self.assertEqual(
+            set([c2, c1, commit.tree, base_tree.id, dir_id, base_dir_id,
+                 sub_id, base_sub_id, store[sub_id][b'c'][1]]),
+            set(objects))
+
+    def test_read_import_objects_missing(self):
+        objects = {}
+        _read_import_objects({}.__getitem__, b'a' * 40, objects)
+        self.assertEqual({}, objects)
+
+    def test_iter_read_ahead(self):
+        repo, c1, c2 = self.make_git_history()
+        results = list(_iter_read_ahead(
+            repo.object_store.__getitem__, [c1, c2, b'a' * 40], 1))
+        self.assertEqual(3, len(results))
+        self.assertIn(c1, results[0])
+        self.assertIn(c2, results[1])
+        self.assertEqual({}, results[2])
+
+    def test_iter_read_ahead_closed(self):
+        repo, c1, c2 = self.make_git_history()
+        read_ahead = _iter_read_ahead(
+            repo.object_store.__getitem__, [c1, c2] * 10, 1)
+        self.assertIn(c1, next(read_ahead))
+        # Closing stops the thread that is waiting to hand over results.
+        read_ahead.close()
+
+    def fetch(self, path, read_ahead):
+        config.GlobalStack().set('git.import_read_ahead', read_ahead)
+        target = self.make_repository(path)
+        source = Repository.open('git')
+        target.fetch(source)
+        return source, target
+
+    def test_fetch(self):
+        self.make_git_history()
+        source, target = self.fetch('without', '0')
+        source, read_ahead_target = self.fetch('with', '4')
+        revids = target.all_revision_ids()
+        self.assertEqual(2, len(revids))
+        self.assertEqual(set(revids),
+                         set(read_ahead_target.all_revision_ids()))
+        for revid in revids:
+            self.assertEqual(
+                target.get_inventory(revid),
+                read_ahead_target.get_inventory(revid))
+        with target.lock_read(), read_ahead_target.lock_read():
+            self.assertEqual(target.texts.keys(),
+                             read_ahead_target.texts.keys())
@@ -0,0 +1,105 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for file graph access."""
+
+from dulwich.repo import Repo as GitRepo
+
+from ...repository import Repository
+from ...tests import TestCaseWithTransport
+
+from .. import (
+    cache,
+    filegraph,
+    )
+
+
+class GitFileLastChangeScannerTests(TestCaseWithTransport):
+
+    def setUp(self):
+        super(GitFileLastChangeScannerTests, self).setUp()
+        self.git_repo = GitRepo.init('.')
+        self.commits = []
+
+    def commit(self, contents, merge=None):
+        self.build_tree_contents(contents)
+        self.git_repo.stage([path for path, _ in contents])
+        commit_id = self.git_repo.do_commit(
+            b'message', committer=b'Joe <joe@example.com>',
+            merge_heads=[merge] if merge is not None else None)
+        self.commits.append(commit_id)
+        return commit_id
+
+    def find(self, path, commit_id):
+        repo = Repository.open('.')
+        return repo._file_change_scanner.find_last_change_revision(
+            path, commit_id)
+
+    def test_find_last_change_revision(self):
+        c1 = self.commit([('a', b'a'), ('b', b'b')])
+        c2 = self.commit([('b', b'b2')])
+        for i in range(5):
+            self.commit([('c', b'c%d' % i)])
+        tip = self.commits[-1]
+        self.assertEqual((b'a', c1), self.find(b'a', tip))
+        self.assertEqual((b'b', c2), self.find(b'b', tip))
+        self.assertEqual((b'c', tip), self.find(b'c', tip))
+        self.assertEqual((b'', c1), self.find(b'', tip))
+
+    def test_uses_index(self):
+        c1 = self.commit([('a', b'a'), ('b', b'b')])
+        for i in range(5):
+            self.commit([('b', b'b%d' % i)])
+        tip = self.commits[-1]
+        self.assertEqual((b'a', c1), self.find(b'a', tip))
+        self.assertTrue(self.get_transport('.git').has(
+            cache.CHANGED_PATH_INDEX_DIR))
+        # The second lookup does not need to diff any trees.
+        self.overrideAttr(filegraph, 'changed_paths', None)
+        self.assertEqual((b'a', c1), self.find(b'a', tip))
+        self.assertEqual((b'b', tip), self.find(b'b', tip))
+
+    def test_written_on_unlock(self):
+        c1 = self.commit([('a', b'a')])
+        tip = self.commit([('b', b'b')])
+        repo = Repository.open('.')
+        with repo.lock_read():
+            self.assertEqual(
+                (b'a', c1),
+                repo._file_change_scanner.find_last_change_revision(
+                    b'a', tip))
+            self.assertFalse(self.get_transport('.git').has(
+                cache.CHANGED_PATH_INDEX_DIR))
+        self.assertTrue(self.get_transport('.git').has(
+            cache.CHANGED_PATH_INDEX_DIR))
+
+    def test_merge(self):
+        c1 = self.commit([('a', b'a'), ('b', b'b')])
+        self.git_repo.refs[b'refs/heads/other'] = c1
+        self.build_tree_contents([('a', b'a-other')])
+        self.git_repo.stage(['a'])
+        other = self.git_repo.do_commit(
+            b'other', committer=b'Joe <joe@example.com>',
+            ref=b'refs/heads/other')
+        c2 = self.commit([('a', b'a'), ('b', b'b2')])
+        merge = self.commit([('a', b'a-other')], merge=other)
+        tip = self.commit([('c', b'c')])
+        self.assertEqual((b'a', merge), self.find(b'a', tip))
+        self.assertEqual((b'a', other), self.find(b'a', other))
+        # b differs between the merge and the merged revision.
+        self.assertEqual((b'b', merge), self.find(b'b', tip))
+        self.assertEqual((b'b', c2), self.find(b'b', c2))
+        self.assertEqual((b'b', c1), self.find(b'b', other))
@@ -0,0 +1,316 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for reading and writing git index files."""
+
+import os
+import struct
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+from dulwich.index import IndexEntry
+from dulwich.objects import (
+    Blob,
+    hex_to_sha,
+    )
+
+from ... import osutils
+from ...tests import (
+    TestCase,
+    TestCaseInTempDir,
+    )
+from ...tests.features import ExecutableFeature
+
+from .. import index as _mod_index
+from ..index import (
+    BadIndex,
+    FSMonitorQuery,
+    GitIndex,
+    UnsupportedIndexExtension,
+    query_fsmonitor_hook,
+    read_ewah,
+    write_ewah,
+    )
+
+
+def make_entry(data, mtime=1000000000):
+    return IndexEntry(
+        (mtime, 0), (mtime, 0), 0, 0, 0o100644, 0, 0, len(data),
+        Blob.from_string(data).id, 0)
+
+
+def add_extension(data, signature, ext_data):
+    data = data[:-20] + struct.pack('>4sL', signature, len(ext_data)) + (
+        ext_data)
+    return data + hex_to_sha(osutils.sha_string(data))
+
+
+class EWAHTests(TestCase):
+
+    def assertRoundTrip(self, bits, bit_size):
+        data = write_ewah(bits, bit_size)
+        self.assertEqual((sorted(bits), len(data)), read_ewah(data))
+
+    def test_empty(self):
+        self.assertRoundTrip([], 0)
+        self.assertRoundTrip([], 1000)
+
+    def test_sparse(self):
+        self.assertRoundTrip([0, 5, 63, 64, 200], 300)
+        self.assertRoundTrip([3, 9000], 10000)
+
+    def test_dense(self):
+        self.assertRoundTrip(list(range(1000)), 1000)
+
+    def test_running_ones(self):
+        # A run of 3 words of ones, followed by a single literal word.
+        data = struct.pack('>LLQQL', 256, 2, (1 << 33) | (3 << 1) | 1, 5, 0)
+        self.assertEqual(
+            (list(range(192)) + [192, 194], len(data)), read_ewah(data))
+
+
+class GitIndexTests(TestCaseInTempDir):
+
+    def make_index(self, entries, version=None):
+        index = GitIndex('index')
+        index._version = version
+        for name, data in entries:
+            index[name] = make_entry(data)
+        index.write()
+        return GitIndex('index')
+
+    def test_missing(self):
+        index = GitIndex('index')
+        self.assertEqual(0, len(index))
+        self.assertTrue(index.is_current())
+        self.assertTrue(index.is_modified())
+
+    def test_round_trip(self):
+        index = self.make_index([(b'a', b'foo'), (b'dir/b', b'bar')])
+        self.assertEqual([b'a', b'dir/b'], sorted(index))
+        self.assertEqual(make_entry(b'bar'), index[b'dir/b'])
+        self.assertEqual(2, index._version)
+        self.assertTrue(index.is_current())
+        self.assertFalse(index.is_modified())
+
+    def test_version_4(self):
+        index = self.make_index(
+            [(b'dir/a', b'foo'), (b'dir/ab', b'bar'), (b'e', b'')],
+            version=4)
+        self.assertEqual(4, index._version)
+        self.assertEqual([b'dir/a', b'dir/ab', b'e'], sorted(index))
+        self.assertEqual(make_entry(b'bar'), index[b'dir/ab'])
+
+    def test_extended_flags(self):
+        index = GitIndex('index')
+        index[b'a'] = make_entry(b'foo')
+        # The intent-to-add flag.
+        index._extended_flags[b'a'] = 0x2000
+        index.write()
+        index = GitIndex('index')
+        self.assertEqual(3, index._version)
+        self.assertEqual({b'a': 0x2000}, index._extended_flags)
+        self.assertEqual(make_entry(b'foo'), index[b'a'])
+
+    def test_long_name(self):
+        name = b'a' * 5000
+        index = self.make_index([(name, b'foo')])
+        self.assertEqual([name], list(index))
+
+    def test_bad_checksum(self):
+        self.make_index([(b'a', b'foo')])
+        with open('index', 'rb') as f:
+            data = f.read()
+        with open('index', 'wb') as f:
+            f.write(data[:-1] + b'x')
+        self.assertRaises(BadIndex, GitIndex, 'index')
+
+    def test_no_checksum(self):
+        self.make_index([(b'a', b'foo')])
+        with open('index', 'rb') as f:
+            data = f.read()
+        with open('index', 'wb') as f:
+            f.write(data[:-20] + b'\0' * 20)
+        self.assertEqual([b'a'], list(GitIndex('index')))
+
+    def add_extension(self, signature, ext_data):
+        with open('index', 'rb') as f:
+            data = f.read()
+        with open('index', 'wb') as f:
+            f.write(add_extension(data, signature, ext_data))
+
+    def test_unsupported_extension(self):
+        self.make_index([(b'a', b'foo')])
+        self.add_extension(b'sdir', b'')
+        self.assertRaises(UnsupportedIndexExtension, GitIndex, 'index')
+
+    def test_optional_extension(self):
+        self.make_index([(b'a', b'foo')])
+        self.add_extension(b'EOIE', b'x' * 24)
+        index = GitIndex('index')
+        index.write()
+        self.assertNotIn(b'EOIE', index.serialize())
+
+    def test_cache_tree(self):
+        self.make_index([(b'a', b'foo')])
+        self.add_extension(b'TREE', b'cached tree')
+        index = GitIndex('index')
+        self.assertIn(b'cached tree', index.serialize())
+        # Updating the stat information doesn't invalidate the cache tree.
+        index[b'a'] = make_entry(b'foo', mtime=1000000001)
+        self.assertIn(b'cached tree', index.serialize())
+        index[b'a'] = make_entry(b'bar')
+        self.assertNotIn(b'cached tree', index.serialize())
+
+    def test_untracked_cache(self):
+        self.make_index([(b'a', b'foo')])
+        self.add_extension(b'UNTR', b'untracked')
+        index = GitIndex('index')
+        index[b'a'] = make_entry(b'bar')
+        self.assertIn(b'untracked', index.serialize())
+        index[b'b'] = make_entry(b'bar')
+        self.assertNotIn(b'untracked', index.serialize())
+
+    def test_fsmonitor(self):
+        index = GitIndex('index')
+        for name in [b'a', b'b', b'c']:
+            index[name] = make_entry(name)
+        index.fsmonitor_token = b'token'
+        index.fsmonitor_dirty = {b'b'}
+        index.write()
+        index = GitIndex('index')
+        self.assertEqual(b'token', index.fsmonitor_token)
+        self.assertEqual({b'b'}, index.fsmonitor_dirty)
+        del index[b'a']
+        index.write()
+        index = GitIndex('index')
+        self.assertEqual({b'b'}, index.fsmonitor_dirty)
+
+    def test_is_racy(self):
+        index = self.make_index([(b'a', b'foo')])
+        self.assertFalse(index.is_racy(make_entry(b'foo')))
+        self.assertTrue(index.is_racy(
+            make_entry(b'foo', mtime=int(time.time()) + 10)))
+
+    def test_smudge_racy(self):
+        now = int(time.time())
+        index = GitIndex('index')
+        index[b'a'] = make_entry(b'foo', mtime=now)
+        index[b'b'] = make_entry(b'foo')
+        index.write()
+        index = GitIndex('index')
+        self.assertEqual((0, 0), index[b'a'].mtime)
+        self.assertEqual(3, index[b'a'].size)
+        self.assertEqual((1000000000, 0), index[b'b'].mtime)
+
+    def test_is_up_to_date(self):
+        self.build_tree_contents([('a', b'foo')])
+        st = os.lstat('a')
+        index = self.make_index([])
+        entry = make_entry(b'foo')._replace(
+            ctime=st.st_ctime, mtime=st.st_mtime, ino=st.st_ino)
+        index._stat = SimpleNamespace(st_mtime=st.st_mtime + 1)
+        self.assertTrue(index.is_up_to_date(entry, st))
+        self.assertFalse(
+            index.is_up_to_date(entry._replace(size=4), st))
+        self.assertFalse(
+            index.is_up_to_date(entry._replace(mode=0o100755), st))
+        index._stat = st
+        self.assertFalse(index.is_up_to_date(entry, st))
+
+
+class SplitIndexTests(TestCaseInTempDir):
+
+    _test_needs_features = [ExecutableFeature('git')]
+
+    def setUp(self):
+        super(SplitIndexTests, self).setUp()
+        os.mkdir('repo')
+        self.run_git('init', '-q', '.')
+
+    def run_git(self, *args):
+        subprocess.check_call(
+            ['git', '-C', 'repo'] + list(args), stdout=subprocess.DEVNULL)
+
+    def test_read(self):
+        self.build_tree_contents(
+            [('repo/%s' % name, name) for name in ['a', 'b', 'c', 'd']])
+        self.run_git('add', 'a', 'b', 'c', 'd')
+        self.run_git('update-index', '--split-index')
+        self.build_tree_contents([('repo/b', 'changed'), ('repo/e', 'new')])
+        self.run_git('rm', '-q', '--cached', 'c')
+        self.run_git('add', 'b', 'e')
+        index = GitIndex('repo/.git/index')
+        self.assertEqual([b'a', b'b', b'd', b'e'], sorted(index))
+        self.assertEqual(Blob.from_string(b'changed').id, index[b'b'].sha)
+        # Split indexes are written in full.
+        index.write()
+        self.assertNotIn(b'link', index.serialize()[-40:])
+        self.assertEqual(
+            [b'a', b'b', b'd', b'e'], sorted(GitIndex('repo/.git/index')))
+
+    def test_missing_shared_index(self):
+        self.build_tree_contents([('repo/a', 'a')])
+        self.run_git('add', 'a')
+        self.run_git('update-index', '--split-index')
+        for name in os.listdir('repo/.git'):
+            if name.startswith(_mod_index.SHARED_INDEX_PREFIX):
+                os.unlink(os.path.join('repo/.git', name))
+        self.assertRaises(BadIndex, GitIndex, 'repo/.git/index')
+
+
+class FSMonitorHookTests(TestCaseInTempDir):
+
+    def make_hook(self, output, exit_code=0):
+        with open('hook', 'w') as f:
+            f.write('#!%s\n' % sys.executable)
+            f.write('import sys\n')
+            f.write('assert sys.argv[1:] == ["2", "token"]\n')
+            f.write('sys.stdout.buffer.write(%r)\n' % output)
+            f.write('sys.exit(%d)\n' % exit_code)
+        os.chmod('hook', 0o755)
+        return os.path.abspath('hook')
+
+    def test_changed(self):
+        hook = self.make_hook(b'newtoken\0a\0dir/\0')
+        self.assertEqual(
+            (b'newtoken', {b'a', b'dir'}),
+            query_fsmonitor_hook(hook, b'token', '.'))
+
+    def test_everything(self):
+        hook = self.make_hook(b'newtoken\0/\0')
+        self.assertEqual(
+            (b'newtoken', None), query_fsmonitor_hook(hook, b'token', '.'))
+
+    def test_failed(self):
+        hook = self.make_hook(b'newtoken\0a\0', exit_code=1)
+        self.assertIs(None, query_fsmonitor_hook(hook, b'token', '.'))
+
+    def test_missing(self):
+        self.assertIs(
+            None, query_fsmonitor_hook('nonexistent', b'token', '.'))
+
+    def test_may_have_changed(self):
+        query = FSMonitorQuery(b'token', {b'a', b'dir'}, {b'b'})
+        self.assertTrue(query.may_have_changed(b'a'))
+        self.assertTrue(query.may_have_changed(b'b'))
+        self.assertTrue(query.may_have_changed(b'dir/c'))
+        self.assertFalse(query.may_have_changed(b'c'))
+        self.assertFalse(query.may_have_changed(b'ab'))
+        query = FSMonitorQuery(b'token', None, set())
+        self.assertTrue(query.may_have_changed(b'c'))
@@ -25,6 +25,11 @@ from dulwich.objects import (
     Tree,
     )
 
+from ... import (
+    config,
+    debug,
+    trace,
+    )
 from ...branchbuilder import (
     BranchBuilder,
     )
@@ -48,9 +53,13 @@ from ...tests.features import SymlinkFeature
 from ..cache import (
     DictGitShaMap,
     )
+from .. import (
+    object_store,
+    )
 from ..object_store import (
     BazaarObjectStore,
     LRUTreeCache,
+    SharedCache,
     directory_to_tree,
     _check_expected_sha,
     _find_missing_bzr_revids,
@@ -141,6 +150,76 @@ class LRUTreeCacheTests(TestCaseWithTransport):
         tree = self.cache.revision_tree(revid)
         self.assertEqual(revid, tree.get_revision_id())
 
+    def build_revision(self):
+        bb = BranchBuilder(branch=self.branch)
+        bb.start_series()
+        revid = bb.build_snapshot(None,
+                                  [('add', ('', None, 'directory', None)),
+                                   ('add', ('foo', b'foo-id',
+                                            'file', b'a\nb\nc\nd\ne\n')),
+                                   ])
+        bb.finish_series()
+        return revid
+
+    def test_cached(self):
+        revid = self.build_revision()
+        tree = self.cache.revision_tree(revid)
+        self.assertIs(tree, self.cache.revision_tree(revid))
+        self.assertEqual([tree], self.cache.revision_trees([revid]))
+
+    def test_clear(self):
+        revid = self.build_revision()
+        tree = self.cache.revision_tree(revid)
+        self.cache.clear()
+        self.assertIsNot(tree, self.cache.revision_tree(revid))
+
+
+class SharedCacheTests(TestCase):
+
+    def test_hits_and_misses(self):
+        cache = SharedCache('test cache', 1000, len)
+        self.assertIs(None, cache.get(b'a'))
+        cache.add(b'a', b'value')
+        self.assertEqual(b'value', cache.get(b'a'))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_bounded(self):
+        cache = SharedCache('test cache', 100, len)
+        cache.add(b'a', b'x' * 60)
+        cache.add(b'b', b'y' * 60)
+        self.assertIs(None, cache.get(b'a'))
+        self.assertEqual(b'y' * 60, cache.get(b'b'))
+
+    def test_size_computed_once(self):
+        # Values that grow after being added are still accounted for with
+        # the size they were added with.
+        cache = SharedCache('test cache', 100, len)
+        value = [1, 2]
+        cache.add(b'a', value)
+        value.extend(range(200))
+        cache.clear()
+        self.assertEqual(0, cache._cache._value_size)
+
+    def test_report(self):
+        log = []
+        self.overrideAttr(trace, 'mutter', lambda *args: log.append(args))
+        cache = SharedCache('test cache', 100, len)
+        cache.get(b'a')
+        cache.report()
+        self.assertEqual([], log)
+        self.overrideAttr(debug, 'debug_flags', {'cache'})
+        cache.report()
+        self.assertEqual(
+            [('%s: %d hits, %d misses, %d entries using %d of %d bytes',
+              'test cache', 0, 1, 0, 0, 100)], log)
+
+    def test_configured_size(self):
+        self.addCleanup(object_store.clear_shared_caches)
+        object_store.clear_shared_caches()
+        config.GlobalStack().set('git.object_cache_size', '2M')
+        self.assertEqual(
+            2 * 1000 * 1000, object_store.get_object_cache()._cache._max_size)
+
 
 class BazaarObjectStoreTests(TestCaseWithTransport):
 
@@ -170,6 +249,42 @@ class BazaarObjectStoreTests(TestCaseWithTransport):
         self.store.lock_read()
         self.assertEqual(b, self.store[b.id])
 
+    def test_get_blob_cached(self):
+        self.branch.lock_write()
+        self.addCleanup(self.branch.unlock)
+        bb = BranchBuilder(branch=self.branch)
+        bb.start_series()
+        bb.build_snapshot(None,
+                          [('add', ('', None, 'directory', None)),
+                           ('add', ('foo', b'foo-id', 'file', b'cached\n')),
+                           ])
+        bb.finish_series()
+        b = Blob.from_string(b'cached\n')
+        with self.store.lock_read():
+            self.assertEqual(b, self.store[b.id])
+        # A store for another instance of the repository finds the blob in
+        # the process wide object cache.
+        repository = self.branch.controldir.open_repository()
+        store = BazaarObjectStore(repository)
+        self.overrideAttr(repository, 'iter_files_bytes', None)
+        with store.lock_read():
+            self.assertEqual(b, store[b.id])
+
+    def test_tree_cache_cleared_on_unlock(self):
+        bb = BranchBuilder(branch=self.branch)
+        bb.start_series()
+        revid = bb.build_snapshot(None,
+                                  [('add', ('', None, 'directory', None))])
+        bb.finish_series()
+        with self.branch.repository.lock_read():
+            with self.store.lock_read():
+                tree = self.store.tree_cache.revision_tree(revid)
+            # The repository is still locked, so the tree is still usable.
+            self.assertIs(tree, self.store.tree_cache.revision_tree(revid))
+        with self.store.lock_read():
+            pass
+        self.assertEqual(0, len(self.store.tree_cache._cache._cache))
+
     def test_directory_converted_to_symlink(self):
         self.requireFeature(SymlinkFeature)
         b = Blob()
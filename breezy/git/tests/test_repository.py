@@ -315,6 +315,18 @@ class RevisionGistImportTests(tests.TestCaseWithTransport):
                          self.import_rev(revid))
 
 
+    def test_fetch_objects_without_commit(self):
+        revid = self.bzr_tree.commit("pointless")
+        self.overrideAttr(
+            MissingObjectsIterator, 'iter_revision_objects',
+            lambda iterator, revid, lossy: iter([]))
+        inter = self.get_inter()
+        with self.git_repo.lock_write():
+            self.assertRaises(
+                AssertionError, inter.fetch_objects, [(None, revid)],
+                lossy=True)
+
+
 class ForeignTestsRepositoryFactory(object):
 
     def make_repository(self, transport):
@@ -17,18 +17,29 @@
 """Test for git server."""
 
 from dulwich.client import TCPGitClient
+from dulwich.objects import (
+    Blob,
+    sha_to_hex,
+    )
+from dulwich.pack import PackData
 from dulwich.repo import Repo
+import os
 import threading
+import time
 
+from ... import config
 from ...transport import transport_server_registry
 from ...tests import (
     TestCase,
     TestCaseWithTransport,
     )
 
+from .. import server
+from ..object_store import BazaarObjectStore
 from ..server import (
     BzrBackend,
     BzrTCPGitServer,
+    GitServeCache,
     )
 
 
@@ -97,3 +108,150 @@ class TestPlainFetch(GitServerTestCase):
         self.assertEqual(
             set(result.refs.keys()),
             set([b"refs/tags/atag", b"HEAD"]))
+
+
+class TestServeCache(GitServerTestCase):
+
+    def setUp(self):
+        super(TestServeCache, self).setUp()
+        self.generated = []
+        orig = BazaarObjectStore.generate_pack_contents
+
+        def generate_pack_contents(store, have, want, *args, **kwargs):
+            self.generated.append((sorted(have), sorted(want)))
+            return orig(store, have, want, *args, **kwargs)
+        self.overrideAttr(
+            BazaarObjectStore, 'generate_pack_contents',
+            generate_pack_contents)
+        self.wt = self.make_branch_and_tree('t', format='bzr')
+        self.build_tree_contents([('t/foo', b'foo')])
+        self.wt.add('foo')
+        self.wt.commit(message="some data")
+        self.port = self.start_server(self.get_transport('t'))
+
+    def clone(self, path):
+        c = TCPGitClient('localhost', port=self.port)
+        gitrepo = Repo.init(path, mkdir=True)
+        self.addCleanup(gitrepo.close)
+        result = c.fetch('/', gitrepo)
+        # Check that all objects were received.
+        head = gitrepo[result.refs[b'HEAD']]
+        for entry in gitrepo.object_store.iter_tree_contents(head.tree):
+            gitrepo[entry.sha]
+        return gitrepo, result.refs[b'HEAD']
+
+    def get_cache(self):
+        return GitServeCache.from_repository(self.wt.branch.repository)
+
+    def test_clone_cached(self):
+        gitrepo, head = self.clone('clone1')
+        self.assertEqual([([], [head])], self.generated)
+        self.assertEqual(
+            b'foo', gitrepo[gitrepo[gitrepo[head].tree][b'foo'][1]].data)
+        gitrepo, head = self.clone('clone2')
+        self.assertEqual(1, len(self.generated))
+        self.assertEqual(1, len(list(self.get_cache().iter_clones())))
+
+    def test_clone_incremental(self):
+        gitrepo, head1 = self.clone('clone1')
+        self.build_tree_contents([('t/bar', b'bar')])
+        self.wt.add('bar')
+        self.wt.commit(message="more data")
+        gitrepo, head2 = self.clone('clone2')
+        self.assertEqual(
+            [([], [head1]), ([head1], [head2])], self.generated)
+        self.assertEqual([head1], list(gitrepo[head2].parents))
+        self.assertEqual(
+            b'bar', gitrepo[gitrepo[gitrepo[head2].tree][b'bar'][1]].data)
+        clones = list(self.get_cache().iter_clones())
+        self.assertEqual([[head2], [head1]], [c[1] for c in clones])
+        self.assertEqual(clones[1][2], clones[0][2][:1])
+
+    def test_clone_base_pruned(self):
+        gitrepo, head1 = self.clone('clone1')
+        cache = self.get_cache()
+        for filename in os.listdir(cache.store.pack_dir):
+            if filename.endswith('.pack'):
+                os.unlink(os.path.join(cache.store.pack_dir, filename))
+        self.build_tree_contents([('t/bar', b'bar')])
+        self.wt.add('bar')
+        self.wt.commit(message="more data")
+        gitrepo, head2 = self.clone('clone2')
+        self.assertEqual(
+            [([], [head1]), ([], [head2])], self.generated)
+        self.assertEqual(
+            b'foo', gitrepo[gitrepo[gitrepo[head2].tree][b'foo'][1]].data)
+
+    def test_clone_pruned_by_other_process(self):
+        # Another process may prune the clone before it is opened.
+        self.overrideAttr(
+            GitServeCache, 'get_clone_pack', lambda cache, wants: None)
+        gitrepo, head = self.clone('clone1')
+        self.assertEqual([([], [head]), ([], [head])], self.generated)
+
+    def test_disabled(self):
+        config.GlobalStack().set('git.serve_cache_size', 0)
+        self.clone('clone1')
+        self.clone('clone2')
+        self.assertEqual(2, len(self.generated))
+        self.assertIs(None, self.get_cache())
+
+
+class TestGitServeCache(TestCaseWithTransport):
+
+    def add_clone(self, cache, name, base_names=()):
+        blob = Blob.from_string(name * 1000)
+        pack = cache.add_clone_pack([blob.id], base_names, [(blob, None)])
+        return blob.id, pack
+
+    def test_get_clone_pack(self):
+        cache = GitServeCache('cache', 1024 * 1024)
+        self.assertIs(None, cache.get_clone_pack([b'a' * 40]))
+        sha, pack = self.add_clone(cache, b'a')
+        self.assertEqual(1, len(pack))
+        self.assertEqual(
+            [sha], [obj.id for (obj, path) in cache.get_clone_pack([sha])])
+
+    def test_write_pack(self):
+        cache = GitServeCache('cache', 1024 * 1024)
+        sha1, pack1 = self.add_clone(cache, b'a')
+        names = list(cache.iter_clones())[0][2]
+        sha2, pack2 = self.add_clone(cache, b'b', names)
+        self.assertEqual(2, len(pack2))
+        with open('combined.pack', 'wb') as f:
+            pack2.write_pack(f)
+        with PackData('combined.pack') as data:
+            data.check()
+            self.assertEqual(
+                set([sha1, sha2]),
+                set(sha_to_hex(entry[0]) for entry in data.iterentries()))
+
+    def test_prune(self):
+        self.overrideAttr(server, '_PRUNE_GRACE_PERIOD', 0)
+        cache = GitServeCache('cache', 1)
+        self.add_clone(cache, b'a')
+        self.add_clone(cache, b'b')
+        clones = list(cache.iter_clones())
+        # The most recent clone is always kept.
+        self.assertEqual(1, len(clones))
+        self.assertEqual(
+            2, len(os.listdir(cache.store.pack_dir)))
+
+    def test_prune_keeps_recent_packs(self):
+        cache = GitServeCache('cache', 1)
+        self.add_clone(cache, b'a')
+        self.add_clone(cache, b'b')
+        self.assertEqual(1, len(list(cache.iter_clones())))
+        # The pack of the first clone may be about to be used by a clone
+        # that another process is recording.
+        self.assertEqual(4, len(os.listdir(cache.store.pack_dir)))
+        old = time.time() - server._PRUNE_GRACE_PERIOD - 10
+        keep = list(cache.iter_clones())[0][2][0].decode('ascii')
+        for filename in os.listdir(cache.store.pack_dir):
+            if not filename.startswith(keep):
+                os.utime(os.path.join(cache.store.pack_dir, filename),
+                         (old, old))
+        cache.prune()
+        self.assertEqual(
+            sorted([keep + '.idx', keep + '.pack']),
+            sorted(os.listdir(cache.store.pack_dir)))
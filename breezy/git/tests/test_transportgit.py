@@ -16,18 +16,103 @@
 
 """Tests for bzr-git's object store."""
 
-from dulwich.objects import Blob
+from io import BytesIO
+
+from dulwich.objects import (
+    Blob,
+    Tree,
+    )
+from dulwich.pack import (
+    OFS_DELTA,
+    Pack,
+    PackData,
+    load_pack_index_file,
+    write_pack_header,
+    write_pack_index_v2,
+    )
 from dulwich.tests.test_object_store import PackBasedObjectStoreTests
 from dulwich.tests.utils import make_object
 
-from ...tests import TestCaseWithTransport
+from ... import osutils
+from ...tests import (
+    TestCase,
+    TestCaseWithTransport,
+    )
 
+from .. import transportgit
 from ..transportgit import (
     TransportObjectStore,
     TransportRefsContainer,
+    write_pack_stream,
     )
 
 
+def make_versions(count):
+    """Make blobs for successive versions of a file."""
+    lines = [b'line %d\n' % i for i in range(100)]
+    blobs = []
+    for i in range(count):
+        lines[(i * 7) % len(lines)] = b'changed in version %d\n' % i
+        blobs.append(Blob.from_string(b''.join(lines)))
+    return blobs
+
+
+class WritePackStreamTests(TestCase):
+
+    def read_pack(self, f, entries):
+        data = BytesIO()
+        write_pack_header(data, len(entries))
+        data.write(f.getvalue())
+        checksum = osutils.sha(data.getvalue()).digest()
+        data.write(checksum)
+        pd = PackData.from_file(BytesIO(data.getvalue()),
+                                len(data.getvalue()))
+        idx = BytesIO()
+        write_pack_index_v2(idx, entries, checksum)
+        idx.seek(0)
+        return Pack.from_objects(pd, load_pack_index_file('test.idx', idx))
+
+    def get_types(self, pack):
+        return [unpacked.pack_type_num
+                for unpacked in pack.data._iter_unpacked()]
+
+    def test_deltified(self):
+        blobs = make_versions(5)
+        f = BytesIO()
+        entries = write_pack_stream(f, ((b, 'foo') for b in blobs))
+        self.assertEqual(sorted(b.sha().digest() for b in blobs),
+                         [e[0] for e in entries])
+        pack = self.read_pack(f, entries)
+        self.assertEqual([Blob.type_num] + [OFS_DELTA] * 4,
+                         self.get_types(pack))
+        for blob in blobs:
+            self.assertEqual(blob, pack[blob.id])
+
+    def test_chain_length_bounded(self):
+        self.overrideAttr(transportgit, 'MAX_DELTA_CHAIN', 2)
+        blobs = make_versions(5)
+        f = BytesIO()
+        entries = write_pack_stream(f, ((b, 'foo') for b in blobs))
+        types = self.get_types(self.read_pack(f, entries))
+        self.assertEqual(
+            [Blob.type_num, OFS_DELTA, OFS_DELTA, Blob.type_num, OFS_DELTA],
+            types)
+
+    def test_not_deltified(self):
+        blobs = make_versions(3)
+        tree = Tree()
+        tree.add(b'foo', 0o100644, blobs[0].id)
+        f = BytesIO()
+        entries = write_pack_stream(
+            f, [(blobs[0], 'foo'), (tree, ''), (blobs[1], 'bar'),
+                (blobs[0], 'foo'), (blobs[2], 'foo')], deltify=False)
+        self.assertEqual(4, len(entries))
+        types = self.get_types(self.read_pack(f, entries))
+        self.assertEqual(
+            [Blob.type_num, Tree.type_num, Blob.type_num, Blob.type_num],
+            types)
+
+
 class TransportObjectStoreTests(PackBasedObjectStoreTests, TestCaseWithTransport):
 
     def setUp(self):
@@ -66,6 +151,62 @@ class TransportObjectStoreTests(PackBasedObjectStoreTests, TestCaseWithTransport
         restore = TransportObjectStore(self.get_transport())
         self.assertEqual(2, len(restore.packs))
 
+    def test_add_pack_objects(self):
+        blobs = make_versions(3)
+        pack = self.store.add_pack_objects((b, 'foo') for b in blobs)
+        self.assertEqual(1, len(self.store.packs))
+        pack.check()
+        for blob in blobs:
+            self.assertEqual(blob, self.store[blob.id])
+        self.assertEqual(
+            set(['pack-%s.pack' % pack.name().decode('ascii'),
+                 'pack-%s.idx' % pack.name().decode('ascii')]),
+            set(self.store.pack_transport.list_dir('.')))
+        # Reopening the store finds the pack.
+        restore = TransportObjectStore(self.get_transport())
+        self.assertEqual(blobs[1], restore[blobs[1].id])
+
+    def test_add_pack_objects_empty(self):
+        self.assertIs(None, self.store.add_pack_objects([]))
+        self.assertEqual([], self.store.pack_transport.list_dir('.'))
+
+    def test_iter_blob_chunks(self):
+        blob = make_object(
+            Blob, data=b''.join(b'line %d\n' % i for i in range(1000)))
+        self.store.add_pack_objects([(blob, None)])
+        # Also when the pack has not been opened yet.
+        for store in [self.store, TransportObjectStore(self.get_transport())]:
+            chunks = list(store.iter_blob_chunks(blob.id, chunk_size=100))
+            self.assertEqual(blob.data, b''.join(chunks))
+            self.assertTrue(len(chunks) > 1)
+            self.assertTrue(max(map(len, chunks)) <= 100)
+
+    def test_iter_blob_chunks_interleaved(self):
+        blobs = [make_object(Blob, data=b'%d' % i * 1000) for i in range(2)]
+        self.store.add_pack_objects(
+            [(blob, None) for blob in blobs], deltify=False)
+        iters = [self.store.iter_blob_chunks(blob.id, chunk_size=10)
+                 for blob in blobs]
+        chunks = [[], []]
+        for pair in zip(*iters):
+            for i, chunk in enumerate(pair):
+                chunks[i].append(chunk)
+        self.assertEqual([blob.data for blob in blobs],
+                         [b''.join(c) for c in chunks])
+
+    def test_iter_blob_chunks_delta(self):
+        blobs = make_versions(3)
+        self.store.add_pack_objects((b, 'foo') for b in blobs)
+        for blob in blobs:
+            self.assertEqual(
+                blob.data, b''.join(self.store.iter_blob_chunks(blob.id)))
+
+    def test_iter_blob_chunks_loose(self):
+        blob = make_object(Blob, data=b"data")
+        self.store.add_object(blob)
+        self.assertEqual(
+            b"data", b''.join(self.store.iter_blob_chunks(blob.id)))
+
 
 # FIXME: Unfortunately RefsContainerTests requires on a specific set of refs existing.
 
@@ -19,6 +19,8 @@
 
 import os
 import stat
+import sys
+import time
 
 from dulwich import __version__ as dulwich_version
 from dulwich.diff_tree import RenameDetector, tree_changes
@@ -42,6 +44,7 @@ from ...bzr.inventorytree import InventoryTreeChange as TreeChange
 from ..mapping import (
     default_mapping,
     )
+from .. import workingtree
 from ..tree import (
     tree_delta_from_git_changes,
     )
@@ -133,6 +136,73 @@ class GitWorkingTreeTests(TestCaseWithTransport):
         self.assertEqual([], list(subtree.unknowns()))
 
 
+class GitWorkingTreeStatCacheTests(TestCaseWithTransport):
+
+    def setUp(self):
+        super(GitWorkingTreeStatCacheTests, self).setUp()
+        self.tree = self.make_branch_and_tree('.', format="git")
+        self.build_tree(['a', 'b'])
+        self.tree.add(['a', 'b'])
+        self.tree.commit('add files')
+        self.hashed = []
+        orig = workingtree.blob_from_path_and_stat
+
+        def blob_from_path_and_stat(path, st):
+            self.hashed.append(os.path.basename(path))
+            return orig(path, st)
+        self.overrideAttr(
+            workingtree, 'blob_from_path_and_stat', blob_from_path_and_stat)
+        # Make sure the stat information in the index isn't racy.
+        self.touch('a', 200)
+        self.touch('b', 200)
+        self.assertEqual([b'a', b'b'], self.status())
+
+    def touch(self, path, age=100):
+        t = time.time() - age
+        os.utime(path, (t, t))
+
+    def status(self):
+        del self.hashed[:]
+        self.assertFalse(self.tree.has_changes())
+        return sorted(self.hashed)
+
+    def test_refresh_stat(self):
+        self.touch('a')
+        self.assertEqual([b'a'], self.status())
+        # The refreshed stat information was saved by the read lock.
+        with self.tree.lock_read():
+            self.assertEqual(
+                int(os.lstat('a').st_mtime), self.tree.index[b'a'].mtime[0])
+        self.assertEqual([], self.status())
+
+    def test_index_locked(self):
+        self.touch('a')
+        with open('.git/index.lock', 'wb'):
+            pass
+        self.assertEqual([b'a'], self.status())
+        self.assertEqual([b'a'], self.status())
+
+    def test_fsmonitor(self):
+        with self.tree.lock_tree_write():
+            self.tree.index.fsmonitor_token = b'token'
+            self.tree._index_dirty = True
+        with open('hook', 'w') as f:
+            f.write('#!%s\n' % sys.executable)
+            f.write('import sys\n')
+            f.write('sys.stdout.buffer.write(b"%s\\0b\\0" % '
+                    'sys.argv[2].encode())\n')
+        os.chmod('hook', 0o755)
+        with open('.git/config', 'a') as f:
+            f.write('[core]\n\tfsmonitor = ./hook\n')
+        self.touch('a')
+        self.touch('b')
+        # Only the file reported by the hook is checked.
+        self.assertEqual([b'b'], self.status())
+        with self.tree.lock_read():
+            self.assertEqual(b'token', self.tree.index.fsmonitor_token)
+            self.assertEqual(set(), self.tree.index.fsmonitor_dirty)
+
+
 class GitWorkingTreeFileTests(TestCaseWithTransport):
 
     def setUp(self):
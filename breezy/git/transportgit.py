@@ -19,7 +19,9 @@
 from io import BytesIO
 
 import os
+import struct
 import sys
+import zlib
 
 from dulwich.errors import (
     NoIndexPresent,
@@ -29,6 +31,7 @@ from dulwich.file import (
     FileLocked,
     )
 from dulwich.objects import (
+    Blob,
     ShaFile,
     )
 from dulwich.object_store import (
@@ -38,10 +41,13 @@ from dulwich.object_store import (
     )
 from dulwich.pack import (
     MemoryPackIndex,
+    OFS_DELTA,
     PackData,
     Pack,
     iter_sha1,
     load_pack_index_file,
+    take_msb_bytes,
+    write_pack_object,
     write_pack_objects,
     write_pack_index_v2,
     )
@@ -62,6 +68,7 @@ from dulwich.repo import (
     )
 
 from .. import (
+    lru_cache,
     osutils,
     transport as _mod_transport,
     urlutils,
@@ -81,6 +88,108 @@ from ..lock import LogicalLockResult
 from ..trace import warning
 
 
+# Maximum length of delta chains in packs written by write_pack_stream.
+MAX_DELTA_CHAIN = 50
+# Memory used for keeping delta bases around in write_pack_stream.
+DELTA_BASE_CACHE_SIZE = 32 * 1024 * 1024
+# Objects smaller than this are not worth deltifying.
+_MIN_DELTA_SIZE = 64
+# Size of the chunks read by TransportObjectStore.iter_blob_chunks.
+BLOB_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_inflated(read, chunk_size):
+    """Decompress a zlib stream, without keeping all of it in memory.
+
+    :param read: Function that returns up to the requested number of bytes
+        of the compressed stream
+    :param chunk_size: Maximum size of the chunks to read and return
+    :return: Iterator over decompressed chunks
+    """
+    decomp = zlib.decompressobj()
+    data = b''
+    while not decomp.eof:
+        if not data:
+            data = read(chunk_size)
+        chunk = decomp.decompress(data, chunk_size)
+        if not chunk and not data:
+            raise zlib.error('truncated compressed stream')
+        data = decomp.unconsumed_tail
+        if chunk:
+            yield chunk
+
+
+def _make_delta(base, target):
+    """Create a git delta from base to target."""
+    try:
+        from ..bzr._groupcompress_pyx import (
+            encode_base128_int,
+            make_delta,
+            )
+    except ImportError:
+        from ..bzr._groupcompress_py import (
+            encode_base128_int,
+            make_delta,
+            )
+    # The groupcompress delta format is git's, without the size of the
+    # base.
+    return encode_base128_int(len(base)) + make_delta(base, target)
+
+
+def write_pack_stream(f, objects, deltify=True, compression_level=-1):
+    """Write objects to pack data as they are generated.
+
+    Unlike write_pack_objects, this does not need to know the number of
+    objects up front, or keep them in memory. Objects are deltified against
+    the previous object written for the same path, as a push writes many
+    versions of the same files and directories.
+
+    :param f: Empty file to write the objects to. The pack header is not
+        written; the objects start at offset 12 of the pack.
+    :param objects: Iterable over (object, path) tuples.
+    :param deltify: Whether to deltify objects.
+    :param compression_level: zlib compression level to use.
+    :return: List of (sha, offset, crc32) tuples for the objects written,
+        sorted by sha.
+    """
+    entries = {}
+    bases = lru_cache.LRUSizeCache(
+        max_size=DELTA_BASE_CACHE_SIZE,
+        compute_size=lambda base: len(base[1]))
+    for obj, path in objects:
+        sha = obj.sha().digest()
+        if sha in entries:
+            continue
+        offset = 12 + f.tell()
+        type_num = obj.type_num
+        raw = obj.as_raw_string()
+        key = (type_num, path)
+        base = None
+        if deltify and path is not None and len(raw) >= _MIN_DELTA_SIZE:
+            base = bases.get(key)
+        depth = 0
+        if base is not None and base[2] < MAX_DELTA_CHAIN:
+            base_offset, base_raw, base_depth = base
+            delta = _make_delta(base_raw, raw)
+            if len(delta) < len(raw) // 2:
+                depth = base_depth + 1
+                crc32 = write_pack_object(
+                    f, OFS_DELTA, (offset - base_offset, delta),
+                    compression_level=compression_level)
+            else:
+                base = None
+        else:
+            base = None
+        if base is None:
+            crc32 = write_pack_object(
+                f, type_num, raw, compression_level=compression_level)
+        entries[sha] = (offset, crc32)
+        if deltify and path is not None:
+            bases[key] = (offset, raw, depth)
+    return sorted((sha, offset, crc32)
+                  for (sha, (offset, crc32)) in entries.items())
+
+
 class TransportRefsContainer(RefsContainer):
     """Refs container that reads refs from a transport."""
 
@@ -483,10 +592,10 @@ class TransportRepo(BaseRepo):
 
     def open_index(self):
         """Open the index for this repository."""
-        from dulwich.index import Index
+        from .index import GitIndex
         if not self.has_index():
             raise NoIndexPresent()
-        return Index(self.index_path())
+        return GitIndex(self.index_path())
 
     def has_index(self):
         """Check if an index is present."""
@@ -716,6 +825,48 @@ class TransportObjectStore(PackBasedObjectStore):
         except NoSuchFile:
             return None
 
+    def iter_blob_chunks(self, sha, chunk_size=BLOB_CHUNK_SIZE):
+        """Iterate over the contents of a blob.
+
+        Blobs that are stored undeltified in a pack (as git does for large
+        files) are decompressed as they are read, rather than loaded into
+        memory all at once. Other blobs are read in full.
+
+        :param sha: Hex SHA1 of the blob
+        :param chunk_size: Maximum size of the chunks to return
+        :return: Iterator over chunks of the blob contents
+        """
+        pack, pos = self._find_packed_object(sha)
+        if pack is not None:
+            f = pack.data._file
+
+            def read(size):
+                # The pack file is shared with other readers, so seek
+                # before every read.
+                nonlocal pos
+                f.seek(pos)
+                data = f.read(size)
+                pos += len(data)
+                return data
+            header, _ = take_msb_bytes(read)
+            if (header[0] >> 4) & 0x07 == Blob.type_num:
+                return _iter_inflated(read, chunk_size)
+        return iter(self[sha].as_raw_chunks())
+
+    def _find_packed_object(self, sha):
+        """Find the pack an object is stored in.
+
+        :return: Tuple with the pack and the offset of the object in it, or
+            (None, None) if the object is not in any pack
+        """
+        for iter_packs in (self._iter_cached_packs, self._update_pack_cache):
+            for pack in iter_packs():
+                try:
+                    return pack, pack.index.object_index(sha)
+                except KeyError:
+                    pass
+        return None, None
+
     def add_object(self, obj):
         """Add a single object to this object store.
 
@@ -763,6 +914,42 @@ class TransportObjectStore(PackBasedObjectStore):
         self._add_cached_pack(basename, final_pack)
         return final_pack
 
+    def add_pack_objects(self, objects, deltify=True):
+        """Write objects to a new pack as they are generated.
+
+        The objects are written to a temporary file, and the pack and its
+        index are only added once all objects have been written.
+
+        :param objects: Iterable over (object, path) tuples.
+        :param deltify: Whether to deltify objects.
+        :return: The new Pack, or None if there were no objects.
+        """
+        import tempfile
+        with tempfile.TemporaryFile() as body:
+            entries = write_pack_stream(
+                body, objects, deltify=deltify,
+                compression_level=self.pack_compression_level)
+            if not entries:
+                return None
+            basename = "pack-%s" % iter_sha1(
+                entry[0] for entry in entries).decode('ascii')
+            header = b'PACK' + struct.pack('>LL', 2, len(entries))
+            sha = osutils.sha(header)
+            body.seek(0)
+            with self.pack_transport.open_write_stream(
+                    basename + ".pack") as datafile:
+                datafile.write(header)
+                for chunk in osutils.file_iterator(body):
+                    sha.update(chunk)
+                    datafile.write(chunk)
+                pack_checksum = sha.digest()
+                datafile.write(pack_checksum)
+        with self.pack_transport.open_write_stream(
+                basename + ".idx") as idxfile:
+            write_pack_index_v2(idxfile, entries, pack_checksum)
+        self._update_pack_cache()
+        return self._pack_cache[basename]
+
     def move_in_thin_pack(self, f):
         """Move a specific file containing a pack into the pack directory.
 
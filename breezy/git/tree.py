@@ -60,6 +60,7 @@ from .. import (
     tree as _mod_tree,
     workingtree,
     )
+from ..iterablefile import IterableFile
 from ..revision import (
     CURRENT_REVISION,
     NULL_REVISION,
@@ -240,6 +241,14 @@ entry_factory = {
     }
 
 
+def _iter_blob_chunks(store, hexsha):
+    """Iterate over the contents of a blob, streaming it where possible."""
+    iter_blob_chunks = getattr(store, 'iter_blob_chunks', None)
+    if iter_blob_chunks is None:
+        return iter(store[hexsha].chunked)
+    return iter_blob_chunks(hexsha)
+
+
 def ensure_normalized_path(path):
     """Check whether path is normalized.
 
@@ -609,7 +618,7 @@ class GitRevisionTree(revisiontree.RevisionTree, GitTree):
     def get_file_sha1(self, path, stat_value=None):
         if self.tree is None:
             raise errors.NoSuchFile(path)
-        return osutils.sha_string(self.get_file_text(path))
+        return osutils.sha_strings(self._iter_file_chunks(path))
 
     def get_file_verifier(self, path, stat_value=None):
         (store, mode, hexsha) = self._lookup_path(path)
@@ -629,6 +638,26 @@ class GitRevisionTree(revisiontree.RevisionTree, GitTree):
         else:
             return b""
 
+    def _iter_file_chunks(self, path):
+        (store, mode, hexsha) = self._lookup_path(path)
+        if stat.S_ISREG(mode):
+            return _iter_blob_chunks(store, hexsha)
+        else:
+            return iter([])
+
+    def get_file(self, path):
+        """See RevisionTree.get_file.
+
+        The contents of large files are read as they are needed, rather than
+        loaded into memory all at once.
+        """
+        return IterableFile(self._iter_file_chunks(path))
+
+    def iter_files_bytes(self, desired_files):
+        """See RevisionTree.iter_files_bytes."""
+        for path, identifier in desired_files:
+            yield identifier, self._iter_file_chunks(path)
+
     def get_symlink_target(self, path):
         """See RevisionTree.get_symlink_target."""
         (store, mode, hexsha) = self._lookup_path(path)
@@ -1616,7 +1645,12 @@ class MutableGitIndexTree(mutabletree.MutableTree, GitTree):
         else:
             return kind
 
-    def _live_entry(self, relpath):
+    def _live_entry(self, relpath, index_entry=None):
+        """Return an index entry describing the file at relpath.
+
+        :param index_entry: The current index entry for relpath, if any;
+            returned as is if the file is known to still match it
+        """
         raise NotImplementedError(self._live_entry)
 
     def transform(self, pb=None):
@@ -1677,7 +1711,7 @@ def snapshot_workingtree(target, want_unversioned=False):
     trust_executable = target._supports_executable()
     for path, index_entry in target._recurse_index_entries():
         try:
-            live_entry = target._live_entry(path)
+            live_entry = target._live_entry(path, index_entry)
         except EnvironmentError as e:
             if e.errno == errno.ENOENT:
                 # Entry was removed; keep it listed, but mark it as gone.
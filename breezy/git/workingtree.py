@@ -26,15 +26,13 @@ from dulwich.ignore import (
 from dulwich.config import ConfigFile as GitConfigFile
 from dulwich.file import GitFile, FileLocked
 from dulwich.index import (
-    Index,
-    SHA1Writer,
+    blob_from_path_and_stat,
     build_index_from_tree,
     index_entry_from_path,
     index_entry_from_stat,
     FLAG_STAGEMASK,
     read_submodule_head,
     validate_path,
-    write_index_dict,
     )
 from dulwich.object_store import (
     tree_lookup_path,
@@ -75,6 +73,11 @@ from ..mutabletree import (
 from .dir import (
     LocalGitDir,
     )
+from .index import (
+    FSMonitorQuery,
+    GitIndex,
+    query_fsmonitor_hook,
+    )
 from .tree import (
     MutableGitIndexTree,
     )
@@ -195,7 +198,9 @@ class GitWorkingTree(MutableGitIndexTree, workingtree.WorkingTree):
         self._transport = self.repository._git._controltransport
         self._format = GitWorkingTreeFormat()
         self.index = None
+        self._cached_index = None
         self._index_file = None
+        self._fsmonitor = None
         self.views = self._make_views()
         self._rules_searcher = None
         self._detect_case_handling()
@@ -208,7 +213,12 @@ class GitWorkingTree(MutableGitIndexTree, workingtree.WorkingTree):
         return False
 
     def _read_index(self):
-        self.index = Index(self.control_transport.local_abspath('index'))
+        index = self._cached_index
+        # Avoid parsing the index again if nothing has changed it since the
+        # last time the tree was locked.
+        if index is None or index.is_modified() or not index.is_current():
+            index = GitIndex(self.control_transport.local_abspath('index'))
+        self.index = index
         self._index_dirty = False
 
     def _get_submodule_index(self, relpath):
@@ -221,7 +231,7 @@ class GitWorkingTree(MutableGitIndexTree, workingtree.WorkingTree):
         else:
             index_path = self.control_transport.local_abspath(
                 posixpath.join('modules', decode_git_path(info[1]), 'index'))
-        return Index(index_path)
+        return GitIndex(index_path)
 
     def lock_read(self):
         """Lock the repository for read operations.
@@ -301,7 +311,10 @@ class GitWorkingTree(MutableGitIndexTree, workingtree.WorkingTree):
                     # file by calling .flush()
                     self._index_file.abort()
                 self._index_file = None
+            elif self._index_dirty:
+                self._save_refreshed_index()
             self._lock_mode = None
+            self._cached_index = self.index
             self.index = None
         finally:
             self.branch.unlock()
@@ -696,14 +709,29 @@ class GitWorkingTree(MutableGitIndexTree, workingtree.WorkingTree):
 
     def _flush(self, f):
         try:
-            shaf = SHA1Writer(f)
-            write_index_dict(shaf, self.index)
-            shaf.close()
+            f.write(self.index.serialize())
         except BaseException:
             f.abort()
             raise
+        f.close()
         self._index_dirty = False
 
+    def _save_refreshed_index(self):
+        """Write out stat information refreshed under a read lock.
+
+        This is only an optimization, so nothing is written if the index
+        is locked or was changed by somebody else in the meantime.
+        """
+        try:
+            f = GitFile(self.control_transport.local_abspath('index'), 'wb')
+        except (FileLocked, OSError) as e:
+            trace.mutter('not saving refreshed index: %s', e)
+            return
+        if not self.index.is_current():
+            f.abort()
+            return
+        self._flush(f)
+
     def get_file_mtime(self, path):
         """See Tree.get_file_mtime."""
         try:
@@ -815,10 +843,78 @@ class GitWorkingTree(MutableGitIndexTree, workingtree.WorkingTree):
     def _lstat(self, path):
         return os.lstat(self.abspath(path))
 
-    def _live_entry(self, path):
+    def _live_entry(self, path, index_entry=None):
+        fsmonitor = self._fsmonitor
+        if index_entry is not None and fsmonitor is not None:
+            if not fsmonitor.may_have_changed(path):
+                return index_entry
+            fsmonitor.dirty.add(path)
         encoded_path = self.abspath(decode_git_path(path)).encode(
             osutils._fs_enc)
-        return index_entry_from_path(encoded_path)
+        if index_entry is None or S_ISGITLINK(index_entry.mode):
+            return index_entry_from_path(encoded_path)
+        st = os.lstat(encoded_path)
+        if not (stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode)):
+            return index_entry_from_path(encoded_path)
+        if self.index.is_up_to_date(index_entry, st):
+            live_entry = index_entry
+        else:
+            live_entry = index_entry_from_stat(
+                st, blob_from_path_and_stat(encoded_path, st).id, 0)
+            if ((live_entry.sha, live_entry.mode) !=
+                    (index_entry.sha, index_entry.mode)):
+                return live_entry
+            if path in self.index and self.index[path] == index_entry:
+                # Record the new stat information, so that the file doesn't
+                # have to be read again next time.
+                self.index[path] = live_entry._replace(
+                    flags=index_entry.flags)
+                self._index_dirty = True
+        if fsmonitor is not None:
+            fsmonitor.dirty.discard(path)
+        return live_entry
+
+    def _query_fsmonitor(self):
+        """Ask the core.fsmonitor hook which files changed.
+
+        Only hooks are supported, and only once git has stored a token in
+        the index.
+
+        :return: A FSMonitorQuery, or None
+        """
+        token = self.index.fsmonitor_token
+        if token is None:
+            return None
+        try:
+            hook = self.repository._git.get_config_stack().get(
+                b'core', b'fsmonitor')
+        except KeyError:
+            return None
+        if hook.lower() in (b'true', b'false', b'yes', b'no', b'on', b'off',
+                            b'1', b'0', b''):
+            # The builtin fsmonitor daemon is not supported.
+            return None
+        result = query_fsmonitor_hook(
+            os.fsdecode(hook), token, self.basedir)
+        if result is None:
+            return None
+        new_token, changed = result
+        return FSMonitorQuery(new_token, changed, self.index.fsmonitor_dirty)
+
+    def git_snapshot(self, want_unversioned=False):
+        with self.lock_read():
+            self._fsmonitor = self._query_fsmonitor()
+            try:
+                ret = super(GitWorkingTree, self).git_snapshot(
+                    want_unversioned=want_unversioned)
+            finally:
+                fsmonitor = self._fsmonitor
+                self._fsmonitor = None
+            if fsmonitor is not None:
+                self.index.fsmonitor_token = fsmonitor.token
+                self.index.fsmonitor_dirty = fsmonitor.dirty
+                self._index_dirty = True
+            return ret
 
     def is_executable(self, path):
         with self.lock_read():
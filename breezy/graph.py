@@ -254,6 +254,11 @@ class Graph(object):
             self.get_parents = parents_provider.get_parents
         if getattr(parents_provider, 'get_parent_map', None) is not None:
             self.get_parent_map = parents_provider.get_parent_map
+        # Parents providers can optionally supply generation numbers, which
+        # allow searches to stop early. A revision can only be an ancestor
+        # of revisions with a higher generation number.
+        self._get_generation_map = getattr(
+            parents_provider, 'get_generation_map', None)
         self._parents_provider = parents_provider
 
     def __repr__(self):
@@ -760,7 +765,8 @@ class Graph(object):
 
         while True:
             newly_seen = set()
-            for searcher in searchers:
+            stepped = self._searchers_to_step(searchers)
+            for searcher in stepped:
                 new_ancestors = searcher.step()
                 if new_ancestors:
                     newly_seen.update(new_ancestors)
@@ -797,7 +803,8 @@ class Graph(object):
                     # This searcher is searching a unique set of nodes, let it
                     unique_search_sets.add(will_search_set)
 
-            if len(unique_search_sets) == 1:
+            if (len(unique_search_sets) == 1 and
+                    len(stepped) == len(searchers)):
                 nodes = unique_search_sets.pop()
                 uncommon_nodes = nodes.difference(common_ancestors)
                 if uncommon_nodes:
@@ -810,6 +817,59 @@ class Graph(object):
                 break
         return border_ancestors, common_ancestors, searchers
 
+    def _searchers_to_step(self, searchers):
+        """Pick the searchers to advance in a round of a search.
+
+        Without generation numbers all searchers are advanced together.
+        Otherwise only the searchers that are about to query the revisions
+        with the highest generation number are, so that a searcher which
+        starts out much further back in history doesn't walk beyond the
+        point where the others will meet it.
+        """
+        if self._get_generation_map is None or len(searchers) < 2:
+            return searchers
+        max_generations = []
+        for searcher in searchers:
+            next_query = searcher._next_query
+            generations = self._get_generation_map(next_query)
+            if not next_query or len(generations) != len(next_query):
+                max_generations.append(None)
+            else:
+                max_generations.append(max(generations.values()))
+        known = [generation for generation in max_generations
+                 if generation is not None]
+        if not known:
+            return searchers
+        top = max(known)
+        return [searcher for searcher, generation
+                in zip(searchers, max_generations)
+                if generation is None or generation == top]
+
+    def _heads_with_generations(self, candidate_heads, generations):
+        """Find the heads of a set of revisions using generation numbers.
+
+        The ancestors of all candidates are searched, except for those with a
+        generation number at or below the lowest generation number of the
+        candidates, as these can not lead to another candidate.
+        """
+        min_generation = min(generations.values())
+        candidate_heads = set(candidate_heads)
+        seen = set()
+        pending = list(candidate_heads)
+        while pending and len(candidate_heads) > 1:
+            parent_map = self.get_parent_map(pending)
+            next_pending = set()
+            for parents in parent_map.values():
+                next_pending.update(parents)
+            next_pending.difference_update(seen)
+            seen.update(next_pending)
+            candidate_heads.difference_update(next_pending)
+            generations = self._get_generation_map(next_pending)
+            pending = [key for key in next_pending
+                       if generations.get(key, min_generation + 1) >
+                       min_generation]
+        return candidate_heads
+
     def heads(self, keys):
         """Return the heads from amongst keys.
 
@@ -833,6 +893,11 @@ class Graph(object):
                 return {revision.NULL_REVISION}
         if len(candidate_heads) < 2:
             return candidate_heads
+        if self._get_generation_map is not None:
+            generations = self._get_generation_map(candidate_heads)
+            if len(generations) == len(candidate_heads):
+                return self._heads_with_generations(
+                    candidate_heads, generations)
         searchers = dict((c, self._make_breadth_first_searcher([c]))
                          for c in candidate_heads)
         active_searchers = dict(searchers)
@@ -1697,6 +1762,17 @@ class GraphThunkIdsToKeys(object):
             node.key = node.key[0]
         return nodes
 
+    def iter_merge_sort(self, tip_revision):
+        for node in self._graph.iter_merge_sort((tip_revision,)):
+            node.key = node.key[0]
+            yield node
+
+    def get_dotted_revnos(self, tip_revision, revision_ids):
+        """See KnownGraph.get_dotted_revnos()"""
+        revnos = self._graph.get_dotted_revnos(
+            (tip_revision,), [(r,) for r in revision_ids])
+        return {key[0]: revno for key, revno in revnos.items()}
+
     def add_node(self, revision, parents):
         self._graph.add_node((revision,), [(p,) for p in parents])
 
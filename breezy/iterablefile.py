@@ -15,6 +15,8 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+from itertools import chain
+
 
 class IterableFileBase(object):
     """Create a file-like object from any iterable"""
@@ -80,9 +82,10 @@ class IterableFileBase(object):
         >>> IterableFileBase([b'This ', b'is ', b'a ', b'test.']).read_all()
         b'This is a test.'
         """
-        def no_stop(result):
-            return None
-        return self._read(no_stop)
+        result = b"".join(chain([self._buffer], self._iter))
+        self._buffer = b""
+        self.done = True
+        return result
 
     def push_back(self, contents):
         """
@@ -109,6 +109,14 @@ class LRUCache(object):
             # Trigger the cleanup
             self.cleanup()
 
+    def __delitem__(self, key):
+        """Remove an entry from the cache."""
+        node = self._cache[key]
+        if (node is self._most_recently_used
+                and node.next_key is not _null_key):
+            self._most_recently_used = self._cache[node.next_key]
+        self._remove_node(node)
+
     def cache_size(self):
         """Get the number of entries we will cache."""
         return self._max_cache
@@ -271,6 +279,7 @@ class LRUSizeCache(LRUCache):
             self._cache[key] = node
         else:
             self._value_size -= self._compute_size(node.value)
+            node.value = value
         self._value_size += value_len
         self._record_access(node)
 
@@ -18,7 +18,10 @@
 """Tests of the 'brz pack' command."""
 import os
 
-from breezy import tests
+from breezy import (
+    config,
+    tests,
+    )
 
 
 class TestPack(tests.TestCaseWithTransport):
@@ -82,3 +85,32 @@ class TestPack(tests.TestCaseWithTransport):
 
         pack_names = t.list_dir('repository/obsolete_packs')
         self.assertTrue(len(pack_names) == 0)
+
+    def test_pack_incremental(self):
+        wt = self.make_branch_and_tree('.')
+        config_stack = wt.branch.repository._pack_collection.config_stack
+        config_stack.set('repository.autopack_max_bytes', '1')
+        self._make_versioned_file('file0.txt')
+        for i in range(10):
+            self._update_file('file0.txt', 'HELLO %d\n' % i)
+        t = wt.branch.repository.controldir.transport
+        self.assertLength(11, [name for name in t.list_dir('repository/packs')])
+        out, err = self.run_bzr(['pack', '--incremental'])
+        self.assertEqual('', out)
+        self.assertEqual('', err)
+        self.assertLength(2, [name for name in t.list_dir('repository/packs')])
+
+    def test_pack_incremental_remote(self):
+        wt = self.make_branch_and_tree('.')
+        # The limit also applies to the repository opened by the server.
+        config.GlobalStack().set('repository.autopack_max_bytes', '1')
+        self._make_versioned_file('file0.txt')
+        for i in range(10):
+            self._update_file('file0.txt', 'HELLO %d\n' % i)
+        t = wt.branch.repository.controldir.transport
+        self.assertLength(11, [name for name in t.list_dir('repository/packs')])
+        out, err = self.run_bzr(
+            ['pack', '--incremental', self.make_smart_server('.').base])
+        self.assertEqual('', out)
+        self.assertEqual('', err)
+        self.assertLength(2, [name for name in t.list_dir('repository/packs')])
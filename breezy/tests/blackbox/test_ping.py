@@ -34,5 +34,6 @@ class TestSmartServerPing(tests.TestCaseWithTransport):
         self.assertLength(1, self.hpss_connections)
         self.assertEqual(out,
                          "Response: (b'ok', b'2')\n"
-                         "Headers: {'Software version': '%s'}\n" % (breezy.version_string,))
+                         "Headers: {'Pipelining': 'yes', "
+                         "'Software version': '%s'}\n" % (breezy.version_string,))
         self.assertEqual(err, "")
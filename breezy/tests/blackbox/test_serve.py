@@ -244,6 +244,14 @@ class TestBzrServe(TestBzrServeBase):
         self.make_read_requests(branch)
         self.assertServerFinishesCleanly(process)
 
+    def test_bzr_serve_port_concurrent_requests(self):
+        self.make_branch('.')
+        process, url = self.start_server_port(
+            ['-Oserve.max_concurrent_requests=2'])
+        branch = Branch.open(url)
+        self.make_read_requests(branch)
+        self.assertServerFinishesCleanly(process)
+
     def test_bzr_serve_supports_protocol(self):
         # Make a branch
         self.make_branch('.')
@@ -38,3 +38,12 @@ class TestRevisionIdToDottedRevno(TestCaseWithBranch):
             revmap['1.1.1']))
         self.assertRaises(errors.NoSuchRevision,
                           the_branch.revision_id_to_dotted_revno, b'rev-1.0.2')
+
+    def test_lookup_dotted_revnos(self):
+        tree, revmap = self.create_tree_with_merge()
+        the_branch = tree.branch
+        self.assertEqual(
+            {revmap['1.1.1']: (1, 1, 1), revmap['2']: (2,)},
+            the_branch.revision_ids_to_dotted_revnos(
+                [revmap['1.1.1'], revmap['2'], b'rev-1.0.2']))
+        self.assertEqual({}, the_branch.revision_ids_to_dotted_revnos([]))
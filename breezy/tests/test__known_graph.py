@@ -22,6 +22,7 @@ from .. import (
     errors,
     _known_graph_py,
     tests,
+    tsort,
     )
 from . import test_graph
 from ..revision import NULL_REVISION
@@ -419,6 +420,32 @@ class TestKnownGraphMergeSort(TestCaseWithKnownGraph):
         if result_list != value:
             self.assertEqualDiff(pprint.pformat(result_list),
                                  pprint.pformat(value))
+        self.assertPartialSorts(ancestry, branch_tip, result_list)
+
+    def assertPartialSorts(self, ancestry, branch_tip, result_list):
+        """Check that partial merge sorts match the full one."""
+        # Use the smallest windows, so widening them is exercised.
+        self.overrideAttr(tsort, '_INITIAL_WINDOW', 1)
+        graph = self.make_known_graph(ancestry)
+        value = [(n.key, n.merge_depth, n.revno, n.end_of_merge)
+                 for n in graph.iter_merge_sort(branch_tip)]
+        if result_list != value:
+            self.assertEqualDiff(pprint.pformat(result_list),
+                                 pprint.pformat(value))
+        expected = {key: revno for key, _, revno, _ in result_list}
+        for key in ancestry:
+            graph = self.make_known_graph(ancestry)
+            self.assertEqual(
+                {k: v for k, v in expected.items() if k == key},
+                graph.get_dotted_revnos(branch_tip, [key]))
+        # Requests for older and older revisions widen the window.
+        graph = self.make_known_graph(ancestry)
+        for key, _, revno, _ in result_list:
+            self.assertEqual(
+                {key: revno}, graph.get_dotted_revnos(branch_tip, [key]))
+        graph = self.make_known_graph(ancestry)
+        self.assertEqual(
+            expected, graph.get_dotted_revnos(branch_tip, list(ancestry)))
 
     def test_merge_sort_empty(self):
         # sorting of an emptygraph does not error
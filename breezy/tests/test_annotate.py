@@ -316,6 +316,19 @@ class TestAnnotate(tests.TestCaseWithTransport):
                                   '1.1.1 barry@f | third\n',
                                   builder.get_branch(), 'a', b'rev-3')
 
+    def test_annotate_numbers_only_needed_revisions(self):
+        builder = self.create_merged_trees()
+        branch = builder.get_branch()
+
+        def get_revision_id_to_revno_map():
+            self.fail('annotate numbered the whole ancestry')
+        branch.get_revision_id_to_revno_map = get_revision_id_to_revno_map
+        with branch.lock_read():
+            self.assertBranchAnnotate('1     joe@foo | first\n'
+                                      '2     joe@foo | second\n'
+                                      '1.1.1 barry@f | third\n',
+                                      branch, 'a', b'rev-3')
+
     def test_annotate_limits_dotted_revnos(self):
         """Annotate should limit dotted revnos to a depth of 12"""
         builder = self.create_deeply_merged_trees()
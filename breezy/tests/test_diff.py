@@ -740,6 +740,50 @@ class TestDiffTree(tests.TestCaseWithTransport):
             b'--- old label\n+++ new label\n@@ -1,1 +1,1 @@\n-old\n+new\n\n',
             differ.to_file.getvalue())
 
+    def test_diff_text_binary_read_partially(self):
+        self.build_tree_contents([('new-tree/file', b'\0' * 100000)])
+        self.new_tree.add('file')
+        reads = []
+        get_file = self.new_tree.get_file
+
+        class RecordingFile(object):
+
+            def __init__(self, f):
+                self._f = f
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                self._f.close()
+
+            def read(self, size=-1):
+                data = self._f.read(size)
+                reads.append(len(data))
+                return data
+        self.new_tree.get_file = lambda path: RecordingFile(get_file(path))
+        differ = diff.DiffText(self.old_tree, self.new_tree, BytesIO())
+        differ.diff_text(None, 'file', 'old label', 'new label')
+        self.assertEqual(b'Binary files file and file differ\n',
+                         differ.to_file.getvalue())
+        self.assertEqual([1024], reads)
+
+    def test_diff_text_binary_other_differ(self):
+        # Differs other than internal_diff decide what to do with binary
+        # files themselves.
+        self.build_tree_contents([('new-tree/file', b'\0binary\n')])
+        self.new_tree.add('file')
+        calls = []
+
+        def text_differ(old_label, old_lines, new_label, new_lines, to_file,
+                        **kwargs):
+            calls.append((old_lines, new_lines))
+        differ = diff.DiffText(self.old_tree, self.new_tree, BytesIO(),
+                               text_differ=text_differ)
+        differ.diff_text(None, 'file', 'old label', 'new label')
+        self.assertEqual([([], [b'\0binary\n'])], calls)
+        self.assertEqual(b'', differ.to_file.getvalue())
+
     def test_diff_deletion(self):
         self.build_tree_contents([('old-tree/file', b'contents'),
                                   ('new-tree/file', b'contents')])
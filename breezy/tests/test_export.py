@@ -24,6 +24,7 @@ import time
 import zipfile
 
 from .. import (
+    archive,
     errors,
     export,
     tests,
@@ -33,6 +34,62 @@ from ..archive.tar import tarball_generator
 from . import features
 
 
+class TestExportIterItems(tests.TestCaseWithTransport):
+
+    def test_files_fetched_in_batches(self):
+        self.overrideAttr(export, '_FILE_BATCH_SIZE', 2)
+        wt = self.make_branch_and_tree('.')
+        self.build_tree_contents([
+            ('a', b'a content'), ('b', b'b content'), ('dir/',),
+            ('dir/c', b'c content'), ('dir/d', b'd content')])
+        wt.add(['a', 'b', 'dir', 'dir/c', 'dir/d'])
+        revid = wt.commit('1')
+        tree = wt.branch.repository.revision_tree(revid)
+        batches = []
+        orig_iter_files_bytes = tree.iter_files_bytes
+
+        def iter_files_bytes(desired_files):
+            batches.append(sorted(path for path, _ in desired_files))
+            return orig_iter_files_bytes(desired_files)
+        tree.iter_files_bytes = iter_files_bytes
+        with tree.lock_read():
+            items = [
+                (final_path, entry.kind,
+                 None if chunks is None else b''.join(chunks))
+                for final_path, tree_path, entry, chunks
+                in export._export_iter_items(tree, None)]
+        self.assertEqual([['a', 'b'], ['dir/c', 'dir/d']], batches)
+        self.assertEqual(
+            [('a', 'file', b'a content'), ('b', 'file', b'b content'),
+             ('dir', 'directory', None),
+             ('dir/c', 'file', b'c content'),
+             ('dir/d', 'file', b'd content')],
+            items)
+
+    def test_order_unchanged_by_repack(self):
+        wt = self.make_branch_and_tree('.')
+        self.build_tree_contents([
+            ('z', b'z content'), ('dir/',), ('dir/y', b'y content')])
+        wt.add(['z', 'dir', 'dir/y'])
+        wt.commit('1')
+        self.build_tree_contents([
+            ('a', b'a content'), ('dir/b', b'b content'),
+            ('z', b'new z content')])
+        wt.add(['a', 'dir/b'])
+        revid = wt.commit('2')
+        repo = wt.branch.repository
+
+        def export_order():
+            tree = repo.revision_tree(revid)
+            with tree.lock_read():
+                return [final_path for final_path, tree_path, entry, chunks
+                        in export._export_iter_items(tree, None)]
+        expected = ['a', 'dir', 'z', 'dir/b', 'dir/y']
+        self.assertEqual(expected, export_order())
+        repo.pack()
+        self.assertEqual(expected, export_order())
+
+
 class TestDirExport(tests.TestCaseWithTransport):
 
     def test_missing_file(self):
@@ -275,6 +332,39 @@ class TarExporterTests(tests.TestCaseWithTransport):
         self.addCleanup(ball2.close)
         self.assertEqual(["bar/a"], ball2.getnames())
 
+    def test_tarball_generator_streams_large_files(self):
+        self.overrideAttr(archive, '_CHUNK_SIZE', 1000)
+        wt = self.make_branch_and_tree('.')
+        self.build_tree_contents([
+            ('dir/',), ('dir/big', b'x' * 4500), ('small', b'small\n')])
+        wt.add(['dir', 'dir/big', 'small'])
+        revid = wt.commit('1')
+        tree = wt.branch.repository.revision_tree(revid)
+        chunks = list(tarball_generator(tree, 'bar'))
+        # The big file is passed on in pieces.
+        self.assertEqual(4, chunks.count(b'x' * 1000))
+        self.assertEqual(0, len(b''.join(chunks)) % tarfile.RECORDSIZE)
+        with tarfile.open(None, "r", BytesIO(b''.join(chunks))) as ball:
+            self.assertEqual(
+                ['bar/dir', 'bar/dir/big', 'bar/small'],
+                sorted(ball.getnames()))
+            self.assertEqual(
+                b'x' * 4500, ball.extractfile('bar/dir/big').read())
+            self.assertEqual(
+                b'small\n', ball.extractfile('bar/small').read())
+
+    def test_tarball_generator_compressed(self):
+        wt = self.make_branch_and_tree('.')
+        self.build_tree_contents([('a', b'a content')])
+        wt.add(['a'])
+        wt.commit('1')
+        for format in ('gz', 'bz2'):
+            target = BytesIO(
+                b''.join(tarball_generator(wt, 'bar', format=format)))
+            with tarfile.open(None, "r:%s" % format, target) as ball:
+                self.assertEqual(
+                    b'a content', ball.extractfile('bar/a').read())
+
 
 class ZipExporterTests(tests.TestCaseWithTransport):
 
@@ -291,6 +381,23 @@ class ZipExporterTests(tests.TestCaseWithTransport):
         info = zfile.getinfo("test/har")
         self.assertEqual(time.localtime(timestamp)[:6], info.date_time)
 
+    def test_contents(self):
+        self.overrideAttr(archive, '_CHUNK_SIZE', 1000)
+        self.overrideAttr(export, '_FILE_BATCH_SIZE', 1)
+        tree = self.make_branch_and_tree('.')
+        self.build_tree_contents([
+            ('dir/',), ('dir/big', b'x' * 4500), ('small', b'small\n')])
+        tree.add(['dir', 'dir/big', 'small'])
+        tree.commit('setup')
+        export.export(tree.basis_tree(), 'test.zip', format='zip')
+        with zipfile.ZipFile('test.zip') as zfile:
+            self.assertIs(None, zfile.testzip())
+            self.assertEqual(
+                ['test/dir/', 'test/dir/big', 'test/small'],
+                sorted(zfile.namelist()))
+            self.assertEqual(b'x' * 4500, zfile.read('test/dir/big'))
+            self.assertEqual(b'small\n', zfile.read('test/small'))
+
 
 class RootNameTests(tests.TestCase):
 
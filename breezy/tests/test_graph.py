@@ -460,6 +460,35 @@ class SharedInstrumentedParentsProvider(object):
         return self._real_parents_provider.get_cached_parent_map(nodes)
 
 
+class GenerationParentsProvider(_mod_graph.DictParentsProvider):
+    """A DictParentsProvider that also supplies generation numbers."""
+
+    def __init__(self, ancestry):
+        super(GenerationParentsProvider, self).__init__(ancestry)
+        self.generation_calls = []
+
+    def _get_generation(self, key):
+        if key == NULL_REVISION:
+            return 0
+        parents = self.ancestry.get(key)
+        if parents is None:
+            # Ghosts have no generation number.
+            return None
+        generations = [self._get_generation(p) for p in parents]
+        if None in generations:
+            return None
+        return 1 + max(generations or [0])
+
+    def get_generation_map(self, keys):
+        self.generation_calls.extend(keys)
+        generations = {}
+        for key in keys:
+            generation = self._get_generation(key)
+            if generation is not None:
+                generations[key] = generation
+        return generations
+
+
 class TestGraphBase(tests.TestCase):
 
     def make_graph(self, ancestors):
@@ -1253,6 +1282,38 @@ class TestGraph(TestCaseWithMemoryTransport):
             state)
 
 
+class TestGraphWithGenerations(TestGraph):
+    """Run the Graph tests with a parents provider with generation numbers."""
+
+    def make_graph(self, ancestors):
+        return _mod_graph.Graph(GenerationParentsProvider(ancestors))
+
+    def make_instrumented_graph(self, ancestors):
+        provider = GenerationParentsProvider(ancestors)
+        instrumented = InstrumentedParentsProvider(provider)
+        instrumented.get_generation_map = provider.get_generation_map
+        return _mod_graph.Graph(instrumented), instrumented
+
+    def test_heads_stops_at_lowest_generation(self):
+        graph, provider = self.make_instrumented_graph(with_tail)
+        self.assertEqual({b'i', b'g'}, graph.heads([b'i', b'g']))
+        # f and e have a generation number at or below that of g, so they
+        # can not lead to g.
+        self.assertEqual({b'g', b'h', b'i'}, set(provider.calls))
+
+    def test_heads_missing_generation(self):
+        graph = self.make_graph(with_ghost)
+        self.assertEqual({b'a', b'c'}, graph.heads([b'a', b'c', b'e']))
+
+    def test_difference_waits_for_lagging_side(self):
+        graph, provider = self.make_instrumented_graph(with_tail)
+        self.assertEqual(({b'f', b'h', b'i'}, {b'g'}),
+                         graph.find_difference(b'i', b'g'))
+        # The search from g does not run ahead while the search from i
+        # catches up.
+        self.assertNotIn(b'c', provider.calls)
+
+
 class TestFindUniqueAncestors(TestGraphBase):
 
     def assertFindUniqueAncestors(self, graph, expected, node, common):
@@ -215,6 +215,20 @@ class TestLRUCache(tests.TestCase):
         cache[2]
         self.assertEqual([2, 3, 5, 4, 1], [n.key for n in walk_lru(cache)])
 
+    def test_delitem(self):
+        cache = lru_cache.LRUCache(max_cache=10)
+        for key in range(4):
+            cache[key] = key
+        del cache[3]
+        self.assertEqual([2, 1, 0], [n.key for n in walk_lru(cache)])
+        del cache[1]
+        self.assertEqual([2, 0], [n.key for n in walk_lru(cache)])
+        del cache[0]
+        self.assertEqual([2], [n.key for n in walk_lru(cache)])
+        del cache[2]
+        self.assertEqual([], list(walk_lru(cache)))
+        self.assertRaises(KeyError, cache.__delitem__, 2)
+
     def test_get(self):
         cache = lru_cache.LRUCache(max_cache=5)
 
@@ -299,6 +313,13 @@ class TestLRUSizeCache(tests.TestCase):
         cache['my key'] = 'my value text'
         self.assertEqual(13, cache._value_size)
 
+    def test_replace_value(self):
+        cache = lru_cache.LRUSizeCache()
+        cache['my key'] = 'my value text'
+        cache['my key'] = 'other text'
+        self.assertEqual('other text', cache['my key'])
+        self.assertEqual(10, cache._value_size)
+
     def test_remove_tracks_size(self):
         cache = lru_cache.LRUSizeCache()
         self.assertEqual(0, cache._value_size)
@@ -308,6 +329,12 @@ class TestLRUSizeCache(tests.TestCase):
         cache._remove_node(node)
         self.assertEqual(0, cache._value_size)
 
+    def test_delitem_tracks_size(self):
+        cache = lru_cache.LRUSizeCache()
+        cache['my key'] = 'my value text'
+        del cache['my key']
+        self.assertEqual(0, cache._value_size)
+
     def test_no_add_over_size(self):
         """Adding a large value may not be cached at all."""
         cache = lru_cache.LRUSizeCache(max_size=10, after_cleanup_size=5)
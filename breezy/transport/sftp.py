@@ -392,17 +392,17 @@ class SFTPTransport(ConnectedTransport):
 
         :return: The created connection and its associated credentials.
 
-        The credentials are only the password as it may have been entered
-        interactively by the user and may be different from the one provided
-        in base url at transport creation time.
+        The credentials are the user and password, as returned for an
+        earlier connection; the password may have been entered interactively
+        by the user and may be different from the one provided in base url
+        at transport creation time.
         """
         if credentials is None:
-            password = self._parsed_url.password
+            user, password = self._parsed_url.user, self._parsed_url.password
         else:
-            password = credentials
+            user, password = credentials
 
         vendor = ssh._get_ssh_vendor()
-        user = self._parsed_url.user
         if user is None:
             auth = config.AuthenticationConfig()
             user = auth.get_user('ssh', self._parsed_url.host,
@@ -16,6 +16,7 @@
 
 """Topological sorting routines."""
 
+import heapq
 
 from . import (
     errors,
@@ -24,7 +25,8 @@ from . import (
     )
 
 
-__all__ = ["topo_sort", "TopoSorter", "merge_sort", "MergeSorter"]
+__all__ = ["topo_sort", "TopoSorter", "merge_sort", "MergeSorter",
+           "PartialMergeSorter"]
 
 
 def topo_sort(graph):
@@ -709,3 +711,274 @@ class MergeSorter(object):
         self._scheduled_nodes.append(
             (node_name, merge_depth, self._revnos[node_name][0]))
         return node_name
+
+
+# Number of mainline revisions covered by the first window a
+# PartialMergeSorter sorts when iterating.
+_INITIAL_WINDOW = 100
+
+
+class PartialMergeSorter(object):
+    """Merge sort the ancestry of a tip only as far back as needed.
+
+    The dotted revno, merge depth and position in the merge sorted output of
+    a merged revision only depend on the revisions merged into the mainline
+    since the mainline revision its branch started from, i.e. the one
+    numbered by the first element of its dotted revno. So rather than merge
+    sorting the whole ancestry of the tip, this sorts a window: the part of
+    the ancestry that is not also in the ancestry of an older mainline
+    revision, with that mainline revision as its root. Revnos in the window
+    are offset by the revno of the root. Revisions whose branch started
+    before the root, or from another root altogether, can not be numbered
+    this way; if they are needed the window is widened.
+
+    The most recent window is kept, so later requests only sort again when
+    they need to go further back in history.
+    """
+
+    def __init__(self, known_graph, tip_key):
+        """Create a PartialMergeSorter.
+
+        :param known_graph: A KnownGraph containing the ancestry of tip_key.
+        :param tip_key: The key to sort the ancestry of.
+        """
+        self._graph = known_graph
+        self.tip_key = tip_key
+        self._mainline_revnos = None
+        self._mainline = None
+        self._bases = {}
+        # The revno of the mainline revision at the root of the window (0
+        # when the whole ancestry was sorted), or None if nothing has been
+        # sorted yet.
+        self._window_start = None
+        self._window_nodes = []
+        # Number of nodes at the start of the window that are in the same
+        # position and have the same values as in a full merge sort.
+        self._window_prefix = 0
+        self._revnos = {}
+
+    def _ensure_mainline(self):
+        if self._mainline is not None:
+            return
+        mainline = []
+        mainline_revnos = {}
+        key = self.tip_key
+        if key not in (_mod_revision.NULL_REVISION,
+                       (_mod_revision.NULL_REVISION,)):
+            get_parent_keys = self._graph.get_parent_keys
+            while True:
+                try:
+                    parent_keys = get_parent_keys(key)
+                except KeyError:
+                    break
+                if parent_keys is None:
+                    # A ghost
+                    break
+                if key in mainline_revnos:
+                    raise errors.GraphCycleError(mainline)
+                mainline.append(key)
+                mainline_revnos[key] = None
+                if not parent_keys:
+                    break
+                key = parent_keys[0]
+        mainline.reverse()
+        for revno, key in enumerate(mainline, 1):
+            mainline_revnos[key] = revno
+        self._mainline = mainline
+        self._mainline_revnos = mainline_revnos
+
+    def _find_base(self, key):
+        """Find the mainline revno the branch of key started from.
+
+        :return: The first element of the dotted revno key would get, 0 if
+            its branch started from another root or a ghost, or None if key
+            is not in the graph or is a ghost.
+        """
+        mainline_revnos = self._mainline_revnos
+        bases = self._bases
+        get_parent_keys = self._graph.get_parent_keys
+        path = []
+        seen = set()
+        while True:
+            base = mainline_revnos.get(key)
+            if base is None:
+                base = bases.get(key)
+            if base is not None:
+                break
+            try:
+                parent_keys = get_parent_keys(key)
+            except KeyError:
+                parent_keys = None
+            if parent_keys is None:
+                if not path:
+                    return None
+                # The left-hand parent is a ghost.
+                base = 0
+                break
+            if key in seen:
+                raise errors.GraphCycleError(path)
+            seen.add(key)
+            path.append(key)
+            if not parent_keys:
+                base = 0
+                break
+            key = parent_keys[0]
+        for key in path:
+            bases[key] = base
+        return base
+
+    def _find_window(self, start_key):
+        """Find the ancestry of the tip that is not in the ancestry of
+        start_key.
+
+        Nodes are visited in order of decreasing gdfo, so a node's children
+        have all been visited before it is; the walk stops as soon as no
+        nodes that might be in the window are left.
+        """
+        nodes = self._graph._nodes
+        get_parent_keys = self._graph.get_parent_keys
+        tip_key = self.tip_key
+        if tip_key == start_key:
+            return [tip_key]
+        excluded = {tip_key: False, start_key: True}
+        queue = [(-nodes[tip_key].gdfo, tip_key),
+                 (-nodes[start_key].gdfo, start_key)]
+        heapq.heapify(queue)
+        num_pending = 1
+        window = []
+        while num_pending:
+            key = heapq.heappop(queue)[1]
+            is_excluded = excluded[key]
+            if not is_excluded:
+                num_pending -= 1
+                window.append(key)
+            for parent_key in get_parent_keys(key):
+                parent_node = nodes.get(parent_key)
+                if parent_node is None or parent_node.parent_keys is None:
+                    # Ghosts are not part of the sorted output.
+                    continue
+                parent_excluded = excluded.get(parent_key)
+                if parent_excluded is None:
+                    excluded[parent_key] = is_excluded
+                    heapq.heappush(queue, (-parent_node.gdfo, parent_key))
+                    if not is_excluded:
+                        num_pending += 1
+                elif is_excluded and not parent_excluded:
+                    excluded[parent_key] = True
+                    num_pending -= 1
+        return window
+
+    def _sort(self, start):
+        """Merge sort the window rooted at the mainline revno start."""
+        if start <= 1:
+            start = 0
+            nodes = self._graph.merge_sort(self.tip_key)
+        else:
+            start_key = self._mainline[start - 1]
+            get_parent_keys = self._graph.get_parent_keys
+            parent_map = {key: get_parent_keys(key)
+                          for key in self._find_window(start_key)}
+            # Cut the root off from its ancestry, so it is numbered 1 and
+            # its children are numbered as they are in the full sort.
+            parent_map[start_key] = ()
+            nodes = self._graph.__class__(
+                parent_map, do_cache=False).merge_sort(self.tip_key)
+        offset = max(0, start - 1)
+        revnos = {}
+        prefix = None
+        for i, node in enumerate(nodes):
+            revno = node.revno
+            if start:
+                if revno[0] == 0:
+                    # The branch started before the root of the window, or
+                    # from another root.
+                    if prefix is None:
+                        prefix = i
+                    continue
+                revno = (revno[0] + offset,) + revno[1:]
+            revnos[node.key] = revno
+        if prefix is None:
+            prefix = len(nodes)
+            if start:
+                # The root of the window is last, and is followed by the
+                # revisions merged into it in the full sort.
+                prefix -= 1
+        self._window_start = start
+        self._window_nodes = nodes
+        self._window_prefix = prefix
+        self._revnos = revnos
+
+    def _widen(self, start):
+        """Sort a window rooted at or before the mainline revno start.
+
+        Windows at least double in size, so that the cost of widening them
+        repeatedly stays in proportion to the cost of the final window.
+        """
+        if self._window_start is not None:
+            start = min(start, 2 * self._window_start - len(self._mainline))
+        self._sort(start)
+
+    def get_dotted_revnos(self, keys):
+        """Compute the dotted revnos of keys.
+
+        :return: A dict mapping the keys that are in the ancestry of the tip
+            to dotted revno tuples.
+        """
+        self._ensure_mainline()
+        result = {}
+        missing = []
+        start = None
+        for key in keys:
+            revno = self._mainline_revnos.get(key)
+            if revno is not None:
+                result[key] = (revno,)
+                continue
+            revno = self._revnos.get(key)
+            if revno is not None:
+                result[key] = revno
+                continue
+            base = self._find_base(key)
+            if base is None or self._window_start == 0:
+                continue
+            if self._window_start is not None and base >= self._window_start:
+                # Part of the window if it is in the ancestry at all.
+                continue
+            missing.append(key)
+            if start is None or base < start:
+                start = base
+        if missing:
+            self._widen(start)
+            for key in missing:
+                revno = self._revnos.get(key)
+                if revno is not None:
+                    result[key] = revno
+        return result
+
+    def iter_merge_sorted(self):
+        """Iterate over the merge sorted ancestry of the tip.
+
+        This yields the same output as a full merge sort, but only sorts as
+        much of the ancestry as has been consumed.
+
+        :return: An iterator over (key, merge_depth, revno, end_of_merge)
+            tuples, newest first.
+        """
+        self._ensure_mainline()
+        if not self._mainline:
+            return
+        if self._window_start is None:
+            self._sort(len(self._mainline) - _INITIAL_WINDOW)
+        i = 0
+        while True:
+            # The window may be widened by other callers while this is
+            # suspended; the first nodes are the same in every window.
+            while i < self._window_prefix:
+                node = self._window_nodes[i]
+                revno = node.revno
+                if self._window_start:
+                    revno = (revno[0] + self._window_start - 1,) + revno[1:]
+                yield node.key, node.merge_depth, revno, node.end_of_merge
+                i += 1
+            if self._window_start == 0:
+                return
+            self._widen(self._window_start)
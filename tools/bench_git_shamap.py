@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Compare the performance of the git sha map backends.
+
+A synthetic history is written to each backend, one write group per batch
+of revisions as a fetch from git would, after which random git shas, blob
+ids and commits are looked up.
+
+Usage: bench_git_shamap.py [--objects=N] [--backend=NAME]...
+"""
+
+import hashlib
+import optparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from dulwich.objects import Commit
+
+from breezy import osutils
+from breezy.revision import Revision
+from breezy.transport import get_transport
+from breezy.git.cache import (
+    DictBzrGitCache,
+    IndexBzrGitCache,
+    IndexGitCacheFormat,
+    SqliteBzrGitCache,
+    TdbBzrGitCache,
+    )
+
+
+def make_dict(path):
+    return DictBzrGitCache()
+
+
+def make_sqlite(path):
+    return SqliteBzrGitCache(os.path.join(path, 'idmap.db'))
+
+
+def make_tdb(path):
+    return TdbBzrGitCache(os.path.join(path, 'idmap.tdb'))
+
+
+def make_index(path):
+    transport = get_transport(path)
+    IndexGitCacheFormat().initialize(transport)
+    return IndexBzrGitCache(transport)
+
+
+BACKENDS = [
+    ('dict', make_dict),
+    ('sqlite', make_sqlite),
+    ('tdb', make_tdb),
+    ('index', make_index),
+    ]
+
+
+def fake_sha(*args):
+    return hashlib.sha1(repr(args).encode('ascii')).hexdigest().encode('ascii')
+
+
+def make_commit(i):
+    c = Commit()
+    c.committer = c.author = b'Somebody <somebody@example.com>'
+    c.commit_time = c.author_time = i
+    c.commit_timezone = c.author_timezone = 0
+    c.message = b'revision %d' % i
+    c.tree = fake_sha('tree', i, b'root')
+    return c
+
+
+def iter_revisions(num_revisions, objects_per_revision):
+    """Yield (revid, commit, trees, blobs) for a synthetic history."""
+    num_trees = max(1, objects_per_revision // 10)
+    num_blobs = max(0, objects_per_revision - num_trees - 1)
+    for i in range(num_revisions):
+        revid = b'rev-%d' % i
+        trees = [(fake_sha('tree', i, j), b'dir-%d' % j)
+                 for j in range(num_trees)]
+        blobs = [(fake_sha('blob', i, j), b'file-%d' % j)
+                 for j in range(num_blobs)]
+        yield revid, make_commit(i), trees, blobs
+
+
+def time_call(f, *args):
+    begin = osutils.perf_counter()
+    f(*args)
+    return osutils.perf_counter() - begin
+
+
+def fill(cache, revisions, revisions_per_group):
+    idmap = cache.idmap
+    for offset in range(0, len(revisions), revisions_per_group):
+        idmap.start_write_group()
+        for revid, commit, trees, blobs in revisions[
+                offset:offset + revisions_per_group]:
+            updater = cache.get_updater(Revision(revid))
+            for sha, fileid in trees:
+                updater.add_object(('tree', sha), (fileid, revid), None)
+            for sha, fileid in blobs:
+                updater.add_object(('blob', sha), (fileid, revid), None)
+            updater.add_object(commit, {'testament3-sha1': b'0' * 40}, None)
+            updater.finish()
+        idmap.commit_write_group()
+
+
+def lookup_shas(idmap, shas):
+    for sha in shas:
+        list(idmap.lookup_git_sha(sha))
+
+
+def lookup_blobs(idmap, keys):
+    for fileid, revid in keys:
+        idmap.lookup_blob_id(fileid, revid)
+
+
+def lookup_commits(idmap, revids):
+    for revid in revids:
+        idmap.lookup_commit(revid)
+
+
+def main(argv):
+    p = optparse.OptionParser(usage=__doc__.strip().splitlines()[-1])
+    p.add_option('--objects', default=1000000, type=int,
+                 help='Number of git objects to map.')
+    p.add_option('--objects-per-revision', default=100, type=int)
+    p.add_option('--revisions-per-group', default=1000, type=int,
+                 help='Number of revisions per write group.')
+    p.add_option('--lookups', default=10000, type=int)
+    p.add_option('--backend', action='append', dest='backends',
+                 help='Backend to test (default: all available).')
+    opts, args = p.parse_args(argv)
+
+    num_revisions = max(1, opts.objects // opts.objects_per_revision)
+    revisions = list(iter_revisions(num_revisions, opts.objects_per_revision))
+    num_objects = sum(1 + len(trees) + len(blobs)
+                      for revid, commit, trees, blobs in revisions)
+    rand = random.Random(0)
+    sample = [rand.choice(revisions) for i in range(opts.lookups)]
+    shas = []
+    blob_keys = []
+    for revid, commit, trees, blobs in sample:
+        sha, fileid = rand.choice(blobs + trees)
+        shas.append(sha)
+        if blobs:
+            blob_keys.append((rand.choice(blobs)[1], revid))
+    shas.extend(commit.id for revid, commit, trees, blobs in sample)
+    revids = [revid for revid, commit, trees, blobs in sample]
+
+    print('%d objects in %d revisions, %d lookups of each kind' % (
+        num_objects, num_revisions, opts.lookups))
+    print('%-8s %10s %12s %12s %12s' % (
+        'backend', 'insert', 'git sha', 'blob id', 'commit'))
+    for name, factory in BACKENDS:
+        if opts.backends and name not in opts.backends:
+            continue
+        path = tempfile.mkdtemp(prefix='bench-shamap-')
+        try:
+            try:
+                cache = factory(path)
+            except ImportError as e:
+                print('%-8s unavailable: %s' % (name, e))
+                continue
+            insert = time_call(
+                fill, cache, revisions, opts.revisions_per_group)
+            times = [
+                time_call(lookup_shas, cache.idmap, shas),
+                time_call(lookup_blobs, cache.idmap, blob_keys),
+                time_call(lookup_commits, cache.idmap, revids),
+                ]
+            print('%-8s %9.2fs %11.2fs %11.2fs %11.2fs' % (
+                (name, insert) + tuple(times)))
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])